@@ -580,6 +580,7 @@ export class VideoAnalysisService implements OnModuleInit, OnModuleDestroy {
         const message = JSON.stringify({
           job_id: jobId,
           analysis_mode: job.analysisMode,
+          queued_at: Date.now() / 1000, // queue age metric (upgrade/common/metrics.py)
         });
         await this.redis.rpush('queue:jobs', message);
         this.logger.log(`Job ${jobId} pushed to Redis queue`);
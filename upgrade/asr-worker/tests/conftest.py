@@ -0,0 +1,6 @@
+import os
+import sys
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..")))        # worker
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..", "..")))  # common
@@ -0,0 +1,100 @@
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+import pytest
+
+from worker import audio
+
+SR = audio.SAMPLE_RATE
+
+
+def tone_with_gaps(seconds: int, gap_every: int) -> np.ndarray:
+    """440 Hz tone with 0.5 s of silence at every gap_every seconds."""
+    t = np.arange(seconds * SR) / SR
+    x = (0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    for g in range(gap_every, seconds, gap_every):
+        x[g * SR - SR // 4:g * SR + SR // 4] = 0
+    return x
+
+
+def blocks(x: np.ndarray, size: int):
+    for i in range(0, len(x), size):
+        yield x[i:i + size]
+
+
+def test_windows_cover_input_and_cut_in_silence():
+    x = tone_with_gaps(95, 9)
+    out = list(audio.iter_audio_windows(blocks(x, 12345), window_sec=20, search_sec=4))
+
+    assert np.array_equal(np.concatenate([w for _, w in out]), x)
+    offsets = [o for o, _ in out]
+    assert offsets[0] == 0
+    for (o, w), nxt in zip(out, offsets[1:]):
+        assert o + len(w) / SR == pytest.approx(nxt)
+        assert len(w) <= 20 * SR
+        assert np.abs(x[int(nxt * SR) - 100:int(nxt * SR) + 100]).max() == 0  # cut inside a gap
+
+
+def test_windows_without_quiet_point_still_bounded():
+    x = np.ones(50 * SR, dtype=np.float32)
+    out = list(audio.iter_audio_windows(blocks(x, SR), window_sec=10))
+    assert sum(len(w) for _, w in out) == len(x)
+    assert max(len(w) for _, w in out) <= 10 * SR
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")
+def test_decode_matches_wav(tmp_path):
+    src = tmp_path / "v.mkv"
+    subprocess.check_call([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", "sine=frequency=300:duration=3:sample_rate=44100",
+        "-c:a", "pcm_s16le", str(src),
+    ])
+    wav = tmp_path / "audio.wav"
+    size = audio.extract_wav(str(src), str(wav))
+    with wave.open(str(wav)) as w:
+        from_file = np.frombuffer(w.readframes(w.getnframes()), dtype="<i2").astype(np.float32) / 32768.0
+
+    streamed = audio.decode_audio(str(src))
+    assert size == wav.stat().st_size
+    assert len(streamed) == 3 * SR
+    assert np.array_equal(streamed, from_file)
+
+    windowed = list(audio.iter_audio_windows(audio.iter_pcm_blocks(str(src), 4099), window_sec=1))
+    assert np.array_equal(np.concatenate([w for _, w in windowed]), streamed)
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")
+def test_decode_failure_raises(tmp_path):
+    with pytest.raises(subprocess.CalledProcessError):
+        audio.decode_audio(str(tmp_path / "missing.mp4"))
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")
+def test_demux_spools_frames_in_the_same_pass(tmp_path):
+    from common import media
+
+    src = tmp_path / "raw" / "v.mp4"
+    src.parent.mkdir()
+    subprocess.check_call([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=10:duration=12",
+        "-f", "lavfi", "-i", "sine=frequency=300:duration=12",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest", str(src),
+    ])
+    job = str(tmp_path)
+    done = []
+    pcm = audio.decode_audio(str(src), extra_outputs=media.frames_output_args(job, 5, 3),
+                             on_done=lambda: done.append(media.finish_spool(job, 5, 3)))
+    assert done and np.array_equal(pcm, audio.decode_audio(str(src)))
+
+    spool = media.ready_spool(job, 5, 3)
+    assert spool and media.ready_spool(job, 10, 3) is None
+    separate = subprocess.check_output([
+        "ffmpeg", "-v", "error", "-i", str(src), "-an", "-vf", "fps=1/5", "-q:v", "3",
+        "-f", "image2pipe", "-c:v", "mjpeg", "pipe:1",
+    ])
+    with open(spool, "rb") as f:
+        assert f.read() == separate
+    media.remove_spool(job)
+    assert not (tmp_path / media.DEMUX_DIR).exists()
@@ -0,0 +1,214 @@
+import threading
+
+import numpy as np
+import pytest
+
+from worker import transcript
+from worker.batching import SAMPLE_RATE, BatchScheduler, StubBackend
+
+
+class FakeJob:
+    def __init__(self, name: str, seconds: float, gate: threading.Event = None, load_error=None,
+                 window: float = 0):
+        self.name = name
+        self.seconds = seconds
+        self.gate = gate
+        self.load_error = load_error
+        self.window = window or seconds
+        self.seen = []
+        self.commits = []  # (segments, position)
+        self.committed = []
+        self.segs = self.meta = self.error = None
+        self.finished = threading.Event()
+
+    def load(self):
+        if self.gate:
+            self.gate.wait(5)
+        if self.load_error:
+            raise self.load_error
+        return self.seconds, self.windows()
+
+    def windows(self):
+        offset = 0.0
+        while True:
+            n = min(self.window, self.seconds - offset)
+            yield offset, np.zeros(int(n * SAMPLE_RATE), dtype=np.float32)
+            offset += n
+            if offset >= self.seconds:
+                return
+
+    def progress(self, done, total):
+        self.seen.append(done)
+
+    def commit(self, segs, position, speech_sec):
+        self.commits.append((len(segs), position))
+        self.committed.extend(segs)
+
+    def done(self, meta):
+        self.segs, self.meta = self.committed, meta
+        self.finished.set()
+
+    def failed(self, e):
+        self.error = e
+        self.finished.set()
+
+
+@pytest.fixture
+def run_jobs():
+    scheds = []
+
+    def run(backend, jobs, **kw):
+        sched = BatchScheduler(backend, **kw)
+        scheds.append(sched)
+        sched.start()
+        for job in jobs:
+            assert sched.wait_capacity(5)
+            sched.submit(job)
+        assert sched.drain(5)
+        return sched
+
+    yield run
+    for sched in scheds:
+        sched.stop()
+
+
+def test_chunks_from_several_jobs_share_batches_and_come_back_in_order(run_jobs):
+    backend = StubBackend(chunk_sec=10)
+    jobs = [FakeJob("a", 95), FakeJob("b", 42), FakeJob("c", 5)]
+    run_jobs(backend, jobs, batch_size=4, max_jobs=3, fill_wait=0.5)
+
+    for job in jobs:
+        starts = [s["start"] for s in job.segs]
+        assert starts == [10.0 * i for i in range(len(starts))]
+        assert job.segs[-1]["end"] == job.seconds
+        assert job.meta["duration"] == job.seconds
+        assert job.seen == sorted(job.seen) and job.seen[-1] == job.seconds
+    # 10 + 5 + 1 chunks in batches of at most 4 -> all but the last batch full
+    assert sum(backend.batches) == 16
+    assert max(backend.batches) == 4 and backend.batches.count(4) >= 3
+
+
+def test_failed_batch_only_fails_its_jobs(run_jobs):
+    class Flaky(StubBackend):
+        def infer(self, chunks):
+            if any(c.state.job.name == "bad" for c in chunks):
+                raise RuntimeError("CUDA error")
+            return super().infer(chunks)
+
+    good, bad, late = FakeJob("good", 20), FakeJob("bad", 20), FakeJob("late", 20)
+    run_jobs(Flaky(chunk_sec=10), [good, bad, late], batch_size=2, max_jobs=1)
+
+    assert isinstance(bad.error, RuntimeError) and bad.segs is None
+    assert good.error is None and len(good.segs) == 2
+    assert late.error is None and len(late.segs) == 2
+
+
+def test_load_error_and_capacity(run_jobs):
+    gate = threading.Event()
+    sched = BatchScheduler(StubBackend(), batch_size=2, max_jobs=1)
+    sched.start()
+    try:
+        broken = FakeJob("broken", 1, gate=gate, load_error=FileNotFoundError("video"))
+        sched.submit(broken)
+        assert not sched.wait_capacity(0.1)  # one job admitted, still loading
+        gate.set()
+        assert broken.finished.wait(5) and isinstance(broken.error, FileNotFoundError)
+        assert sched.wait_capacity(5)
+
+        silent = FakeJob("silent", 0)
+        sched.submit(silent)
+        assert silent.finished.wait(5) and silent.segs == []
+    finally:
+        sched.stop()
+
+
+def test_windows_are_queued_as_they_are_split():
+    """The model starts on the first window of a long job before the rest is
+    decoded, and at most queue_chunks chunks of it wait in memory."""
+    backend = StubBackend(chunk_sec=10)
+    sched = BatchScheduler(backend, batch_size=2, max_jobs=1, queue_chunks=4)
+    first_done = threading.Event()
+    queued = []
+
+    class Streaming(FakeJob):
+        def windows(self):
+            for offset, samples in super().windows():
+                if offset >= 60:  # third window: only once the model has the first
+                    assert first_done.wait(5)
+                queued.append(len(sched.pending))
+                yield offset, samples
+
+        def progress(self, done, total):
+            super().progress(done, total)
+            first_done.set()
+
+    long = Streaming("long", 125, window=30)
+    sched.start()
+    try:
+        sched.submit(long)
+        assert sched.drain(5)
+    finally:
+        sched.stop()
+    assert long.error is None
+    assert [s["start"] for s in long.segs] == [0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 110, 120]
+    assert long.segs[-1]["end"] == 125 and long.meta["duration"] == 125
+    assert long.seen[-1] == 125 and long.seen == sorted(long.seen)
+    assert max(queued) <= 4
+
+
+def test_commits_follow_chunk_order_and_a_retry_resumes_after_them(run_jobs):
+    class Flaky(StubBackend):
+        broken = True
+
+        def infer(self, chunks):
+            if self.broken and any(c.start >= 60 for c in chunks):
+                raise RuntimeError("CUDA error")
+            return super().infer(chunks)
+
+    backend = Flaky(chunk_sec=10)
+    first = FakeJob("a", 100, window=30)
+    run_jobs(backend, [first], batch_size=3, max_jobs=1)
+    assert isinstance(first.error, RuntimeError)
+    # in order, each commit at the end of its last chunk, nothing past the failure
+    positions = [p for _, p in first.commits]
+    assert positions == sorted(positions) and 0 < positions[-1] <= 60
+    assert [s["start"] for s in first.committed] == [10.0 * i for i in range(len(first.committed))]
+
+    # re-delivered: the windows start where the commits ended
+    backend.broken = False
+    again = FakeJob("a", 100, window=30)
+    again.windows = lambda: transcript.resume_windows(FakeJob.windows(again), positions[-1])
+    run_jobs(backend, [again], batch_size=3, max_jobs=1)
+    assert again.error is None
+    assert [s["start"] for s in first.committed + again.segs] == [10.0 * i for i in range(10)]
+    assert again.meta["duration"] == 100
+
+
+def test_jobs_outside_the_batches_run_alone_within_capacity():
+    class Sequential(FakeJob):
+        def process(self):
+            if self.gate:
+                self.gate.wait(5)
+            if self.load_error:
+                raise self.load_error
+            self.done({"pipeline": "sequential"})
+
+    backend = StubBackend(chunk_sec=10)
+    sched = BatchScheduler(backend, batch_size=2, max_jobs=2)
+    sched.start()
+    try:
+        gate = threading.Event()
+        accurate, batched = Sequential("accurate", 20, gate=gate), FakeJob("batched", 20)
+        sched.submit_alone(accurate)
+        sched.submit(batched)
+        assert batched.finished.wait(5) and not accurate.finished.is_set()
+        assert sched.wait_capacity(5) and sched.active == 1  # the lone job still counts
+        gate.set()
+        assert sched.drain(5)
+        assert accurate.meta == {"pipeline": "sequential"} and sum(backend.batches) == 2
+
+        broken = Sequential("broken", 20, load_error=RuntimeError("CUDA error"))
+        sched.submit_alone(broken)
+        assert sched.drain(5) and isinstance(broken.error, RuntimeError)
+    finally:
+        sched.stop()
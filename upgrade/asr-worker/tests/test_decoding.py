@@ -0,0 +1,122 @@
+import json
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from worker import decoding, transcript
+
+SR = decoding.SAMPLE_RATE
+
+
+class StubWhisper:
+    """model.transcribe() on CPU: one segment per 5 s, confidences from a
+    script. Samples carry their own position (sample value = seconds into
+    the recording), so a re-decoded clip is known by its audio alone.
+
+    low: {start second: (avg_logprob, compression_ratio)} for the cheap
+    profiles; accurate decodes everything at -0.2 unless in accurate_low.
+    """
+
+    def __init__(self, low: dict, accurate_low: dict = None):
+        self.low = low
+        self.accurate_low = accurate_low or {}
+        self.calls = []  # (beam_size, first second, seconds)
+
+    def transcribe(self, samples, language, task, vad_filter, beam_size, best_of, temperature):
+        t0 = round(float(samples[0]), 2)
+        self.calls.append((beam_size, t0, len(samples) / SR))
+        accurate = beam_size == decoding.PROFILES["accurate"]["beam_size"]
+        script = self.accurate_low if accurate else self.low
+
+        def segs():
+            for i in range(0, len(samples), 5 * SR):
+                start = round(float(samples[i]), 2)
+                logprob, ratio = script.get(start, (-0.2, 1.5))
+                yield SimpleNamespace(
+                    start=i / SR, end=min(i + 5 * SR, len(samples)) / SR,
+                    text=f" {'accurate' if accurate else 'cheap'} {start:g} ",
+                    avg_logprob=logprob, compression_ratio=ratio)
+        return segs(), SimpleNamespace(language=language, language_probability=0.98765)
+
+
+def audio(seconds: float, start: float = 0.0) -> np.ndarray:
+    return (start + np.arange(int(seconds * SR)) / SR).astype(np.float64)
+
+
+def test_select_profile():
+    by_mode = {"TEXT_ONLY": "fast", "FULL": "balanced"}
+    pick = lambda **kw: decoding.select_profile(by_mode=by_mode, urgent="accurate", default="balanced", **kw)
+    assert pick(analysis_mode="TEXT_ONLY") == "fast"
+    assert pick(analysis_mode="FULL") == "balanced"
+    assert pick(analysis_mode="FULL", lane="urgent") == "accurate"
+    assert pick(requested="fast", analysis_mode="FULL", lane="urgent") == "fast"
+    assert pick(requested="turbo", analysis_mode="TEXT_ONLY") == "fast"
+    assert pick(analysis_mode="OTHER") == "balanced"
+    assert decoding.parse_modes("TEXT_ONLY=fast, FULL = accurate,X=nope") == {"TEXT_ONLY": "fast", "FULL": "accurate"}
+    # accurate keeps the cache key of the single-profile worker
+    assert decoding.decode_params("accurate") == {"beam_size": 10, "best_of": 10, "temperature": [0.0, 0.2, 0.4]}
+    assert decoding.decode_params("fast")["profile"] == "fast"
+    with pytest.raises(ValueError):
+        decoding.Decoder(StubWhisper({}), "turbo")
+
+
+def test_escalates_low_confidence_runs_only():
+    # 60 s: segments at 10 and 15 (one run), 40 (repetition loop) are low
+    model = StubWhisper({10.0: (-1.3, 1.6), 15.0: (-0.9, 1.4), 40.0: (-0.3, 3.1)})
+    segs, meta = decoding.Decoder(model, "fast")(audio(60), offset=100.0)
+    assert meta["decode"]["segments"] == 0  # lazy: nothing decoded yet
+    segs = list(segs)
+
+    assert [s["text"] for s in segs] == [
+        "cheap 0", "cheap 5", "accurate 10", "accurate 15", "cheap 20", "cheap 25",
+        "cheap 30", "cheap 35", "accurate 40", "cheap 45", "cheap 50", "cheap 55"]
+    assert [s["start"] for s in segs] == [100.0 + 5 * k for k in range(12)]
+    assert segs[-1]["end"] == 160.0
+    # one greedy pass + one accurate pass per low run, over its audio only
+    assert model.calls == [(1, 0.0, 60.0), (10, 10.0, 10.0), (10, 40.0, 5.0)]
+    assert meta == {"language": "th", "probability": 0.9877, "decode": {
+        "profile": "fast", "segments": 12, "low_confidence": 3, "redecoded": 2,
+        "redecoded_sec": 15.0, "replaced": 2}}
+
+    # accurate decodes once, never escalates
+    model = StubWhisper({10.0: (-1.3, 1.6)})
+    segs, meta = decoding.Decoder(model, "accurate")(audio(20))
+    assert [s["text"] for s in segs] == ["accurate 0", "accurate 5", "accurate 10", "accurate 15"]
+    assert model.calls == [(10, 0.0, 20.0)]
+    assert meta["decode"]["redecoded"] == 0
+
+
+def test_keeps_cheap_run_when_redecode_is_worse_and_caps_spans():
+    model = StubWhisper({k * 5.0: (-1.0, 1.5) for k in range(2, 12)},
+                        accurate_low={k * 5.0: (-1.5, 1.5) for k in range(8, 12)})
+    segs, meta = decoding.Decoder(model, "balanced", span_max_sec=30)(audio(60))
+    texts = [s["text"] for s in segs]
+    # 10..60 s is one low run, cut at 30 s of audio: 10-40 re-decoded fine,
+    # 40-60 came back worse and is kept as it was
+    assert model.calls == [(5, 0.0, 60.0), (10, 10.0, 30.0), (10, 40.0, 20.0)]
+    assert texts == ["cheap 0", "cheap 5"] + [f"accurate {t}" for t in range(10, 40, 5)] + \
+        [f"cheap {t}" for t in range(40, 60, 5)]
+    assert meta["decode"]["replaced"] == 1 and meta["decode"]["redecoded_sec"] == 50.0
+
+
+def test_stats_reach_transcript_meta(tmp_path):
+    model = StubWhisper({10.0: (-1.3, 1.6), 130.0: (-1.3, 1.6)})
+    ckpt = transcript.Checkpoint(str(tmp_path / transcript.CHECKPOINT_FILE), key="k", fsync=False)
+    tr = transcript.Transcriber(decoding.Decoder(model, "fast"), ckpt, use_vad=False)
+    # two windows, each its own transcribe call: the counts add up
+    meta = tr.run([(0.0, audio(120)), (120.0, audio(60, 120.0))])
+    transcript.write_artifacts(str(tmp_path), ckpt.iter_segments(), meta)
+    ckpt.close()
+
+    with open(os.path.join(tmp_path, "transcript.json"), encoding="utf-8") as f:
+        doc = json.load(f)
+    assert doc["meta"]["decode"] == {"profile": "fast", "segments": 36, "low_confidence": 2,
+                                     "redecoded": 2, "redecoded_sec": 10.0, "replaced": 2}
+    assert [s["text"] for s in doc["segments"] if s["text"].startswith("accurate")] == ["accurate 10", "accurate 130"]
+
+    # counts are committed with the segments: reopening keeps them
+    again = transcript.Checkpoint(str(tmp_path / transcript.CHECKPOINT_FILE), key="k", fsync=False)
+    assert again.state["decode"]["redecoded"] == 2
+    again.close()
@@ -0,0 +1,122 @@
+import json
+import multiprocessing
+import os
+import signal
+
+import numpy as np
+import pytest
+
+from worker import transcript
+
+SR = transcript.SAMPLE_RATE
+
+
+def lesson(seconds: int, seed: int = 0) -> np.ndarray:
+    """Noise with speech-like bursts: 40 s talk / 15 s quiet, repeated."""
+    rng = np.random.default_rng(seed)
+    x = rng.normal(0, 0.002, seconds * SR)
+    t = np.arange(seconds * SR) / SR
+    talking = (t % 55) < 40
+    x += talking * 0.2 * np.sin(2 * np.pi * 180 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    return x.astype(np.float32)
+
+
+class StubModel:
+    """One segment per 5 s of the audio it is given; optionally SIGKILLs its
+    own process when asked for the segment starting at kill_at."""
+
+    def __init__(self, kill_at: float = None):
+        self.kill_at = kill_at
+        self.offsets = []
+
+    def __call__(self, samples, offset):
+        self.offsets.append(offset)
+        def segs():
+            step = 5 * SR
+            for i in range(0, len(samples), step):
+                start = round(offset + i / SR, 2)
+                if self.kill_at is not None and start >= self.kill_at:
+                    os.kill(os.getpid(), signal.SIGKILL)
+                end = round(offset + min(i + step, len(samples)) / SR, 2)
+                yield {"start": start, "end": end, "text": f"ข้อความ {start:.2f}"}
+        return segs(), {"language": "th", "probability": 0.97}
+
+
+def windows(x, window_sec):
+    step = int(window_sec * SR)
+    return [(i / SR, x[i:i + step]) for i in range(0, len(x), step)]
+
+
+def transcribe_to(art_dir, x, use_vad, window_sec, model, chunk_max_sec=20.0):
+    ckpt = transcript.Checkpoint(os.path.join(art_dir, transcript.CHECKPOINT_FILE), key="k", fsync=False)
+    meta = transcript.Transcriber(model, ckpt, use_vad=use_vad, chunk_max_sec=chunk_max_sec).run(
+        windows(x, window_sec))
+    n = transcript.write_artifacts(art_dir, ckpt.iter_segments(), meta)
+    ckpt.remove()
+    return n
+
+
+def read_all(art_dir):
+    out = {}
+    for name in ("transcript.json", "transcript.txt", "transcript.srt"):
+        with open(os.path.join(art_dir, name), "rb") as f:
+            out[name] = f.read()
+    return out
+
+
+@pytest.mark.parametrize("use_vad", [False, True])
+def test_resume_after_kill_gives_identical_transcript(tmp_path, use_vad):
+    x = lesson(300)
+    ref_dir, dir_ = str(tmp_path / "ref"), str(tmp_path / "job")
+    transcribe_to(ref_dir, x, use_vad, 120, StubModel())
+
+    child = multiprocessing.get_context("fork").Process(
+        target=transcribe_to, args=(dir_, x, use_vad, 120, StubModel(kill_at=170)))
+    child.start()
+    child.join(30)
+    assert child.exitcode == -signal.SIGKILL
+    ckpt_path = os.path.join(dir_, transcript.CHECKPOINT_FILE)
+    with open(ckpt_path, "ab") as f:
+        f.write(b'{"start": 171.0, "end": 17')  # torn last write
+
+    resumed = transcript.Checkpoint(ckpt_path, key="k")
+    assert 120 <= resumed.committed <= 170
+    assert resumed.last["end"] <= resumed.committed
+    resumed.close()
+
+    model = StubModel()
+    transcribe_to(dir_, x, use_vad, 120, model)
+    assert min(model.offsets) >= resumed.committed - 20  # nothing before the last commit was redone
+    assert read_all(dir_) == read_all(ref_dir)
+    assert not os.path.exists(ckpt_path)
+
+
+def test_checkpoint_with_other_settings_starts_over(tmp_path):
+    path = str(tmp_path / transcript.CHECKPOINT_FILE)
+    ckpt = transcript.Checkpoint(path, key="beam10")
+    ckpt.append({"start": 0.0, "end": 5.0, "text": "a"})
+    ckpt.commit(5.0, language="th")
+    ckpt.append({"start": 5.0, "end": 9.0, "text": "uncommitted"})
+    ckpt.close()
+
+    same = transcript.Checkpoint(path, key="beam10")
+    assert (same.committed, same.segments, same.state) == (5.0, 1, {"language": "th"})
+    assert [s["text"] for s in same.iter_segments()] == ["a"]
+    same.close()
+
+    other = transcript.Checkpoint(path, key="beam5")
+    assert (other.committed, other.segments) == (0.0, 0)
+    assert list(other.iter_segments()) == []
+    other.close()
+
+
+def test_streamed_json_matches_json_dump(tmp_path):
+    segs = [{"start": 0.0, "end": 1.5, "text": "สวัสดี \"ครับ\""}, {"start": 1.5, "end": 3661.25, "text": "x"}]
+    meta = {"language": "th", "probability": 0.9, "duration": 3700.0, "speech_sec": 12.5}
+    for case in (segs, []):
+        transcript.write_artifacts(str(tmp_path), iter(case), meta)
+        with open(tmp_path / "transcript.json", encoding="utf-8") as f:
+            assert f.read() == json.dumps({"segments": case, "meta": meta}, ensure_ascii=False, indent=2)
+    transcript.write_artifacts(str(tmp_path), segs, meta)
+    with open(tmp_path / "transcript.srt", encoding="utf-8") as f:
+        assert "2\n00:00:01,500 --> 01:01:01,250\nx\n" in f.read()
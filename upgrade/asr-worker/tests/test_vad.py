@@ -0,0 +1,77 @@
+import numpy as np
+
+from worker import vad
+
+SR = vad.SAMPLE_RATE
+
+
+def lesson(plan, seed=0):
+    """Synthetic classroom audio: (seconds, speech?) blocks over low noise."""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for sec, speech in plan:
+        n = int(sec * SR)
+        x = rng.normal(0, 0.002, n)
+        if speech:
+            t = np.arange(n) / SR
+            # syllable-rate amplitude modulation of a voiced tone
+            x += 0.2 * np.sin(2 * np.pi * 180 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+        parts.append(x)
+    return np.concatenate(parts).astype(np.float32)
+
+
+def test_speech_regions_find_speech_and_skip_silence():
+    plan = [(5, False), (20, True), (60, False), (8, True), (0.5, False), (4, True), (30, False)]
+    x = lesson(plan)
+    regions = vad.speech_regions(x) / SR
+
+    # the 0.5 s pause is closed, the long silences are not
+    assert len(regions) == 2
+    np.testing.assert_allclose(regions, [[5, 25], [85, 97.5]], atol=0.3)
+    speech = (regions[:, 1] - regions[:, 0]).sum()
+    assert speech / (len(x) / SR) < 0.3
+
+
+def test_silence_only_and_empty():
+    assert vad.speech_regions(lesson([(10, False)])).shape == (0, 2)
+    assert vad.speech_regions(np.zeros(0, dtype=np.float32)).shape == (0, 2)
+    assert vad.plan_chunks(np.empty((0, 2), dtype=np.int64)).shape == (0, 2)
+
+
+def test_plan_chunks_joins_short_gaps_and_splits_long_speech():
+    regions = (np.array([[0, 10], [11, 20], [40, 45], [60, 200]]) * SR).astype(np.int64)
+    chunks = vad.plan_chunks(regions, max_sec=60, join_gap_sec=2, overlap_sec=1) / SR
+
+    assert chunks[0].tolist() == [0, 20]   # joined across the 1 s pause
+    assert chunks[1].tolist() == [40, 45]  # 20 s gap: new chunk, silence skipped
+    long = chunks[2:]
+    assert long[0, 0] == 60 and long[-1, 1] == 200
+    assert (long[:, 1] - long[:, 0] <= 60).all()
+    np.testing.assert_allclose(long[:-1, 1] - long[1:, 0], 1.0)  # 1 s overlap at each cut
+
+
+def test_stitch_absolute_times_and_straddling_words():
+    chunks = (np.array([[0, 60], [59, 119], [150, 160]]) * SR).astype(np.int64)
+    results = [
+        [{"start": 1.0, "end": 30.0, "text": "สวัสดีนักเรียน"},
+         {"start": 55.0, "end": 59.8, "text": "วันนี้เราจะเรียน"}],       # word on the cut, heard by chunk 0
+        [{"start": 59.0, "end": 59.7, "text": "เรียน"},                  # same word again, before the cut
+         {"start": 59.3, "end": 70.0, "text": "เรียนเรื่องเศษส่วน"},      # straddles the cut
+         {"start": 100.0, "end": 118.0, "text": "ทำแบบฝึกหัด"}],
+        [{"start": 151.0, "end": 155.0, "text": "เก็บของ"}],
+    ]
+    segs = vad.stitch(chunks, results)
+    texts = [s["text"] for s in segs]
+
+    assert texts == ["สวัสดีนักเรียน", "วันนี้เราจะเรียน", "เรื่องเศษส่วน", "ทำแบบฝึกหัด", "เก็บของ"]
+    starts = [s["start"] for s in segs]
+    assert starts == sorted(starts)
+    assert all(a["end"] <= b["start"] for a, b in zip(segs, segs[1:]))
+
+
+def test_stitch_offset_shifts_chunk_boundaries():
+    chunks = (np.array([[0, 60], [59, 119]]) * SR).astype(np.int64)
+    results = [[{"start": 1000.0, "end": 1059.8, "text": "a"}],
+               [{"start": 1059.2, "end": 1060.0, "text": "b"}]]
+    # cut at 1000 + 59.5: "b" (mid 1059.6) belongs to chunk 1, "a" (mid 1029.9) to chunk 0
+    assert [s["text"] for s in vad.stitch(chunks, results, offset=1000.0)] == ["a", "b"]
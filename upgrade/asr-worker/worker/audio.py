@@ -0,0 +1,131 @@
+"""
+Audio decoding for the asr-worker
+- ffmpeg decodes the video's audio track to mono 16 kHz s16le on a pipe;
+  extra_outputs adds more outputs to the same ffmpeg (the FULL-mode frames
+  spool, common/media.py), so the video is read once for both
+- decode_audio(): whole track as one float32 array (what faster-whisper expects)
+- iter_audio_windows(): bounded-memory windows for multi-hour recordings, cut
+  at the quietest 100 ms near each window end so speech is not split mid-word
+- extract_wav(): the old file-based path (audio/audio.wav), kept as a fallback
+"""
+
+import os
+import subprocess
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2  # pcm_s16le
+PIPE_BLOCK = 1 << 20  # bytes per read from ffmpeg
+ENERGY_FRAME = SAMPLE_RATE // 10  # 100 ms
+
+
+def _pcm_cmd(video_path: str, extra_outputs: list = ()) -> list:
+    return [
+        "ffmpeg", "-nostdin", "-v", "error", "-i", video_path,
+        "-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1", *extra_outputs,
+    ]
+
+
+def iter_pcm_blocks(video_path: str, block_bytes: int = PIPE_BLOCK, extra_outputs: list = (), on_done=None):
+    """Yield float32 sample blocks straight from ffmpeg's stdout.
+
+    Raises CalledProcessError if ffmpeg fails. Closing the generator early
+    kills ffmpeg. on_done() runs once ffmpeg has exited cleanly (all
+    extra_outputs complete).
+    """
+    proc = subprocess.Popen(_pcm_cmd(video_path, extra_outputs), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    carry = b""
+    try:
+        while True:
+            buf = proc.stdout.read(block_bytes)
+            if not buf:
+                break
+            if carry:
+                buf, carry = carry + buf, b""
+            if len(buf) % BYTES_PER_SAMPLE:
+                buf, carry = buf[:-1], buf[-1:]
+            yield np.frombuffer(buf, dtype="<i2").astype(np.float32) / 32768.0
+        err = proc.stderr.read()
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, "ffmpeg", stderr=err)
+        if on_done:
+            on_done()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+
+def decode_audio(video_path: str, duration_hint: float = 0.0, extra_outputs: list = (), on_done=None) -> np.ndarray:
+    """Whole audio track as float32 in [-1, 1).
+
+    With a duration hint the buffer is allocated once, so peak memory is
+    ~4 bytes/sample instead of the bytes + int16 + float32 copies.
+    """
+    out = np.empty(int(duration_hint * SAMPLE_RATE) + SAMPLE_RATE, dtype=np.float32)
+    n = 0
+    for block in iter_pcm_blocks(video_path, extra_outputs=extra_outputs, on_done=on_done):
+        if n + len(block) > len(out):
+            out = np.resize(out, max(2 * len(out), n + len(block)))
+        out[n:n + len(block)] = block
+        n += len(block)
+    return out[:n]
+
+
+def quietest_cut(samples: np.ndarray, lo: int, hi: int) -> int:
+    """Sample index in the middle of the quietest 100 ms frame in [lo, hi)."""
+    frames = (hi - lo) // ENERGY_FRAME
+    if frames < 2:
+        return hi
+    energy = np.square(samples[lo:lo + frames * ENERGY_FRAME]).reshape(frames, ENERGY_FRAME).sum(axis=1)
+    return lo + int(np.argmin(energy)) * ENERGY_FRAME + ENERGY_FRAME // 2
+
+
+def iter_audio_windows(blocks, window_sec: float = 600.0, search_sec: float = 20.0):
+    """Regroup sample blocks into (offset_sec, samples) windows.
+
+    Each window is at most window_sec long; its end is moved back to the
+    quietest point in the last search_sec. Only one window (plus the block
+    being copied in) is held in memory at a time.
+    """
+    window = int(window_sec * SAMPLE_RATE)
+    search = min(int(search_sec * SAMPLE_RATE), window // 2)
+    buf = np.empty(window, dtype=np.float32)
+    n = 0
+    offset = 0
+    for block in blocks:
+        while len(block):
+            take = min(len(block), len(buf) - n)
+            buf[n:n + take] = block[:take]
+            n += take
+            block = block[take:]
+            while n >= window:
+                cut = quietest_cut(buf, window - search, window)
+                yield offset / SAMPLE_RATE, buf[:cut].copy()
+                buf[:n - cut] = buf[cut:n]
+                n -= cut
+                offset += cut
+    if n:
+        yield offset / SAMPLE_RATE, buf[:n].copy()
+
+
+def extract_wav(video_path: str, audio_path: str) -> int:
+    """Extract mono 16kHz WAV. Returns file size in bytes."""
+    cmd = [
+        "ffmpeg", "-y", "-i", video_path,
+        "-ac", "1", "-ar", str(SAMPLE_RATE), "-c:a", "pcm_s16le",
+        audio_path,
+    ]
+    subprocess.check_call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return os.path.getsize(audio_path)
+
+
+def read_wav(audio_path: str) -> np.ndarray:
+    """float32 samples of a mono 16 kHz pcm_s16le WAV (extract_wav output)."""
+    with wave.open(audio_path, "rb") as w:
+        pcm = w.readframes(w.getnframes())
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
@@ -0,0 +1,357 @@
+"""
+Cross-job batched ASR
+- Admitted jobs are decoded and VAD-split into <=30 s chunks on prefetch
+  threads while the model is busy with earlier jobs, one audio window at a
+  time: a job's chunks are queued as each window is split, and its
+  prefetch thread waits while queue_chunks of them are still queued, so a
+  long recording is never held as one array (or one feature stack)
+- One inference thread takes chunks FIFO across jobs and runs them through the
+  backend batch_size at a time, so the tail of one job shares a batch with the
+  head of the next
+- Results are put back in per-job chunk order: each run of chunks done
+  from the front of a job is handed to its commit() (the checkpoint), so a
+  re-delivered job resumes past them. commit()/done()/failed() run on a
+  separate finisher thread so DB and artifact writes never stall the model
+- Jobs the batches cannot serve (another decode profile) go through
+  submit_alone(): job.process() one at a time on its own thread, counted
+  against max_jobs like the batched ones
+- Backends are pluggable: WhisperBackend wraps faster-whisper's
+  BatchedInferencePipeline, tests and benchmarks use a CPU stub
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+class Chunk:
+    __slots__ = ("state", "index", "start", "end", "payload")
+
+    def __init__(self, state, index: int, start: float, end: float, payload):
+        self.state = state
+        self.index = index
+        self.start = start
+        self.end = end
+        self.payload = payload
+
+
+class _JobState:
+    def __init__(self, job, total: float):
+        self.job = job
+        self.total = total     # duration hint for progress; 0 = unknown
+        self.duration = 0.0    # audio loaded so far
+        self.results = []      # per chunk: None until inferred, () once committed
+        self.spans = []        # per chunk: (start, end)
+        self.next = 0          # first chunk not committed
+        self.queued = 0        # chunks in pending
+        self.left = 0          # chunks not inferred yet
+        self.loaded = False    # every window split
+        self.speech = 0.0
+        self.failed = False
+
+
+# ─── Backends ───
+# prepare(samples) -> [(start_sec, end_sec, payload)]   prefetch threads, CPU
+# infer([Chunk]) -> [[{start, end, text}]]              inference thread; absolute times
+
+
+class WhisperBackend:
+    """faster-whisper BatchedInferencePipeline split into its CPU half
+    (Silero VAD + log-mel features) and its GPU half (forward on a batch)."""
+
+    def __init__(self, model, language: str = "th", beam_size: int = 5, chunk_sec: int = 30):
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+        from faster_whisper.transcribe import BatchedInferencePipeline
+        from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps, merge_segments
+
+        self.model = model
+        self.language = language
+        self.pipeline = BatchedInferencePipeline(model)
+        self.tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual,
+                                   task="transcribe", language=language)
+        self.vad = VadOptions(max_speech_duration_s=chunk_sec, min_silence_duration_ms=160)
+        # Build the decode options exactly as pipeline.transcribe() would; the
+        # segment generator it returns is lazy, so nothing is decoded here.
+        _, info = self.pipeline.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32),
+                                           language=language, beam_size=beam_size, vad_filter=False)
+        self.options = info.transcription_options
+        self._pad_or_trim = pad_or_trim
+        self._speech = lambda x: merge_segments(get_speech_timestamps(x, self.vad), self.vad)
+        self._collect = collect_chunks
+
+    def prepare(self, samples: np.ndarray) -> list:
+        clips = self._speech(samples)
+        if not clips:
+            return []
+        chunks, metas = self._collect(samples, clips)
+        fe = self.model.feature_extractor
+        return [(m["start_time"], m["end_time"], self._pad_or_trim(fe(c)[..., :-1]))
+                for c, m in zip(chunks, metas)]
+
+    def infer(self, chunks: list) -> list:
+        features = np.stack([c.payload for c in chunks])
+        metas = [{"start_time": c.start, "end_time": c.end} for c in chunks]
+        out = self.pipeline.forward(features, self.tokenizer, metas, self.options)
+        return [[{"start": round(s["start"], 2), "end": round(s["end"], 2), "text": s["text"].strip()}
+                 for s in segs] for segs in out]
+
+
+class StubBackend:
+    """CPU stand-in: fixed-length chunks, one segment per chunk.
+
+    infer() sleeps batch_cost + item_cost * len(chunks) to mimic a GPU whose
+    per-call overhead is amortised by batching.
+    """
+
+    language = "th"
+
+    def __init__(self, chunk_sec: float = 30.0, batch_cost: float = 0.0, item_cost: float = 0.0):
+        self.chunk_sec = chunk_sec
+        self.batch_cost = batch_cost
+        self.item_cost = item_cost
+        self.batches = []
+
+    def prepare(self, samples: np.ndarray) -> list:
+        step = int(self.chunk_sec * SAMPLE_RATE)
+        return [(i / SAMPLE_RATE, min(i + step, len(samples)) / SAMPLE_RATE, None)
+                for i in range(0, len(samples), step)]
+
+    def infer(self, chunks: list) -> list:
+        self.batches.append(len(chunks))
+        if self.batch_cost or self.item_cost:
+            time.sleep(self.batch_cost + self.item_cost * len(chunks))
+        return [[{"start": c.start, "end": c.end, "text": f"{c.start:.2f}"}] for c in chunks]
+
+
+# ─── Scheduler ───
+
+class BatchScheduler:
+    """Feeds chunks from up to max_jobs admitted jobs to one backend.
+
+    A job is any object with load() -> (duration hint, iterable of
+    (offset_sec, float32 samples) windows), progress(done, total),
+    commit(segs, position, speech_sec), done(meta) and failed(exc).
+    commit() gets the job's segments in order, each call covering its audio
+    up to position seconds (speech_sec of it VAD speech); done() follows
+    the last one. load(), the windows and backend.prepare() run on prefetch
+    threads; commit()/done()/failed() on the finisher thread.
+    """
+
+    def __init__(self, backend, batch_size: int = 8, max_jobs: int = 3, prefetch_threads: int = 2,
+                 fill_wait: float = 0.05, queue_chunks: int = 64):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_jobs = max_jobs
+        self.fill_wait = fill_wait  # wait this long for a job still decoding to top up a batch
+        self.queue_chunks = queue_chunks  # per job; the next window is split once fewer are queued
+        self.pending = deque()
+        self.active = 0
+        self.preparing = 0
+        self._cond = threading.Condition()
+        self._prefetch = ThreadPoolExecutor(prefetch_threads, thread_name_prefix="asr-prefetch")
+        self._finisher = ThreadPoolExecutor(1, thread_name_prefix="asr-finish")
+        self._alone = ThreadPoolExecutor(1, thread_name_prefix="asr-alone")
+        self._thread = None
+        self._stop = False
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="asr-infer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join()
+        self._prefetch.shutdown()
+        self._alone.shutdown()
+        self._finisher.shutdown()
+
+    def wait_capacity(self, timeout: float = None) -> bool:
+        """True once fewer than max_jobs jobs are in flight."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.active < self.max_jobs, timeout)
+
+    def drain(self, timeout: float = None) -> bool:
+        """True once every submitted job has finished."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.active == 0, timeout)
+
+    def submit(self, job):
+        with self._cond:
+            self.active += 1
+            self.preparing += 1
+        self._prefetch.submit(self._prepare, job)
+
+    def submit_alone(self, job):
+        """Run job.process() outside the batches (failed(exc) if it raises)."""
+        with self._cond:
+            self.active += 1
+        self._alone.submit(self._process, job)
+
+    def _process(self, job):
+        try:
+            job.process()
+        except Exception as e:
+            self._complete(job, e, None)
+            return
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    # ─── prefetch threads ───
+
+    def _prepare(self, job):
+        state = None
+        try:
+            total, windows = job.load()
+            state = _JobState(job, total)
+            for offset, samples in windows:
+                parts = self.backend.prepare(samples)
+                end = offset + len(samples) / SAMPLE_RATE
+                del samples
+                if not self._queue(state, offset, end, parts):
+                    break  # failed meanwhile (a batch with its chunks)
+        except Exception as e:
+            with self._cond:
+                self.preparing -= 1
+            if state is None:
+                self._finish(job, e)
+            else:
+                self._fail_state(state, e)
+            return
+        with self._cond:
+            self.preparing -= 1
+            state.loaded = True
+            last = not state.left and not state.failed
+        if last:  # no speech at all, or the model was quicker than the decode
+            self._finish_state(state)
+
+    def _queue(self, state: _JobState, offset: float, end: float, parts: list) -> bool:
+        """Queue the chunks of one window (times shifted by offset). False if
+        the job failed."""
+        with self._cond:
+            self._cond.wait_for(lambda: state.queued < self.queue_chunks or state.failed or self._stop)
+            if state.failed:
+                return False
+            n = len(state.results)
+            state.results.extend([None] * len(parts))
+            state.spans.extend((offset + start, offset + stop) for start, stop, _ in parts)
+            state.queued += len(parts)
+            state.left += len(parts)
+            state.duration = end
+            state.speech += sum(stop - start for start, stop, _ in parts)
+            self.pending.extend(Chunk(state, n + i, offset + start, offset + stop, payload)
+                                for i, (start, stop, payload) in enumerate(parts))
+            self._cond.notify_all()
+        return True
+
+    # ─── inference thread ───
+
+    def _take_batch(self) -> list:
+        with self._cond:
+            self._cond.wait_for(lambda: self.pending or self._stop)
+            if len(self.pending) < self.batch_size and self.preparing and not self._stop:
+                self._cond.wait_for(lambda: len(self.pending) >= self.batch_size or not self.preparing,
+                                    self.fill_wait)
+            n = min(self.batch_size, len(self.pending))
+            batch = [self.pending.popleft() for _ in range(n)]
+            for c in batch:
+                c.state.queued -= 1
+            self._cond.notify_all()  # prefetch threads waiting on queue_chunks
+            return batch
+
+    def _run(self):
+        while not self._stop:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                results = self.backend.infer(batch)
+            except Exception as e:
+                for state in {c.state for c in batch}:
+                    self._fail_state(state, e)
+                continue
+            for chunk, segs in zip(batch, results):
+                state = chunk.state
+                if state.failed:
+                    continue
+                state.results[chunk.index] = segs
+                with self._cond:
+                    state.left -= 1
+                    last = state.loaded and not state.left
+                self._commit_ready(state)
+                state.job.progress(chunk.end, state.total or state.duration)
+                if last:
+                    self._finish_state(state)
+
+    # ─── finishing ───
+
+    def _commit_ready(self, state: _JobState):
+        """Hand the chunks done from state.next on to job.commit(), in order."""
+        segs, speech, i = [], 0.0, state.next
+        while i < len(state.results) and state.results[i] is not None:
+            segs.extend(state.results[i])
+            speech += state.spans[i][1] - state.spans[i][0]
+            state.results[i] = ()
+            i += 1
+        if i == state.next:
+            return
+        state.next = i
+        self._finisher.submit(self._commit, state, segs, state.spans[i - 1][1], speech)
+
+    def _commit(self, state: _JobState, segs: list, position: float, speech: float):
+        if state.failed:
+            return
+        try:
+            state.job.commit(segs, position, speech)
+        except Exception as e:
+            self._fail_state(state, e)
+
+    def _fail_state(self, state: _JobState, e: Exception):
+        with self._cond:
+            if state.failed:
+                return
+            state.failed = True
+            self.pending = deque(c for c in self.pending if c.state is not state)
+            self._cond.notify_all()
+        self._finish(state.job, e)
+
+    def _finish_state(self, state: _JobState):
+        meta = {
+            "language": self.backend.language,
+            "probability": 1.0,
+            "duration": round(state.duration, 2),
+            "speech_sec": round(state.speech, 2),
+        }
+        self._finisher.submit(self._complete_state, state, meta)
+
+    def _complete_state(self, state: _JobState, meta: dict):
+        if not state.failed:  # else a commit failed it, and _complete() is queued
+            self._complete(state.job, None, meta)
+
+    def _finish(self, job, error, meta=None):
+        self._finisher.submit(self._complete, job, error, meta)
+
+    def _complete(self, job, error, meta):
+        try:
+            if error is None:
+                try:
+                    job.done(meta)
+                except Exception as e:
+                    job.failed(e)
+            else:
+                job.failed(error)
+        except Exception as e:
+            print(f"[BATCH] failure handler raised: {e}")
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify_all()
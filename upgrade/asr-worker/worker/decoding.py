@@ -0,0 +1,161 @@
+"""
+Decode profiles + confidence-driven escalation
+- Profiles: accurate is the full search (beam_size=10, best_of=10, the
+  0.0/0.2/0.4 temperature fallback); balanced is beam 5 and fast greedy,
+  both without the fallback
+- select_profile(): the message's decode_profile, else accurate for the
+  urgent lane (someone is waiting to assess it), else by analysis_mode
+  (ASR_PROFILE_BY_MODE), else ASR_PROFILE
+- Decoder: a transcribe(samples, offset) -> (segment iterator, meta)
+  callable for worker/transcript.py over any model with faster-whisper's
+  model.transcribe(). In fast / balanced, a run of consecutive segments
+  with avg_logprob < ESCALATE_LOGPROB or compression_ratio >
+  ESCALATE_COMPRESSION (what triggers whisper's own temperature fallback,
+  stricter on log-prob) is decoded again, its audio only, with the
+  accurate settings; the result replaces the run unless it scores worse.
+  Segments stay lazy: only the current low-confidence run is buffered
+- meta["decode"]: profile + escalation counts of the call, updated as the
+  iterator is consumed (Transcriber sums them into transcript.json meta)
+"""
+
+import os
+
+SAMPLE_RATE = 16000
+
+ACCURATE = "accurate"
+PROFILES = {
+    "fast": {"beam_size": 1, "best_of": 1, "temperature": [0.0]},
+    "balanced": {"beam_size": 5, "best_of": 5, "temperature": [0.0]},
+    ACCURATE: {"beam_size": 10, "best_of": 10, "temperature": [0.0, 0.2, 0.4]},
+}
+
+ASR_PROFILE = os.getenv("ASR_PROFILE", "balanced")  # when neither the message nor the mode picks one
+ASR_PROFILE_BY_MODE = os.getenv("ASR_PROFILE_BY_MODE", "TEXT_ONLY=fast,FULL=balanced")
+ASR_PROFILE_URGENT = os.getenv("ASR_PROFILE_URGENT", ACCURATE)  # lane "urgent" (common/fairqueue.py); "" = by mode
+ESCALATE_LOGPROB = float(os.getenv("ESCALATE_LOGPROB", "-0.7"))  # whisper falls back below -1.0
+ESCALATE_COMPRESSION = float(os.getenv("ESCALATE_COMPRESSION", "2.4"))  # repetition loops
+ESCALATE_SPAN_MAX_SEC = float(os.getenv("ESCALATE_SPAN_MAX_SEC", "30"))  # one whisper window per re-decode
+
+STATS = ("segments", "low_confidence", "redecoded", "redecoded_sec", "replaced")
+
+
+def parse_modes(spec: str) -> dict:
+    """"TEXT_ONLY=fast,FULL=balanced" -> {mode: profile}."""
+    out = {}
+    for item in spec.split(","):
+        mode, _, profile = item.partition("=")
+        if mode.strip() and profile.strip() in PROFILES:
+            out[mode.strip()] = profile.strip()
+    return out
+
+
+def select_profile(requested: str = None, analysis_mode: str = None, lane: str = None,
+                   default: str = None, by_mode: dict = None, urgent: str = None) -> str:
+    """Profile of one job; unknown names fall through to the next rule."""
+    default = default or ASR_PROFILE
+    default = default if default in PROFILES else "balanced"
+    by_mode = parse_modes(ASR_PROFILE_BY_MODE) if by_mode is None else by_mode
+    urgent = ASR_PROFILE_URGENT if urgent is None else urgent
+    if requested in PROFILES:
+        return requested
+    if lane == "urgent" and urgent in PROFILES:
+        return urgent
+    return by_mode.get(analysis_mode, default)
+
+
+def decode_params(profile: str) -> dict:
+    """Settings of profile that change the transcript (artifact cache key).
+    accurate gives exactly the keys of the single-profile worker, so its
+    cached transcripts stay valid."""
+    params = dict(PROFILES[profile])
+    if profile != ACCURATE:
+        params.update(profile=profile, escalate_logprob=ESCALATE_LOGPROB,
+                      escalate_compression=ESCALATE_COMPRESSION, escalate_span_max_sec=ESCALATE_SPAN_MAX_SEC)
+    return params
+
+
+class Decoder:
+    """transcribe_fn for worker/transcript.py: model.transcribe() with the
+    options of profile, low-confidence runs re-decoded as accurate.
+
+    model.transcribe(samples, **options) returns (segments, info) as
+    faster-whisper does: segments with start / end (seconds into samples),
+    text, avg_logprob and compression_ratio; info with language and
+    language_probability.
+    """
+
+    def __init__(self, model, profile: str = "balanced", language: str = "th",
+                 logprob_min: float = ESCALATE_LOGPROB, compression_max: float = ESCALATE_COMPRESSION,
+                 span_max_sec: float = ESCALATE_SPAN_MAX_SEC):
+        if profile not in PROFILES:
+            raise ValueError(f"unknown decode profile {profile!r} (profiles: {list(PROFILES)})")
+        self.model = model
+        self.profile = profile
+        self.language = language
+        self.logprob_min = logprob_min
+        self.compression_max = compression_max
+        self.span_max_sec = span_max_sec
+
+    def _transcribe(self, samples, profile: str):
+        return self.model.transcribe(samples, language=self.language, task="transcribe",
+                                     vad_filter=False, **PROFILES[profile])
+
+    def low(self, s) -> bool:
+        return s.avg_logprob < self.logprob_min or s.compression_ratio > self.compression_max
+
+    def __call__(self, samples, offset: float = 0.0):
+        segments, info = self._transcribe(samples, self.profile)
+        counts = {"profile": self.profile, **dict.fromkeys(STATS, 0)}
+        meta = {"language": info.language, "probability": round(info.language_probability, 4),
+                "decode": counts}
+        escalate = self.profile != ACCURATE
+
+        def out(s, shift: float = 0.0, cap: float = None):
+            counts["segments"] += 1
+            end = shift + float(s.end) if cap is None else min(shift + float(s.end), cap)
+            return {
+                "start": round(offset + min(shift + float(s.start), end), 2),
+                "end": round(offset + end, 2),
+                "text": s.text.strip(),
+            }
+
+        def segs():
+            run = []
+            for s in segments:
+                if escalate and self.low(s):
+                    counts["low_confidence"] += 1
+                    if run and s.end - run[0].start > self.span_max_sec:
+                        yield from self._escalate(samples, run, counts, out)
+                        run = []
+                    run.append(s)
+                    continue
+                if run:
+                    yield from self._escalate(samples, run, counts, out)
+                    run = []
+                yield out(s)
+            if run:
+                yield from self._escalate(samples, run, counts, out)
+        return segs(), meta
+
+    def _escalate(self, samples, run: list, counts: dict, out):
+        """Decode the audio under run again as accurate; the better of the
+        two transcripts, in order."""
+        start, end = float(run[0].start), float(run[-1].end)
+        clip = samples[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+        counts["redecoded"] += 1
+        counts["redecoded_sec"] = round(counts["redecoded_sec"] + end - start, 2)
+        again, _ = self._transcribe(clip, ACCURATE)
+        again = [s for s in again if s.text.strip()]
+        if again and self._score(again) >= self._score(run):
+            counts["replaced"] += 1
+            for s in again:
+                yield out(s, start, end)
+            return
+        for s in run:
+            yield out(s)
+
+    def _score(self, segs: list) -> tuple:
+        """(fewer low-confidence segments, higher duration-weighted log-prob)."""
+        dur = [max(float(s.end - s.start), 0.01) for s in segs]
+        logprob = sum(d * s.avg_logprob for d, s in zip(dur, segs)) / sum(dur)
+        return -sum(self.low(s) for s in segs), logprob
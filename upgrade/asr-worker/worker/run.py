@@ -1,93 +1,164 @@
 """
 asr-worker: GPU-only ASR with faster-whisper
-- Reads from Redis queue:jobs
-- Extracts audio via ffmpeg
-- Transcribes with faster-whisper (CUDA only, NO CPU fallback)
-- Writes transcript artifacts
+- Reads from Redis queue:jobs through the reliable queue (common/jobqueue.py):
+  messages are leased, acked when done, re-claimed from a worker that died
+  and retried up to QUEUE_MAX_ATTEMPTS times before the dead-letter list
+- QUEUE_SCHEDULER=fair claims fairly across users, shortest lesson first
+  and urgent lane first (common/fairqueue.py); fifo = arrival order
+- Streams decoded PCM from ffmpeg straight into the model (AUDIO_MODE=stream);
+  recordings over AUDIO_STREAM_MAX_SEC go through bounded-memory windows,
+  in the batched path too
+- FULL jobs (DEMUX_FRAMES): the same ffmpeg also writes the sampled frames
+  to demux/frames.mjpeg for the vision-worker, so the video is read and
+  decoded once; the ffprobe result is shared as raw/media.json (common/media.py)
+- AUDIO_MODE=file keeps the old audio.wav path (quota reserved via the shared
+  Redis ledger)
+- Energy VAD skips silence; speech chunks are transcribed independently
+  (ASR_PARALLEL_CHUNKS at a time) and stitched back in absolute time
+- Transcribes with faster-whisper (CUDA only, NO CPU fallback); with
+  ASR_BATCH_SIZE > 0 chunks of several jobs share batched inference calls
+- Per-job decode profile (fast / balanced / accurate) from the message, the
+  lane or analysis_mode; fast and balanced re-decode only low-confidence
+  segments with the accurate settings (worker/decoding.py). With
+  ASR_BATCH_SIZE > 0, profiles in ASR_BATCH_PROFILES are batched (beam
+  ASR_BATCH_BEAM_SIZE, no escalation), the others (accurate: the urgent
+  lane) still go through the sequential decoder
+- Segments are checkpointed to an append-only file as the model yields them
+  (batched: as each job's chunks come back in order); whichever worker gets
+  a re-delivered message resumes the job from its last committed position
+  (worker/transcript.py)
+- Writes transcript artifacts from the checkpoint in one pass; re-uploads of
+  the same video (same content hash + model + decode params) get them
+  hardlinked from the artifact cache; .gz / .br siblings are written once
+  for media-api to send as they are (common/precompress.py)
 - Updates MariaDB job status
-- On FULL mode: pushes to queue:frames for vision-worker
+- Publishes stage transitions + transcription progress to Redis (job:{id}:events)
+- Adds each finished transcript to the search index (common/textindex.py)
+- On FULL mode: pushes to queue:frames for vision-worker; writes
+  artifacts/timeline.json if the frames are already done (common/timeline.py)
+- Stage timers, ASR real-time factor, queue depth and DB latency are
+  exported on METRICS_PORT (common/metrics.py)
 """
 
 import os
+import socket
 import sys
 import time
 import json
 import traceback
-import subprocess
 import shutil
 
 import redis
-import mysql.connector
 from faster_whisper import WhisperModel
 
+from common import cas, fairqueue, media, metrics, precompress, progress, textindex, timeline
+from common.db import Database
+from common.fairqueue import FairQueue
+from common.jobqueue import JobQueue
+from common.quota import QuotaLedger
+from worker import audio, batching, decoding, transcript
+
 # ─── Config ───
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 DATA_ROOT = os.getenv("DATA_ROOT", "/data/jobs")
 MODEL_NAME = os.getenv("MODEL_NAME", "large-v3")
 COMPUTE_TYPE = os.getenv("COMPUTE_TYPE", "float16")
 NO_CPU_FALLBACK = os.getenv("NO_CPU_FALLBACK", "true").lower() == "true"
-
-DB_HOST = os.getenv("DB_HOST", "host.docker.internal")
-DB_PORT = int(os.getenv("DB_PORT", "3306"))
-DB_USER = os.getenv("DB_USER", "root")
-DB_PASS = os.getenv("DB_PASS", "")
-DB_NAME = os.getenv("DB_NAME", "teachermon")
+QUOTA_BYTES = int(os.getenv("QUOTA_BYTES_PER_USER", "1073741824"))
+QUOTA_RECONCILE_SEC = float(os.getenv("QUOTA_RECONCILE_SEC", "30"))
+AUDIO_BYTES_PER_SEC = audio.SAMPLE_RATE * audio.BYTES_PER_SAMPLE  # mono 16 kHz pcm_s16le
+AUDIO_MODE = os.getenv("AUDIO_MODE", "stream")  # stream | file
+AUDIO_STREAM_MAX_SEC = float(os.getenv("AUDIO_STREAM_MAX_SEC", "3600"))
+AUDIO_WINDOW_SEC = float(os.getenv("AUDIO_WINDOW_SEC", "600"))
+ASR_VAD = os.getenv("ASR_VAD", "energy")  # energy | off
+ASR_CHUNK_MAX_SEC = float(os.getenv("ASR_CHUNK_MAX_SEC", "120"))
+ASR_PARALLEL_CHUNKS = int(os.getenv("ASR_PARALLEL_CHUNKS", "1"))  # model replicas (VRAM!)
+ASR_BATCH_SIZE = int(os.getenv("ASR_BATCH_SIZE", "0"))  # 0 = one job at a time, full beam search
+ASR_BATCH_BEAM_SIZE = int(os.getenv("ASR_BATCH_BEAM_SIZE", "5"))
+ASR_BATCH_PROFILES = {p.strip() for p in os.getenv("ASR_BATCH_PROFILES", "fast,balanced").split(",")
+                      if p.strip()}  # decode profiles the batches serve (no escalation); others run sequentially
+ASR_MAX_JOBS = int(os.getenv("ASR_MAX_JOBS", "3"))  # jobs admitted at once (decoding + inference)
+ASR_PREFETCH_THREADS = int(os.getenv("ASR_PREFETCH_THREADS", "2"))
+DEMUX_FRAMES = os.getenv("DEMUX_FRAMES", "true").lower() == "true"  # FULL: frames from the audio ffmpeg pass
+FRAME_INTERVAL = int(os.getenv("FRAME_INTERVAL_SEC", "5"))  # must match the vision-worker's
+FRAME_QSCALE = 3  # vision-worker JPEG_QSCALE
+EARLY_FRAMES_TTL_SEC = 7 * 24 * 3600
+ASR_WORKER_ID = os.getenv("ASR_WORKER_ID") or socket.gethostname()
+QUEUE_VISIBILITY_SEC = float(os.getenv("QUEUE_VISIBILITY_SEC", "300"))  # lease lost after this without heartbeat
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+QUEUE_SCHEDULER = os.getenv("QUEUE_SCHEDULER", "fair")  # fair (common/fairqueue.py) | fifo; same on every consumer
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))  # 0 = no exporter
+TEXT_INDEX_ROOT = os.getenv("TEXT_INDEX_ROOT", "/data/index")  # transcript search index; "" = off
 
 # ─── Redis ───
 r = redis.from_url(REDIS_URL)
 
-# ─── DB helpers ───
+queue = (FairQueue if QUEUE_SCHEDULER == "fair" else JobQueue)(
+    r, "queue:jobs", ASR_WORKER_ID, QUEUE_VISIBILITY_SEC, QUEUE_MAX_ATTEMPTS)
+PERMANENT_ERRORS = (OverflowError, FileNotFoundError, LookupError)  # failed without a retry
 
-def get_db():
-    return mysql.connector.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        user=DB_USER,
-        password=DB_PASS,
-        database=DB_NAME,
-        charset="utf8mb4",
-        collation="utf8mb4_unicode_ci",
-    )
+# ─── DB helpers (pooled, see common/db.py) ───
+db = Database.from_env()
 
 
 def update_job_status(job_id: str, status: str, extra: dict = None):
     """Update analysis_job row. extra = dict of column->value pairs."""
-    conn = get_db()
-    try:
-        cur = conn.cursor()
-        sets = ["status = %s", "updated_at = NOW()"]
-        vals = [status]
-        if extra:
-            for k, v in extra.items():
-                sets.append(f"{k} = %s")
-                vals.append(v)
-        vals.append(job_id)
-        sql = f"UPDATE analysis_job SET {', '.join(sets)} WHERE id = %s"
-        cur.execute(sql, vals)
-        conn.commit()
-    finally:
-        conn.close()
+    db.update_job(job_id, {"status": status, **(extra or {})})
+    progress.publish(r, job_id, status=status, **(extra or {}))
 
 
 def get_job_mode(job_id: str) -> str:
-    """Return analysis_mode for a job."""
-    conn = get_db()
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT analysis_mode FROM analysis_job WHERE id = %s", (job_id,)
-        )
-        row = cur.fetchone()
-        return row[0] if row else "TEXT_ONLY"
-    finally:
-        conn.close()
+    """Return analysis_mode for a job (cached for the life of the job)."""
+    meta = db.job_meta(job_id)
+    return meta["analysis_mode"] if meta else "TEXT_ONLY"
+
+
+def get_job_user_id(job_id: str) -> str | None:
+    """Return the user_id that owns this job (cached for the life of the job)."""
+    meta = db.job_meta(job_id)
+    return meta["user_id"] if meta else None
+
+
+# ─── Quota ledger ───
+ledger = QuotaLedger(r, QUOTA_BYTES, connect=db.connect)
+
+# ─── Artifact cache (see common/cas.py) ───
+cache = cas.ArtifactCache.from_env(r)
+TRANSCRIPT_FILES = ["transcript.json", "transcript.txt", "transcript.srt"]
+
+
+def job_profile(job_id: str, data: dict, analysis_mode: str) -> str:
+    """Decode profile of a job (worker/decoding.py): decode_profile in the
+    message, else by lane (message or sched:job), else by analysis_mode."""
+    lane = data.get("lane")
+    if lane is None:
+        rec = r.get(fairqueue.job_key(job_id))
+        lane = json.loads(rec).get("lane") if rec else None
+    return decoding.select_profile(data.get("decode_profile"), analysis_mode, lane)
+
+
+def batched(profile: str) -> bool:
+    """Jobs of profile share the batched inference calls (ASR_BATCH_SIZE > 0)."""
+    return ASR_BATCH_SIZE > 0 and profile in ASR_BATCH_PROFILES
+
+
+def decode_params(profile: str) -> dict:
+    """Everything besides the audio that changes the transcript (cache key)."""
+    if batched(profile):
+        return {"pipeline": "batched", "beam_size": ASR_BATCH_BEAM_SIZE, "vad": "silero"}
+    params = {"pipeline": "sequential", "language": "th", **decoding.decode_params(profile)}
+    if AUDIO_MODE != "file" and ASR_VAD != "off":
+        params.update(vad=ASR_VAD, chunk_max_sec=ASR_CHUNK_MAX_SEC)
+    return params
 
 
 # ─── GPU model init ───
 
 print(f"[INIT] Loading model {MODEL_NAME} (compute={COMPUTE_TYPE}) on GPU...")
 try:
-    model = WhisperModel(MODEL_NAME, device="cuda", compute_type=COMPUTE_TYPE)
+    with metrics.timer(stage="model_load"):
+        model = WhisperModel(MODEL_NAME, device="cuda", compute_type=COMPUTE_TYPE,
+                             num_workers=ASR_PARALLEL_CHUNKS)
     print("[INIT] Model loaded successfully on CUDA")
 except Exception as e:
     print(f"[FATAL] Cannot load model on GPU: {e}")
@@ -112,167 +183,426 @@ def find_video_file(raw_dir: str) -> str | None:
     return None
 
 
+def early_frames_key(job_id: str) -> str:
+    """Set once the frames job was queued from the demux pass."""
+    return f"frames:early:{job_id}"
+
+
+def get_video_duration(video_path: str) -> float:
+    """Video duration in seconds (ffprobe once per video, raw/media.json)."""
+    with metrics.timer(stage="probe"):
+        return media.load(os.path.dirname(video_path), video_path)["duration"]
+
+
 def ffmpeg_extract_audio(video_path: str, audio_path: str) -> int:
     """Extract mono 16kHz WAV. Returns file size in bytes."""
-    cmd = [
-        "ffmpeg", "-y", "-i", video_path,
-        "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le",
-        audio_path,
-    ]
-    subprocess.check_call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    return os.path.getsize(audio_path)
-
-
-def transcribe(audio_path: str):
-    """GPU-only transcription. Raises on any error (no CPU fallback)."""
-    segments, info = model.transcribe(
-        audio_path,
-        language="th",
-        task="transcribe",
-        beam_size=10,
-        best_of=10,
-        vad_filter=False,
-        temperature=[0.0, 0.2, 0.4],
-    )
-    segs = []
-    for s in segments:
-        segs.append({
-            "start": round(float(s.start), 2),
-            "end": round(float(s.end), 2),
-            "text": s.text.strip(),
-        })
-    meta = {
-        "language": info.language,
-        "probability": round(info.language_probability, 4),
-        "duration": round(info.duration, 2) if hasattr(info, "duration") else None,
-    }
-    return segs, meta
-
-
-def write_artifacts(art_dir: str, segs: list, meta: dict):
-    """Write transcript.json, transcript.txt, transcript.srt."""
-    os.makedirs(art_dir, exist_ok=True)
-
-    # JSON
-    with open(os.path.join(art_dir, "transcript.json"), "w", encoding="utf-8") as f:
-        json.dump({"segments": segs, "meta": meta}, f, ensure_ascii=False, indent=2)
-
-    # Plain text
-    with open(os.path.join(art_dir, "transcript.txt"), "w", encoding="utf-8") as f:
-        for s in segs:
-            f.write(f"[{s['start']:.2f}-{s['end']:.2f}] {s['text']}\n")
-
-    # SRT
-    with open(os.path.join(art_dir, "transcript.srt"), "w", encoding="utf-8") as f:
-        for i, s in enumerate(segs, 1):
-            start_h = int(s["start"] // 3600)
-            start_m = int((s["start"] % 3600) // 60)
-            start_s = int(s["start"] % 60)
-            start_ms = int((s["start"] % 1) * 1000)
-            end_h = int(s["end"] // 3600)
-            end_m = int((s["end"] % 3600) // 60)
-            end_s = int(s["end"] % 60)
-            end_ms = int((s["end"] % 1) * 1000)
-            f.write(f"{i}\n")
-            f.write(
-                f"{start_h:02d}:{start_m:02d}:{start_s:02d},{start_ms:03d}"
-                f" --> "
-                f"{end_h:02d}:{end_m:02d}:{end_s:02d},{end_ms:03d}\n"
-            )
-            f.write(f"{s['text']}\n\n")
+    with metrics.timer(stage="extract_audio"):
+        size = audio.extract_wav(video_path, audio_path)
+    metrics.BYTES.inc(size, kind="audio_wav")
+    return size
 
 
-def cleanup_on_failure(job_id: str):
-    """Remove audio + frames dirs on failure to free space."""
-    for subdir in ("audio", "frames"):
-        d = os.path.join(DATA_ROOT, job_id, subdir)
-        if os.path.isdir(d):
-            shutil.rmtree(d, ignore_errors=True)
+def transcriber(profile: str) -> decoding.Decoder:
+    """GPU-only transcription with the settings of profile. Raises on any
+    error (no CPU fallback).
 
+    Called as transcribe(samples, offset): a lazy iterator of segments
+    (timestamps shifted by offset, the position of samples in the
+    recording) and the detected language + decode stats; the model decodes
+    as the iterator is consumed.
+    """
+    return decoding.Decoder(model, profile, language="th")
 
-# ─── Main loop ───
 
-def main():
-    print("[START] asr-worker ready — waiting for jobs on queue:jobs")
-    while True:
-        item = r.blpop("queue:jobs", timeout=5)
-        if not item:
-            continue
+def audio_windows(video_path: str, duration: float, demux: dict = None):
+    """Streaming mode: (offset_sec, samples) windows from the ffmpeg PCM
+    pipe, no audio.wav on disk.
+
+    Unknown (0) or long durations take the windowed path so a multi-hour
+    recording never has to fit in memory as one array. demux: extra ffmpeg
+    outputs + on_done (AsrJob.demux()).
+    """
+    demux = demux or {}
+    if 0 < duration <= AUDIO_STREAM_MAX_SEC:
+        yield 0.0, audio.decode_audio(video_path, duration, **demux)
+        return
+    yield from audio.iter_audio_windows(audio.iter_pcm_blocks(video_path, **demux), AUDIO_WINDOW_SEC)
+
+
+def transcribe_video(video_path: str, duration: float, tr: transcript.Transcriber, demux: dict = None) -> dict:
+    """Sequential path: audio_windows() through tr. Audio the checkpoint
+    already covers is decoded again but not transcribed."""
+    return tr.run(audio_windows(video_path, duration, demux))
+
 
-        _, raw = item
-        msg = json.loads(raw.decode("utf-8"))
-        job_id = msg["job_id"]
-        analysis_mode = msg.get("analysis_mode", "TEXT_ONLY")
+def build_timeline(art_dir: str):
+    """timeline.json once frames_index.json is there too (the vision-worker
+    does the same on its side). Not fatal: analysis can rebuild it."""
+    try:
+        with metrics.timer(stage="timeline"):
+            tl = timeline.build_if_ready(art_dir)
+        if tl is not None:
+            precompress.write_all(art_dir, [timeline.TIMELINE_FILE])
+            print(f"  [TIMELINE] {len(tl)} segments joined to {len(tl.frame_t)} frames")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"  [TIMELINE] not written: {e}")
+
+
+def index_transcript(job_id: str, art_dir: str):
+    """Add the transcript to the search index (common/textindex.py). Not
+    fatal: the job is done either way, only not searchable."""
+    if not TEXT_INDEX_ROOT:
+        return
+    try:
+        with open(os.path.join(art_dir, timeline.TRANSCRIPT_FILE), encoding="utf-8") as f:
+            segments = json.load(f)["segments"]
+        with metrics.timer(stage="index"):
+            n = textindex.add_job(TEXT_INDEX_ROOT, job_id, segments)
+        print(f"  [INDEX] {n} segments searchable")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"  [INDEX] not indexed: {e}")
+
+
+def remove_audio(job_id: str):
+    """Drop audio/ (AUDIO_MODE=file) after a failure; a retry extracts it again."""
+    d = os.path.join(DATA_ROOT, job_id, "audio")
+    if os.path.isdir(d):
+        shutil.rmtree(d, ignore_errors=True)
 
-        print(f"[JOB] Processing {job_id} (mode={analysis_mode})")
 
-        job_dir = os.path.join(DATA_ROOT, job_id)
-        raw_dir = os.path.join(job_dir, "raw")
-        video_path = find_video_file(raw_dir)
-        if not video_path:
-            update_job_status(job_id, "FAILED", {
+def cleanup_on_failure(job_id: str):
+    """Failed for good: drop the frames spool, and frames:early with it so a
+    re-run (requeue_dead) queues the frames again. frames/ belongs to the
+    vision-worker and is left alone."""
+    media.remove_spool(os.path.join(DATA_ROOT, job_id))
+    r.delete(early_frames_key(job_id))
+
+
+# ─── Jobs ───
+
+class AsrJob:
+    """Worker-side state of one queue:jobs message.
+
+    The sequential loop calls process(); the batch scheduler calls load(),
+    then progress() per chunk, commit() as chunks come back in order and
+    done() or failed() (see worker/batching.py).
+    """
+
+    def __init__(self, msg):
+        self.msg = msg  # common.jobqueue.Message
+        self.job_id = job_id = msg.data["job_id"]
+        self.analysis_mode = msg.data.get("analysis_mode", "TEXT_ONLY")
+        self.profile = job_profile(job_id, msg.data, self.analysis_mode)
+        self.job_dir = job_dir = os.path.join(DATA_ROOT, job_id)
+        self.raw_dir = os.path.join(job_dir, "raw")
+        self.audio_dir = os.path.join(job_dir, "audio")
+        self.art_dir = os.path.join(job_dir, "artifacts")
+        self.audio_path = os.path.join(self.audio_dir, "audio.wav")
+        self.video_path = find_video_file(self.raw_dir)
+        self.user_id = None
+        self.res = None
+        self.cache_key = None
+        self.settings_key = ""
+        self.audio_charged = 0
+        self.ckpt = None  # batched path
+        self.reporter = progress.ProgressReporter(r, job_id)
+        self.job = db.job_writer(job_id, on_change=lambda cols: progress.publish(r, job_id, **cols))
+
+    def start(self) -> bool:
+        """Mark PROCESSING_ASR. False (job already FAILED) if there is no video."""
+        pipeline = "batched" if batched(self.profile) else "sequential"
+        print(f"[JOB] Processing {self.job_id} (mode={self.analysis_mode}, profile={self.profile}, {pipeline})")
+        if not self.video_path:
+            update_job_status(self.job_id, "FAILED", {
                 "error_message": "No video file found in raw directory",
                 "error_code": "VIDEO_NOT_FOUND",
             })
-            print(f"[FAILED] job_id={job_id} No video file found in {raw_dir}")
-            continue
-        audio_dir = os.path.join(job_dir, "audio")
-        art_dir = os.path.join(job_dir, "artifacts")
-        os.makedirs(audio_dir, exist_ok=True)
-        os.makedirs(art_dir, exist_ok=True)
-
-        audio_path = os.path.join(audio_dir, "audio.wav")
+            print(f"[FAILED] job_id={self.job_id} No video file found in {self.raw_dir}")
+            return False
+        if AUDIO_MODE == "file":
+            os.makedirs(self.audio_dir, exist_ok=True)
+        os.makedirs(self.art_dir, exist_ok=True)
+
+        self.user_id = get_job_user_id(self.job_id)
+        self.res = ledger.reservation(self.user_id, f"audio:{self.job_id}")
+        content = cas.read_content_hash(self.raw_dir)
+        self.settings_key = cas.cache_key(content or "", model=MODEL_NAME, compute_type=COMPUTE_TYPE,
+                                          **decode_params(self.profile))
+        if content:
+            self.cache_key = self.settings_key
 
         # --- Mark PROCESSING_ASR ---
-        update_job_status(job_id, "PROCESSING_ASR", {
-            "asr_started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-        })
+        self.job.status("PROCESSING_ASR", asr_started_at=time.strftime("%Y-%m-%d %H:%M:%S"))
+        return True
+
+    def progress(self, done: float, total: float):
+        self.reporter.update(
+            asr_sec=round(done, 1),
+            duration_sec=round(total, 1),
+            progress=round(min(1.0, done / total), 3) if total else None,
+        )
 
+    def checkpoint(self) -> transcript.Checkpoint:
+        ckpt = transcript.Checkpoint(os.path.join(self.art_dir, transcript.CHECKPOINT_FILE), self.settings_key)
+        if ckpt.committed:
+            print(f"  [CKPT] resuming at {ckpt.committed:.1f}s ({ckpt.segments} segments kept)")
+        return ckpt
+
+    def process(self):
+        """Sequential path: decode + transcribe this job alone, resuming from
+        the checkpoint a killed run left behind."""
+        if self.user_id is None:
+            raise LookupError(f"Job not found: {self.job_id}")
+
+        duration = get_video_duration(self.video_path)
+        ckpt = self.checkpoint()
         try:
-            # 1) Extract audio
-            print(f"  [1/3] Extracting audio from {video_path}")
-            audio_bytes = ffmpeg_extract_audio(video_path, audio_path)
-            update_job_status(job_id, "PROCESSING_ASR", {
-                "audio_bytes": audio_bytes,
-                "total_bytes": audio_bytes,  # will be recalculated
-            })
+            t0 = time.perf_counter()
+            with metrics.timer(stage="transcribe"):
+                meta = self.transcribe_into(ckpt, duration)
+            if duration:
+                metrics.ASR_RTF.observe((time.perf_counter() - t0) / duration)
+            print(f"  [2/3] Transcription done: {ckpt.segments} segments")
+            if "decode" in meta:
+                d = meta["decode"]
+                print(f"  [DECODE] {d['profile']}: {d['low_confidence']} low-confidence segments, "
+                      f"{d['redecoded']} spans ({d['redecoded_sec']:.1f}s) re-decoded, {d['replaced']} replaced")
+            n = self.write(ckpt.iter_segments(), meta)
+        finally:
+            ckpt.close()
+        ckpt.remove()
+        self.complete(n)
+
+    def transcribe_into(self, ckpt: transcript.Checkpoint, duration: float) -> dict:
+        tr = transcript.Transcriber(
+            transcriber(self.profile), ckpt,
+            use_vad=AUDIO_MODE != "file" and ASR_VAD != "off",
+            chunk_max_sec=ASR_CHUNK_MAX_SEC,
+            parallel=ASR_PARALLEL_CHUNKS,
+            on_progress=self.progress,
+            total=duration,
+        )
+        if AUDIO_MODE == "file":
+            # 1) Reserve quota for the WAV, then extract audio
+            est_bytes = int(duration * AUDIO_BYTES_PER_SEC) + 4096
+            if not self.res.ensure(est_bytes):
+                raise OverflowError(
+                    f"Estimated audio ({est_bytes / 1024 / 1024:.1f} MB) exceeds remaining quota"
+                )
+            print(f"  [1/3] Extracting audio from {self.video_path}")
+            self.reporter.stage("extract_audio")
+            audio_bytes = ffmpeg_extract_audio(self.video_path, self.audio_path)
+            if not self.res.ensure(audio_bytes):
+                raise OverflowError("Quota exceeded during audio extraction")
+            self.res.commit(audio_bytes)
+            self.audio_charged = audio_bytes
+            # buffered: written together with ASR_DONE in one UPDATE
+            self.job.set(audio_bytes=audio_bytes, total_bytes=audio_bytes)  # total will be recalculated
             print(f"  [1/3] Audio extracted: {audio_bytes / 1024 / 1024:.1f} MB")
 
             # 2) Transcribe (GPU only)
             print(f"  [2/3] Transcribing with {MODEL_NAME} on GPU...")
-            segs, meta = transcribe(audio_path)
-            print(f"  [2/3] Transcription done: {len(segs)} segments")
+            self.reporter.stage("transcribe", progress=0.0)
+            return tr.run([(0.0, audio.read_wav(self.audio_path))])
+        else:
+            # 1+2) Decode straight into the model; nothing written, nothing charged
+            self.job.set(audio_bytes=0)
+            print(f"  [1-2/3] Streaming audio from {self.video_path} into {MODEL_NAME} on GPU...")
+            self.reporter.stage("transcribe", progress=0.0)
+            return transcribe_video(self.video_path, duration, tr, self.demux())
+
+    def demux(self) -> dict:
+        """FULL jobs: audio decode kwargs that also spool the sampled frames
+        for the vision-worker. Once ffmpeg finishes the spool is published and
+        the frames job queued (once per job), while transcription goes on."""
+        if not DEMUX_FRAMES or self.analysis_mode != "FULL":
+            return {}
+        if r.exists(early_frames_key(self.job_id)):
+            return {}  # a retry: the vision-worker already has the first attempt's spool
+        print(f"  [DEMUX] frames every {FRAME_INTERVAL}s spooled in the same ffmpeg pass")
+        return {
+            "extra_outputs": media.frames_output_args(self.job_dir, FRAME_INTERVAL, FRAME_QSCALE),
+            "on_done": self.spooled,
+        }
+
+    def spooled(self):
+        media.finish_spool(self.job_dir, FRAME_INTERVAL, FRAME_QSCALE)
+        if r.set(early_frames_key(self.job_id), 1, nx=True, ex=EARLY_FRAMES_TTL_SEC):
+            r.rpush("queue:frames", json.dumps({"job_id": self.job_id, "early": True,
+                                                "queued_at": round(time.time(), 3)}))
+            print(f"  [DEMUX] frames spooled, pushed {self.job_id} to queue:frames ahead of ASR_DONE")
+
+    def load(self):
+        """Batched path, prefetch thread: the duration and the audio windows
+        the sequential path reads (audio_windows()), decoded as the
+        scheduler takes them, from where the checkpoint left off."""
+        if self.user_id is None:
+            raise LookupError(f"Job not found: {self.job_id}")
+        duration = get_video_duration(self.video_path)
+        self.ckpt = self.checkpoint()
+        self.job.set(audio_bytes=0)
+        self.reporter.stage("transcribe", progress=0.0)
+        windows = audio_windows(self.video_path, duration, self.demux())
+        return duration, transcript.resume_windows(windows, self.ckpt.committed)
+
+    def from_cache(self) -> bool:
+        """Same video already transcribed with the same settings: link the
+        transcript instead of decoding anything. True if the job is done."""
+        if not self.cache_key or self.user_id is None:
+            return False
+        manifest = cache.fetch("asr", self.cache_key, self.art_dir)
+        if manifest is None:
+            return False
+        print(f"  [CACHE] transcript reused ({manifest.get('segments')} segments)")
+        self.job.set(audio_bytes=0)
+        self.reporter.stage("write_artifacts", progress=1.0, segments=manifest.get("segments"), cached=True)
+        with metrics.timer(stage="precompress"):
+            precompress.write_all(self.art_dir, TRANSCRIPT_FILES)  # the links are new files
+        self.complete(manifest.get("segments"))
+        return True
+
+    def commit(self, segs: list, position: float, speech_sec: float):
+        """Batched path: the next chunks of the transcript, in order."""
+        for s in segs:
+            self.ckpt.append(s)
+        speech_sec += self.ckpt.state.get("speech_sec", 0.0)
+        self.ckpt.commit(position, speech_sec=round(speech_sec, 2))
+
+    def done(self, meta: dict):
+        """Batched path: every chunk is committed; write from the checkpoint."""
+        meta["speech_sec"] = self.ckpt.state.get("speech_sec", 0.0)
+        meta["decode"] = {"profile": self.profile, "pipeline": "batched", "beam_size": ASR_BATCH_BEAM_SIZE}
+        print(f"  [2/3] Transcription done: {self.ckpt.segments} segments")
+        try:
+            n = self.write(self.ckpt.iter_segments(), meta)
+        finally:
+            self.ckpt.close()
+        self.ckpt.remove()
+        self.complete(n)
+
+    def write(self, segments, meta: dict) -> int:
+        # 3) Write artifacts (one pass over segments)
+        print(f"  [3/3] Writing artifacts...")
+        self.reporter.stage("write_artifacts", progress=1.0)
+        with metrics.timer(stage="write_artifacts"):
+            n = transcript.write_artifacts(self.art_dir, segments, meta)
+        with metrics.timer(stage="precompress"):
+            precompress.write_all(self.art_dir, TRANSCRIPT_FILES)
+        if self.cache_key:
+            try:
+                cache.store("asr", self.cache_key, self.art_dir, TRANSCRIPT_FILES, segments=n)
+            except OSError as e:
+                print(f"  [CACHE] store failed: {e}")
+        return n
+
+    def complete(self, segments: int):
+        # --- Mark ASR_DONE --- (unless frames, started early, already failed the job)
+        self.job.status("ASR_DONE", unless_status="FAILED",
+                        asr_done_at=time.strftime("%Y-%m-%d %H:%M:%S"), has_transcript=1)
+
+        print(f"[DONE] job_id={self.job_id} segments={segments}")
+        index_transcript(self.job_id, self.art_dir)
+        if self.analysis_mode == "FULL":
+            build_timeline(self.art_dir)
+
+        # 4) If FULL mode, enqueue frame extraction (already queued if demuxed)
+        if self.analysis_mode == "FULL" and not r.exists(early_frames_key(self.job_id)):
+            frame_msg = json.dumps({"job_id": self.job_id, "queued_at": round(time.time(), 3)})
+            r.rpush("queue:frames", frame_msg)
+            print(f"  [QUEUE] Pushed {self.job_id} to queue:frames for vision-worker")
+        db.forget_job(self.job_id)
+        self.msg.ack()
+        metrics.JOBS.inc(service="asr", outcome="done")
+
+    def failed(self, e: Exception):
+        # ─── FAIL FAST: no CPU fallback ───
+        err = str(e)
+        tb = "".join(traceback.format_exception(e))
+        print(f"[FAILED] job_id={self.job_id} err={err}\n{tb}")
+
+        if self.res:
+            self.res.release()
+        remove_audio(self.job_id)
+        if self.audio_charged:
+            ledger.adjust(self.user_id, -self.audio_charged)  # audio.wav was just deleted
+
+        self.job.discard()
+        if self.ckpt:
+            self.ckpt.close()
+        # the checkpoint stays either way: a retry resumes from it. So does the
+        # frames spool: an early vision run may be reading it
+        attempt = f"attempt {self.msg.attempts}/{QUEUE_MAX_ATTEMPTS}"
+        if not isinstance(e, PERMANENT_ERRORS) and self.msg.retry(err):
+            print(f"  [QUEUE] {self.job_id} requeued after {attempt}")
+            self.job.set(error_message=f"ASR {attempt} failed, retrying: {err[:400]}")
+            self.job.flush()
+            metrics.JOBS.inc(service="asr", outcome="retry")
+        else:
+            cleanup_on_failure(self.job_id)
+            self.job.status("FAILED", error_message=f"ASR failed: {err[:500]}", error_code="ASR_GPU_ERROR")
+            self.msg.ack()  # no-op if retry() just dead-lettered it
+            metrics.JOBS.inc(service="asr", outcome="failed")
+        db.forget_job(self.job_id)
 
-            # 3) Write artifacts
-            print(f"  [3/3] Writing artifacts...")
-            write_artifacts(art_dir, segs, meta)
 
-            # --- Mark ASR_DONE ---
-            update_job_status(job_id, "ASR_DONE", {
-                "asr_done_at": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "has_transcript": 1,
-            })
+# ─── Main loop ───
 
-            print(f"[DONE] job_id={job_id} segments={len(segs)}")
+def next_message() -> AsrJob | None:
+    msg = queue.claim(timeout=5)
+    return AsrJob(msg) if msg else None
 
-            # 4) If FULL mode, enqueue frame extraction
-            if analysis_mode == "FULL":
-                frame_msg = json.dumps({"job_id": job_id})
-                r.rpush("queue:frames", frame_msg)
-                print(f"  [QUEUE] Pushed {job_id} to queue:frames for vision-worker")
 
+def main():
+    print("[START] asr-worker ready — waiting for jobs on queue:jobs")
+    ledger.start_reconciler(QUOTA_RECONCILE_SEC)
+    metrics.watch_queues(queue)
+    metrics.serve(METRICS_PORT)
+    queue.start_heartbeat()
+    if ASR_BATCH_SIZE > 0:
+        return main_batched()
+    while True:
+        job = next_message()
+        if not job:
+            continue
+        if not job.start():
+            job.msg.ack()
+            continue
+        try:
+            if not job.from_cache():
+                job.process()
         except Exception as e:
-            # ─── FAIL FAST: no CPU fallback ───
-            err = str(e)
-            tb = traceback.format_exc()
-            print(f"[FAILED] job_id={job_id} err={err}\n{tb}")
-
-            cleanup_on_failure(job_id)
-
-            update_job_status(job_id, "FAILED", {
-                "error_message": f"ASR failed: {err[:500]}",
-                "error_code": "ASR_GPU_ERROR",
-            })
+            job.failed(e)
+
+
+def main_batched():
+    """Cross-job batching: up to ASR_MAX_JOBS jobs decode and VAD-split on
+    prefetch threads, window by window, while one thread feeds their chunks
+    to the model in batches of ASR_BATCH_SIZE. Jobs of the other profiles
+    take the sequential path, one at a time, within the same ASR_MAX_JOBS."""
+    backend = batching.WhisperBackend(model, language="th", beam_size=ASR_BATCH_BEAM_SIZE)
+    sched = batching.BatchScheduler(backend, ASR_BATCH_SIZE, ASR_MAX_JOBS, ASR_PREFETCH_THREADS)
+    sched.start()
+    print(f"[START] batched ASR: batch={ASR_BATCH_SIZE} max_jobs={ASR_MAX_JOBS} "
+          f"profiles={','.join(sorted(ASR_BATCH_PROFILES))} (beam {ASR_BATCH_BEAM_SIZE}, no escalation); "
+          f"{','.join(p for p in decoding.PROFILES if p not in ASR_BATCH_PROFILES) or 'none'} sequential")
+    while True:
+        if not sched.wait_capacity(timeout=5):
+            continue
+        job = next_message()
+        if not job:
+            continue
+        if not job.start():
+            job.msg.ack()
+            continue
+        try:
+            if job.from_cache():
+                continue
+            if batched(job.profile):
+                sched.submit(job)
+            else:
+                sched.submit_alone(job)
+        except Exception as e:
+            job.failed(e)
 
 
 if __name__ == "__main__":
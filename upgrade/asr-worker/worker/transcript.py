@@ -0,0 +1,308 @@
+"""
+Checkpointed transcription + streaming transcript writers
+- Checkpoint: append-only JSON lines (artifacts/transcript.ckpt.jsonl).
+  Segments are appended as the model yields them; a commit line records the
+  audio position they cover and is fsynced. Reopening drops a torn or
+  uncommitted tail, so a killed worker resumes from its last commit
+- Transcriber: runs windows of samples through any transcribe(samples,
+  offset) -> (segment iterator, meta) callable into a Checkpoint, skipping
+  audio the checkpoint already covers (per segment without VAD, per VAD
+  chunk with it)
+- resume_windows(): the same skip for the batched path (worker/batching.py),
+  which commits chunk by chunk itself
+- Decode stats a transcribe_fn reports in meta["decode"] (worker/decoding.py)
+  are summed across calls, committed with the segments they cover
+- write_artifacts(): transcript.json/.txt/.srt from a segment iterator in
+  one pass; with Checkpoint.iter_segments() no segment list is ever built
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from common import cas
+from worker import vad
+
+SAMPLE_RATE = 16000
+CHECKPOINT_FILE = "transcript.ckpt.jsonl"
+CHECKPOINT_VERSION = 1
+
+
+# ─── Checkpoint ───
+
+class Checkpoint:
+    """Append-only segment log of one job.
+
+    Line 1 is a header pinning the settings (key); a checkpoint written with
+    other settings is discarded. Then segment lines and commit lines
+    {"commit": seconds, **state}: everything before the last commit line is
+    durable, state is whatever the writer needs back on resume.
+    """
+
+    def __init__(self, path: str, key: str = "", fsync: bool = True):
+        self.path = path
+        self.key = key
+        self.fsync = fsync
+        self.committed = 0.0  # audio seconds fully transcribed
+        self.segments = 0     # committed segments
+        self.last = None      # last committed segment
+        self.state = {}       # from the last commit line
+        self.size = 0         # bytes up to and including the last commit line
+        self._pending = []
+        self._f = None
+        self._open()
+
+    def _open(self):
+        try:
+            with open(self.path, "rb") as f:
+                self._replay(f)
+        except FileNotFoundError:
+            pass
+        if not self.size:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._f = open(self.path, "wb")
+            self._f.write(self._line({"v": CHECKPOINT_VERSION, "key": self.key}))
+            self._sync()
+            self.size = self._f.tell()
+            return
+        self._f = open(self.path, "r+b")
+        self._f.truncate(self.size)  # torn / uncommitted tail
+        self._f.seek(self.size)
+
+    def _replay(self, f):
+        header = f.readline()
+        try:
+            head = json.loads(header)
+        except ValueError:
+            return
+        if head.get("v") != CHECKPOINT_VERSION or head.get("key") != self.key:
+            print(f"[CKPT] {self.path}: written with other settings, starting over")
+            return
+        pos = self.size = len(header)
+        pending = []
+        for line in f:
+            pos += len(line)
+            if not line.endswith(b"\n"):
+                break  # killed mid-write
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break
+            if "commit" not in rec:
+                pending.append(rec)
+                continue
+            self.committed = rec.pop("commit")
+            self.state = rec
+            self.segments += len(pending)
+            self.last = pending[-1] if pending else self.last
+            self.size = pos
+            pending = []
+
+    @staticmethod
+    def _line(rec: dict) -> bytes:
+        return (json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def _sync(self):
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+
+    def append(self, seg: dict):
+        """Buffered until the next commit()."""
+        self._f.write(self._line(seg))
+        self._pending.append(seg)
+
+    def commit(self, position: float, **state):
+        """Everything appended so far covers audio up to position seconds."""
+        self._f.write(self._line({"commit": position, **state}))
+        self._sync()
+        self.size = self._f.tell()
+        self.committed = position
+        self.state = state
+        self.segments += len(self._pending)
+        self.last = self._pending[-1] if self._pending else self.last
+        self._pending = []
+
+    def iter_segments(self):
+        """Committed segments in order, read back from disk one at a time."""
+        with open(self.path, "rb") as f:
+            f.readline()
+            pos = f.tell()
+            for line in f:
+                pos += len(line)
+                if pos > self.size:
+                    break
+                rec = json.loads(line)
+                if "commit" not in rec:
+                    yield rec
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# ─── Transcription ───
+
+def resume_windows(windows, committed: float):
+    """(offset_sec, samples) windows with the audio before committed seconds
+    dropped: windows that end before it are skipped, the one it falls in
+    starts there."""
+    for offset, samples in windows:
+        end = offset + len(samples) / SAMPLE_RATE
+        if end <= committed:
+            continue
+        skip = max(0, int(round((committed - offset) * SAMPLE_RATE)))
+        yield offset + skip / SAMPLE_RATE, samples[skip:]
+
+
+class Transcriber:
+    """Feeds (offset_sec, samples) windows through transcribe_fn into ckpt.
+
+    transcribe_fn(samples, offset) returns a lazy iterator of segments in
+    absolute seconds plus the language meta. With use_vad, each window is
+    split into speech chunks (worker/vad.py) run `parallel` at a time and
+    committed chunk by chunk; without it every segment is committed as the
+    model yields it. on_progress(seconds_done, total) follows each commit.
+    """
+
+    def __init__(self, transcribe_fn, ckpt: Checkpoint, use_vad: bool = True,
+                 chunk_max_sec: float = 120.0, parallel: int = 1, on_progress=None, total: float = 0.0):
+        self.transcribe_fn = transcribe_fn
+        self.ckpt = ckpt
+        self.use_vad = use_vad
+        self.chunk_max_sec = chunk_max_sec
+        self.parallel = parallel
+        self.on_progress = on_progress
+        self.total = total
+        # running meta, carried across a restart by the commit lines
+        self.state = dict(ckpt.state)
+
+    def _commit(self, position: float, total: float):
+        self.ckpt.commit(position, **self.state)
+        if self.on_progress:
+            self.on_progress(position, self.total or total)
+
+    def _language(self, meta: dict):
+        if "language" not in self.state:
+            self.state.update(language=meta["language"], probability=meta["probability"])
+
+    def _tally(self, base: dict, meta: dict):
+        """state["decode"] = base (totals before this call) + the call's
+        counts so far; strings (the profile) are taken as they are."""
+        counts = meta.get("decode")
+        if counts is None:
+            return
+        self.state["decode"] = {k: v if isinstance(v, str) else round(base.get(k, 0) + v, 2)
+                                for k, v in counts.items()}
+
+    def run(self, windows):
+        for offset, samples in windows:
+            end = offset + len(samples) / SAMPLE_RATE
+            if end <= self.ckpt.committed:
+                continue  # done before the restart
+            if self.use_vad:
+                self._run_chunks(samples, offset, end)
+            else:
+                self._run_segments(samples, offset, end)
+            self.state["duration"] = round(end, 2)
+            self._commit(end, end)
+        return self.meta()
+
+    def _run_segments(self, samples, offset: float, end: float):
+        skip = max(0, int(round((self.ckpt.committed - offset) * SAMPLE_RATE)))
+        segs, meta = self.transcribe_fn(samples[skip:], offset + skip / SAMPLE_RATE)
+        self._language(meta)
+        base = dict(self.state.get("decode", {}))
+        for s in segs:
+            self.ckpt.append(s)
+            self._tally(base, meta)
+            self._commit(s["end"], end)
+        self._tally(base, meta)
+
+    def _run_chunks(self, samples, offset: float, end: float):
+        regions = vad.speech_regions(samples)
+        chunks = vad.plan_chunks(regions, self.chunk_max_sec)
+        ends = offset + chunks[:, 1] / SAMPLE_RATE
+        first = int((ends <= self.ckpt.committed).sum())  # chunks done before the restart
+
+        def run(chunk):
+            start, stop = chunk
+            segs, meta = self.transcribe_fn(samples[start:stop], offset + start / SAMPLE_RATE)
+            return list(segs), meta
+
+        with ThreadPoolExecutor(self.parallel) as pool:
+            def results():
+                for segs, meta in pool.map(run, chunks[first:]):
+                    self._language(meta)
+                    self._tally(dict(self.state.get("decode", {})), meta)
+                    yield segs
+
+            for k, segs in enumerate(vad.stitch_iter(chunks, results(), offset, first, self.ckpt.last), first):
+                for s in segs:
+                    self.ckpt.append(s)
+                self._commit(float(ends[k]), end)
+        speech = float((regions[:, 1] - regions[:, 0]).sum()) / SAMPLE_RATE
+        self.state["speech_sec"] = round(self.state.get("speech_sec", 0.0) + speech, 2)
+
+    def meta(self) -> dict:
+        meta = {
+            "language": self.state.get("language", "th"),
+            "probability": self.state.get("probability", 0.0),
+            "duration": self.state.get("duration", 0.0),
+        }
+        if self.use_vad:
+            meta["speech_sec"] = self.state.get("speech_sec", 0.0)
+        if "decode" in self.state:
+            meta["decode"] = self.state["decode"]
+        return meta
+
+
+# ─── Artifacts ───
+
+def _srt_time(t: float) -> str:
+    h = int(t // 3600)
+    m = int((t % 3600) // 60)
+    s = int(t % 60)
+    ms = int((t % 1) * 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def _indent(text: str, prefix: str) -> str:
+    return "\n".join(prefix + line for line in text.split("\n"))
+
+
+def write_artifacts(art_dir: str, segments, meta: dict) -> int:
+    """Write transcript.json, transcript.txt, transcript.srt in one pass over
+    segments (any iterable). Returns the segment count.
+
+    Each file is written aside and renamed into place: the old one may be a
+    hardlink into the artifact cache. The JSON is byte-for-byte what
+    json.dump(..., indent=2) gives for the whole document.
+    """
+    os.makedirs(art_dir, exist_ok=True)
+    n = 0
+    with ExitStack() as stack:
+        files = []
+        for name in ("transcript.json", "transcript.txt", "transcript.srt"):
+            tmp = stack.enter_context(cas.replacing(os.path.join(art_dir, name)))
+            files.append(stack.enter_context(open(tmp, "w", encoding="utf-8")))
+        fj, ft, fs = files
+
+        fj.write('{\n  "segments": [')
+        for n, s in enumerate(segments, 1):
+            fj.write(",\n" if n > 1 else "\n")
+            fj.write(_indent(json.dumps(s, ensure_ascii=False, indent=2), "    "))
+            ft.write(f"[{s['start']:.2f}-{s['end']:.2f}] {s['text']}\n")
+            fs.write(f"{n}\n{_srt_time(s['start'])} --> {_srt_time(s['end'])}\n{s['text']}\n\n")
+        fj.write("\n  ]" if n else "]")
+        fj.write(',\n  "meta": ' + _indent(json.dumps(meta, ensure_ascii=False, indent=2), "  ")[2:] + "\n}")
+    return n
@@ -0,0 +1,146 @@
+"""
+Energy VAD + chunk planning for long recordings (NumPy only, no model)
+- speech_regions(): 30 ms frame energy against an adaptive noise floor, with
+  short gaps closed, short bursts dropped and edges padded
+- plan_chunks(): joins regions separated by short pauses into chunks of at
+  most max_sec; long silences (student work time) are never transcribed, and
+  speech longer than max_sec is split into overlapping pieces
+- stitch(): merges per-chunk segments (already in absolute time) back into one
+  list; overlaps are resolved at their midpoint and text repeated on both
+  sides of a cut is dropped from the later chunk; stitch_iter() does the
+  same one chunk at a time
+"""
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+
+
+def _runs(mask: np.ndarray):
+    """Start/end (exclusive) indices of the True runs in mask."""
+    d = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(d == 1), np.flatnonzero(d == -1)
+
+
+def frame_db(samples: np.ndarray, frame: int) -> np.ndarray:
+    n = len(samples) // frame
+    x = samples[:n * frame].reshape(n, frame)
+    return 10 * np.log10(np.einsum("ij,ij->i", x, x) / frame + 1e-10)
+
+
+def speech_regions(samples: np.ndarray, margin_db: float = 12.0, floor_pct: float = 10.0,
+                   min_db: float = -50.0, min_speech_ms: int = 250, min_silence_ms: int = 700,
+                   pad_ms: int = 200) -> np.ndarray:
+    """(n, 2) array of [start, end) sample indices that contain speech.
+
+    A frame is speech when it is margin_db above the floor_pct percentile of
+    the recording (the noise floor) and above min_db in absolute terms.
+    """
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    db = frame_db(samples, frame)
+    if not len(db):
+        return np.empty((0, 2), dtype=np.int64)
+    thr = max(np.percentile(db, floor_pct) + margin_db, min_db)
+    starts, ends = _runs(db > thr)
+    if not len(starts):
+        return np.empty((0, 2), dtype=np.int64)
+
+    # close pauses shorter than min_silence_ms
+    keep = (starts[1:] - ends[:-1]) * FRAME_MS >= min_silence_ms
+    starts = np.concatenate((starts[:1], starts[1:][keep]))
+    ends = np.concatenate((ends[:-1][keep], ends[-1:]))
+    # drop clicks / coughs
+    long = (ends - starts) * FRAME_MS >= min_speech_ms
+    starts, ends = starts[long], ends[long]
+    if not len(starts):
+        return np.empty((0, 2), dtype=np.int64)
+
+    pad = SAMPLE_RATE * pad_ms // 1000
+    s = np.maximum(starts * frame - pad, 0)
+    e = np.minimum(ends * frame + pad, len(samples))
+    # padding can make neighbours touch again
+    new = np.concatenate(([True], s[1:] > e[:-1]))
+    last = np.concatenate((new[1:], [True]))
+    return np.stack((s[new], e[last]), axis=1).astype(np.int64)
+
+
+def plan_chunks(regions: np.ndarray, max_sec: float = 60.0, join_gap_sec: float = 2.0,
+                overlap_sec: float = 1.0) -> np.ndarray:
+    """(n, 2) sample ranges to transcribe independently.
+
+    Regions less than join_gap_sec apart share a chunk while it stays under
+    max_sec. A region longer than max_sec is cut into max_sec pieces that
+    overlap by overlap_sec so a word on the cut is heard whole at least once.
+    """
+    max_len = int(max_sec * SAMPLE_RATE)
+    join_gap = int(join_gap_sec * SAMPLE_RATE)
+    overlap = int(overlap_sec * SAMPLE_RATE)
+    chunks = []
+    cur = None
+    for s, e in regions:
+        if cur is not None and s - cur[1] <= join_gap and e - cur[0] <= max_len:
+            cur[1] = e
+            continue
+        if cur is not None:
+            chunks.append(cur)
+        if e - s <= max_len:
+            cur = [s, e]
+            continue
+        step = max_len - overlap
+        piece_starts = np.arange(s, e - overlap, step)
+        pieces = np.stack((piece_starts, np.minimum(piece_starts + max_len, e)), axis=1)
+        chunks.extend(p.tolist() for p in pieces[:-1])
+        cur = pieces[-1].tolist()
+    if cur is not None:
+        chunks.append(cur)
+    return np.array(chunks, dtype=np.int64).reshape(-1, 2)
+
+
+def _overlap_text(prev: str, nxt: str, min_chars: int = 3) -> int:
+    """Length of the longest suffix of prev that nxt starts with."""
+    for n in range(min(len(prev), len(nxt)), min_chars - 1, -1):
+        if prev.endswith(nxt[:n]):
+            return n
+    return 0
+
+
+def stitch_iter(chunks: np.ndarray, results, offset: float = 0.0, first: int = 0, prev: dict = None):
+    """Incremental stitch(): yields the kept segments of each chunk as its
+    result arrives, so they can be committed before later chunks finish.
+
+    results holds the per-chunk lists for chunks[first:]; prev is the last
+    segment already emitted for the chunks before first (when resuming).
+    """
+    bounds = chunks / SAMPLE_RATE + offset
+    # between chunks: midpoint of the overlap, or of the skipped silence
+    cut = np.concatenate(([-np.inf], (bounds[1:, 0] + bounds[:-1, 1]) / 2, [np.inf]))
+
+    for k, segs in enumerate(results, first):
+        out = []
+        if segs:
+            mid = np.array([(s["start"] + s["end"]) / 2 for s in segs])
+            keep = (mid >= cut[k]) & (mid < cut[k + 1])
+            for s, kept in zip(segs, keep):
+                if not kept:
+                    continue
+                s = dict(s)
+                if prev and s["start"] < prev["end"]:
+                    n = _overlap_text(prev["text"], s["text"])
+                    s["text"] = s["text"][n:].lstrip()
+                    s["start"] = min(prev["end"], s["end"])
+                    if not s["text"]:
+                        continue
+                out.append(s)
+                prev = s
+        yield out
+
+
+def stitch(chunks: np.ndarray, results: list, offset: float = 0.0) -> list:
+    """One segment list from per-chunk lists (absolute seconds, chunk order).
+
+    Each segment is kept by the chunk whose side of the boundary its midpoint
+    falls on; a boundary word both overlapping chunks transcribed is then
+    removed from the start of the later segment.
+    """
+    return [s for segs in stitch_iter(chunks, results, offset) for s in segs]
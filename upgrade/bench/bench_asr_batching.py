@@ -0,0 +1,94 @@
+"""
+Benchmark: asr-worker throughput (jobs/hour) against batch size.
+
+Runs the real BatchScheduler (worker/batching.py) with the CPU stub backend.
+The stub's infer() costs --batch-cost + --item-cost * chunks seconds, which is
+roughly how a GPU behaves: a fixed per-call price that batching amortises.
+Each job's load() sleeps --decode-sec to stand in for ffmpeg + VAD.
+
+"sequential" is the old worker: one job at a time, decode then infer with
+nothing prefetched (batch 1, max_jobs 1).
+
+    python bench/bench_asr_batching.py --jobs 12 --batch 1 4 8 16
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "asr-worker"))
+
+import numpy as np
+
+from worker.batching import SAMPLE_RATE, BatchScheduler, StubBackend
+
+
+class SyntheticJob:
+    def __init__(self, minutes: float, decode_sec: float):
+        self.minutes = minutes
+        self.decode_sec = decode_sec
+
+    def load(self):
+        time.sleep(self.decode_sec)
+        return self.minutes * 60, [(0.0, np.zeros(int(self.minutes * 60 * SAMPLE_RATE), dtype=np.float32))]
+
+    def progress(self, done, total):
+        pass
+
+    def commit(self, segs, position, speech_sec):
+        pass
+
+    def done(self, meta):
+        pass
+
+    def failed(self, e):
+        raise e
+
+
+def run(jobs: list, backend: StubBackend, batch: int, max_jobs: int) -> float:
+    sched = BatchScheduler(backend, batch_size=batch, max_jobs=max_jobs)
+    sched.start()
+    t0 = time.perf_counter()
+    for job in jobs:
+        sched.wait_capacity()
+        sched.submit(job)
+    sched.drain()
+    wall = time.perf_counter() - t0
+    sched.stop()
+    return wall
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--jobs", type=int, default=12)
+    ap.add_argument("--minutes", type=float, nargs=2, default=(5, 15), help="job length range")
+    ap.add_argument("--batch", type=int, nargs="+", default=(1, 2, 4, 8, 16))
+    ap.add_argument("--max-jobs", type=int, default=3)
+    ap.add_argument("--decode-sec", type=float, default=0.3)
+    ap.add_argument("--batch-cost", type=float, default=0.04)
+    ap.add_argument("--item-cost", type=float, default=0.01)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    lengths = [rng.uniform(*args.minutes) for _ in range(args.jobs)]
+    chunks = sum(int(np.ceil(m * 2)) for m in lengths)  # 30 s chunks
+    print(f"{args.jobs} jobs, {sum(lengths):.0f} min audio, {chunks} chunks")
+
+    cases = [("sequential", 1, 1)] + [(f"batch={b}", b, args.max_jobs) for b in args.batch]
+    base = None
+    for name, batch, max_jobs in cases:
+        backend = StubBackend(batch_cost=args.batch_cost, item_cost=args.item_cost)
+        wall = run([SyntheticJob(m, args.decode_sec) for m in lengths], backend, batch, max_jobs)
+        rate = args.jobs / wall * 3600
+        base = base or rate
+        print(f"{name:11s} wall={wall:6.2f}s  jobs/hour={rate:8.0f}  x{rate / base:4.2f}  "
+              f"calls={len(backend.batches)} mean_batch={np.mean(backend.batches):.1f}")
+
+
+if __name__ == "__main__":
+    main()
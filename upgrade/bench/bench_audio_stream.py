@@ -0,0 +1,126 @@
+"""
+Benchmark: asr-worker audio path, WAV file vs ffmpeg pipe vs bounded windows.
+
+Each mode runs in a fresh child process (so peak RSS is per mode) on the same
+synthetic lavfi video (tone + test pattern):
+  file    ffmpeg -> audio/audio.wav -> read back -> model   (AUDIO_MODE=file)
+  stream  ffmpeg pipe -> one float32 array -> model         (AUDIO_MODE=stream)
+  window  ffmpeg pipe -> --window-sec windows -> model      (long recordings)
+
+The default model is a CPU stub that only walks the samples in 30 s windows,
+so the numbers isolate decode + I/O cost. --model small (etc.) runs
+faster-whisper on CPU instead.
+
+    python bench/bench_audio_stream.py --minutes 60
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "asr-worker"))
+
+import numpy as np
+
+from worker import audio
+
+MODES = ("file", "stream", "window")
+
+
+def make_video(path: str, minutes: float):
+    subprocess.check_call([
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", "testsrc=size=320x240:rate=5",
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+        "-t", str(minutes * 60), "-c:v", "libx264", "-preset", "ultrafast",
+        "-c:a", "aac", "-shortest", path,
+    ])
+
+
+class StubModel:
+    def transcribe(self, samples):
+        step = 30 * audio.SAMPLE_RATE
+        return [float(np.sqrt(np.mean(np.square(samples[i:i + step])))) for i in range(0, len(samples), step)]
+
+
+class WhisperCPU:
+    def __init__(self, name: str):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(name, device="cpu", compute_type="int8")
+
+    def transcribe(self, source):
+        segments, _ = self.model.transcribe(source, language="th", beam_size=1)
+        return [s.text for s in segments]
+
+
+def read_wav(path: str) -> np.ndarray:
+    with wave.open(path) as w:
+        return np.frombuffer(w.readframes(w.getnframes()), dtype="<i2").astype(np.float32) / 32768.0
+
+
+def child(mode: str, video: str, scratch: str, model_name: str | None, window_sec: float, duration: float):
+    model = WhisperCPU(model_name) if model_name else StubModel()
+    wav_bytes = 0
+    if mode == "file":
+        wav = os.path.join(scratch, "audio.wav")
+        wav_bytes = audio.extract_wav(video, wav)
+        model.transcribe(wav if model_name else read_wav(wav))
+    elif mode == "stream":
+        model.transcribe(audio.decode_audio(video, duration))  # worker passes the ffprobe duration
+    else:
+        for _, samples in audio.iter_audio_windows(audio.iter_pcm_blocks(video), window_sec):
+            model.transcribe(samples)
+    print(json.dumps({"wav_bytes": wav_bytes}))
+
+
+def run_mode(mode: str, args, video: str, scratch: str) -> dict:
+    cmd = [sys.executable, __file__, "--child", mode, "--video", video, "--scratch", scratch,
+           "--window-sec", str(args.window_sec), "--minutes", str(args.minutes)]
+    if args.model:
+        cmd += ["--model", args.model]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    out = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    if status:
+        raise SystemExit(f"{mode} child failed")
+    return {"mode": mode, "wall": wall, "cpu": usage.ru_utime + usage.ru_stime,
+            "rss_mb": usage.ru_maxrss / 1024, **json.loads(out)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--minutes", type=float, default=30)
+    ap.add_argument("--model", help="faster-whisper model name (CPU); default is the stub")
+    ap.add_argument("--window-sec", type=float, default=600)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    ap.add_argument("--video", help=argparse.SUPPRESS)
+    ap.add_argument("--scratch", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(args.child, args.video, args.scratch, args.model, args.window_sec, args.minutes * 60)
+        return
+
+    with tempfile.TemporaryDirectory() as scratch:
+        video = os.path.join(scratch, "lesson.mp4")
+        make_video(video, args.minutes)
+        print(f"video: {args.minutes:g} min, {os.path.getsize(video) / 1e6:.1f} MB, model={args.model or 'stub'}")
+        for mode in MODES:
+            runs = [run_mode(mode, args, video, scratch) for _ in range(args.repeat)]
+            best = min(runs, key=lambda x: x["wall"])
+            print(f"{mode:7s} wall={best['wall']:.2f}s cpu={best['cpu']:.2f}s "
+                  f"peak_rss={max(x['rss_mb'] for x in runs):.0f}MB wav_written={best['wav_bytes'] / 1e6:.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
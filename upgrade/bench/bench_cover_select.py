@@ -0,0 +1,92 @@
+"""
+Benchmark: vision-worker cover selection and cover/thumb writing.
+
+Builds a job's worth of 720p JPEG frames (--frames, default 700 = ~58 min at
+one frame per 5 s) straight from ffmpeg's lavfi test source, then times:
+- old: middle frame opened at full size, re-encoded as cover.jpg, LANCZOS
+  resize of the full frame to thumb.jpg
+- pick: worker/cover.py draft decodes of every frame (1/8 scale) + the
+  vectorized scoring, reported separately
+- write: cover.jpg as the frame's own bytes + thumb.jpg from a draft decode
+
+    python bench/bench_cover_select.py --frames 700 --size 1280x720
+"""
+
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "vision-worker"))
+
+from worker import cover, frames
+
+
+def make_frames(n: int, size: str) -> list:
+    out = subprocess.check_output([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=1:duration={n}",
+        "-q:v", "3", "-f", "image2pipe", "-c:v", "mjpeg", "pipe:1",
+    ])
+    return list(frames.split_jpegs([out]))
+
+
+def old_cover(jpeg: bytes, art_dir: str):
+    img = Image.open(io.BytesIO(jpeg))
+    img.save(os.path.join(art_dir, "cover.jpg"), format="JPEG", quality=85)
+    w, h = img.size
+    img.resize((320, int(h * 320 / w)), Image.LANCZOS).save(os.path.join(art_dir, "thumb.jpg"),
+                                                            format="JPEG", quality=75)
+
+
+def best_of(repeat: int, fn) -> float:
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        wall = time.perf_counter() - t0
+        best = min(best or wall, wall)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--frames", type=int, default=700)
+    ap.add_argument("--size", default="1280x720")
+    ap.add_argument("--threads", type=int, default=0, help="decode threads (0 = one per CPU)")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    jpegs = make_frames(args.frames, args.size)
+    print(f"{len(jpegs)} frames {args.size}, {sum(map(len, jpegs)) / len(jpegs) / 1024:.0f} KB avg, "
+          f"{os.cpu_count()} CPUs")
+    tmp = tempfile.mkdtemp(prefix="bench-cover-")
+    try:
+        t_old = best_of(args.repeat, lambda: old_cover(jpegs[len(jpegs) // 2], tmp))
+        t_decode = best_of(args.repeat, lambda: list(map(cover.small_gray, jpegs)))
+        stack = np.stack([cover.small_gray(j) for j in jpegs])
+        t_score = best_of(args.repeat, lambda: cover.scores(stack))
+        picked = []
+        t_pick = best_of(args.repeat, lambda: picked.append(cover.pick(enumerate(jpegs), args.threads)))
+        t_write = best_of(args.repeat, lambda: cover.write_cover_and_thumb(jpegs[picked[-1]], tmp))
+
+        print(f"old middle cover+thumb      {t_old * 1e3:8.1f} ms")
+        print(f"draft decode, {len(jpegs)} frames   {t_decode * 1e3:8.1f} ms  "
+              f"({t_decode / len(jpegs) * 1e3:.2f} ms/frame, {stack.shape[2]}x{stack.shape[1]})")
+        print(f"scoring (vectorized)        {t_score * 1e3:8.1f} ms")
+        print(f"pick total                  {t_pick * 1e3:8.1f} ms  -> frame {picked[-1]}")
+        print(f"new cover+thumb write       {t_write * 1e3:8.1f} ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
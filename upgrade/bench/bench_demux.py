@@ -0,0 +1,99 @@
+"""
+Benchmark: FULL-mode decode, audio and frames in separate passes vs one pass.
+
+For each video length, times the old pipeline (the asr-worker's PCM ffmpeg,
+then the vision-worker's own frames ffmpeg over the same file) against the
+demux pass (one ffmpeg with the frames spool as a second output, see
+common/media.py). Prints wall time and the ffmpeg CPU time of each (children
+rusage), and checks that PCM and frames are byte-identical both ways.
+
+    python bench/bench_demux.py --minutes 2 10 30
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "asr-worker"))
+
+from common import media
+from worker import audio
+
+INTERVAL = 5
+QSCALE = 3
+
+
+def make_video(path: str, minutes: float, size: str):
+    subprocess.check_call([
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=25:duration={minutes * 60}",
+        "-f", "lavfi", "-i", f"sine=frequency=300:duration={minutes * 60}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "250", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest", path,
+    ])
+
+
+def child_cpu() -> float:
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+
+def separate(video: str) -> tuple:
+    pcm = audio.decode_audio(video)
+    frames = subprocess.check_output([
+        "ffmpeg", "-v", "error", "-i", video, "-an", "-vf", f"fps=1/{INTERVAL}", "-q:v", str(QSCALE),
+        "-f", "image2pipe", "-c:v", "mjpeg", "pipe:1",
+    ])
+    return pcm, frames
+
+
+def demuxed(video: str, job_dir: str) -> tuple:
+    pcm = audio.decode_audio(video, extra_outputs=media.frames_output_args(job_dir, INTERVAL, QSCALE),
+                             on_done=lambda: media.finish_spool(job_dir, INTERVAL, QSCALE))
+    with open(media.ready_spool(job_dir, INTERVAL, QSCALE), "rb") as f:
+        frames = f.read()
+    media.remove_spool(job_dir)
+    return pcm, frames
+
+
+def timed(fn, *args) -> tuple:
+    c0, t0 = child_cpu(), time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - t0, child_cpu() - c0, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--minutes", type=float, nargs="+", default=[2, 10])
+    ap.add_argument("--size", default="1280x720")
+    ap.add_argument("--repeat", type=int, default=2)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-demux-") as tmp:
+        video = os.path.join(tmp, "lesson.mp4")
+        for minutes in args.minutes:
+            make_video(video, minutes, args.size)
+            print(f"\n{minutes:g} min {args.size}, {os.path.getsize(video) / 1024 / 1024:.1f} MB")
+            print(f"{'pipeline':>10} {'wall s':>8} {'ffmpeg cpu s':>13}")
+            ref = None
+            for name, fn, extra in (("separate", separate, ()), ("demux", demuxed, (tmp,))):
+                best = None
+                for _ in range(args.repeat):
+                    wall, cpu, out = timed(fn, video, *extra)
+                    best = min(best or (wall, cpu), (wall, cpu))
+                if ref is None:
+                    ref = out
+                assert np.array_equal(out[0], ref[0]) and out[1] == ref[1], "outputs differ"
+                print(f"{name:>10} {best[0]:8.2f} {best[1]:13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark: perceptual hashing throughput of the vision-worker dedup stage.
+
+Real MJPEG frames (the worker's own image2pipe settings) of a synthetic
+lavfi video are hashed in one process, so frames/s is per core. "draft"
+is worker/dedup.py (libjpeg scales in the DCT); "full" decodes the whole
+frame first and resizes afterwards, for comparison.
+
+    python bench/bench_frame_hash.py --size 1280x720 --frames 200
+"""
+
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "vision-worker"))
+
+import numpy as np
+from PIL import Image
+
+from worker import dedup, frames
+
+
+def full_gray(jpeg: bytes, size: tuple) -> np.ndarray:
+    img = Image.open(io.BytesIO(jpeg))
+    return np.asarray(img.convert("L").resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def make_frames(size: str, n: int) -> list:
+    tmp = tempfile.mkdtemp(prefix="bench-hash-")
+    try:
+        video = os.path.join(tmp, "v.mp4")
+        subprocess.check_call([
+            "ffmpeg", "-v", "error", "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=5:duration={n}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", video,
+        ])
+        return list(frames.iter_jpegs(video, 1, 3))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def rate(fn, jpegs: list, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for j in jpegs:
+            fn(j)
+        wall = time.perf_counter() - t0
+        best = min(best or wall, wall)
+    return len(jpegs) / best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", default="1280x720")
+    ap.add_argument("--frames", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    jpegs = make_frames(args.size, args.frames)
+    mean_kb = sum(map(len, jpegs)) / len(jpegs) / 1024
+    print(f"{len(jpegs)} frames {args.size}, {mean_kb:.0f} KB each")
+
+    original = dedup.gray
+    for decode in ("draft", "full"):
+        dedup.gray = original if decode == "draft" else full_gray
+        for method, fn in dedup.HASHES.items():
+            print(f"{method:5s} {decode:5s} {rate(fn, jpegs, args.repeat):8.0f} frames/s/core")
+    dedup.gray = original
+
+
+if __name__ == "__main__":
+    main()
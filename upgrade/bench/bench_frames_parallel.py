@@ -0,0 +1,79 @@
+"""
+Benchmark: vision-worker frame extraction, one ffmpeg vs N parallel ranges.
+
+For each video length, extracts frames with worker/frames.py at jobs=1 (one
+sequential ffmpeg) and at each --jobs value (plan_segments ranges decoded by
+seek-based ffmpegs at once, then merged). Checks that every run produces the
+same index and bytes, and prints wall time and speedup against jobs=1.
+Speedup is bounded by the cores available (printed first): each ffmpeg runs
+with -threads 1.
+
+    python bench/bench_frames_parallel.py --minutes 2 10 30 --jobs 2 4 8
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "vision-worker"))
+
+from worker import frames
+
+INTERVAL = 5
+QSCALE = 3
+
+
+def make_video(path: str, minutes: float, size: str):
+    subprocess.check_call([
+        "ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+        "-i", f"testsrc2=size={size}:rate=25:duration={minutes * 60}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "250", "-pix_fmt", "yuv420p", path,
+    ])
+
+
+def run(video: str, out: str, jobs: int, duration: float) -> tuple:
+    shutil.rmtree(out, ignore_errors=True)
+    t0 = time.perf_counter()
+    index, total = frames.extract(video, frames.FileStore(out), INTERVAL, QSCALE, jobs=jobs, duration=duration)
+    return time.perf_counter() - t0, index, total
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--minutes", type=float, nargs="+", default=[2, 10])
+    ap.add_argument("--jobs", type=int, nargs="+", default=[2, 4])
+    ap.add_argument("--size", default="1280x720")
+    ap.add_argument("--repeat", type=int, default=2)
+    args = ap.parse_args()
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    print(f"cores available: {cores}")
+    tmp = tempfile.mkdtemp(prefix="bench-frames-par-")
+    try:
+        for minutes in args.minutes:
+            video = os.path.join(tmp, "lesson.mp4")
+            make_video(video, minutes, args.size)
+            duration = minutes * 60
+            base = None
+            for jobs in [1] + args.jobs:
+                best = None
+                for _ in range(args.repeat):
+                    wall, index, total = run(video, os.path.join(tmp, "out"), jobs, duration)
+                    best = min(best or wall, wall)
+                if base is None:
+                    base, ref = best, (index, total)
+                assert (index, total) == ref, f"jobs={jobs} output differs from jobs=1"
+                print(f"{minutes:5g} min  jobs={jobs:2d}  frames={len(index):5d}  wall={best:7.2f}s  "
+                      f"speedup={base / best:5.2f}x")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
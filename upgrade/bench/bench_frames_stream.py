@@ -0,0 +1,99 @@
+"""
+Benchmark: vision-worker frame extraction, old two-pass path vs image2pipe.
+
+"files" is the old worker: ffmpeg writes frames/%06d.jpg to completion, then
+the directory is globbed for the byte total, again for the index and again
+for the cover. "stream" is worker/frames.py: frames arrive over a pipe and
+are written, counted and indexed as they come; the cover is then picked
+from the index (worker/cover.py). Also reports how long the
+stream path takes to notice a quota overrun (--quota-mb) and stop ffmpeg.
+
+    python bench/bench_frames_stream.py --minutes 10 --quota-mb 2
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "vision-worker"))
+
+from worker import cover, frames
+
+INTERVAL = 5
+QSCALE = 3
+
+
+def make_video(path: str, minutes: float):
+    subprocess.check_call([
+        "ffmpeg", "-v", "error", "-y", "-f", "lavfi",
+        "-i", f"testsrc2=size=1280x720:rate=25:duration={minutes * 60}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "250", "-pix_fmt", "yuv420p", path,
+    ])
+
+
+def run_files(video: str, out: str) -> tuple:
+    subprocess.check_call(["ffmpeg", "-v", "error", "-y", "-i", video, "-vf", f"fps=1/{INTERVAL}",
+                           "-q:v", str(QSCALE), os.path.join(out, "%06d.jpg")])
+    total = sum(os.path.getsize(f) for f in glob.glob(os.path.join(out, "*.jpg")))
+    index = sorted(glob.glob(os.path.join(out, "*.jpg")))
+    cover = sorted(glob.glob(os.path.join(out, "*.jpg")))[len(index) // 2]
+    return len(index), total, cover
+
+
+def run_stream(video: str, out: str, quota: int = 0) -> tuple:
+    index, total = frames.extract(video, frames.FileStore(out), INTERVAL, QSCALE,
+                                  admit=(lambda n: n <= quota) if quota else None)
+    return len(index), total, cover.pick((e["frame"], read(out, e["frame"])) for e in index)
+
+
+def read(out: str, name: str) -> bytes:
+    with open(os.path.join(out, name), "rb") as f:
+        return f.read()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--minutes", type=float, default=10)
+    ap.add_argument("--quota-mb", type=float, default=2)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench-frames-")
+    try:
+        video = os.path.join(tmp, "lesson.mp4")
+        make_video(video, args.minutes)
+        for name, fn in (("files", run_files), ("stream", run_stream)):
+            best = None
+            for _ in range(args.repeat):
+                out = os.path.join(tmp, name)
+                shutil.rmtree(out, ignore_errors=True)
+                os.makedirs(out)
+                t0 = time.perf_counter()
+                n, total, _ = fn(video, out)
+                wall = time.perf_counter() - t0
+                best = min(best or wall, wall)
+            print(f"{name:7s} frames={n:5d} bytes={total / 1024 / 1024:7.1f} MB  wall={best:6.2f}s")
+
+        out = os.path.join(tmp, "quota")
+        os.makedirs(out)
+        t0 = time.perf_counter()
+        try:
+            run_stream(video, out, int(args.quota_mb * 1024 * 1024))
+        except OverflowError:
+            pass
+        written = sum(os.path.getsize(os.path.join(out, f)) for f in os.listdir(out))
+        print(f"quota   {args.quota_mb} MB: stopped after {time.perf_counter() - t0:.2f}s, "
+              f"{len(os.listdir(out))} frames / {written / 1024 / 1024:.2f} MB on disk")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
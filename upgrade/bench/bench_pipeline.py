@@ -0,0 +1,388 @@
+"""
+Benchmark: the media pipeline end to end, offline, against a stored baseline.
+
+Generates a synthetic lesson with ffmpeg lavfi sources (testsrc2 pattern at
+--size, a tone that talks for --speech-ratio of every --period seconds over
+a faint noise floor), then runs each stage the way the services do, each in
+a fresh child process:
+  upload                  media-api POST /upload through the FastAPI
+                          TestClient (in-process fakeredis, no MariaDB)
+  ffmpeg_extract_audio    asr-worker audio.extract_wav -> audio/audio.wav
+  transcribe              energy VAD chunks -> deterministic CPU stub model
+                          -> checkpoint -> transcript.json/.txt/.srt
+  extract_frames          vision-worker extract_frames (dedup, FRAME_STORE)
+  build_frames_index      artifacts/frames_index.json
+  create_cover_and_thumb  activity cover pick + cover.jpg / thumb.jpg
+
+Worker settings come from the environment as in production (e.g.
+FRAME_DEDUP=off, FRAME_STORE=pack, FRAME_EXTRACT_JOBS=4).
+
+Per stage: wall time and CPU time (user + sys, ffmpeg children included) of
+the stage itself, interpreter start-up + the service's imports (startup_s),
+peak RSS (largest process of the stage, from wait4) and bytes written
+(growth of the job dir). The best of --repeat runs goes to --out as JSON and is
+compared with --baseline: a stage slower / bigger than the baseline by more
+than --tolerance (and by more than the noise floors), or producing other
+output counts, is a regression and the exit status is 1. Baselines are only
+comparable for the same video parameters and a similar box.
+
+    python bench/bench_pipeline.py                       # 2 min 640x360, vs bench/baseline_pipeline.json
+    python bench/bench_pipeline.py --minutes 10 --size 1280x720 --speech-ratio 0.5
+    python bench/bench_pipeline.py --save-baseline       # record this box's numbers
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+BASELINE = os.path.join(HERE, "baseline_pipeline.json")
+
+STAGES = ("upload", "ffmpeg_extract_audio", "transcribe", "extract_frames",
+          "build_frames_index", "create_cover_and_thumb")
+SERVICE = {
+    "upload": "media-api",
+    "ffmpeg_extract_audio": "asr-worker",
+    "transcribe": "asr-worker",
+    "extract_frames": "vision-worker",
+    "build_frames_index": "vision-worker",
+    "create_cover_and_thumb": "vision-worker",
+}
+PRELOAD = {  # imported before the clock starts: interpreter start-up is not the stage
+    "media-api": ("fakeredis", "fastapi.testclient", "app.main"),
+    "asr-worker": ("worker.audio", "worker.transcript"),
+    "vision-worker": ("worker.run",),
+}
+JOB_ID = "bench-job"
+USER_ID = "bench-user"
+SAMPLE_RATE = 16000
+
+# regressions smaller than these are noise on a shared box
+MIN_SECONDS = 0.05
+MIN_RSS_MB = 5.0
+MIN_BYTES = 64 * 1024
+
+
+# ─── Synthetic lesson ───
+
+def make_video(path: str, seconds: float, size: str, fps: int, speech_ratio: float, period: float):
+    """Test pattern + a 180 Hz voice-like tone (4 Hz syllable envelope) on
+    for speech_ratio of every period, over -54 dBFS noise."""
+    talk = max(0.0, min(1.0, speech_ratio)) * period
+    voice = (f"0.2*sin(2*PI*180*t)*(0.6+0.4*sin(2*PI*4*t))*lt(mod(t\\,{period:g})\\,{talk:g})"
+             f"+0.002*(random(0)-0.5)")
+    subprocess.check_call([
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}",
+        "-f", "lavfi", "-i", f"aevalsrc={voice}:s=44100",
+        "-t", f"{seconds:g}", "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest", path,
+    ])
+
+
+def ffmpeg_version() -> str:
+    try:
+        return subprocess.check_output(["ffmpeg", "-version"], text=True).splitlines()[0]
+    except (OSError, subprocess.CalledProcessError):
+        return "?"
+
+
+# ─── Stages (child process) ───
+
+class StubModel:
+    """Deterministic stand-in for transcribe(): one segment per 5 s of the
+    chunk it is given, labelled by its loudness, after touching every
+    sample once (the cost of handing audio to a real model)."""
+
+    def __call__(self, samples, offset: float):
+        import numpy as np
+
+        step = 5 * SAMPLE_RATE
+
+        def segs():
+            for i in range(0, len(samples), step):
+                part = samples[i:i + step]
+                level = float(np.sqrt(np.mean(np.square(part, dtype=np.float32)))) if len(part) else 0.0
+                yield {
+                    "start": round(offset + i / SAMPLE_RATE, 2),
+                    "end": round(offset + (i + len(part)) / SAMPLE_RATE, 2),
+                    "text": f"ช่วงที่ {i // step + 1} ระดับ {level:.3f}",
+                }
+        return segs(), {"language": "th", "probability": 1.0}
+
+
+class Unlimited:
+    """Quota reservation that always grows (quota is not what is measured)."""
+
+    def ensure(self, total: int, step: int = 0) -> bool:
+        return True
+
+
+def stage_upload(work: str, job_dir: str) -> dict:
+    import fakeredis
+    import fakeredis.aioredis
+    from fastapi.testclient import TestClient
+
+    from app import events, main
+    from common.quota import QuotaLedger
+
+    server = fakeredis.FakeServer()
+    main.r = fakeredis.FakeRedis(server=server)
+    main.DATA_ROOT = os.path.dirname(job_dir)
+    main.ledger = QuotaLedger(main.r, 1 << 40)
+    main.broker = events.ProgressBroker(fakeredis.aioredis.FakeRedis(server=server))
+    with open(os.path.join(work, "lesson.mp4"), "rb") as f, TestClient(main.app) as client:
+        resp = client.post(f"/api/v1/jobs/{JOB_ID}/upload", headers={"X-User-Id": USER_ID},
+                           files={"file": ("lesson.mp4", f, "video/mp4")})
+    resp.raise_for_status()
+    return {"raw_bytes": resp.json()["raw_bytes"]}
+
+
+def stage_extract_audio(work: str, job_dir: str) -> dict:
+    from worker import audio
+
+    os.makedirs(os.path.join(job_dir, "audio"), exist_ok=True)
+    size = audio.extract_wav(os.path.join(job_dir, "raw", "video.mp4"), os.path.join(job_dir, "audio", "audio.wav"))
+    return {"wav_bytes": size}
+
+
+def stage_transcribe(work: str, job_dir: str) -> dict:
+    from worker import audio, transcript
+
+    art_dir = os.path.join(job_dir, "artifacts")
+    samples = audio.read_wav(os.path.join(job_dir, "audio", "audio.wav"))
+    ckpt = transcript.Checkpoint(os.path.join(art_dir, transcript.CHECKPOINT_FILE), key="bench")
+    meta = transcript.Transcriber(StubModel(), ckpt).run([(0.0, samples)])
+    n = transcript.write_artifacts(art_dir, ckpt.iter_segments(), meta)
+    ckpt.remove()
+    return {"segments": n, "speech_sec": meta.get("speech_sec", 0.0)}
+
+
+def stage_extract_frames(work: str, job_dir: str) -> dict:
+    from worker import dedup
+    from worker import run as vision
+
+    video = os.path.join(job_dir, "raw", "video.mp4")
+    deduper = dedup.Deduper(vision.FRAME_DEDUP, vision.FRAME_DEDUP_MAX_DIST) if vision.FRAME_DEDUP != "off" else None
+    index, total = vision.extract_frames(video, os.path.join(job_dir, "frames"), Unlimited(), deduper=deduper,
+                                         duration=vision.get_video_duration(video))
+    with open(os.path.join(work, "index.json"), "w", encoding="utf-8") as f:  # handed to the next stages
+        json.dump(index, f)
+    return {"frames": len(index), "aliased": sum(1 for e in index if e.get("alias")), "frames_bytes": total}
+
+
+def _load_index(work: str) -> list:
+    with open(os.path.join(work, "index.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def stage_build_index(work: str, job_dir: str) -> dict:
+    from worker import run as vision
+
+    index = _load_index(work)
+    vision.write_frames_index(index, os.path.join(job_dir, "artifacts"))
+    return {"entries": len(index)}
+
+
+def stage_cover(work: str, job_dir: str) -> dict:
+    from worker import run as vision
+
+    art_dir = os.path.join(job_dir, "artifacts")
+    vision.create_cover_and_thumb(os.path.join(job_dir, "frames"), _load_index(work), art_dir)
+    return {"cover": os.path.exists(os.path.join(art_dir, "cover.jpg"))}
+
+
+RUNNERS = {
+    "upload": stage_upload,
+    "ffmpeg_extract_audio": stage_extract_audio,
+    "transcribe": stage_transcribe,
+    "extract_frames": stage_extract_frames,
+    "build_frames_index": stage_build_index,
+    "create_cover_and_thumb": stage_cover,
+}
+
+
+def child(stage: str, work: str):
+    # each service has its own `worker` package: one service per process
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.join(ROOT, SERVICE[stage]))
+    for name in PRELOAD[SERVICE[stage]]:
+        importlib.import_module(name)
+    job_dir = os.path.join(work, "jobs", JOB_ID)
+    with open(os.devnull, "w") as quiet:  # keep the workers' progress prints off the result pipe
+        out, sys.stdout = sys.stdout, quiet
+        try:
+            t0, cpu0 = time.perf_counter(), _cpu()
+            info = RUNNERS[stage](work, job_dir)
+            wall, cpu = time.perf_counter() - t0, _cpu() - cpu0
+        finally:
+            sys.stdout = out
+    print(json.dumps({"wall_s": round(wall, 3), "cpu_s": round(cpu, 3), "output": info}))
+
+
+def _cpu() -> float:
+    """CPU seconds of this process and the ffmpegs it has waited for."""
+    own, kids = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime
+
+
+# ─── Driver ───
+
+def tree_bytes(path: str) -> int:
+    total = 0
+    for dirpath, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def run_stage(stage: str, work: str) -> dict:
+    job_dir = os.path.join(work, "jobs", JOB_ID)
+    before = tree_bytes(job_dir)
+    env = {**os.environ, "DATA_ROOT": os.path.join(work, "jobs"), "METRICS_PORT": "0",
+           "CACHE_ROOT": os.path.join(work, "cache")}
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", stage, "--work", work],
+                            stdout=subprocess.PIPE, env=env)
+    out = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    if status:
+        raise SystemExit(f"{stage} failed")
+    timed = json.loads(out)
+    return {
+        **timed,
+        "startup_s": round(max(0.0, wall - timed["wall_s"]), 3),
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "bytes_written": tree_bytes(job_dir) - before,
+    }
+
+
+def run_pipeline(video: str, root: str) -> dict:
+    work = tempfile.mkdtemp(prefix="bench-pipeline-", dir=root)
+    try:
+        shutil.copyfile(video, os.path.join(work, "lesson.mp4"))
+        return {stage: run_stage(stage, work) for stage in STAGES}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def best_of(runs: list) -> dict:
+    """Per stage: least wall / CPU of the runs (the least disturbed), the
+    highest peak RSS and bytes (those don't get better by luck)."""
+    out = {}
+    for stage in STAGES:
+        xs = [run[stage] for run in runs]
+        out[stage] = {
+            "wall_s": min(x["wall_s"] for x in xs),
+            "cpu_s": min(x["cpu_s"] for x in xs),
+            "startup_s": min(x["startup_s"] for x in xs),
+            "peak_rss_mb": max(x["peak_rss_mb"] for x in xs),
+            "bytes_written": max(x["bytes_written"] for x in xs),
+            "output": xs[0]["output"],
+        }
+    return out
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions of result against baseline, as printable lines."""
+    floors = {"wall_s": MIN_SECONDS, "cpu_s": MIN_SECONDS, "peak_rss_mb": MIN_RSS_MB, "bytes_written": MIN_BYTES}
+    problems = []
+    for stage in STAGES:
+        new, old = result["stages"][stage], baseline["stages"].get(stage)
+        if old is None:
+            continue
+        for key, floor in floors.items():
+            if new[key] > old[key] * (1 + tolerance) and new[key] - old[key] > floor:
+                problems.append(f"{stage}: {key} {old[key]} -> {new[key]} (+{(new[key] / old[key] - 1) * 100:.0f}%)"
+                                if old[key] else f"{stage}: {key} 0 -> {new[key]}")
+        if new["output"] != old["output"]:
+            problems.append(f"{stage}: output {old['output']} -> {new['output']}")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--minutes", type=float, default=2)
+    ap.add_argument("--size", default="640x360")
+    ap.add_argument("--fps", type=int, default=25)
+    ap.add_argument("--speech-ratio", type=float, default=0.7, help="share of each period with a voice")
+    ap.add_argument("--period", type=float, default=20.0, help="talk + pause cycle, seconds")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--out", default="pipeline_results.json")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed growth over the baseline")
+    ap.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    ap.add_argument("--root", help="scratch dir (default: the system temp dir)")
+    ap.add_argument("--child", choices=STAGES, help=argparse.SUPPRESS)
+    ap.add_argument("--work", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(args.child, args.work)
+        return
+
+    params = {"minutes": args.minutes, "size": args.size, "fps": args.fps,
+              "speech_ratio": args.speech_ratio, "period": args.period}
+    with tempfile.TemporaryDirectory(dir=args.root) as scratch:
+        video = os.path.join(scratch, "lesson.mp4")
+        make_video(video, args.minutes * 60, args.size, args.fps, args.speech_ratio, args.period)
+        params["video_bytes"] = os.path.getsize(video)
+        print(f"video: {args.minutes:g} min {args.size}@{args.fps} speech {args.speech_ratio:.0%}, "
+              f"{params['video_bytes'] / 1e6:.1f} MB; {args.repeat} run(s)")
+        runs = [run_pipeline(video, args.root) for _ in range(args.repeat)]
+
+    result = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(),
+                 "cpus": os.cpu_count(), "ffmpeg": ffmpeg_version()},
+        "video": params,
+        "repeat": args.repeat,
+        "stages": best_of(runs),
+    }
+    print(f"{'stage':24s} {'wall s':>8} {'cpu s':>8} {'start s':>8} {'rss MB':>8} {'written MB':>11}  output")
+    for stage, s in result["stages"].items():
+        print(f"{stage:24s} {s['wall_s']:8.2f} {s['cpu_s']:8.2f} {s['startup_s']:8.2f} {s['peak_rss_mb']:8.0f} "
+              f"{s['bytes_written'] / 1e6:11.2f}  {json.dumps(s['output'], ensure_ascii=False)}")
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"results: {args.out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"baseline saved: {args.baseline}")
+        return
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print("no baseline to compare with (--save-baseline records one)")
+        return
+    if any(baseline["video"].get(k) != v for k, v in params.items() if k != "video_bytes"):
+        print(f"baseline is for another video ({baseline['video']}), not compared")
+        return
+    problems = compare(result, baseline, args.tolerance)
+    for line in problems:
+        print(f"REGRESSION {line}")
+    if problems:
+        sys.exit(1)
+    print(f"no regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark: bytes re-sent over a flaky link, single-shot vs resumable upload.
+
+The link drops after an exponentially distributed number of bytes (mean
+--mean-drop-mb). Single-shot uploads restart from byte 0 after every drop
+(the server deletes the partial file). Resumable uploads go through the real
+media-api routes in-process (PATCH with Upload-Offset, HEAD after a drop);
+bytes still in flight when the link drops (--inflight-kb) are lost.
+
+Runs offline: Redis is fakeredis unless --redis-url is given.
+
+    python bench/bench_resumable_upload.py --size-mb 256 --mean-drop-mb 16 64 256
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "media-api"))
+
+import redis
+from fastapi.testclient import TestClient
+
+from app import main as media_api
+from common.quota import QuotaLedger
+
+MB = 1024 * 1024
+
+
+def single_shot(size: int, drops) -> int:
+    """Bytes sent until one full attempt survives."""
+    sent = 0
+    while True:
+        d = next(drops)
+        if d >= size:
+            return sent + size
+        sent += d
+
+
+def resumable(client, job_id: str, data: bytes, chunk: int, inflight: int, drops):
+    """Upload via the resumable API. Returns (bytes sent, requests made)."""
+    size = len(data)
+    client.post(f"/api/v1/jobs/{job_id}/upload/resumable", json={"size": size})
+    sent = requests = 0
+    offset = 0
+    budget = next(drops)  # bytes until the link drops
+    while offset < size:
+        body = data[offset:offset + chunk]
+        if budget < len(body):
+            # link drops mid-request: only bytes that made it past the socket buffer land
+            landed = max(0, budget - inflight)
+            sent += budget
+            client.patch(f"/api/v1/jobs/{job_id}/upload", content=body[:landed],
+                         headers={"Upload-Offset": str(offset)})
+            head = client.head(f"/api/v1/jobs/{job_id}/upload")
+            offset = int(head.headers["Upload-Offset"])
+            requests += 2
+            budget = next(drops)
+            continue
+        budget -= len(body)
+        sent += len(body)
+        resp = client.patch(f"/api/v1/jobs/{job_id}/upload", content=body,
+                            headers={"Upload-Offset": str(offset)})
+        requests += 1
+        offset += len(body)
+        if resp.status_code not in (200, 204):
+            raise RuntimeError(f"PATCH failed: {resp.status_code} {resp.text}")
+    return sent, requests
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size-mb", type=int, default=256)
+    ap.add_argument("--chunk-mb", type=int, default=8)
+    ap.add_argument("--inflight-kb", type=int, default=256)
+    ap.add_argument("--mean-drop-mb", type=float, nargs="+", default=[16, 64, 256, 1024])
+    ap.add_argument("--trials", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--redis-url", default=None)
+    args = ap.parse_args()
+
+    if args.redis_url:
+        r = redis.from_url(args.redis_url)
+    else:
+        import fakeredis
+        r = fakeredis.FakeRedis()
+
+    size = args.size_mb * MB
+    block = os.urandom(MB)
+    data = block * args.size_mb
+
+    with tempfile.TemporaryDirectory() as root:
+        media_api.DATA_ROOT = root
+        media_api.r = r
+        media_api.ledger = QuotaLedger(r, 1 << 50)
+        client = TestClient(media_api.app)
+
+        print(f"size={args.size_mb} MiB chunk={args.chunk_mb} MiB inflight={args.inflight_kb} KiB "
+              f"trials={args.trials}")
+        print(f"{'mean drop MiB':>14} {'single-shot x':>14} {'resumable x':>12} {'requests':>9} {'s/upload':>9}")
+        for mean in args.mean_drop_mb:
+            rng = random.Random(args.seed)
+            drops = iter(lambda: int(rng.expovariate(1 / (mean * MB))), None)
+            base = sum(single_shot(size, drops) for _ in range(args.trials)) / args.trials
+
+            rng = random.Random(args.seed)
+            drops = iter(lambda: int(rng.expovariate(1 / (mean * MB))), None)
+            sent = reqs = 0
+            t0 = time.perf_counter()
+            for t in range(args.trials):
+                job_id = f"bench-{mean}-{t}"
+                s, n = resumable(client, job_id, data, args.chunk_mb * MB, args.inflight_kb * 1024, drops)
+                sent += s
+                reqs += n
+                os.remove(os.path.join(root, job_id, "raw", "video.mp4"))
+            dt = (time.perf_counter() - t0) / args.trials
+            print(f"{mean:>14g} {base / size:>14.2f} {sent / args.trials / size:>12.3f} "
+                  f"{reqs / args.trials:>9.1f} {dt:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
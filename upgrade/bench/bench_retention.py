@@ -0,0 +1,114 @@
+"""
+Benchmark: retention-worker sweep throughput on fake expired jobs.
+
+Builds --jobs job dirs on a tmpfs (default /dev/shm) with a frames/ store
+each (--layout files: --frames empty JPEG files per job; pack: frames.pack +
+frames.idx; every 100th job also gets artifacts that must survive: /dev/shm
+is usually capped at ~770k inodes), then runs worker/retention.py's
+Sweeper over them for each --threads value and prints jobs/second. The
+analysis_job table is an in-memory stand-in with the same keyset paging, so
+the numbers are the traversal + unlink + batching cost, not MariaDB's; the
+query and transaction counts are printed to size that part.
+
+    python bench/bench_retention.py --jobs 100000 --threads 1 4 8
+    python bench/bench_retention.py --layout pack --max-ops 20000
+"""
+
+import argparse
+import bisect
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "retention-worker"))
+
+from worker import retention
+
+NOW = datetime(2027, 1, 1)
+
+
+class MemoryStore(retention.JobStore):
+    """Expired-job rows in a sorted list; counts round trips."""
+
+    def __init__(self, n: int):
+        self.keys = sorted((NOW - timedelta(seconds=n - i), f"job{i:07d}") for i in range(n))
+        self.user = {job_id: f"u{i % 500}" for i, (_, job_id) in enumerate(self.keys)}
+        self.deleted = set()
+        self.queries = self.transactions = 0
+
+    def expired(self, cutoff, after, limit):
+        self.queries += 1
+        out = []
+        for t, job_id in self.keys[bisect.bisect_right(self.keys, after):]:
+            if t > cutoff or len(out) == limit:
+                break
+            if job_id not in self.deleted:
+                out.append((job_id, t))
+        return out
+
+    def mark_deleted(self, job_ids):
+        self.transactions += 1
+        freed = {}
+        for job_id in job_ids:
+            if job_id not in self.deleted:
+                self.deleted.add(job_id)
+                uid = self.user[job_id]
+                freed[uid] = freed.get(uid, 0) + 50_000
+        return freed
+
+
+def make_jobs(root: str, n: int, layout: str, frames: int):
+    for i in range(n):
+        job = os.path.join(root, f"job{i:07d}")
+        d = os.path.join(job, "frames")
+        os.makedirs(d)
+        if i % 100 == 0:
+            os.mkdir(os.path.join(job, "artifacts"))
+            open(os.path.join(job, "artifacts", "cover.jpg"), "wb").close()
+        names = ["frames.pack", "frames.idx"] if layout == "pack" else [f"{k + 1:06d}.jpg" for k in range(frames)]
+        for name in names:
+            open(os.path.join(d, name), "wb").close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--jobs", type=int, default=100_000)
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    ap.add_argument("--batch", type=int, default=500)
+    ap.add_argument("--layout", choices=["files", "pack"], default="files")
+    ap.add_argument("--frames", type=int, default=3, help="files per job with --layout files")
+    ap.add_argument("--max-ops", type=float, default=0, help="unlinks/s limit (0 = none)")
+    ap.add_argument("--root", default="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    args = ap.parse_args()
+
+    per_job = 2 if args.layout == "pack" else args.frames
+    print(f"{args.jobs} jobs, {args.layout} layout ({per_job} files each), batch {args.batch}, "
+          f"cores {os.cpu_count()}, root {args.root or tempfile.gettempdir()}")
+    print(f"{'threads':>8} {'setup s':>8} {'sweep s':>8} {'jobs/s':>9} {'files/s':>9} {'queries':>8} {'txns':>6}")
+    for threads in args.threads:
+        root = tempfile.mkdtemp(prefix="bench-retention-", dir=args.root)
+        try:
+            t0 = time.perf_counter()
+            make_jobs(root, args.jobs, args.layout, args.frames)
+            setup = time.perf_counter() - t0
+            store = MemoryStore(args.jobs)
+            sweeper = retention.Sweeper(store, root, threads=threads, batch=args.batch,
+                                        limiter=retention.RateLimiter(args.max_ops) if args.max_ops else None)
+            stats = sweeper.run(NOW)
+            assert stats["jobs"] == args.jobs and stats["files"] == args.jobs * per_job, stats
+            assert not os.path.exists(os.path.join(root, "job0000000", "frames"))
+            assert os.path.exists(os.path.join(root, "job0000000", "artifacts", "cover.jpg"))
+            sec = stats["seconds"]
+            print(f"{threads:>8} {setup:8.1f} {sec:8.2f} {stats['jobs'] / sec:9.0f} "
+                  f"{stats['files'] / sec:9.0f} {store.queries:>8} {store.transactions:>6}")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
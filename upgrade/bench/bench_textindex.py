@@ -0,0 +1,120 @@
+"""
+Benchmark: transcript search index (common/textindex.py).
+
+Builds an index the way the asr-worker does, one add_job() per lesson
+(--hours lessons of an hour, --per-hour segments each), over synthetic Thai
+text: words of 1-4 syllables from a Zipf-distributed vocabulary, no spaces
+inside sentences. Reports:
+  build    add_job() per lesson (merges included), index bytes per hour
+  query    --queries searches each of: a frequent word, a rare word, two
+           words, a 4-character fragment; p50 / p95 ms and hits
+  scan     the same rare-word query as a scan of every transcript.json
+           (what finding a phrase took without the index), on the
+           smallest --hours only
+
+    python bench/bench_textindex.py --hours 100 1000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import numpy as np
+
+from common import textindex
+
+CONSONANTS = "กขคงจฉชซญดตถทนบปผพฟมยรลวศสหอ"
+VOWELS = ["ะ", "า", "ิ", "ี", "ึ", "ื", "ุ", "ู", "เ", "แ", "โ", "ไ", "ั", "ำ", "อ"]
+TONES = ["", "", "", "่", "้"]
+
+
+def vocabulary(rng, size: int) -> list:
+    words = set()
+    while len(words) < size:
+        syll = [c + v + t for c, v, t in zip(rng.choice(list(CONSONANTS), 4), rng.choice(VOWELS, 4), rng.choice(TONES, 4))]
+        words.add("".join(syll[:int(rng.integers(1, 5))]))
+    return sorted(words)
+
+
+def lessons(rng, vocab: list, hours: int, per_hour: int):
+    """(job_id, segments) per lesson."""
+    p = 1 / np.arange(1, len(vocab) + 1)
+    p /= p.sum()
+    for j in range(hours):
+        words = rng.choice(len(vocab), size=(per_hour, 12), p=p)
+        lens = rng.integers(4, 13, per_hour)
+        segs = [{"start": round(i * 3600 / per_hour, 2), "end": round((i + 0.8) * 3600 / per_hour, 2),
+                 "text": "".join(vocab[w] for w in words[i, :lens[i]]) + (" ครับ" if i % 7 == 0 else "")}
+                for i in range(per_hour)]
+        yield f"lesson-{j:06d}", segs
+
+
+def timed_queries(ix, queries: list) -> tuple:
+    ms, hits = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        res = ix.search(q, limit=20)
+        ms.append((time.perf_counter() - t0) * 1e3)
+        hits.append(res["total"])
+    return np.percentile(ms, 50), np.percentile(ms, 95), int(np.median(hits))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--hours", type=int, nargs="+", default=[100, 400])
+    ap.add_argument("--per-hour", type=int, default=900, help="transcript segments per hour")
+    ap.add_argument("--vocab", type=int, default=20_000)
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vocab = vocabulary(rng, args.vocab)
+    long_words = [w for w in vocab if len(w) >= 6]
+    kinds = {
+        "frequent": [w for w in vocab[:50] if len(w) >= 3][:args.queries],
+        "rare": [str(w) for w in rng.choice(long_words[len(long_words) // 2:], args.queries)],
+        "two words": [f"{a} {b}" for a, b in zip(rng.choice(vocab[:500], args.queries), rng.choice(vocab[:500], args.queries))],
+        "fragment": [str(w)[:4] for w in rng.choice(long_words[:2000], args.queries)],
+    }
+
+    print(f"{'hours':>6} {'segments':>9} {'build s':>8} {'ms/lesson':>10} {'MB':>7} {'KB/hour':>8} {'files':>6}  "
+          + "  ".join(f"{k + ' p50/p95 ms (hits)':>30}" for k in kinds))
+    for k, hours in enumerate(sorted(args.hours)):
+        with tempfile.TemporaryDirectory() as root:
+            t0 = time.perf_counter()
+            n = 0
+            scan_dir = os.path.join(root, "jobs")
+            for job_id, segs in lessons(np.random.default_rng(args.seed + 1), vocab, hours, args.per_hour):
+                n += textindex.add_job(os.path.join(root, "index"), job_id, segs)
+                if k == 0:
+                    os.makedirs(os.path.join(scan_dir, job_id))
+                    with open(os.path.join(scan_dir, job_id, "transcript.json"), "w", encoding="utf-8") as f:
+                        json.dump({"segments": segs}, f, ensure_ascii=False)
+            build = time.perf_counter() - t0
+            ix = textindex.TextIndex(os.path.join(root, "index"))
+            st = ix.stats()
+            row = [timed_queries(ix, qs) for qs in kinds.values()]
+            print(f"{hours:6d} {n:9d} {build:8.1f} {build / hours * 1e3:10.0f} {st['bytes'] / 1e6:7.1f} "
+                  f"{st['bytes'] / hours / 1e3:8.0f} {st['segments']:6d}  "
+                  + "  ".join(f"{f'{p50:.2f} / {p95:.2f} ({h})':>30}" for p50, p95, h in row))
+            if k == 0:
+                q = kinds["rare"][0]
+                t0 = time.perf_counter()
+                found = 0
+                for job_id in os.listdir(scan_dir):
+                    with open(os.path.join(scan_dir, job_id, "transcript.json"), encoding="utf-8") as f:
+                        found += sum(q in s["text"] for s in json.load(f)["segments"])
+                scan = (time.perf_counter() - t0) * 1e3
+                assert found == ix.search(q)["total"]
+                print(f"{'':6} scan of {hours} transcript.json for {q!r}: {scan:.0f} ms ({found} hits)")
+
+
+if __name__ == "__main__":
+    main()
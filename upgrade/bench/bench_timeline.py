@@ -0,0 +1,104 @@
+"""
+Benchmark: transcript <-> frames timeline join (common/timeline.py).
+
+Writes a synthetic transcript.json (--per-hour segments per hour, 1-12 s
+each, a few overlapping) and frames_index.json (one frame per --interval)
+for each --hours value, then times:
+  join     Timeline(...) on arrays already in memory (the searchsorted join)
+  build    build_if_ready(): both JSON files in, timeline.json out
+  load     Timeline.load(timeline.json)
+  query    --queries random between(t0, t0 + 60 s) calls
+For the smallest size the pairwise join (every segment against every
+frame, what a nested loop does) is timed too, as the reference. Per-segment
+cost staying flat as --hours grows is the linear scaling.
+
+    python bench/bench_timeline.py --hours 1 4 16 --per-hour 3000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import numpy as np
+
+from common import timeline
+
+
+def make_artifacts(art_dir: str, hours: float, per_hour: int, interval: int, seed: int = 0) -> tuple:
+    rng = np.random.default_rng(seed)
+    duration = hours * 3600
+    n = int(hours * per_hour)
+    start = np.sort(rng.uniform(0, duration, n)).round(2)
+    end = (start + rng.uniform(1, 12, n)).round(2)
+    segments = [{"start": float(s), "end": float(e), "text": f"ประโยคที่ {i}"} for i, (s, e) in
+                enumerate(zip(start, end))]
+    frame_t = np.arange(0, duration, interval)
+    index = [{"frame": f"{i + 1:06d}.jpg", "timestamp_sec": int(t), "timestamp_str": f"{int(t // 60):02d}:{int(t % 60):02d}"}
+             for i, t in enumerate(frame_t)]
+    with open(os.path.join(art_dir, timeline.TRANSCRIPT_FILE), "w", encoding="utf-8") as f:
+        json.dump({"segments": segments, "meta": {"language": "th"}}, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(art_dir, timeline.FRAMES_INDEX_FILE), "w", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
+    return start, end, [s["text"] for s in segments], frame_t, [e["frame"] for e in index]
+
+
+def pairwise(start, end, frame_t, interval: int) -> list:
+    """The nested-loop join the timeline replaces."""
+    until = list(frame_t[1:]) + [frame_t[-1] + interval]
+    frame_t = list(frame_t)
+    out = []
+    for s, e in zip(start.tolist(), end.tolist()):
+        on = [i for i, (t, u) in enumerate(zip(frame_t, until)) if t < e and u > s]
+        out.append((on[0], on[-1]) if on else (-1, -1))
+    return out
+
+
+def timed(fn, repeat: int = 3):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--hours", type=float, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--per-hour", type=int, default=3000, help="segments per hour of recording")
+    ap.add_argument("--interval", type=int, default=5, help="seconds between frames")
+    ap.add_argument("--queries", type=int, default=10_000)
+    args = ap.parse_args()
+
+    print(f"{'hours':>6} {'segments':>9} {'frames':>7} {'join ms':>8} {'ns/seg':>7} {'build ms':>9} "
+          f"{'load ms':>8} {'json MB':>8} {'query us':>9} {'pairwise ms':>12}")
+    for k, hours in enumerate(sorted(args.hours)):
+        with tempfile.TemporaryDirectory() as art:
+            start, end, texts, frame_t, names = make_artifacts(art, hours, args.per_hour, args.interval)
+            join, tl = timed(lambda: timeline.Timeline(start, end, texts, frame_t, names, interval=args.interval))
+            build, _ = timed(lambda: timeline.build_if_ready(art))
+            path = os.path.join(art, timeline.TIMELINE_FILE)
+            load, again = timed(lambda: timeline.Timeline.load(path))
+            assert np.array_equal(again.frame_first, tl.frame_first) and np.array_equal(again.frame_last, tl.frame_last)
+
+            t0s = np.random.default_rng(1).uniform(0, hours * 3600, args.queries).tolist()
+            query, _ = timed(lambda: [tl.between(t0, t0 + 60) for t0 in t0s], repeat=1)
+
+            ref = ""
+            if k == 0:
+                sec, pairs = timed(lambda: pairwise(start, end, frame_t, args.interval), repeat=1)
+                assert pairs == list(zip(tl.frame_first.tolist(), tl.frame_last.tolist()))
+                ref = f"{sec * 1e3:12.0f}"
+            n = len(tl)
+            print(f"{hours:6g} {n:9d} {len(frame_t):7d} {join * 1e3:8.1f} {join / n * 1e9:7.0f} {build * 1e3:9.0f} "
+                  f"{load * 1e3:8.0f} {os.path.getsize(path) / 1e6:8.2f} {query / args.queries * 1e6:9.1f} {ref:>12}")
+
+
+if __name__ == "__main__":
+    main()
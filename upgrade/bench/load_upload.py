@@ -0,0 +1,144 @@
+"""
+Load test: N concurrent multipart uploads + a /quota latency probe.
+
+Reports aggregate upload MB/s and p50/p99/max latency of GET /api/v1/quota
+measured while the uploads run (an event-loop stall shows up as a p99 spike).
+
+Against a running media-api:
+    python bench/load_upload.py --url http://127.0.0.1:9940 -n 8 --size-mb 500
+
+Or let the script start uvicorn for a media-api tree (e.g. a git worktree of an
+older commit to get "before" numbers) on a scratch DATA_ROOT:
+    python bench/load_upload.py --spawn media-api --redis-url redis://127.0.0.1:6379/0
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+MB = 1024 * 1024
+BOUNDARY = "----media-api-load-test"
+
+
+async def multipart_body(size: int):
+    block = os.urandom(MB)
+    yield (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"v.mp4\"\r\n"
+           f"Content-Type: video/mp4\r\n\r\n").encode()
+    left = size
+    while left > 0:
+        n = min(left, MB)
+        yield block[:n]
+        left -= n
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def one_upload(client: httpx.AsyncClient, i: int, size: int) -> int:
+    job = (await client.post("/api/v1/jobs", json={})).json()["job_id"]
+    resp = await client.post(
+        f"/api/v1/jobs/{job}/upload",
+        content=multipart_body(size),
+        headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}",
+                 "X-User-Id": f"load-{i}"},
+    )
+    resp.raise_for_status()
+    return resp.json()["raw_bytes"]
+
+
+def probe(url: str, stop, every: float, out):
+    """Runs in its own process so client-side load does not skew the numbers."""
+    lat = []
+    with httpx.Client(base_url=url) as client:
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            client.get("/api/v1/quota").raise_for_status()
+            lat.append(time.perf_counter() - t0)
+            time.sleep(every)
+    out.send(lat)
+
+
+def start_probe(url: str, every: float):
+    stop = multiprocessing.Event()
+    recv, send = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.Process(target=probe, args=(url, stop, every, send))
+    proc.start()
+
+    def finish() -> list:
+        stop.set()
+        lat = recv.recv()
+        proc.join()
+        return lat
+
+    return finish
+
+
+def pct(xs: list, p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))] * 1000 if xs else float("nan")
+
+
+async def run(url: str, n: int, size: int, every: float):
+    limits = httpx.Limits(max_connections=n + 4)
+    finish = start_probe(url, every)
+    await asyncio.sleep(2.0)
+    idle = finish()
+
+    async with httpx.AsyncClient(base_url=url, timeout=None, limits=limits) as client:
+        finish = start_probe(url, every)
+        t0 = time.perf_counter()
+        total = sum(await asyncio.gather(*(one_upload(client, i, size) for i in range(n))))
+        dt = time.perf_counter() - t0
+        busy = finish()
+
+    print(f"uploads={n} x {size / MB:.0f} MiB  wall={dt:.2f}s  aggregate={total / MB / dt:.1f} MB/s")
+    print(f"/quota idle : p50={pct(idle, 50):.2f}ms p99={pct(idle, 99):.2f}ms (n={len(idle)})")
+    print(f"/quota load : p50={pct(busy, 50):.2f}ms p99={pct(busy, 99):.2f}ms "
+          f"max={max(busy) * 1000:.2f}ms (n={len(busy)})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:9940")
+    ap.add_argument("-n", type=int, default=8, help="concurrent uploads")
+    ap.add_argument("--size-mb", type=int, default=500)
+    ap.add_argument("--probe-ms", type=float, default=20)
+    ap.add_argument("--spawn", metavar="MEDIA_API_DIR", help="start uvicorn for this media-api dir")
+    ap.add_argument("--redis-url", default="redis://127.0.0.1:6379/0")
+    ap.add_argument("--port", type=int, default=9941)
+    args = ap.parse_args()
+
+    proc = None
+    scratch = tempfile.TemporaryDirectory()
+    if args.spawn:
+        app_dir = os.path.abspath(args.spawn)
+        common_dir = os.path.dirname(app_dir)
+        env = dict(os.environ, DATA_ROOT=scratch.name, REDIS_URL=args.redis_url,
+                   QUOTA_BYTES_PER_USER=str(1 << 50), PYTHONPATH=f"{app_dir}:{common_dir}")
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=app_dir, env=env,
+        )
+        args.url = f"http://127.0.0.1:{args.port}"
+        for _ in range(100):
+            try:
+                httpx.get(args.url + "/docs")
+                break
+            except httpx.HTTPError:
+                time.sleep(0.1)
+    try:
+        asyncio.run(run(args.url, args.n, args.size_mb * MB, args.probe_ms / 1000))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+        scratch.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Simulator: queue wait per user under FIFO (common/jobqueue.py) and the fair
+scheduler (common/fairqueue.py), on the same synthetic arrival trace.
+
+The trace mixes:
+  bulk       one user dropping --bulk lessons of ~1 h at once (a term's backlog)
+  t1..tN     --teachers regular teachers, a few 10-50 min lessons each over
+             --hours, Poisson arrivals
+  assessor   a few lessons an assessor is waiting on (lane "urgent"; FIFO
+             has no lanes)
+Both policies run their real claim scripts on fakeredis in simulated time:
+--workers consumers, each job takes duration * --rtf + --overhead seconds.
+Reported per user: jobs, p50 / p95 / max wait (claim - upload), in minutes.
+
+    python bench/sim_scheduler.py
+    python bench/sim_scheduler.py --workers 3 --bulk 40 --quantum 900 --aging 1
+"""
+
+import argparse
+import heapq
+import json
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import fakeredis
+import numpy as np
+
+from common import fairqueue
+from common.fairqueue import FairQueue
+from common.jobqueue import JobQueue
+
+QUEUE = "queue:jobs"
+
+
+def make_trace(args) -> list:
+    """[(arrival s, job_id, user, duration s, lane)] sorted by arrival."""
+    rng = np.random.default_rng(args.seed)
+    horizon = args.hours * 3600
+    jobs = []
+    for i in range(args.bulk):
+        jobs.append((float(rng.uniform(0, 120)), "bulk", float(rng.uniform(50, 70)) * 60, "normal"))
+    for k in range(1, args.teachers + 1):
+        t = float(rng.exponential(horizon / args.lessons))
+        while t < horizon:
+            jobs.append((t, f"t{k}", float(rng.uniform(10, 50)) * 60, "normal"))
+            t += float(rng.exponential(horizon / args.lessons))
+    for t in np.sort(rng.uniform(0, horizon, args.assessed)):
+        jobs.append((float(t), "assessor", float(rng.uniform(20, 40)) * 60, "urgent"))
+    jobs.sort()
+    return [(t, f"j{i:04d}", user, dur, lane) for i, (t, user, dur, lane) in enumerate(jobs)]
+
+
+def simulate(queue, r, trace: list, workers: int, rtf: float, overhead: float) -> dict:
+    """Replay trace through queue; {job_id: wait s}."""
+    arrivals = list(reversed(trace))
+    meta = {job_id: (t, dur) for t, job_id, _, dur, _ in trace}
+    busy = []  # heap of finish times
+    waits = {}
+    now = 0.0
+    while arrivals or busy or len(waits) < len(trace):
+        while arrivals and arrivals[-1][0] <= now:
+            t, job_id, user, dur, lane = arrivals.pop()
+            fairqueue.set_job(r, job_id, user_id=user, duration_sec=round(dur, 1), lane=lane)
+            r.rpush(QUEUE, json.dumps({"job_id": job_id, "queued_at": t}))
+        while busy and busy[0] <= now:
+            heapq.heappop(busy)
+        while len(busy) < workers:
+            msg = queue.claim(0)
+            if msg is None:
+                break
+            job_id = msg.data["job_id"]
+            t, dur = meta[job_id]
+            waits[job_id] = now - t
+            msg.ack()
+            heapq.heappush(busy, now + dur * rtf + overhead)
+        upcoming = [x for x in (arrivals[-1][0] if arrivals else None, busy[0] if busy else None) if x is not None]
+        if not upcoming:
+            break
+        now = min(upcoming)
+    return waits
+
+
+def report(name: str, trace: list, waits: dict):
+    by_user = {}
+    for _, job_id, user, _, _ in trace:
+        by_user.setdefault(user, []).append(waits[job_id] / 60)
+    print(f"\n{name}")
+    print(f"  {'user':<10} {'jobs':>5} {'p50 min':>8} {'p95 min':>8} {'max min':>8}")
+    rows = sorted(by_user.items(), key=lambda kv: (kv[0] != "assessor", kv[0] != "bulk", kv[0]))
+    for user, w in rows + [("(all)", [x / 60 for x in waits.values()])]:
+        p50, p95 = np.percentile(w, [50, 95])
+        print(f"  {user:<10} {len(w):5d} {p50:8.1f} {p95:8.1f} {max(w):8.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--hours", type=float, default=4, help="span of the teachers' / assessor's arrivals")
+    ap.add_argument("--bulk", type=int, default=20, help="~1 h lessons the bulk user queues at t=0")
+    ap.add_argument("--teachers", type=int, default=6)
+    ap.add_argument("--lessons", type=float, default=3, help="mean lessons per teacher over --hours")
+    ap.add_argument("--assessed", type=int, default=4, help="urgent jobs")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--rtf", type=float, default=0.25, help="processing seconds per second of video")
+    ap.add_argument("--overhead", type=float, default=20, help="seconds per job on top")
+    ap.add_argument("--quantum", type=float, default=fairqueue.QUEUE_QUANTUM_SEC)
+    ap.add_argument("--aging", type=float, default=fairqueue.QUEUE_AGING)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    trace = make_trace(args)
+    video = sum(d for _, _, _, d, _ in trace)
+    print(f"{len(trace)} jobs, {video / 3600:.1f} h of video, {args.workers} workers, "
+          f"~{video * args.rtf / args.workers / 3600:.1f} h of work each")
+    for name, make in (("FIFO", lambda r: JobQueue(r, QUEUE, "sim")),
+                       (f"fair (quantum {args.quantum:g} s, aging {args.aging:g})",
+                        lambda r: FairQueue(r, QUEUE, "sim", quantum_sec=args.quantum, aging=args.aging))):
+        r = fakeredis.FakeRedis()
+        waits = simulate(make(r), r, trace, args.workers, args.rtf, args.overhead)
+        report(name, trace, waits)
+
+
+if __name__ == "__main__":
+    main()
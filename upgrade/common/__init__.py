@@ -0,0 +1 @@
+# shared code for media-api, asr-worker and vision-worker
@@ -0,0 +1,224 @@
+"""
+Content-addressed artifact cache (re-uploads of the same lesson video)
+- media-api hashes the upload as it streams and writes raw/content.sha256
+- Workers key finished artifacts by (content hash, model/decode params) and
+  store them under CACHE_ROOT/{kind}/{key}/ as hardlinks of the job's files
+- A later job with the same key gets the files hardlinked (reflink or copy
+  across filesystems) into its own directory instead of recomputing them
+- Job files may therefore share an inode with the cache: never rewrite an
+  artifact in place, write a new file and os.replace() it (see replacing())
+- LRU eviction bounded by CACHE_MAX_BYTES; the cache's own copies are not
+  charged to any user, each job is charged for its files like a fresh run
+- Entries stored with expires_at (frames: the storing job's
+  frames_expires_at) miss from then on and are purged by expire(), which
+  the retention sweep runs, so cached classroom images never outlive the
+  job's retention
+- Hit/miss/bytes-saved counters in Redis hash cache:stats
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+CONTENT_HASH_FILE = "content.sha256"  # in the job's raw/ dir
+LRU_KEY = "cache:lru"      # zset "kind/key" -> last use
+SIZES_KEY = "cache:bytes"  # hash "kind/key" -> bytes
+EXPIRES_KEY = "cache:expires"  # zset "kind/key" -> epoch s the entry must be gone by
+STATS_KEY = "cache:stats"  # hash of counters
+FICLONE = 0x40049409
+
+
+# ─── Content hash sidecar ───
+
+def write_content_hash(raw_dir: str, digest: str):
+    with replacing(os.path.join(raw_dir, CONTENT_HASH_FILE)) as tmp:
+        with open(tmp, "w") as f:
+            f.write(digest + "\n")
+
+
+def read_content_hash(raw_dir: str) -> str | None:
+    try:
+        with open(os.path.join(raw_dir, CONTENT_HASH_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# ─── Files ───
+
+@contextmanager
+def replacing(path: str):
+    """Yield a temp path next to path; os.replace() it over path on success.
+
+    Breaks any hardlink path had, so cached copies are never modified.
+    """
+    tmp = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def clone_file(src: str, dst: str):
+    """dst becomes a hardlink of src, else a reflink, else a copy."""
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        os.remove(dst)
+        return clone_file(src, dst)
+    except OSError:
+        pass  # EXDEV / EMLINK / no hardlinks on this fs
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            shutil.copyfileobj(s, d, 4 * 1024 * 1024)
+
+
+def cache_key(content_sha256: str, **params) -> str:
+    blob = json.dumps([content_sha256, params], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class ArtifactCache:
+    def __init__(self, root: str, r, max_bytes: int):
+        self.root = root
+        self.r = r
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_env(cls, r) -> "ArtifactCache":
+        return cls(
+            os.getenv("CACHE_ROOT", "/data/cache"),
+            r,
+            int(os.getenv("CACHE_MAX_BYTES", str(50 * 1024 ** 3))),
+        )
+
+    def _dir(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def fetch(self, kind: str, key: str, dest_dir: str) -> dict | None:
+        """Link a cached entry's files into dest_dir. Returns its manifest, or
+        None on a miss (nothing is left behind in dest_dir)."""
+        name = f"{kind}/{key}"
+        entry = self._dir(name)
+        linked = []
+        try:
+            with open(os.path.join(entry, "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("expires_at") and manifest["expires_at"] <= time.time():
+                raise FileNotFoundError(entry)  # waiting for expire()
+            for rel in manifest["files"]:
+                dst = os.path.join(dest_dir, rel)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                clone_file(os.path.join(entry, rel), dst)
+                linked.append(dst)
+        except (FileNotFoundError, NotADirectoryError):  # miss, or evicted mid-fetch
+            for dst in linked:
+                os.remove(dst)
+            self.r.hincrby(STATS_KEY, f"{kind}:miss", 1)
+            return None
+        pipe = self.r.pipeline()
+        pipe.zadd(LRU_KEY, {name: time.time()})
+        pipe.hincrby(STATS_KEY, f"{kind}:hit", 1)
+        pipe.hincrby(STATS_KEY, f"{kind}:bytes_saved", manifest["bytes"])
+        pipe.execute()
+        return manifest
+
+    def store(self, kind: str, key: str, src_dir: str, files: list, expires_at: float = None, **meta):
+        """Add src_dir's files (paths relative to it) under key, then evict.
+        expires_at (epoch s): the entry is dropped by expire() from then on."""
+        name = f"{kind}/{key}"
+        entry = self._dir(name)
+        if os.path.isdir(entry):
+            return
+        tmp = f"{entry}.tmp-{uuid.uuid4().hex[:8]}"
+        size = 0
+        try:
+            for rel in files:
+                dst = os.path.join(tmp, rel)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                clone_file(os.path.join(src_dir, rel), dst)
+                size += os.path.getsize(dst)
+            with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump({"files": files, "bytes": size, "created_at": time.time(),
+                           "expires_at": expires_at, **meta}, f)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if os.path.isdir(entry):
+                return  # another worker stored the same key first
+            raise
+        pipe = self.r.pipeline()
+        pipe.zadd(LRU_KEY, {name: time.time()})
+        pipe.hset(SIZES_KEY, name, size)
+        if expires_at:
+            pipe.zadd(EXPIRES_KEY, {name: expires_at})
+        pipe.execute()
+        self.evict()
+
+    def total_bytes(self) -> int:
+        return sum(int(v) for v in self.r.hvals(SIZES_KEY))
+
+    def evict(self) -> int:
+        """Drop least recently used entries until under max_bytes. Returns bytes freed."""
+        total = self.total_bytes()
+        freed = 0
+        while total > self.max_bytes:
+            popped = self.r.zpopmin(LRU_KEY)  # atomic: each entry is evicted by one worker
+            if not popped:
+                break
+            size = self._drop(popped[0][0].decode())
+            total -= size
+            freed += size
+            self.r.hincrby(STATS_KEY, "evictions", 1)
+            self.r.hincrby(STATS_KEY, "evicted_bytes", size)
+        if freed:
+            print(f"[CACHE] evicted {freed / 1024 / 1024:.1f} MB")
+        return freed
+
+    def expire(self, now: float = None) -> int:
+        """Drop every entry past its expires_at. Returns bytes freed."""
+        now = time.time() if now is None else now
+        freed = n = 0
+        for name in self.r.zrangebyscore(EXPIRES_KEY, "-inf", now):
+            if not self.r.zrem(EXPIRES_KEY, name):
+                continue  # another process is dropping it
+            freed += self._drop(name.decode())
+            n += 1
+        if n:
+            self.r.hincrby(STATS_KEY, "expired", n)
+            print(f"[CACHE] {n} expired entries dropped ({freed / 1024 / 1024:.1f} MB)")
+        return freed
+
+    def _drop(self, name: str) -> int:
+        """Delete entry name and its bookkeeping. Returns its size."""
+        size = int(self.r.hget(SIZES_KEY, name) or 0)
+        pipe = self.r.pipeline()
+        pipe.hdel(SIZES_KEY, name)
+        pipe.zrem(LRU_KEY, name)
+        pipe.zrem(EXPIRES_KEY, name)
+        pipe.execute()
+        # rename first so a concurrent fetch() misses cleanly instead of half-linking
+        doomed = f"{self._dir(name)}.evict-{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(self._dir(name), doomed)
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(doomed, ignore_errors=True)
+        return size
+
+    def stats(self) -> dict:
+        out = {k.decode(): int(v) for k, v in self.r.hgetall(STATS_KEY).items()}
+        out["entries"] = self.r.zcard(LRU_KEY)
+        out["bytes"] = self.total_bytes()
+        out["max_bytes"] = self.max_bytes
+        return out
@@ -0,0 +1,200 @@
+"""
+Shared MariaDB access for media-api and the workers
+- One mysql.connector connection pool per process (no connect/close per query)
+- Pool checkout pings and reconnects dead connections; a statement that hits a
+  dropped connection is retried once on a fresh one
+- Per-job metadata (user_id, analysis_mode) cached for the life of the job
+- JobWriter coalesces analysis_job column updates into the next status write
+- Every call is timed into the db_call_seconds histogram (common/metrics.py)
+"""
+
+import os
+import threading
+import time
+
+from mysql.connector import errors, pooling
+
+from common import metrics
+
+POOL_WAIT_SEC = 10.0
+
+
+class Database:
+    def __init__(self, pool_size: int = 4, pool_name: str = "teachermon", **conn_kwargs):
+        self.pool_size = pool_size
+        self.pool_name = pool_name
+        self.conn_kwargs = conn_kwargs
+        self._pool = None
+        self._lock = threading.Lock()
+        self._meta = {}
+
+    @classmethod
+    def from_env(cls, default_host: str = "host.docker.internal") -> "Database":
+        return cls(
+            pool_size=int(os.getenv("DB_POOL_SIZE", "4")),
+            host=os.getenv("DB_HOST", default_host),
+            port=int(os.getenv("DB_PORT", "3306")),
+            user=os.getenv("DB_USER", "root"),
+            password=os.getenv("DB_PASS", ""),
+            database=os.getenv("DB_NAME", "teachermon"),
+            charset="utf8mb4",
+            collation="utf8mb4_unicode_ci",
+        )
+
+    # ─── Connections ───
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = pooling.MySQLConnectionPool(
+                    pool_name=self.pool_name,
+                    pool_size=self.pool_size,
+                    pool_reset_session=True,
+                    **self.conn_kwargs,
+                )
+            return self._pool
+
+    def connect(self):
+        """Borrow a pooled connection; conn.close() hands it back.
+
+        Waits up to POOL_WAIT_SEC when every connection is busy.
+        """
+        pool = self._get_pool()
+        deadline = time.monotonic() + POOL_WAIT_SEC
+        while True:
+            try:
+                return pool.get_connection()  # pings + reconnects stale connections
+            except errors.PoolError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def _run(self, fn, op: str = "execute"):
+        """fn(conn) on a pooled connection, retried once if the link dropped."""
+        with metrics.timer(metrics.DB_SECONDS, op=op):
+            return self._attempt(fn)
+
+    def _attempt(self, fn):
+        for attempt in (1, 2):
+            conn = self.connect()
+            try:
+                return fn(conn)
+            except (errors.OperationalError, errors.InterfaceError):
+                if attempt == 2:
+                    raise
+                try:
+                    conn.reconnect(attempts=3, delay=1)
+                except errors.Error:
+                    pass
+            finally:
+                conn.close()
+
+    def execute(self, sql: str, params=()) -> int:
+        """Run one write statement in its own transaction. Returns rowcount."""
+        def fn(conn):
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            conn.commit()
+            return cur.rowcount
+        return self._run(fn)
+
+    def fetchone(self, sql: str, params=()):
+        def fn(conn):
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            return cur.fetchone()
+        return self._run(fn, "fetchone")
+
+    def fetchall(self, sql: str, params=()) -> list:
+        def fn(conn):
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            return cur.fetchall()
+        return self._run(fn, "fetchall")
+
+    def transaction(self, fn):
+        """fn(cursor) in one transaction: committed if it returns, rolled
+        back if it raises. Returns what fn returns."""
+        def run(conn):
+            cur = conn.cursor()
+            try:
+                out = fn(cur)
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+            return out
+        return self._run(run, "transaction")
+
+    # ─── analysis_job ───
+
+    def update_job(self, job_id: str, cols: dict, unless_status: str = None) -> int:
+        """UPDATE analysis_job SET cols (+ updated_at) in one statement;
+        with unless_status, rows in that status are left alone."""
+        sets = ["updated_at = NOW()"]
+        vals = []
+        for k, v in cols.items():
+            sets.append(f"{k} = %s")
+            vals.append(v)
+        vals.append(job_id)
+        where = "id = %s"
+        if unless_status:
+            where += " AND status <> %s"
+            vals.append(unless_status)
+        return self.execute(f"UPDATE analysis_job SET {', '.join(sets)} WHERE {where}", vals)
+
+    def job_meta(self, job_id: str) -> dict | None:
+        """{user_id, analysis_mode} for job_id, queried once per job."""
+        meta = self._meta.get(job_id)
+        if meta is None:
+            row = self.fetchone(
+                "SELECT user_id, analysis_mode FROM analysis_job WHERE id = %s", (job_id,)
+            )
+            if not row:
+                return None
+            meta = self._meta[job_id] = {"user_id": row[0], "analysis_mode": row[1]}
+        return meta
+
+    def forget_job(self, job_id: str):
+        """Drop cached metadata once a worker is done with the job."""
+        self._meta.pop(job_id, None)
+
+    def job_writer(self, job_id: str, on_change=None) -> "JobWriter":
+        return JobWriter(self, job_id, on_change)
+
+
+class JobWriter:
+    """Coalesced analysis_job writes for one job.
+
+    set() only buffers columns; the next status() or flush() writes them all
+    in a single UPDATE. Status changes are written right away because NestJS
+    polls them (e.g. QUEUED -> direct Gemini analysis). on_change(fields) is
+    called immediately for both, so progress listeners see buffered values.
+    """
+
+    def __init__(self, db: Database, job_id: str, on_change=None):
+        self.db = db
+        self.job_id = job_id
+        self.on_change = on_change
+        self.pending = {}
+
+    def set(self, **cols):
+        self.pending.update(cols)
+        if self.on_change:
+            self.on_change(cols)
+
+    def status(self, status: str, unless_status: str = None, **cols):
+        merged = {**self.pending, "status": status, **cols}
+        self.db.update_job(self.job_id, merged, unless_status)
+        self.pending = {}
+        if self.on_change:
+            self.on_change({"status": status, **cols})
+
+    def flush(self):
+        if self.pending:
+            self.db.update_job(self.job_id, self.pending)
+            self.pending = {}
+
+    def discard(self):
+        """Forget buffered columns (e.g. bytes of files a failure just deleted)."""
+        self.pending = {}
@@ -0,0 +1,254 @@
+"""
+Fair, duration-aware scheduling for the job queues (queue:jobs, queue:frames)
+- Producers are unchanged: RPUSH the JSON message onto the list. FairQueue
+  is a JobQueue (common/jobqueue.py) whose claim() first admits whatever is
+  on the list into per-user sub-queues, then picks the next message from
+  them, in one Lua script; leases, retries, reclaim and dead letters are
+  the JobQueue ones (a requeued message is admitted again)
+- Cost of a job = seconds of video (ffprobe at upload time, media-api), or
+  QUEUE_DEFAULT_COST_SEC if unknown. Job meta (user_id, duration_sec, lane)
+  comes from the message or from sched:job:{job_id}, written by media-api
+- Within a user: shortest job first with aging. A sub-queue is a zset
+  scored cost + QUEUE_AGING * queued_at, i.e. each second waited is worth
+  QUEUE_AGING seconds of video, so a long lesson is never passed over for
+  good. The score is fixed at admission: no periodic re-scoring
+- Between users: deficit round robin (as Linux sch_drr). A user whose
+  sub-queue becomes non-empty joins the ring with QUANTUM * weight of
+  credit; the user at the head is served while its next job's cost fits
+  its credit, else it gets another quantum and goes to the back. Over time
+  each busy user gets video-seconds in proportion to its weight
+  (sched:weights, default 1), however many jobs it queued
+- Lanes (QUEUE_LANES, highest first, the last is the default) are served in
+  strict priority, each with its own ring; set_job(lane=...) + promote()
+  move a job, also one already waiting (an assessor waiting on a result)
+- The whole state lives in Redis under {queue}:fq:*, so any number of
+  consumers share it; sub-queue keys are built inside the scripts
+  (single-node Redis, like the rest of the stack)
+"""
+
+import json
+import os
+import time
+
+from common.jobqueue import JobQueue
+
+QUEUE_LANES = [lane.strip() for lane in os.getenv("QUEUE_LANES", "urgent,normal").split(",") if lane.strip()]
+QUEUE_QUANTUM_SEC = float(os.getenv("QUEUE_QUANTUM_SEC", "1800"))  # video seconds of credit per turn
+QUEUE_AGING = float(os.getenv("QUEUE_AGING", "0.5"))  # video seconds forgiven per second waited
+QUEUE_DEFAULT_COST_SEC = float(os.getenv("QUEUE_DEFAULT_COST_SEC", "1800"))
+JOB_META_TTL_SEC = 14 * 86400
+ADMIT_MAX = 500  # messages moved off the list per claim
+
+WEIGHTS_KEY = "sched:weights"
+
+
+def job_key(job_id: str) -> str:
+    return f"sched:job:{job_id}"
+
+
+def set_job(r, job_id: str, **meta):
+    """Merge meta (user_id, duration_sec, lane) into the job's scheduling
+    record; read when its messages are admitted."""
+    key = job_key(job_id)
+    cur = r.get(key)
+    rec = json.loads(cur) if cur else {}
+    rec.update({k: v for k, v in meta.items() if v is not None})
+    r.set(key, json.dumps(rec), ex=JOB_META_TTL_SEC)
+    return rec
+
+
+def set_weight(r, user_id: str, weight: float):
+    """Share of a user relative to the others (default 1)."""
+    r.hset(WEIGHTS_KEY, user_id, weight)
+
+
+# ─── Lua scripts ───
+
+_LIB = """
+local P = ARGV[4]
+local lanes = {}
+for lane in string.gmatch(ARGV[5], '[^,]+') do lanes[#lanes + 1] = lane end
+local quantum = tonumber(ARGV[6])
+
+local function weight(user)
+  return tonumber(redis.call('HGET', 'sched:weights', user) or '1') or 1
+end
+
+-- a user's sub-queue became non-empty: join the ring with a fresh quantum
+local function activate(lane, user)
+  redis.call('RPUSH', P .. ':ring:' .. lane, user)
+  redis.call('HSET', P .. ':deficit:' .. lane, user, quantum * weight(user))
+end
+
+local function deactivate(lane, user)
+  redis.call('LREM', P .. ':ring:' .. lane, 1, user)
+  redis.call('HDEL', P .. ':deficit:' .. lane, user)
+end
+"""
+
+# KEYS: ready list, seq, msgs hash, owner hash, leases zset, attempts hash
+# ARGV: consumer, lease deadline, now, prefix, lanes, quantum, aging, default cost, admit max
+# Returns {id, message, deliveries} or nil if nothing is waiting.
+_FAIR_CLAIM = _LIB + """
+local now = tonumber(ARGV[3])
+local aging = tonumber(ARGV[7])
+local default_cost = tonumber(ARGV[8])
+local known = {}
+for _, lane in ipairs(lanes) do known[lane] = true end
+
+-- 1) admit: list -> (lane, user) sub-queues
+for _ = 1, tonumber(ARGV[9]) do
+  local raw = redis.call('LPOP', KEYS[1])
+  if not raw then break end
+  local ok, msg = pcall(cjson.decode, raw)
+  if not ok or type(msg) ~= 'table' then msg = {} end
+  local job = msg.job_id and tostring(msg.job_id) or ''
+  local meta = {}
+  if job ~= '' then
+    local rec = redis.call('GET', 'sched:job:' .. job)
+    if rec then
+      local ok2, m = pcall(cjson.decode, rec)
+      if ok2 and type(m) == 'table' then meta = m end
+    end
+  end
+  local user = tostring(msg.user_id or meta.user_id or '?')
+  local lane = msg.lane or meta.lane
+  if not known[lane] then lane = lanes[#lanes] end
+  local cost = tonumber(msg.duration_sec or meta.duration_sec) or 0
+  if cost <= 0 then cost = default_cost end
+  local t = tonumber(msg.queued_at) or now
+  local q = P .. ':q:' .. lane .. ':' .. user
+  if redis.call('ZSCORE', q, raw) == false then
+    if redis.call('ZCARD', q) == 0 then activate(lane, user) end
+    redis.call('ZADD', q, cost + aging * t, raw)
+    redis.call('HSET', P .. ':meta', raw, cjson.encode({u = user, l = lane, c = cost, j = job}))
+    redis.call('ZADD', P .. ':since', t, raw)
+    if job ~= '' then redis.call('HSET', P .. ':job', job, raw) end
+  end
+end
+
+-- 2) pick: lanes in order, deficit round robin between the users of a lane
+local function pick(lane)
+  local ring = P .. ':ring:' .. lane
+  local dk = P .. ':deficit:' .. lane
+  for _ = 1, 100000 do
+    local user = redis.call('LINDEX', ring, 0)
+    if not user then return nil end
+    local q = P .. ':q:' .. lane .. ':' .. user
+    local head = redis.call('ZRANGE', q, 0, 0)[1]
+    if not head then
+      deactivate(lane, user)
+    else
+      local m = cjson.decode(redis.call('HGET', P .. ':meta', head))
+      local credit = tonumber(redis.call('HGET', dk, user) or '0')
+      if m.c <= credit then
+        redis.call('ZREM', q, head)
+        if redis.call('ZCARD', q) == 0 then
+          deactivate(lane, user)
+        else
+          redis.call('HSET', dk, user, credit - m.c)
+        end
+        return head, m
+      end
+      redis.call('HSET', dk, user, credit + quantum * weight(user))
+      redis.call('RPUSH', ring, redis.call('LPOP', ring))
+    end
+  end
+  return nil
+end
+
+local raw, m
+for _, lane in ipairs(lanes) do
+  raw, m = pick(lane)
+  if raw then break end
+end
+if not raw then return nil end
+redis.call('HDEL', P .. ':meta', raw)
+redis.call('ZREM', P .. ':since', raw)
+if m.j ~= '' then redis.call('HDEL', P .. ':job', m.j) end
+
+-- 3) lease it (as JobQueue's claim)
+local n = redis.call('HINCRBY', KEYS[6], raw, 1)
+local id = tostring(redis.call('INCR', KEYS[2]))
+redis.call('HSET', KEYS[3], id, raw)
+redis.call('HSET', KEYS[4], id, ARGV[1])
+redis.call('ZADD', KEYS[5], ARGV[2], id)
+return {id, raw, n}
+"""
+
+# ARGV: -, -, -, prefix, lanes, quantum, job id, new lane
+# Returns 1 if a waiting message of the job was moved, 0 if none is waiting.
+_PROMOTE = _LIB + """
+local raw = redis.call('HGET', P .. ':job', ARGV[7])
+if not raw then return 0 end
+local m = cjson.decode(redis.call('HGET', P .. ':meta', raw))
+local lane = ARGV[8]
+if m.l == lane then return 1 end
+local old = P .. ':q:' .. m.l .. ':' .. m.u
+local score = redis.call('ZSCORE', old, raw)
+redis.call('ZREM', old, raw)
+if redis.call('ZCARD', old) == 0 then deactivate(m.l, m.u) end
+local new = P .. ':q:' .. lane .. ':' .. m.u
+if redis.call('ZCARD', new) == 0 then activate(lane, m.u) end
+redis.call('ZADD', new, score, raw)
+m.l = lane
+redis.call('HSET', P .. ':meta', raw, cjson.encode(m))
+return 1
+"""
+
+
+class FairQueue(JobQueue):
+    """JobQueue with per-user fair, shortest-first claiming (module docs)."""
+
+    def __init__(self, r, name: str, consumer: str, visibility_sec: float = 300, max_attempts: int = 3,
+                 poll_sec: float = 1.0, lanes: list = None, quantum_sec: float = QUEUE_QUANTUM_SEC,
+                 aging: float = QUEUE_AGING, default_cost_sec: float = QUEUE_DEFAULT_COST_SEC):
+        super().__init__(r, name, consumer, visibility_sec, max_attempts, poll_sec)
+        self.lanes = list(lanes or QUEUE_LANES)
+        self.quantum_sec = quantum_sec
+        self.aging = aging
+        self.default_cost_sec = default_cost_sec
+        self.prefix = f"{name}:fq"
+        self._claim = r.register_script(_FAIR_CLAIM)
+        self._promote = r.register_script(_PROMOTE)
+
+    def _args(self, consumer: str = "", deadline: float = 0, now: float = 0) -> list:
+        return [consumer, deadline, now, self.prefix, ",".join(self.lanes), self.quantum_sec]
+
+    def _pop(self):
+        k = self.keys
+        now = time.time()
+        return self._claim(
+            keys=[self.name, k["seq"], k["msgs"], k["owner"], k["leases"], k["attempts"]],
+            args=self._args(self.consumer, now + self.visibility_sec, now)
+            + [self.aging, self.default_cost_sec, ADMIT_MAX],
+        )
+
+    def promote(self, job_id: str, lane: str) -> bool:
+        """Move the job's waiting message (if any) to lane. True if moved."""
+        if lane not in self.lanes:
+            raise ValueError(f"unknown lane {lane!r} (lanes: {self.lanes})")
+        return bool(self._promote(args=self._args() + [job_id, lane]))
+
+    # ─── Inspection ───
+
+    def stats(self) -> dict:
+        out = super().stats()
+        out["ready"] += self.r.zcard(f"{self.prefix}:since")
+        return out
+
+    def oldest_age(self) -> float:
+        age = super().oldest_age()
+        oldest = self.r.zrange(f"{self.prefix}:since", 0, 0, withscores=True)
+        if oldest:
+            age = max(age, time.time() - oldest[0][1])
+        return age
+
+    def waiting(self, lane: str = None) -> dict:
+        """{lane: {user: messages waiting}} (admitted ones)."""
+        out = {}
+        for ln in [lane] if lane else self.lanes:
+            users = [u.decode() for u in self.r.lrange(f"{self.prefix}:ring:{ln}", 0, -1)]
+            counts = {u: self.r.zcard(f"{self.prefix}:q:{ln}:{u}") for u in users}
+            out[ln] = {u: n for u, n in counts.items() if n}
+        return out
@@ -0,0 +1,137 @@
+"""
+Packed frame store: one job's frames in two files instead of one JPEG each
+- frames/frames.pack: the JPEGs back to back, append-only
+- frames/frames.idx: 16-byte header, then one 16-byte record per sampled
+  timestamp (offset u64, size u32, timestamp ms u32); a deduplicated frame's
+  record points at the bytes of the frame it aliases
+- PackWriter appends the JPEG bytes before the record that points at them,
+  so a reader (or a crash) never sees a record without its data
+- FramePack mmaps both files: frame(n) and at(t) (nearest timestamp, via
+  searchsorted) return memoryviews into the pack, no copy
+- Delete / copy / backup of a job's frames is two files, never a listing
+"""
+
+import mmap
+import os
+
+import numpy as np
+
+PACK_FILE = "frames.pack"
+INDEX_FILE = "frames.idx"
+MAGIC = b"FPK1"
+HEADER_BYTES = 16
+RECORD = np.dtype([("offset", "<u8"), ("size", "<u4"), ("t_ms", "<u4")])
+
+
+def is_packed(frames_dir: str) -> bool:
+    return os.path.exists(os.path.join(frames_dir, INDEX_FILE))
+
+
+class PackWriter:
+    """Appends frames to frames_dir/frames.{pack,idx} (created empty)."""
+
+    def __init__(self, frames_dir: str):
+        os.makedirs(frames_dir, exist_ok=True)
+        self.frames_dir = frames_dir
+        self._pack = open(os.path.join(frames_dir, PACK_FILE), "wb")
+        self._idx = open(os.path.join(frames_dir, INDEX_FILE), "wb")
+        self._idx.write(MAGIC + bytes(HEADER_BYTES - len(MAGIC)))
+        self._records = []  # (offset, size) by frame number, for aliases
+        self.pack_bytes = 0
+
+    @property
+    def bytes(self) -> int:
+        """On-disk size of both files once closed."""
+        return self.pack_bytes + HEADER_BYTES + len(self._records) * RECORD.itemsize
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _record(self, offset: int, size: int, timestamp_sec: float):
+        rec = np.array([(offset, size, round(timestamp_sec * 1000))], dtype=RECORD)
+        self._idx.write(rec.tobytes())
+        self._records.append((offset, size))
+
+    def put(self, jpeg, timestamp_sec: float) -> int:
+        """Append a frame; returns its number."""
+        self._pack.write(jpeg)
+        self._pack.flush()  # data before the record that points at it
+        self._record(self.pack_bytes, len(jpeg), timestamp_sec)
+        self.pack_bytes += len(jpeg)
+        return len(self._records) - 1
+
+    def alias(self, n: int, timestamp_sec: float) -> int:
+        """Add timestamp_sec as another record of frame n's bytes."""
+        self._record(*self._records[n], timestamp_sec)
+        return len(self._records) - 1
+
+    def close(self):
+        self._pack.close()
+        self._idx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class FramePack:
+    """Read-only, memory-mapped view of a packed frames dir."""
+
+    def __init__(self, frames_dir: str):
+        self._maps = []
+        index = self._map(os.path.join(frames_dir, INDEX_FILE))
+        if index is None or index[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"not a frame pack index: {frames_dir}")
+        n = (len(index) - HEADER_BYTES) // RECORD.itemsize  # a torn last record is ignored
+        self.records = np.frombuffer(index, dtype=RECORD, count=n, offset=HEADER_BYTES)
+        self.timestamps = self.records["t_ms"] / 1000.0
+        self._data = self._map(os.path.join(frames_dir, PACK_FILE))
+
+    def _map(self, path: str):
+        with open(path, "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return None
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(m)
+        return memoryview(m)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def frame(self, n: int) -> memoryview:
+        """JPEG bytes of frame n (0-based), zero-copy."""
+        offset, size, _ = self.records[n]
+        return self._data[int(offset):int(offset) + int(size)]
+
+    def nearest(self, t: float) -> int:
+        """Number of the frame whose timestamp is closest to t seconds."""
+        if not len(self):
+            raise IndexError("empty frame pack")
+        i = int(np.searchsorted(self.timestamps, t))
+        if i == len(self) or (i and t - self.timestamps[i - 1] <= self.timestamps[i] - t):
+            i -= 1
+        return i
+
+    def at(self, t: float) -> memoryview:
+        return self.frame(self.nearest(t))
+
+    def close(self):
+        """Unmap the files. Views still held by callers keep their map alive
+        until they are dropped."""
+        self.records = self.timestamps = self._data = None
+        for m in self._maps:
+            try:
+                m.close()
+            except BufferError:
+                pass
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,321 @@
+"""
+Reliable job queue on Redis lists (at-least-once, any number of consumers)
+- Producers are unchanged: RPUSH the JSON message onto the list (queue:jobs,
+  queue:frames)
+- claim() pops a message and takes a lease on it in one Lua script: the
+  message is parked under a per-delivery id in {name}:msgs, with a deadline
+  in the {name}:leases zset, so there is no window where it exists nowhere
+- ack() drops it; retry() puts it back at the tail, or in the dead-letter
+  list {name}:dead once it has been delivered max_attempts times; dead()
+  dead-letters it at once (errors a retry can't fix)
+- Leases of the messages a process holds are renewed by its heartbeat
+  thread; a process that dies stops renewing, and after visibility_sec any
+  consumer's reclaim() puts its messages back at the head of the queue
+- Deliveries are counted per message body ({name}:attempts), so the count
+  survives requeues and crashes; a message whose worker keeps crashing ends
+  up dead-lettered too
+- serve() runs `concurrency` claim -> handler loops on threads
+- stats() / oldest_age() feed the queue gauges (common/metrics.py)
+"""
+
+import json
+import threading
+import time
+
+# ─── Lua scripts ───
+
+# KEYS: ready list, seq, msgs hash, owner hash, leases zset, attempts hash
+# ARGV: consumer, lease deadline
+# Returns {id, message, deliveries} or nil if the queue is empty.
+_CLAIM = """
+local raw = redis.call('LPOP', KEYS[1])
+if not raw then return nil end
+local n = redis.call('HINCRBY', KEYS[6], raw, 1)
+local id = tostring(redis.call('INCR', KEYS[2]))
+redis.call('HSET', KEYS[3], id, raw)
+redis.call('HSET', KEYS[4], id, ARGV[1])
+redis.call('ZADD', KEYS[5], ARGV[2], id)
+return {id, raw, n}
+"""
+
+# KEYS: ready list, msgs hash, owner hash, leases zset, attempts hash, dead list
+# ARGV: id, action (ack | retry | dead), max attempts, reason, now
+# Returns -1 if the lease was lost (reclaimed), 0 acked, 1 requeued, 2 dead.
+_SETTLE = """
+local raw = redis.call('HGET', KEYS[2], ARGV[1])
+if not raw then return -1 end
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[4], ARGV[1])
+if ARGV[2] == 'ack' then
+  redis.call('HDEL', KEYS[5], raw)
+  return 0
+end
+local n = tonumber(redis.call('HGET', KEYS[5], raw) or '0')
+if ARGV[2] == 'retry' and n < tonumber(ARGV[3]) then
+  redis.call('RPUSH', KEYS[1], raw)
+  return 1
+end
+redis.call('HDEL', KEYS[5], raw)
+redis.call('RPUSH', KEYS[6], cjson.encode({message = raw, attempts = n, reason = ARGV[4], at = tonumber(ARGV[5])}))
+return 2
+"""
+
+# KEYS: ready list, msgs hash, owner hash, leases zset, attempts hash, dead list
+# ARGV: now, max attempts, limit
+# Expired leases go back to the head of the queue (dead-lettered if out of
+# attempts). Returns {requeued, dead}.
+_RECLAIM = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]))
+local requeued, dead = 0, 0
+for _, id in ipairs(ids) do
+  local raw = redis.call('HGET', KEYS[2], id)
+  local owner = redis.call('HGET', KEYS[3], id)
+  redis.call('HDEL', KEYS[2], id)
+  redis.call('HDEL', KEYS[3], id)
+  redis.call('ZREM', KEYS[4], id)
+  if raw then
+    local n = tonumber(redis.call('HGET', KEYS[5], raw) or '0')
+    if n < tonumber(ARGV[2]) then
+      redis.call('LPUSH', KEYS[1], raw)
+      requeued = requeued + 1
+    else
+      redis.call('HDEL', KEYS[5], raw)
+      redis.call('RPUSH', KEYS[6], cjson.encode({message = raw, attempts = n,
+        reason = 'lease expired (' .. (owner or '?') .. ')', at = tonumber(ARGV[1])}))
+      dead = dead + 1
+    end
+  end
+end
+return {requeued, dead}
+"""
+
+
+class Message:
+    """One delivery of a queue message. Settle it exactly once with ack(),
+    retry() or dead(); after that (or once the lease is lost) the other
+    calls do nothing."""
+
+    def __init__(self, queue: "JobQueue", msg_id: str, raw: bytes, attempts: int):
+        self.queue = queue
+        self.id = msg_id
+        self.raw = raw
+        self.attempts = attempts  # deliveries so far, this one included
+        self.data = json.loads(raw.decode("utf-8"))
+        self.settled = False
+
+    @property
+    def final(self) -> bool:
+        """True if a retry() would dead-letter instead of requeue."""
+        return self.attempts >= self.queue.max_attempts
+
+    def ack(self) -> bool:
+        """Done. False if the lease had expired and the message was handed
+        to another consumer (the work may then run twice)."""
+        return self._settle("ack") == 0
+
+    def retry(self, reason: str = "") -> bool:
+        """Failed; True if requeued, False if dead-lettered (out of attempts)."""
+        return self._settle("retry", reason) == 1
+
+    def dead(self, reason: str = ""):
+        """Failed for good: straight to the dead-letter list."""
+        self._settle("dead", reason)
+
+    def touch(self) -> bool:
+        """Extend the lease by visibility_sec. False if it was already lost."""
+        return self.queue._renew([self.id]) == 1
+
+    def _settle(self, action: str, reason: str = "") -> int | None:
+        if self.settled:
+            return None
+        self.settled = True
+        res = self.queue._settle_msg(self.id, action, reason)
+        if res == -1:
+            print(f"[QUEUE] {self.queue.name}: lease on {self.data.get('job_id', self.id)} was lost")
+        return res
+
+
+class JobQueue:
+    """Consumer side of the list `name` for this process (consumer = a
+    stable-enough name for logs, e.g. the hostname)."""
+
+    def __init__(self, r, name: str, consumer: str, visibility_sec: float = 300,
+                 max_attempts: int = 3, poll_sec: float = 1.0):
+        self.r = r
+        self.name = name
+        self.consumer = consumer
+        self.visibility_sec = visibility_sec
+        self.max_attempts = max_attempts
+        self.poll_sec = poll_sec
+        self.keys = {k: f"{name}:{k}" for k in ("seq", "msgs", "owner", "leases", "attempts", "dead")}
+        self._claim = r.register_script(_CLAIM)
+        self._settle = r.register_script(_SETTLE)
+        self._reclaim = r.register_script(_RECLAIM)
+        self.held = {}  # id -> Message, renewed by the heartbeat
+        self._lock = threading.Lock()
+        self._thread = None
+        self._head = None  # (message, first seen at the head) for oldest_age()
+
+    def _settle_keys(self) -> list:
+        k = self.keys
+        return [self.name, k["msgs"], k["owner"], k["leases"], k["attempts"], k["dead"]]
+
+    # ─── Consumer ───
+
+    def claim(self, timeout: float = 5.0) -> Message | None:
+        """Next message, waiting up to timeout seconds (polling)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            res = self._pop()
+            if res:
+                msg_id, raw, n = res
+                try:
+                    msg = Message(self, msg_id.decode(), raw, int(n))
+                except ValueError as e:  # not JSON: no worker can handle it
+                    print(f"[QUEUE] {self.name}: dead-lettering malformed message {raw[:100]!r}")
+                    self._settle_msg(msg_id.decode(), "dead", f"malformed: {e}")
+                    continue
+                with self._lock:
+                    self.held[msg.id] = msg
+                return msg
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return None
+            time.sleep(min(self.poll_sec, left))
+
+    def _pop(self):
+        """One claim attempt: {id, message, deliveries} or None."""
+        k = self.keys
+        return self._claim(
+            keys=[self.name, k["seq"], k["msgs"], k["owner"], k["leases"], k["attempts"]],
+            args=[self.consumer, time.time() + self.visibility_sec],
+        )
+
+    def _settle_msg(self, msg_id: str, action: str, reason: str) -> int:
+        with self._lock:
+            self.held.pop(msg_id, None)
+        return self._settle(keys=self._settle_keys(),
+                            args=[msg_id, action, self.max_attempts, reason[:500], time.time()])
+
+    def _renew(self, ids: list) -> int:
+        """Push the leases of ids out by visibility_sec; returns how many were
+        still held (a lost one is forgotten)."""
+        if not ids:
+            return 0
+        deadline = time.time() + self.visibility_sec
+        pipe = self.r.pipeline(transaction=False)
+        for msg_id in ids:
+            pipe.zadd(self.keys["leases"], {msg_id: deadline}, xx=True, ch=True)
+        held = pipe.execute()
+        with self._lock:
+            for msg_id, ok in zip(ids, held):
+                if not ok:
+                    self.held.pop(msg_id, None)
+        return sum(held)
+
+    def reclaim(self, limit: int = 100) -> tuple:
+        """Requeue (or dead-letter) messages whose lease expired. Any consumer
+        may run it. Returns (requeued, dead)."""
+        requeued, dead = self._reclaim(keys=self._settle_keys(),
+                                       args=[time.time(), self.max_attempts, limit])
+        if requeued or dead:
+            print(f"[QUEUE] {self.name}: reclaimed {requeued} stalled message(s), {dead} dead-lettered")
+        return requeued, dead
+
+    def heartbeat_once(self):
+        with self._lock:
+            ids = list(self.held)
+        self._renew(ids)
+        self.reclaim()
+
+    def start_heartbeat(self, interval_sec: float = None):
+        """Renew held leases and reclaim expired ones every interval_sec
+        (default visibility_sec / 3) in a daemon thread."""
+        if self._thread:
+            return self._thread
+        interval_sec = interval_sec or self.visibility_sec / 3
+
+        def loop():
+            while True:
+                try:
+                    self.heartbeat_once()
+                except Exception as e:
+                    print(f"[QUEUE] heartbeat failed: {e}")
+                time.sleep(interval_sec)
+
+        self._thread = threading.Thread(target=loop, name=f"queue-heartbeat:{self.name}", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def serve(self, handler, concurrency: int = 1):
+        """Run handler(msg) on `concurrency` threads forever. The handler
+        settles the message itself; one that returns without settling is
+        acked, one that raises is retried."""
+        self.start_heartbeat()
+
+        def loop():
+            while True:
+                msg = self.claim()
+                if not msg:
+                    continue
+                try:
+                    handler(msg)
+                except Exception as e:
+                    print(f"[QUEUE] {self.name}: handler failed: {e}")
+                    msg.retry(str(e))
+                else:
+                    msg.ack()
+
+        threads = [threading.Thread(target=loop, name=f"{self.name}-{i}", daemon=True)
+                   for i in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    # ─── Inspection ───
+
+    def stats(self) -> dict:
+        k = self.keys
+        pipe = self.r.pipeline(transaction=False)
+        pipe.llen(self.name)
+        pipe.zcard(k["leases"])
+        pipe.llen(k["dead"])
+        ready, inflight, dead = pipe.execute()
+        return {"ready": ready, "inflight": inflight, "dead": dead}
+
+    def oldest_age(self) -> float:
+        """Seconds the message at the head of the queue has waited: since its
+        queued_at (epoch seconds, stamped by the producer), or for a message
+        without one, since this process first saw it at the head."""
+        head = self.r.lindex(self.name, 0)
+        if head is None:
+            self._head = None
+            return 0.0
+        now = time.time()
+        try:
+            queued_at = float(json.loads(head).get("queued_at") or 0)
+        except (ValueError, AttributeError, TypeError):
+            queued_at = 0.0
+        if queued_at:
+            return max(0.0, now - queued_at)
+        if not self._head or self._head[0] != head:
+            self._head = (head, now)
+        return now - self._head[1]
+
+    def dead_letters(self, start: int = 0, end: int = -1) -> list:
+        """Dead-letter entries: {"message", "attempts", "reason", "at"}."""
+        return [json.loads(e) for e in self.r.lrange(self.keys["dead"], start, end)]
+
+    def requeue_dead(self, count: int = -1) -> int:
+        """Move up to count dead letters (all by default) back onto the
+        queue with a fresh attempt budget."""
+        n = 0
+        while count < 0 or n < count:
+            entry = self.r.lpop(self.keys["dead"])
+            if entry is None:
+                break
+            self.r.rpush(self.name, json.loads(entry)["message"])
+            n += 1
+        return n
@@ -0,0 +1,145 @@
+"""
+Shared demux stage: probe a job's video once, decode it once
+- probe() runs ffprobe once; load() caches the result as raw/media.json
+  (duration, container, first video / audio stream), keyed by the video's
+  size and mtime, for both workers
+- The asr-worker's PCM ffmpeg gets a second output (frames_output_args): the
+  sampled frames as an MJPEG stream in demux/frames.mjpeg.part. The video is
+  read and demuxed once, and each stream decoded once, for audio and frames
+- finish_spool() renames the spool into place with its sampling settings
+  once ffmpeg has exited cleanly; the vision-worker takes the frames from
+  ready_spool() instead of decoding the video again, and falls back to its
+  own ffmpeg if there is none (TEXT_ONLY at ASR time, cache hit, failure)
+- The spool is scratch: not charged to quota, removed by the vision-worker
+"""
+
+import json
+import os
+import subprocess
+
+from common import cas
+
+MEDIA_FILE = "media.json"  # in the job's raw/ dir
+DEMUX_DIR = "demux"        # in the job dir
+SPOOL_FILE = "frames.mjpeg"
+
+
+# ─── Probe ───
+
+def _rate(value: str) -> float:
+    num, _, den = (value or "0/1").partition("/")
+    try:
+        return float(num) / float(den or 1) if float(den or 1) else 0.0
+    except ValueError:
+        return 0.0
+
+
+def summarize(info: dict) -> dict:
+    """The fields the workers use from ffprobe -show_format -show_streams JSON."""
+    fmt = info.get("format", {})
+    out = {
+        "duration": float(fmt.get("duration") or 0.0),
+        "format": fmt.get("format_name"),
+        "bit_rate": int(fmt.get("bit_rate") or 0),
+        "video": None,
+        "audio": None,
+    }
+    for st in info.get("streams", []):
+        kind = st.get("codec_type")
+        if kind == "video" and out["video"] is None and not st.get("disposition", {}).get("attached_pic"):
+            out["video"] = {
+                "codec": st.get("codec_name"),
+                "width": st.get("width"),
+                "height": st.get("height"),
+                "fps": round(_rate(st.get("avg_frame_rate")), 3),
+            }
+        elif kind == "audio" and out["audio"] is None:
+            out["audio"] = {
+                "codec": st.get("codec_name"),
+                "sample_rate": int(st.get("sample_rate") or 0),
+                "channels": st.get("channels"),
+            }
+    return out
+
+
+def probe(video_path: str) -> dict:
+    """summarize() of ffprobe's output; duration 0 and no streams if
+    ffprobe is missing or fails."""
+    try:
+        raw = subprocess.check_output([
+            "ffprobe", "-v", "error", "-print_format", "json", "-show_format", "-show_streams", video_path,
+        ], stderr=subprocess.DEVNULL)
+        return summarize(json.loads(raw))
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return summarize({})
+
+
+def load(raw_dir: str, video_path: str) -> dict:
+    """Probe result for video_path, from raw/media.json when it was written
+    for this exact file, else probed now and saved there."""
+    st = os.stat(video_path)
+    source = {"file": os.path.basename(video_path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    path = os.path.join(raw_dir, MEDIA_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("source") == source:
+            return cached
+    except (OSError, ValueError):
+        pass
+    meta = {**probe(video_path), "source": source}
+    if meta["duration"] or meta["video"] or meta["audio"]:  # don't pin a failed probe
+        with cas.replacing(path) as tmp:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+    return meta
+
+
+# ─── Frames spool ───
+
+def spool_path(job_dir: str) -> str:
+    return os.path.join(job_dir, DEMUX_DIR, SPOOL_FILE)
+
+
+def frames_output_args(job_dir: str, interval: int, qscale: int) -> list:
+    """Extra ffmpeg output (goes after the PCM output) writing sampled frames
+    to the .part spool. Same filter and encoder as the vision-worker's own
+    pass, so the frames are byte-identical."""
+    os.makedirs(os.path.join(job_dir, DEMUX_DIR), exist_ok=True)
+    return ["-an", "-vf", f"fps=1/{interval}", "-q:v", str(qscale),
+            "-f", "image2pipe", "-c:v", "mjpeg", "-y", spool_path(job_dir) + ".part"]
+
+
+def finish_spool(job_dir: str, interval: int, qscale: int):
+    """ffmpeg exited cleanly: publish the spool with its settings."""
+    path = spool_path(job_dir)
+    with cas.replacing(path + ".json") as tmp:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"interval": interval, "qscale": qscale}, f)
+    os.replace(path + ".part", path)
+
+
+def ready_spool(job_dir: str, interval: int, qscale: int) -> str | None:
+    """Path of a finished spool sampled with these settings, else None."""
+    path = spool_path(job_dir)
+    try:
+        with open(path + ".json", encoding="utf-8") as f:
+            settings = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if settings != {"interval": interval, "qscale": qscale} or not os.path.exists(path):
+        return None
+    return path
+
+
+def remove_spool(job_dir: str):
+    d = os.path.join(job_dir, DEMUX_DIR)
+    for name in (SPOOL_FILE, SPOOL_FILE + ".part", SPOOL_FILE + ".json"):
+        try:
+            os.remove(os.path.join(d, name))
+        except FileNotFoundError:
+            pass
+    try:
+        os.rmdir(d)
+    except OSError:
+        pass
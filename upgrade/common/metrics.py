@@ -0,0 +1,258 @@
+"""
+In-process metrics in the Prometheus text format (no client library)
+- Counter / Gauge / Histogram families with labels, kept in a Registry;
+  recording is a dict lookup and an add under the family's lock (~1 us), so
+  it stays on in production
+- timer() times a block into a histogram; STAGE_SECONDS is the per-stage
+  timer the workers wrap around ffprobe, ffmpeg, model load, transcription,
+  frames, cover and artifact writes
+- Collectors run at scrape time only (queue depth / oldest message age read
+  from Redis), so the hot path never waits on I/O for metrics
+- render() is the exposition text: media-api serves it as GET /metrics,
+  each worker runs serve(METRICS_PORT), a bare http.server on a daemon thread
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NAMESPACE = "teachermon"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+RATIO_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = f"{NAMESPACE}_{name}"
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[k]) for k in self.labels)
+
+    def _series(self, key: tuple, suffix: str = "", extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return f"{self.name}{suffix}{{{','.join(pairs)}}}" if pairs else f"{self.name}{suffix}"
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in items:
+            lines += self._lines(key, value)
+        return lines
+
+    def _lines(self, key: tuple, value) -> list:
+        return [f"{self._series(key)} {_num(value)}"]
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels))
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Family):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Family):
+    """Cumulative-bucket histogram; per series [bucket counts..., count, sum]."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = TIME_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._values.get(key)
+            if s is None:
+                s = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[i] += 1  # i == len(buckets): only +Inf
+            s[-1] += value
+
+    def value(self, **labels):
+        """(count, sum) of the series, or None."""
+        s = self._values.get(self._key(labels))
+        return (sum(s[:-1]), s[-1]) if s else None
+
+    def _lines(self, key: tuple, s) -> list:
+        lines, acc = [], 0
+        for le, n in zip(self.buckets + (math.inf,), s[:-1]):
+            acc += n
+            le = 'le="%s"' % _num(le)
+            lines.append(f"{self._series(key, '_bucket', le)} {acc}")
+        lines.append(f"{self._series(key, '_count')} {acc}")
+        lines.append(f"{self._series(key, '_sum')} {_num(s[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.families = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, family: _Family) -> _Family:
+        with self._lock:
+            known = self.families.get(family.name)
+            if known is not None:  # module reloaded / defined twice: keep one
+                return known
+            self.families[family.name] = family
+        return family
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = TIME_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, fn):
+        """fn() runs before each render(), e.g. to set gauges from Redis.
+        A failing collector is reported as a counter, not a failed scrape."""
+        self.collectors.append(fn)
+
+    def render(self) -> str:
+        for fn in list(self.collectors):
+            try:
+                fn()
+            except Exception:
+                COLLECTOR_ERRORS.inc(collector=getattr(fn, "__name__", "?"))
+        with self._lock:
+            families = sorted(self.families.values(), key=lambda f: f.name)
+        lines = []
+        for family in families:
+            lines += family.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+add_collector = REGISTRY.add_collector
+render = REGISTRY.render
+
+# ─── Shared metrics ───
+
+COLLECTOR_ERRORS = counter("metrics_collector_errors_total", "Scrape-time collectors that raised", ("collector",))
+STAGE_SECONDS = histogram("stage_seconds", "Wall time per job stage", ("stage",))
+STAGE_ERRORS = counter("stage_errors_total", "Job stages that raised", ("stage",))
+BYTES = counter("bytes_total", "Bytes received or written, by kind", ("kind",))
+JOBS = counter("jobs_total", "Jobs finished by a service, by outcome", ("service", "outcome"))
+ASR_RTF = histogram("asr_real_time_factor", "Transcription wall time / audio duration per job",
+                    buckets=RATIO_BUCKETS)
+FRAMES_PER_SEC = histogram("frames_per_second", "Frames extracted per second of wall time per job",
+                           buckets=RATE_BUCKETS)
+DB_SECONDS = histogram("db_call_seconds", "MariaDB call latency (pool checkout included)", ("op",),
+                       buckets=DB_BUCKETS)
+QUEUE_MESSAGES = gauge("queue_messages", "Messages in a job queue by state", ("queue", "state"))
+QUEUE_OLDEST_AGE = gauge("queue_oldest_age_seconds", "Age of the message at the head of the queue", ("queue",))
+
+
+@contextmanager
+def timer(hist: Histogram = STAGE_SECONDS, **labels):
+    """Time the block into hist (default: STAGE_SECONDS, stage=...).
+    Errors are timed too and, for stages, counted in STAGE_ERRORS."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        if hist is STAGE_SECONDS:
+            STAGE_ERRORS.inc(**labels)
+        raise
+    finally:
+        hist.observe(time.perf_counter() - t0, **labels)
+
+
+def report_queue(q):
+    """Depth (ready / inflight / dead) and head age of a common.jobqueue queue."""
+    for state, n in q.stats().items():
+        QUEUE_MESSAGES.set(n, queue=q.name, state=state)
+    QUEUE_OLDEST_AGE.set(round(q.oldest_age(), 3), queue=q.name)
+
+
+def watch_queues(*queues):
+    """Report queues at scrape time."""
+    def queues_collector():
+        for q in queues:
+            report_queue(q)
+    add_collector(queues_collector)
+
+
+# ─── Exporter ───
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # scrapes every few seconds: keep the worker log clean
+        pass
+
+
+def serve(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer | None:
+    """GET /metrics on port in a daemon thread; port 0 disables it."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    print(f"[METRICS] exporter on :{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,93 @@
+"""
+Precompressed siblings of text artifacts: name.gz / name.br next to name
+- Written once by the worker that writes the artifact (transcript.*,
+  frames_index.json, timeline.json), so media-api never compresses on a
+  request: it picks a sibling by Accept-Encoding and sends the file as is
+- A sibling carries its source's mtime (os.utime); one whose mtime differs
+  is stale (the artifact was rewritten or relinked from the cache) and is
+  not served. Siblings are written aside and renamed into place
+- Brotli is optional (pip Brotli): without it only .gz is written
+- Small files (< MIN_BYTES) and ones that don't shrink get no sibling
+"""
+
+import gzip
+import os
+
+from common import cas
+
+try:
+    import brotli
+except ImportError:  # media-api only reads siblings
+    brotli = None
+
+MIN_BYTES = 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9  # 10-11 are several times slower for a few % on JSON
+ENCODINGS = {"br": ".br", "gzip": ".gz"}  # preferred first
+
+
+def _compress(encoding: str, data: bytes) -> bytes | None:
+    if encoding == "gzip":
+        return gzip.compress(data, GZIP_LEVEL, mtime=0)  # mtime=0: same bytes for the same input
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=BROTLI_QUALITY, mode=brotli.MODE_TEXT)
+    return None
+
+
+def sibling(path: str, encoding: str) -> str:
+    return path + ENCODINGS[encoding]
+
+
+def write_siblings(path: str) -> list:
+    """Compress path into its .gz / .br siblings (stale ones are removed).
+    Returns the encodings written."""
+    st = os.stat(path)
+    written = []
+    data = None
+    if st.st_size >= MIN_BYTES:
+        with open(path, "rb") as f:
+            data = f.read()
+    for encoding in ENCODINGS:
+        out = sibling(path, encoding)
+        packed = _compress(encoding, data) if data is not None else None
+        if packed is None or len(packed) >= len(data):
+            _remove(out)
+            continue
+        with cas.replacing(out) as tmp:
+            with open(tmp, "wb") as f:
+                f.write(packed)
+            os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        written.append(encoding)
+    return written
+
+
+def write_all(art_dir: str, names) -> dict:
+    """write_siblings() for each of names present in art_dir: {name:
+    encodings}. Not fatal: a file that fails is just served uncompressed."""
+    out = {}
+    for name in names:
+        path = os.path.join(art_dir, name)
+        try:
+            out[name] = write_siblings(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"  [PRECOMPRESS] {name}: {e}")
+    return out
+
+
+def fresh(path: str, encoding: str, mtime_ns: int) -> os.stat_result | None:
+    """stat of path's sibling for encoding if it matches the source's
+    mtime_ns, else None."""
+    try:
+        st = os.stat(sibling(path, encoding))
+    except FileNotFoundError:
+        return None
+    return st if st.st_mtime_ns == mtime_ns else None
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,97 @@
+"""
+Job progress channel (Redis)
+- Latest state per job in hash job:{job_id}:state (field -> JSON value, plus seq)
+- Every update bumps seq and PUBLISHes the full state on job:{job_id}:events
+- Workers publish stage transitions and throttled fine-grained progress
+- media-api serves the hash for GET /jobs/{id} and fans the channel out as SSE
+"""
+
+import json
+import time
+import weakref
+
+EVENTS_PATTERN = "job:*:events"
+STATE_TTL_SEC = 7 * 24 * 3600
+TERMINAL_STATUSES = ("DONE", "FAILED", "REJECTED_QUOTA")
+
+
+def state_key(job_id: str) -> str:
+    return f"job:{job_id}:state"
+
+
+def events_channel(job_id: str) -> str:
+    return f"job:{job_id}:events"
+
+
+def job_id_from_channel(channel: str) -> str:
+    return channel[len("job:"):-len(":events")]
+
+
+# KEYS: state hash
+# ARGV: channel, ttl, publish flag, then field/JSON-value pairs
+# Merges fields, bumps seq and publishes the full state as one JSON object.
+_PUBLISH = """
+for i = 4, #ARGV, 2 do redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1]) end
+local seq = redis.call('HINCRBY', KEYS[1], 'seq', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+if ARGV[3] == '1' then
+  local flat = redis.call('HGETALL', KEYS[1])
+  local parts = {}
+  for i = 1, #flat, 2 do parts[#parts + 1] = '"' .. flat[i] .. '":' .. flat[i + 1] end
+  redis.call('PUBLISH', ARGV[1], '{' .. table.concat(parts, ',') .. '}')
+end
+return seq
+"""
+_scripts = weakref.WeakKeyDictionary()  # client -> registered _PUBLISH
+
+
+def _publish_script(r):
+    """_PUBLISH registered once per client (EVALSHA after the first call)."""
+    script = _scripts.get(r)
+    if script is None:
+        script = _scripts[r] = r.register_script(_PUBLISH)
+    return script
+
+
+def publish(r, job_id: str, notify: bool = True, **fields) -> int:
+    """Merge fields into the job state and (by default) publish it. Returns seq."""
+    fields.setdefault("updated_at", round(time.time(), 3))
+    args = [events_channel(job_id), STATE_TTL_SEC, "1" if notify else "0"]
+    for k, v in fields.items():
+        args += [k, json.dumps(v, ensure_ascii=False, default=str)]
+    return _publish_script(r)(keys=[state_key(job_id)], args=args)
+
+
+def decode_state(raw: dict) -> dict | None:
+    """HGETALL result (bytes -> bytes) to a plain dict."""
+    if not raw:
+        return None
+    return {k.decode(): json.loads(v) for k, v in raw.items()}
+
+
+def read_state(r, job_id: str) -> dict | None:
+    return decode_state(r.hgetall(state_key(job_id)))
+
+
+class ProgressReporter:
+    """Per-job publisher used inside a worker.
+
+    stage() always publishes; update() is throttled to one event per
+    min_interval seconds so a fast transcription loop cannot flood Redis.
+    """
+
+    def __init__(self, r, job_id: str, min_interval: float = 1.0):
+        self.r = r
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self._last = 0.0
+
+    def stage(self, stage: str, **fields):
+        self._last = time.monotonic()
+        publish(self.r, self.job_id, stage=stage, **fields)
+
+    def update(self, force: bool = False, **fields):
+        now = time.monotonic()
+        if force or now - self._last >= self.min_interval:
+            self._last = now
+            publish(self.r, self.job_id, **fields)
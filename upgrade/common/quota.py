@@ -0,0 +1,305 @@
+"""
+Shared quota ledger (Redis-cached, DB reconciled)
+- Per-user limit/usage cached in Redis hash quota:{user_id}
+- Byte reservations taken atomically by a Lua check-and-reserve script
+- commit() turns a reservation into usage, release() gives it back
+- Usage changes are written behind to user_media_quota in the background
+- Reconciler reloads usage from DB (NestJS also edits it) and reaps stale leases
+"""
+
+import threading
+import time
+import uuid
+
+# ─── Keys ───
+USERS_KEY = "quota:users"        # set of user_ids cached in Redis
+LEASES_KEY = "quota:leases"      # zset "user_id|res_id" -> lease deadline
+LOCK_KEY = "quota:reconcile:lock"
+
+
+def _quota_key(user_id: str) -> str:
+    return f"quota:{user_id}"
+
+
+def _res_key(user_id: str) -> str:
+    return f"quota:{user_id}:res"
+
+
+# ─── Lua scripts ───
+
+# KEYS: quota hash, reservations hash, leases zset
+# ARGV: res_id, bytes, lease member, lease deadline
+# Returns remaining bytes after reserving, -1 if over limit, -2 if not cached.
+_RESERVE = """
+if redis.call('HEXISTS', KEYS[1], 'limit') == 0 then return -2 end
+local limit = tonumber(redis.call('HGET', KEYS[1], 'limit'))
+local usage = tonumber(redis.call('HGET', KEYS[1], 'usage') or '0')
+local reserved = tonumber(redis.call('HGET', KEYS[1], 'reserved') or '0')
+local n = tonumber(ARGV[2])
+if usage + reserved + n > limit then return -1 end
+redis.call('HINCRBY', KEYS[1], 'reserved', n)
+redis.call('HINCRBY', KEYS[2], ARGV[1], n)
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[3])
+return limit - usage - reserved - n
+"""
+
+# KEYS: quota hash, reservations hash, leases zset, users set
+# ARGV: res_id, actual bytes (may be 0 or negative), lease member, user_id
+# Drops the reservation (if any) and applies actual bytes to usage.
+_SETTLE = """
+local held = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+if held ~= 0 then
+  redis.call('HDEL', KEYS[2], ARGV[1])
+  redis.call('HINCRBY', KEYS[1], 'reserved', -held)
+end
+redis.call('ZREM', KEYS[3], ARGV[3])
+local n = tonumber(ARGV[2])
+if n ~= 0 then
+  redis.call('HINCRBY', KEYS[1], 'usage', n)
+  redis.call('HINCRBY', KEYS[1], 'pending', n)
+  redis.call('SADD', KEYS[4], ARGV[4])
+end
+return tonumber(redis.call('HGET', KEYS[1], 'usage') or '0')
+"""
+
+# KEYS: quota hash, users set
+# ARGV: limit, usage from DB, user_id
+# usage = DB value + deltas not yet written to DB.
+_LOAD = """
+local pending = tonumber(redis.call('HGET', KEYS[1], 'pending') or '0')
+local inflight = tonumber(redis.call('HGET', KEYS[1], 'inflight') or '0')
+redis.call('HSET', KEYS[1], 'limit', ARGV[1], 'usage', tonumber(ARGV[2]) + pending + inflight)
+redis.call('SADD', KEYS[2], ARGV[3])
+return 1
+"""
+
+# KEYS: quota hash
+# Moves pending deltas to inflight; returns inflight (bytes to write to DB).
+_TAKE = """
+local p = tonumber(redis.call('HGET', KEYS[1], 'pending') or '0')
+if p ~= 0 then
+  redis.call('HINCRBY', KEYS[1], 'inflight', p)
+  redis.call('HSET', KEYS[1], 'pending', 0)
+end
+return tonumber(redis.call('HGET', KEYS[1], 'inflight') or '0')
+"""
+
+_UNLOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class QuotaLedger:
+    """Quota ledger shared by media-api and the workers.
+
+    connect: optional callable returning a DB-API connection to the
+    MariaDB holding user_media_quota. Without it the ledger runs on
+    Redis alone with default_limit for every user.
+    """
+
+    def __init__(self, r, default_limit: int, connect=None, lease_sec: int = 3600):
+        self.r = r
+        self.default_limit = int(default_limit)
+        self.connect = connect
+        self.lease_sec = lease_sec
+        self._reserve = r.register_script(_RESERVE)
+        self._settle = r.register_script(_SETTLE)
+        self._load = r.register_script(_LOAD)
+        self._take = r.register_script(_TAKE)
+        self._unlock = r.register_script(_UNLOCK)
+        self._thread = None
+
+    # ─── Hot path (Redis only) ───
+
+    def reserve(self, user_id: str, res_id: str, nbytes: int) -> bool:
+        """Atomically add nbytes to reservation res_id. False if over quota."""
+        keys = [_quota_key(user_id), _res_key(user_id), LEASES_KEY]
+        args = [res_id, int(nbytes), f"{user_id}|{res_id}", time.time() + self.lease_sec]
+        left = self._reserve(keys=keys, args=args)
+        if left == -2:
+            self.load([user_id])
+            left = self._reserve(keys=keys, args=args)
+        return left >= 0
+
+    def commit(self, user_id: str, res_id: str, actual_bytes: int) -> int:
+        """Drop reservation res_id and charge actual_bytes. Returns new usage."""
+        return self._settle(
+            keys=[_quota_key(user_id), _res_key(user_id), LEASES_KEY, USERS_KEY],
+            args=[res_id, int(actual_bytes), f"{user_id}|{res_id}", user_id],
+        )
+
+    def release(self, user_id: str, res_id: str):
+        """Drop reservation res_id without charging anything."""
+        self.commit(user_id, res_id, 0)
+
+    def adjust(self, user_id: str, delta_bytes: int) -> int:
+        """Charge (or with a negative delta, free) bytes outside any reservation."""
+        return self.commit(user_id, "", delta_bytes)
+
+    def snapshot(self, user_id: str) -> dict:
+        """Return limit/usage/reserved/remaining for user_id."""
+        q = self.r.hgetall(_quota_key(user_id))
+        if b"limit" not in q:
+            self.load([user_id])
+            q = self.r.hgetall(_quota_key(user_id))
+        limit = int(q.get(b"limit", self.default_limit))
+        usage = int(q.get(b"usage", 0))
+        reserved = int(q.get(b"reserved", 0))
+        return {
+            "limit_bytes": limit,
+            "usage_bytes": usage,
+            "reserved_bytes": reserved,
+            "remaining_bytes": max(0, limit - usage - reserved),
+        }
+
+    def held(self, user_id: str, res_id: str) -> int:
+        """Bytes currently held by reservation res_id."""
+        return int(self.r.hget(_res_key(user_id), res_id) or 0)
+
+    def reservation(self, user_id: str, res_id: str = None, resume: bool = False) -> "Reservation":
+        """New reservation handle; resume=True picks up bytes already held
+        by res_id (e.g. a resumable upload spanning several requests)."""
+        res = Reservation(self, user_id, res_id or uuid.uuid4().hex)
+        if resume:
+            res.held = self.held(user_id, res.res_id)
+        return res
+
+    # ─── DB sync ───
+
+    def _fetch_db(self, user_ids: list) -> dict:
+        """user_id -> (limit, usage) from user_media_quota (missing users omitted)."""
+        if not self.connect or not user_ids:
+            return {}
+        conn = self.connect()
+        try:
+            cur = conn.cursor()
+            marks = ", ".join(["%s"] * len(user_ids))
+            cur.execute(
+                f"SELECT user_id, limit_bytes, usage_bytes FROM user_media_quota WHERE user_id IN ({marks})",
+                list(user_ids),
+            )
+            return {row[0]: (int(row[1]), int(row[2])) for row in cur.fetchall()}
+        finally:
+            conn.close()
+
+    def load(self, user_ids: list):
+        """(Re)load limit and usage for user_ids from DB into Redis."""
+        rows = self._fetch_db(user_ids)
+        for uid in user_ids:
+            limit, usage = rows.get(uid, (self.default_limit, 0))
+            self._load(keys=[_quota_key(uid), USERS_KEY], args=[limit, usage, uid])
+
+    def flush(self, user_ids: list):
+        """Write pending usage deltas to user_media_quota in one transaction."""
+        if not self.connect:
+            return
+        deltas = []
+        for uid in user_ids:
+            n = self._take(keys=[_quota_key(uid)])
+            if n:
+                deltas.append((uid, n))
+        if not deltas:
+            return
+        conn = self.connect()
+        try:
+            cur = conn.cursor()
+            cur.executemany(
+                "INSERT INTO user_media_quota (id, user_id, limit_bytes, usage_bytes, created_at, updated_at) "
+                "VALUES (UUID(), %s, %s, GREATEST(0, %s), NOW(), NOW()) "
+                "ON DUPLICATE KEY UPDATE usage_bytes = GREATEST(0, CAST(usage_bytes AS SIGNED) + VALUES(usage_bytes)), "
+                "updated_at = NOW()",
+                [(uid, self.default_limit, n) for uid, n in deltas],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        for uid, n in deltas:
+            self.r.hincrby(_quota_key(uid), "inflight", -n)
+
+    def reap_leases(self):
+        """Release reservations whose holder stopped refreshing them (crashed)."""
+        for member in self.r.zrangebyscore(LEASES_KEY, "-inf", time.time()):
+            user_id, res_id = member.decode("utf-8").split("|", 1)
+            print(f"[QUOTA] Reaping stale reservation {res_id} of user {user_id}")
+            self.release(user_id, res_id)
+
+    def reconcile_once(self, batch: int = 500):
+        """Flush deltas, reload usage from DB and reap stale leases.
+
+        Guarded by a Redis lock so only one process reconciles at a time.
+        """
+        token = uuid.uuid4().hex
+        if not self.r.set(LOCK_KEY, token, nx=True, ex=300):
+            return
+        try:
+            users = sorted(m.decode("utf-8") for m in self.r.smembers(USERS_KEY))
+            for i in range(0, len(users), batch):
+                chunk = users[i:i + batch]
+                self.flush(chunk)
+                if self.connect:
+                    self.load(chunk)
+            self.reap_leases()
+        finally:
+            self._unlock(keys=[LOCK_KEY], args=[token])
+
+    def start_reconciler(self, interval_sec: float = 30.0):
+        """Run reconcile_once every interval_sec in a daemon thread."""
+        if self._thread:
+            return self._thread
+
+        def loop():
+            while True:
+                try:
+                    self.reconcile_once()
+                except Exception as e:
+                    print(f"[QUOTA] reconcile failed: {e}")
+                time.sleep(interval_sec)
+
+        self._thread = threading.Thread(target=loop, name="quota-reconciler", daemon=True)
+        self._thread.start()
+        return self._thread
+
+
+class Reservation:
+    """A growing byte reservation for one upload/extraction.
+
+    ensure(n) tops the reservation up (in `step` increments) so it covers n
+    bytes; commit(actual) charges what was really written; leaving the
+    `with` block without committing releases it.
+    """
+
+    def __init__(self, ledger: QuotaLedger, user_id: str, res_id: str):
+        self.ledger = ledger
+        self.user_id = user_id
+        self.res_id = res_id
+        self.held = 0
+        self.done = False
+
+    def ensure(self, total_bytes: int, step: int = 0) -> bool:
+        """Make sure at least total_bytes are reserved. False if over quota."""
+        if total_bytes <= self.held:
+            return True
+        short = total_bytes - self.held
+        # try a full step first, then just the shortfall near the limit
+        for need in ((step, short) if step > short else (short,)):
+            if self.ledger.reserve(self.user_id, self.res_id, need):
+                self.held += need
+                return True
+        return False
+
+    def commit(self, actual_bytes: int) -> int:
+        self.done = True
+        return self.ledger.commit(self.user_id, self.res_id, actual_bytes)
+
+    def release(self):
+        if not self.done:
+            self.done = True
+            self.ledger.release(self.user_id, self.res_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# make `common` importable when running pytest from anywhere
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
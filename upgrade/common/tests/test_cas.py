@@ -0,0 +1,83 @@
+import os
+import time
+
+import fakeredis
+
+from common import cas
+
+
+def make_job(root, name, frames=3, size=1000):
+    job = root / name
+    (job / "frames").mkdir(parents=True)
+    for i in range(frames):
+        (job / "frames" / f"{i:06d}.jpg").write_bytes(os.urandom(size))
+    (job / "frames_index.json").write_text("[]")
+    return job, [f"frames/{i:06d}.jpg" for i in range(frames)] + ["frames_index.json"]
+
+
+def test_store_then_fetch_links_files(tmp_path):
+    r = fakeredis.FakeRedis()
+    cache = cas.ArtifactCache(str(tmp_path / "cache"), r, max_bytes=1 << 30)
+    src, files = make_job(tmp_path, "a")
+    key = cas.cache_key("c0ffee", interval=5)
+    assert key != cas.cache_key("c0ffee", interval=10)
+
+    assert cache.fetch("frames", key, str(tmp_path / "b")) is None
+    assert not (tmp_path / "b").exists()
+    cache.store("frames", key, str(src), files, frames=3)
+
+    manifest = cache.fetch("frames", key, str(tmp_path / "b"))
+    assert manifest["frames"] == 3 and manifest["bytes"] == 3002
+    for rel in files:
+        assert os.stat(src / rel).st_ino == os.stat(tmp_path / "b" / rel).st_ino
+    assert cache.stats()["frames:hit"] == 1
+    assert cache.stats()["frames:miss"] == 1
+    assert cache.stats()["frames:bytes_saved"] == 3002
+
+    # rewriting a job artifact must not reach the shared inode
+    target = str(tmp_path / "b" / "frames_index.json")
+    with cas.replacing(target) as tmp:
+        with open(tmp, "w") as f:
+            f.write("[1]")
+    assert (src / "frames_index.json").read_text() == "[]"
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path):
+    r = fakeredis.FakeRedis()
+    cache = cas.ArtifactCache(str(tmp_path / "cache"), r, max_bytes=2500)
+    for name in ("k1", "k2"):
+        src, files = make_job(tmp_path, name, frames=1)
+        cache.store("asr", name, str(src), files)
+    assert cache.fetch("asr", "k1", str(tmp_path / "use")) is not None  # k1 now most recent
+
+    src, files = make_job(tmp_path, "k3", frames=1)
+    cache.store("asr", "k3", str(src), files)
+
+    assert cache.total_bytes() <= 2500
+    assert not os.path.exists(tmp_path / "cache" / "asr" / "k2")
+    assert cache.fetch("asr", "k1", str(tmp_path / "again")) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_miss_and_are_purged(tmp_path):
+    r = fakeredis.FakeRedis()
+    cache = cas.ArtifactCache(str(tmp_path / "cache"), r, max_bytes=1 << 30)
+    old, old_files = make_job(tmp_path, "old")
+    new, new_files = make_job(tmp_path, "new")
+    now = time.time()
+    cache.store("frames", "k-old", str(old), old_files, expires_at=now - 1)
+    cache.store("frames", "k-new", str(new), new_files, expires_at=now + 3600)
+    cache.store("asr", "k-asr", str(new), ["frames_index.json"])  # never expires
+
+    assert cache.fetch("frames", "k-old", str(tmp_path / "c")) is None
+    assert not (tmp_path / "c").exists()
+    assert cache.expire(now) == 3002
+    assert not (tmp_path / "cache" / "frames" / "k-old").exists()
+    assert (tmp_path / "old" / "frames" / "000000.jpg").exists()  # the job's own links stay
+    assert cache.fetch("frames", "k-new", str(tmp_path / "d"))["files"] == new_files
+    st = cache.stats()
+    assert (st["expired"], st["entries"], st["bytes"]) == (1, 2, 3002 + 2)
+
+    assert cache.expire(now + 7200) == 3002
+    assert cache.fetch("asr", "k-asr", str(tmp_path / "e")) is not None
+    assert cache.stats()["entries"] == 1
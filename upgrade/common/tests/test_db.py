@@ -0,0 +1,90 @@
+import pytest
+
+from common.db import Database
+
+
+class RecordingDB(Database):
+    """Database with the SQL layer replaced by a log."""
+
+    def __init__(self):
+        super().__init__()
+        self.log = []
+
+    def execute(self, sql, params=()):
+        self.log.append((sql, list(params)))
+        return 1
+
+    def fetchone(self, sql, params=()):
+        self.log.append((sql, list(params)))
+        return ("u1", "FULL")
+
+
+def test_job_meta_is_cached_per_job():
+    db = RecordingDB()
+    assert db.job_meta("j1") == {"user_id": "u1", "analysis_mode": "FULL"}
+    assert db.job_meta("j1")["user_id"] == "u1"
+    assert len(db.log) == 1
+    db.forget_job("j1")
+    db.job_meta("j1")
+    assert len(db.log) == 2
+
+
+def test_job_writer_coalesces_columns_into_status_write():
+    db = RecordingDB()
+    seen = []
+    job = db.job_writer("j1", on_change=seen.append)
+    job.set(audio_bytes=10)
+    job.set(total_bytes=10)
+    assert db.log == []  # buffered
+    job.status("ASR_DONE", has_transcript=1)
+
+    assert len(db.log) == 1
+    sql, params = db.log[0]
+    assert sql == ("UPDATE analysis_job SET updated_at = NOW(), audio_bytes = %s, total_bytes = %s, "
+                   "status = %s, has_transcript = %s WHERE id = %s")
+    assert params == [10, 10, "ASR_DONE", 1, "j1"]
+    assert seen == [{"audio_bytes": 10}, {"total_bytes": 10}, {"status": "ASR_DONE", "has_transcript": 1}]
+
+    job.status("ASR_DONE", unless_status="FAILED")
+    assert db.log[1] == ("UPDATE analysis_job SET updated_at = NOW(), status = %s WHERE id = %s AND status <> %s",
+                         ["ASR_DONE", "j1", "FAILED"])
+
+
+def test_job_writer_discard():
+    db = RecordingDB()
+    job = db.job_writer("j1")
+    job.set(audio_bytes=10)
+    job.discard()
+    job.status("FAILED")
+    assert db.log[0][1] == ["FAILED", "j1"]
+
+
+def test_transaction_commits_or_rolls_back():
+    class Conn:
+        def __init__(self):
+            self.calls = []
+
+        def cursor(self):
+            return "cur"
+
+        def commit(self):
+            self.calls.append("commit")
+
+        def rollback(self):
+            self.calls.append("rollback")
+
+        def close(self):
+            self.calls.append("close")
+
+    conn = Conn()
+    db = Database()
+    db.connect = lambda: conn
+    assert db.transaction(lambda cur: cur + "!") == "cur!"
+    assert conn.calls == ["commit", "close"]
+
+    def fail(cur):
+        raise ValueError("bad row")
+
+    with pytest.raises(ValueError, match="bad row"):
+        db.transaction(fail)
+    assert conn.calls[2:] == ["rollback", "close"]
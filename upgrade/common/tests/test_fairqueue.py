@@ -0,0 +1,92 @@
+import json
+import time
+
+import fakeredis
+import pytest
+
+from common import fairqueue
+from common.fairqueue import FairQueue
+
+
+@pytest.fixture
+def r():
+    return fakeredis.FakeRedis()
+
+
+def push(r, job_id, user, duration, queued_at=1000.0, **extra):
+    fairqueue.set_job(r, job_id, user_id=user, duration_sec=duration, **extra)
+    r.rpush("queue:jobs", json.dumps({"job_id": job_id, "queued_at": queued_at}))
+
+
+def drain(q):
+    out = []
+    while (m := q.claim(0)) is not None:
+        out.append(m.data["job_id"])
+        assert m.ack()
+    return out
+
+
+def test_users_share_by_video_seconds_not_by_jobs(r):
+    q = FairQueue(r, "queue:jobs", "w", quantum_sec=1800)
+    for i in range(6):
+        push(r, f"bulk{i}", "bulk", 3600)
+    for i in range(3):
+        push(r, f"t{i}", "teacher", 1200, queued_at=1001.0)
+    order = drain(q)
+    # bulk's first hour needs two quanta; teacher's three 20-minute jobs fit in two
+    assert order[:5] == ["t0", "bulk0", "t1", "t2", "bulk1"]
+    assert order[5:] == [f"bulk{i}" for i in range(2, 6)]
+    assert not r.keys("queue:jobs:fq:*")
+
+
+def test_weights_scale_the_share(r):
+    fairqueue.set_weight(r, "school", 3)
+    q = FairQueue(r, "queue:jobs", "w", quantum_sec=600)
+    for i in range(8):
+        push(r, f"s{i}", "school", 600)
+        push(r, f"o{i}", "other", 600)
+    first = drain(q)[:8]
+    assert sum(j.startswith("s") for j in first) == 6  # 3 : 1
+
+
+
+def test_shortest_first_within_a_user_with_aging(r):
+    q = FairQueue(r, "queue:jobs", "w", aging=0.5, quantum_sec=10_000)
+    push(r, "long", "u", 3600, queued_at=0.0)
+    push(r, "short", "u", 600, queued_at=0.0)
+    push(r, "later", "u", 600, queued_at=10_000.0)  # 600 + 5000 > 3600 + 0: long waited enough
+    assert drain(q) == ["short", "long", "later"]
+
+
+def test_urgent_lane_and_promote_of_a_waiting_job(r):
+    q = FairQueue(r, "queue:jobs", "w")
+    push(r, "a1", "a", 600)
+    push(r, "a2", "a", 600)
+    push(r, "graded", "assessor", 3600, queued_at=1002.0)
+    push(r, "asap", "b", 7200, lane="urgent", queued_at=1003.0)
+    assert q.claim(0).data["job_id"] == "asap"
+    assert q.waiting() == {"urgent": {}, "normal": {"a": 2, "assessor": 1}}
+
+    fairqueue.set_job(r, "graded", lane="urgent")
+    assert q.promote("graded", "urgent") and not q.promote("gone", "urgent")
+    with pytest.raises(ValueError):
+        q.promote("graded", "vip")
+    assert q.waiting() == {"urgent": {"assessor": 1}, "normal": {"a": 2}}
+    assert q.claim(0).data["job_id"] == "graded"
+
+
+def test_retry_is_readmitted_and_counted(r):
+    q = FairQueue(r, "queue:jobs", "w", max_attempts=2)
+    push(r, "j1", "u", 60, queued_at=time.time() - 30)
+    r.rpush("queue:jobs", "not json")
+    assert q.stats() == {"ready": 2, "inflight": 0, "dead": 0}
+    m = q.claim(0)  # admits both; the malformed one (unknown user, default cost) is dead-lettered on its turn
+    assert m.data["job_id"] == "j1" and q.oldest_age() < 5  # the malformed one, admitted just now
+    assert m.retry("flaky")
+    assert q.stats()["ready"] == 2
+    again = q.claim(0)
+    assert (again.data["job_id"], again.attempts) == ("j1", 2)
+    assert not again.retry("still flaky")  # out of attempts
+    assert q.claim(0) is None
+    assert q.stats() == {"ready": 0, "inflight": 0, "dead": 2}
+    assert not r.keys("queue:jobs:fq:*")
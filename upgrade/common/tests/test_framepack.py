@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from common import framepack
+
+
+def test_random_access_nearest_time_and_aliases(tmp_path):
+    frames = [os.urandom(1000 + 37 * i) for i in range(6)]
+    with framepack.PackWriter(str(tmp_path)) as w:
+        for i, jpeg in enumerate(frames):
+            w.put(jpeg, i * 5)
+        w.alias(2, 30)  # deduplicated frame: same bytes as frame 2
+    assert w.bytes == sum(map(os.path.getsize, (tmp_path / framepack.PACK_FILE, tmp_path / framepack.INDEX_FILE)))
+
+    with framepack.FramePack(str(tmp_path)) as pack:
+        assert len(pack) == 7
+        assert [bytes(pack.frame(i)) for i in range(6)] == frames
+        assert isinstance(pack.frame(0), memoryview) and pack.frame(0).readonly
+        assert bytes(pack.frame(6)) == frames[2]
+        assert pack.records[6]["offset"] == pack.records[2]["offset"]  # nothing stored twice
+        assert [pack.nearest(t) for t in (-3, 0, 2.4, 2.5, 2.6, 12.6, 29, 1e9)] == [0, 0, 0, 0, 1, 3, 6, 6]
+        assert bytes(pack.at(11)) == frames[2]
+
+
+def test_torn_last_record_is_ignored_and_bad_index_rejected(tmp_path):
+    with framepack.PackWriter(str(tmp_path)) as w:
+        w.put(b"\xff\xd8one\xff\xd9", 0)
+        w.put(b"\xff\xd8two\xff\xd9", 5)
+    with open(tmp_path / framepack.INDEX_FILE, "ab") as f:
+        f.write(b"\x00" * 7)  # killed while appending a record
+    with framepack.FramePack(str(tmp_path)) as pack:
+        assert len(pack) == 2 and bytes(pack.frame(1)) == b"\xff\xd8two\xff\xd9"
+
+    (tmp_path / framepack.INDEX_FILE).write_bytes(b"not an index")
+    with pytest.raises(ValueError):
+        framepack.FramePack(str(tmp_path))
@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+
+import fakeredis
+import pytest
+
+from common.jobqueue import JobQueue
+
+
+@pytest.fixture
+def r():
+    return fakeredis.FakeRedis()
+
+
+def push(r, *job_ids):
+    for job_id in job_ids:
+        r.rpush("queue:jobs", json.dumps({"job_id": job_id}))
+
+
+def test_consumers_share_the_queue_and_ack(r):
+    a, b = JobQueue(r, "queue:jobs", "a"), JobQueue(r, "queue:jobs", "b")
+    push(r, "j1", "j2")
+    m1, m2 = a.claim(0), b.claim(0)
+    assert (m1.data["job_id"], m2.data["job_id"], m1.attempts) == ("j1", "j2", 1)
+    assert a.claim(0) is None
+    assert a.stats() == {"ready": 0, "inflight": 2, "dead": 0}
+    assert m1.ack() and m2.ack()
+    assert a.stats() == {"ready": 0, "inflight": 0, "dead": 0}
+    assert not r.exists("queue:jobs:msgs", "queue:jobs:attempts", "queue:jobs:leases")
+
+
+def test_stalled_message_is_reclaimed_by_another_consumer(r):
+    dead = JobQueue(r, "queue:jobs", "crashed", visibility_sec=0.05)
+    live = JobQueue(r, "queue:jobs", "live", visibility_sec=0.05)
+    push(r, "j1", "j2")
+    lost = dead.claim(0)
+    live.heartbeat_once()
+    assert r.llen("queue:jobs") == 1  # lease still valid
+
+    time.sleep(0.1)
+    held = live.claim(0)  # j2; j1's holder never renewed
+    assert live.reclaim() == (1, 0)
+    again = live.claim(0)
+    assert (again.data["job_id"], again.attempts) == ("j1", 2)
+    assert not lost.ack()  # too late: someone else owns it now
+    assert again.ack() and held.ack()
+
+
+def test_heartbeat_keeps_long_job_leased(r):
+    q = JobQueue(r, "queue:jobs", "a", visibility_sec=0.1)
+    push(r, "j1")
+    msg = q.claim(0)
+    for _ in range(4):
+        time.sleep(0.05)
+        q.heartbeat_once()
+    assert q.stats()["inflight"] == 1 and r.llen("queue:jobs") == 0
+    assert msg.ack()
+
+
+def test_bounded_retries_then_dead_letter(r):
+    q = JobQueue(r, "queue:jobs", "a", max_attempts=3)
+    push(r, "bad", "ok")
+    seen = []
+    for _ in range(4):
+        msg = q.claim(0)
+        seen.append(msg.data["job_id"])
+        if msg.data["job_id"] == "ok":
+            msg.ack()
+        else:
+            assert msg.retry("CUDA out of memory") is not msg.final
+    assert seen == ["bad", "ok", "bad", "bad"] and q.claim(0) is None
+    [entry] = q.dead_letters()
+    assert json.loads(entry["message"]) == {"job_id": "bad"}
+    assert (entry["attempts"], entry["reason"]) == (3, "CUDA out of memory")
+
+    r.rpush("queue:jobs", b"not json")
+    assert q.claim(0) is None and q.stats()["dead"] == 2
+    assert q.requeue_dead(1) == 1 and q.claim(0).attempts == 1  # fresh budget
+
+
+def test_crash_looping_message_ends_in_dead_letters(r):
+    q = JobQueue(r, "queue:jobs", "a", visibility_sec=0.01, max_attempts=2)
+    push(r, "poison")
+    for _ in range(2):
+        q.claim(0)  # worker dies holding it
+        time.sleep(0.02)
+        q.reclaim()
+    assert q.stats() == {"ready": 0, "inflight": 0, "dead": 1}
+    assert q.dead_letters()[0]["reason"].startswith("lease expired")
+
+
+def test_serve_runs_handlers_concurrently(r):
+    q = JobQueue(r, "queue:jobs", "a", poll_sec=0.01)
+    push(r, *[f"j{i}" for i in range(6)])
+    lock = threading.Lock()
+    running, peak, done = [0], [0], []
+
+    def handler(msg):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+            done.append(msg.data["job_id"])
+        if msg.data["job_id"] == "j5":
+            raise RuntimeError("boom")  # -> retried
+
+    threading.Thread(target=q.serve, args=(handler, 3), daemon=True).start()
+    deadline = time.time() + 5
+    while len(done) < 7 and time.time() < deadline:
+        time.sleep(0.01)
+    assert sorted(set(done)) == [f"j{i}" for i in range(6)] and done.count("j5") >= 2
+    assert peak[0] == 3
@@ -0,0 +1,61 @@
+import json
+import os
+
+from common import media
+
+
+def test_summarize_picks_first_real_streams():
+    info = {
+        "format": {"duration": "61.5", "format_name": "mov,mp4", "bit_rate": "800000"},
+        "streams": [
+            {"codec_type": "video", "codec_name": "mjpeg", "disposition": {"attached_pic": 1}},
+            {"codec_type": "video", "codec_name": "h264", "width": 1280, "height": 720,
+             "avg_frame_rate": "30000/1001"},
+            {"codec_type": "audio", "codec_name": "aac", "sample_rate": "48000", "channels": 2},
+        ],
+    }
+    s = media.summarize(info)
+    assert s["duration"] == 61.5 and s["bit_rate"] == 800000
+    assert s["video"] == {"codec": "h264", "width": 1280, "height": 720, "fps": 29.97}
+    assert s["audio"]["sample_rate"] == 48000
+    assert media.summarize({}) == {"duration": 0.0, "format": None, "bit_rate": 0, "video": None, "audio": None}
+
+
+def test_load_caches_per_file_version(tmp_path, monkeypatch):
+    video = tmp_path / "v.mp4"
+    video.write_bytes(b"x" * 10)
+    calls = []
+
+    def fake_probe(path):
+        calls.append(path)
+        return {**media.summarize({}), "duration": 12.0}
+
+    monkeypatch.setattr(media, "probe", fake_probe)
+    assert media.load(str(tmp_path), str(video))["duration"] == 12.0
+    assert media.load(str(tmp_path), str(video))["duration"] == 12.0
+    assert len(calls) == 1
+    assert json.loads((tmp_path / media.MEDIA_FILE).read_text())["source"]["size"] == 10
+
+    video.write_bytes(b"x" * 20)  # replaced upload
+    media.load(str(tmp_path), str(video))
+    assert len(calls) == 2
+
+    monkeypatch.setattr(media, "probe", lambda path: media.summarize({}))
+    os.remove(tmp_path / media.MEDIA_FILE)
+    assert media.load(str(tmp_path), str(video))["duration"] == 0.0
+    assert not (tmp_path / media.MEDIA_FILE).exists()  # failed probe not pinned
+
+
+def test_spool_is_ready_only_once_finished(tmp_path):
+    job = str(tmp_path)
+    args = media.frames_output_args(job, 5, 3)
+    assert args[-1] == media.spool_path(job) + ".part"
+    with open(args[-1], "wb") as f:
+        f.write(b"\xff\xd8\xff\xd9")
+    assert media.ready_spool(job, 5, 3) is None
+
+    media.finish_spool(job, 5, 3)
+    assert media.ready_spool(job, 5, 3) == media.spool_path(job)
+    assert media.ready_spool(job, 5, 2) is None
+    media.remove_spool(job)
+    assert media.ready_spool(job, 5, 3) is None and not (tmp_path / media.DEMUX_DIR).exists()
@@ -0,0 +1,79 @@
+import json
+import socket
+import urllib.request
+
+import fakeredis
+import pytest
+
+from common import metrics
+from common.jobqueue import JobQueue
+
+
+def test_render_text_format():
+    reg = metrics.Registry()
+    c = reg.counter("t_uploads_total", "Uploads", ("kind",))
+    g = reg.gauge("t_depth", "Depth")
+    h = reg.histogram("t_seconds", "Time", ("stage",), buckets=(0.1, 1))
+    c.inc(3, kind='a"b')
+    g.set(7)
+    for v in (0.05, 0.1, 0.5, 5):
+        h.observe(v, stage="x")
+    assert reg.counter("t_uploads_total", "again", ("kind",)) is c
+
+    lines = reg.render().splitlines()
+    assert "# TYPE teachermon_t_uploads_total counter" in lines
+    assert 'teachermon_t_uploads_total{kind="a\\"b"} 3' in lines
+    assert "teachermon_t_depth 7" in lines
+    assert 'teachermon_t_seconds_bucket{stage="x",le="0.1"} 2' in lines  # le is inclusive
+    assert 'teachermon_t_seconds_bucket{stage="x",le="1"} 3' in lines
+    assert 'teachermon_t_seconds_bucket{stage="x",le="+Inf"} 4' in lines
+    assert 'teachermon_t_seconds_count{stage="x"} 4' in lines
+    assert 'teachermon_t_seconds_sum{stage="x"} 5.65' in lines
+    with pytest.raises(ValueError):
+        c.inc(1)
+
+
+def test_timer_counts_errors_and_collectors_run_at_scrape():
+    before = metrics.STAGE_SECONDS.value(stage="t_fail") or (0, 0.0)
+    with pytest.raises(KeyError):
+        with metrics.timer(stage="t_fail"):
+            raise KeyError("x")
+    assert metrics.STAGE_SECONDS.value(stage="t_fail")[0] == before[0] + 1
+    assert metrics.STAGE_ERRORS.value(stage="t_fail") >= 1
+
+    reg = metrics.Registry()
+    g = reg.gauge("t_scraped", "Set by a collector")
+    reg.add_collector(lambda: g.set(42))
+
+    def broken():
+        raise RuntimeError("redis down")
+
+    reg.add_collector(broken)
+    assert "teachermon_t_scraped 42" in reg.render()
+    assert metrics.COLLECTOR_ERRORS.value(collector="broken") >= 1
+
+
+def test_queue_gauges_and_exporter():
+    r = fakeredis.FakeRedis()
+    q = JobQueue(r, "queue:t", "c1")
+    r.rpush("queue:t", json.dumps({"job_id": "a", "queued_at": 1000.0}), json.dumps({"job_id": "b"}))
+    q.claim(0)  # a in flight, b at the head without a timestamp
+    metrics.report_queue(q)
+    assert metrics.QUEUE_MESSAGES.value(queue="queue:t", state="ready") == 1
+    assert metrics.QUEUE_MESSAGES.value(queue="queue:t", state="inflight") == 1
+    assert metrics.QUEUE_OLDEST_AGE.value(queue="queue:t") < 1  # first seen now
+
+    r.lpush("queue:t", json.dumps({"job_id": "c", "queued_at": 1000.0}))
+    assert q.oldest_age() > 1e9  # stamped by the producer
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = metrics.serve(port, host="127.0.0.1")
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as resp:
+            assert resp.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert 'teachermon_queue_messages{queue="queue:t",state="ready"} 1' in resp.read().decode()
+    finally:
+        server.shutdown()
+    assert metrics.serve(0) is None
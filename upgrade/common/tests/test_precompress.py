@@ -0,0 +1,37 @@
+import gzip
+import os
+
+import pytest
+
+from common import precompress
+
+
+def test_siblings_carry_the_source_mtime(tmp_path):
+    path = str(tmp_path / "transcript.txt")
+    data = ("[0.00-1.50] สวัสดีครับ นักเรียนทุกคน\n" * 200).encode()
+    with open(path, "wb") as f:
+        f.write(data)
+    brotli = pytest.importorskip("brotli")
+    assert precompress.write_all(str(tmp_path), ["transcript.txt", "missing.json"]) == {
+        "transcript.txt": ["br", "gzip"]}
+
+    mtime = os.stat(path).st_mtime_ns
+    with open(path + ".gz", "rb") as f:
+        assert gzip.decompress(f.read()) == data
+    with open(path + ".br", "rb") as f:
+        assert brotli.decompress(f.read()) == data
+    assert precompress.fresh(path, "gzip", mtime) and precompress.fresh(path, "br", mtime)
+    assert precompress.fresh(path, "gzip", mtime + 1) is None
+
+
+def test_small_or_incompressible_files_get_none(tmp_path):
+    small, noise = str(tmp_path / "a.json"), str(tmp_path / "b.json")
+    with open(small, "wb") as f:
+        f.write(b'{"a": 1}')
+    with open(noise, "wb") as f:
+        f.write(os.urandom(4096))
+    with open(noise + ".gz", "wb") as f:  # left over from an older version of the file
+        f.write(b"old")
+    assert precompress.write_siblings(small) == []
+    assert precompress.write_siblings(noise) == []
+    assert not os.path.exists(noise + ".gz")
@@ -0,0 +1,94 @@
+import threading
+
+import fakeredis
+import pytest
+
+from common.quota import QuotaLedger
+
+MB = 1024 * 1024
+
+
+class FakeConn:
+    """Just enough of a DB-API connection for QuotaLedger."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params):
+        self.rows = [(uid, *self.db[uid]) for uid in params if uid in self.db]
+
+    def executemany(self, sql, rows):
+        for uid, limit, delta in rows:
+            lim, usage = self.db.get(uid, (limit, 0))
+            self.db[uid] = (lim, max(0, usage + delta))
+
+    def fetchall(self):
+        return self.rows
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db():
+    return {"u1": (100 * MB, 10 * MB)}
+
+
+@pytest.fixture
+def ledger(db):
+    return QuotaLedger(fakeredis.FakeRedis(), 50 * MB, connect=lambda: FakeConn(db))
+
+
+def test_loads_from_db_and_defaults(ledger):
+    assert ledger.snapshot("u1")["remaining_bytes"] == 90 * MB
+    assert ledger.snapshot("nobody")["limit_bytes"] == 50 * MB
+
+
+def test_parallel_reservations_cannot_overshoot(ledger):
+    ok = []
+
+    def grab():
+        ok.append(ledger.reserve("u1", threading.current_thread().name, 40 * MB))
+
+    threads = [threading.Thread(target=grab) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert ok.count(True) == 2  # 10 MB used + 2 * 40 MB <= 100 MB
+    assert ledger.snapshot("u1")["reserved_bytes"] == 80 * MB
+
+
+def test_commit_release_and_flush(ledger, db):
+    with ledger.reservation("u1", "upload:j1") as res:
+        assert res.ensure(5 * MB, 64 * MB)  # a full step fits
+        assert res.held == 64 * MB
+        res.commit(5 * MB)
+    with ledger.reservation("u1", "frames:j1") as res:
+        assert res.ensure(MB)
+    snap = ledger.snapshot("u1")
+    assert snap["usage_bytes"] == 15 * MB
+    assert snap["reserved_bytes"] == 0
+
+    ledger.reconcile_once()
+    assert db["u1"] == (100 * MB, 15 * MB)
+    assert ledger.snapshot("u1")["usage_bytes"] == 15 * MB
+
+
+def test_reconcile_picks_up_external_changes_and_stale_leases(ledger, db):
+    ledger.lease_sec = -1  # every lease is already stale
+    assert ledger.reserve("u1", "audio:j2", 30 * MB)
+    ledger.adjust("u1", 2 * MB)
+    db["u1"] = (100 * MB, 0)  # NestJS deleted a job meanwhile
+
+    ledger.reconcile_once()
+    snap = ledger.snapshot("u1")
+    assert snap["reserved_bytes"] == 0
+    assert snap["usage_bytes"] == 2 * MB
+    assert db["u1"] == (100 * MB, 2 * MB)
@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+
+from common import textindex
+
+THAI = "กขคงจฉชซญดตถทนบปผพฟมยรลวศสหอะาิีึืุูเแโใไ่้๊๋ั็์"
+
+
+def random_lessons(seed: int, jobs: int = 12, per_job: int = 15) -> dict:
+    rng = np.random.default_rng(seed)
+    lessons = {}
+    for j in range(jobs):
+        segs, t = [], 0.0
+        for _ in range(per_job):
+            text = "".join(rng.choice(list(THAI + "  ,."), size=int(rng.integers(0, 30))))
+            segs.append({"start": round(t, 2), "end": round(t + 3, 2), "text": text})
+            t += 3.5
+        lessons[f"job{j}"] = segs
+    return lessons
+
+
+def scan(lessons: dict, query: str) -> set:
+    terms = [textindex.normalize(w) for w in query.split() if textindex.normalize(w)]
+    return {(job, s["start"]) for job, segs in lessons.items() for s in segs
+            if all(t in textindex.normalize(s["text"]) for t in terms)}
+
+
+def hits(ix, query: str) -> set:
+    res = ix.search(query, limit=10_000)
+    assert res["total"] == len(res["results"]) and res["exact"]
+    return {(h["job_id"], h["start"]) for h in res["results"]}
+
+
+def test_search_matches_a_scan_across_merges(tmp_path, monkeypatch):
+    monkeypatch.setattr(textindex, "FANOUT", 3)
+    root = str(tmp_path)
+    lessons = random_lessons(0)
+    ix = textindex.TextIndex(root)
+    for job, segs in lessons.items():
+        textindex.add_job(root, job, segs)
+    # reprocessed jobs: only their new text may match
+    lessons["job3"] = [{"start": 1.0, "end": 2.0, "text": "กขค ใหม่"}]
+    textindex.add_job(root, "job3", lessons["job3"])
+    lessons["job5"] = []
+    textindex.add_job(root, "job5", [])
+
+    m = textindex.read_manifest(root)
+    assert sorted(f for f in os.listdir(root) if f.endswith(".idx")) == sorted(m["segments"])
+    assert len(m["segments"]) < len(lessons) and max(textindex._level(s) for s in m["segments"]) >= 1
+    rng = np.random.default_rng(1)
+    queries = ["กขค", "ใหม่", "ก", "เแ", "ขค ใหม"]
+    for _ in range(40):
+        job = rng.choice([j for j in lessons if lessons[j]])
+        text = textindex.normalize(lessons[job][int(rng.integers(len(lessons[job])))]["text"])
+        if text:
+            i = int(rng.integers(len(text)))
+            queries.append(text[i:i + int(rng.integers(1, 6))])
+    for q in queries:
+        assert hits(ix, q) == scan(lessons, q), q
+    # past VERIFY_ALL only the hits returned are checked; total is an upper bound
+    monkeypatch.setattr(textindex, "VERIFY_ALL", 0)
+    for q in queries:
+        res, want = ix.search(q, limit=5), scan(lessons, q)
+        assert {(h["job_id"], h["start"]) for h in res["results"]} <= want
+        assert len(res["results"]) == min(5, len(want)) and res["total"] >= len(want)
+
+
+def test_ranking_and_normalization(tmp_path):
+    root = str(tmp_path)
+    textindex.add_job(root, "a", [
+        {"start": 0.0, "end": 4.0, "text": "วันนี้เราจะเรียนเรื่องเศษส่วน"},
+        {"start": 4.0, "end": 9.0, "text": "เศษส่วน, เศษ ส่วน! และเศษส่วนอีกครั้ง"},
+        {"start": 9.0, "end": 12.0, "text": "Fractions are fun"},
+    ])
+    textindex.add_job(root, "b", [{"start": 30.5, "end": 33.0, "text": "ทบทวน เศษส่วน"}])
+    ix = textindex.TextIndex(root)
+    res = ix.search("เศษส่วน")
+    assert res["total"] == 3
+    assert res["results"][0] == {"job_id": "a", "start": 4.0, "end": 9.0, "score": res["results"][0]["score"],
+                                 "text": "เศษส่วน, เศษ ส่วน! และเศษส่วนอีกครั้ง"}
+    assert [h["job_id"] for h in ix.search("FRACTIONS")["results"]] == ["a"]
+    assert [h["start"] for h in ix.search("ทบทวน  เศษ")["results"]] == [30.5]
+    assert ix.search("?! ")["results"] == [] and ix.search("ไม่มีคำนี้")["total"] == 0
+
+    textindex.add_job(root, "b", [{"start": 1.0, "end": 2.0, "text": "อย่างอื่น"}])  # seen by the open reader
+    assert {h["job_id"] for h in ix.search("เศษส่วน")["results"]} == {"a"}
+    assert ix.stats()["docs"] == 4
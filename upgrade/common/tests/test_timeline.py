@@ -0,0 +1,86 @@
+import json
+import os
+
+import numpy as np
+
+from common import timeline
+
+
+def random_timeline(seed: int, n_segments: int = 300, interval: int = 5, duration: float = 900.0):
+    rng = np.random.default_rng(seed)
+    start = np.sort(rng.uniform(0, duration, n_segments)).round(2)
+    end = (start + rng.uniform(0, 12, n_segments)).round(2)  # some overlap, some zero-length
+    end[::17] = start[::17]
+    frame_t = np.arange(0, duration, interval)
+    return start, end, frame_t
+
+
+def brute_force(start, end, frame_t, interval):
+    """Every (segment, frame) pair: frames on screen during the segment."""
+    until = np.append(frame_t[1:], frame_t[-1] + interval)
+    out = []
+    for s, e in zip(start, end):
+        e = max(e, s + timeline.MIN_SPAN)
+        on = [i for i, (t, u) in enumerate(zip(frame_t, until)) if t < e and u > s]
+        near = min(range(len(frame_t)), key=lambda i: (abs(frame_t[i] - (s + e) / 2), i))
+        out.append((on[0] if on else -1, on[-1] if on else -1, near))
+    return out
+
+
+def test_join_matches_pairwise_overlap():
+    for seed in range(3):
+        start, end, frame_t = random_timeline(seed)
+        tl = timeline.Timeline(start, end, [f"s{i}" for i in range(len(start))], frame_t,
+                               [f"{i + 1:06d}.jpg" for i in range(len(frame_t))])
+        expected = brute_force(start, end, frame_t, 5)
+        assert tl.interval == 5
+        assert list(zip(tl.frame_first.tolist(), tl.frame_last.tolist())) == [x[:2] for x in expected]
+        # nearest by midpoint, computed on the unrounded midpoint in both
+        mids = (start + np.maximum(end, start + timeline.MIN_SPAN)) / 2
+        assert tl.nearest_frame(mids).tolist() == [x[2] for x in expected]
+
+
+def test_between_matches_a_scan():
+    start, end, frame_t = random_timeline(7)
+    tl = timeline.Timeline(start, end, [str(i) for i in range(len(start))], frame_t,
+                           [f"{i + 1:06d}.jpg" for i in range(len(frame_t))])
+    rng = np.random.default_rng(1)
+    for t0 in rng.uniform(-10, 920, 50):
+        t1 = t0 + rng.uniform(0, 60)
+        got = tl.between(t0, t1)
+        want = [i for i in range(len(start)) if start[i] < max(t1, t0 + timeline.MIN_SPAN) and end[i] > t0]
+        assert [int(s["text"]) for s in got["segments"]] == want
+        assert [f["index"] for f in got["frames"]] == [
+            i for i, t in enumerate(frame_t) if t < max(t1, t0 + timeline.MIN_SPAN) and t + 5 > t0]
+
+
+def test_build_if_ready_writes_a_loadable_timeline(tmp_path):
+    art = str(tmp_path)
+    segments = [{"start": 0.0, "end": 4.5, "text": "สวัสดี"}, {"start": 6.0, "end": 12.0, "text": "ครับ"}]
+    with open(os.path.join(art, "transcript.json"), "w", encoding="utf-8") as f:
+        json.dump({"segments": segments, "meta": {"language": "th"}}, f)
+    assert timeline.build_if_ready(art) is None  # frames not there yet
+    assert not os.path.exists(os.path.join(art, "timeline.json"))
+
+    index = [{"frame": "000001.jpg", "timestamp_sec": 0, "timestamp_str": "00:00"},
+             {"frame": "000001.jpg", "timestamp_sec": 5, "timestamp_str": "00:05", "alias": True},
+             {"frame": "000003.jpg", "timestamp_sec": 10, "timestamp_str": "00:10"}]
+    with open(os.path.join(art, "frames_index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    tl = timeline.build_if_ready(art)
+
+    path = os.path.join(art, "timeline.json")
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    doc = json.loads(text)
+    assert len(text.splitlines()) == 2 + 3 + 2 + 2 + 1  # header, "frames":[, rows, ], "segments":[, rows, ]}
+    assert text.splitlines()[2] == '[0,"000001.jpg",0],'
+    assert doc["frames"][1] == [5, "000001.jpg", 1]
+    assert doc["segments"] == [[0.0, 4.5, "สวัสดี", 0, 0, 0], [6.0, 12.0, "ครับ", 1, 2, 2]]
+
+    again = timeline.Timeline.load(path)
+    assert again.between(4, 7) == tl.between(4, 7) == {
+        "segments": [tl.segment(0), tl.segment(1)],
+        "frames": [{"index": 0, "t": 0.0, "frame": "000001.jpg"},
+                   {"index": 1, "t": 5.0, "frame": "000001.jpg", "alias": True}],
+    }
@@ -0,0 +1,446 @@
+"""
+Full-text search over all transcripts: a character trigram inverted index
+- Thai has no spaces between words, so there are no words to index: text is
+  normalized (NFC, casefolded; spaces, punctuation and symbols dropped) and
+  every 3 consecutive code points is a gram. Terms of 1-3 characters are
+  answered by the postings alone (1-2 by a key range: every gram they
+  start); a longer term's grams can all occur without the term, so its hits
+  are checked against the text before they are returned
+- A document is one transcript segment: postings point at (job_id, start,
+  end) and carry how often the gram occurs there. Query terms (split on
+  spaces) must all occur; hits are ranked BM25 (occurrences, idf over the
+  index, segment length), computed with numpy over all candidates, so only
+  the ones returned are read and checked. total is exact for short terms or
+  up to VERIFY_ALL candidates, else an upper bound ("exact": false)
+- On disk: INDEX_ROOT/seg-{level}-{seq}.idx, immutable, one file each: a
+  JSON header then flat little-endian arrays (sorted gram keys, posting
+  offsets, doc ids and counts, per-doc job / start / end / length, text
+  offsets, UTF-8 text), memory-mapped and viewed with numpy.frombuffer:
+  nothing is parsed or loaded at open, a query touches the pages of its
+  grams and hits
+- Incremental: add_job() (asr-worker, at ASR_DONE) writes a small segment
+  for one job and records it in manifest.json; a job indexed again points
+  at its new segment and its old docs are skipped. FANOUT segments of a
+  level are merged into one of the next level (postings concatenated, docs
+  of replaced jobs dropped), so a doc is rewritten O(log n) times and a
+  query opens few files
+- Writers serialize on an flock; readers never lock: files are replaced by
+  rename and a reader reopens what changed when manifest.json does
+"""
+
+import fcntl
+import json
+import math
+import mmap
+import os
+import time
+import unicodedata
+from contextlib import contextmanager
+
+import numpy as np
+
+from common import cas
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+MAGIC = b"TXTIDX01"
+ALIGN = 64
+FANOUT = 8  # segments of a level merged into one of the next
+BITS = 21  # per code point in a gram key (3 * 21 < 64)
+VERIFY_ALL = 500  # long-term candidates all checked (exact total) up to this many
+VERIFY_MAX = 20_000  # candidates checked per query looking for `limit` real hits
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_DROP = dict.fromkeys(cp for cp in range(0x10000) if unicodedata.category(chr(cp))[0] in "ZPSC")
+
+
+def normalize(text: str) -> str:
+    """What the index sees: casefolded, spaces / punctuation / symbols gone."""
+    return unicodedata.normalize("NFC", text).casefold().translate(_DROP)
+
+
+def _codepoints(norm: str) -> np.ndarray:
+    return np.frombuffer(norm.encode("utf-32-le"), dtype="<u4").astype(np.uint64)
+
+
+def grams(norm: str) -> tuple:
+    """(unique gram keys, occurrences) of normalized text. Two NULs pad the
+    end so every character starts a gram (1-2 character terms find it by
+    range)."""
+    c = _codepoints(norm + "\0\0")
+    return np.unique((c[:-2] << np.uint64(2 * BITS)) | (c[1:-1] << np.uint64(BITS)) | c[2:], return_counts=True)
+
+
+def key_ranges(term: str) -> list:
+    """[(lo, hi)] gram key ranges a normalized term needs, all of them. A
+    long term needs only the grams that cover it (every third one and the
+    last): its hits are checked against the text anyway."""
+    c = [int(x) for x in _codepoints(term)]
+    if len(c) >= 3:
+        at = set(range(0, len(c) - 2, 3)) | {len(c) - 3}
+        keys = {(c[i] << 2 * BITS) | (c[i + 1] << BITS) | c[i + 2] for i in at}
+        return [(k, k) for k in sorted(keys)]
+    lo = sum(x << (2 - i) * BITS for i, x in enumerate(c))
+    return [(lo, lo | ((1 << (3 - len(c)) * BITS) - 1))]
+
+
+def occurrences(text: str, term: str) -> int:
+    """Overlapping occurrences (as the gram counts are)."""
+    n, i = 0, text.find(term)
+    while i >= 0:
+        n += 1
+        i = text.find(term, i + 1)
+    return n
+
+
+def _intersect(a: np.ndarray, b: np.ndarray, universe: int) -> tuple:
+    """Indices (ia, ib) of the values in both sorted unique arrays of ids <
+    universe: a lookup table when they are a good part of it, else binary
+    search of the shorter in the longer."""
+    if len(a) + len(b) > universe // 32:
+        at = np.full(universe, -1, np.int64)
+        at[b] = np.arange(len(b))
+        ib = at[a]
+        ia = np.flatnonzero(ib >= 0)
+        return ia, ib[ia]
+    swap = len(a) > len(b)
+    if swap:
+        a, b = b, a
+    pos = np.minimum(np.searchsorted(b, a), max(len(b) - 1, 0))
+    ia = np.flatnonzero(b[pos] == a) if len(b) else np.zeros(0, np.int64)
+    ib = pos[ia]
+    return (ib, ia) if swap else (ia, ib)
+
+
+# ─── Segment files ───
+
+def _best_first(scores: np.ndarray, cap: int):
+    """Indices by descending score (ties: ascending index), at most cap;
+    only as much of the order as the caller consumes is computed."""
+    n, k, done = min(len(scores), cap), 64, 0
+    while done < n:
+        if k < len(scores):  # all scores >= the k-th largest: a prefix of the order
+            top = np.flatnonzero(scores >= np.partition(scores, len(scores) - k)[len(scores) - k])
+        else:
+            top = np.arange(len(scores))
+        top = top[np.lexsort((top, -scores[top]))]
+        yield from top[done:n].tolist()
+        done, k = len(top), k * 8
+
+
+def _align(n: int) -> int:
+    return -(-n // ALIGN) * ALIGN
+
+
+def _postings(all_keys: np.ndarray, doc_ids: np.ndarray, counts: np.ndarray) -> dict:
+    """Posting arrays from (gram, doc, count) triples with ascending doc ids."""
+    order = np.argsort(all_keys, kind="stable")  # doc ids stay ascending within a gram
+    keys, first = np.unique(all_keys[order], return_index=True)
+    return {
+        "keys": keys.astype("<u8"),
+        "post_off": np.append(first, len(order)).astype("<u8"),
+        "post": doc_ids[order].astype("<u4"),
+        "post_tf": np.minimum(counts[order], 0xFFFF).astype("<u2"),
+    }
+
+
+def build(docs: list) -> dict:
+    """Arrays of a segment indexing docs [(job index, start, end, text)]."""
+    norms = [normalize(text) for _, _, _, text in docs]
+    per_doc = [grams(n) for n in norms]
+    n_grams = np.array([len(k) for k, _ in per_doc], dtype=np.int64)
+    empty = np.zeros(0, np.uint64)
+    arrays = _postings(np.concatenate([k for k, _ in per_doc]) if docs else empty,
+                       np.repeat(np.arange(len(docs), dtype=np.uint32), n_grams),
+                       np.concatenate([c for _, c in per_doc]) if docs else empty)
+    blobs = [text.encode("utf-8") for _, _, _, text in docs]
+    arrays.update({
+        "doc_job": np.array([d[0] for d in docs], dtype="<u4"),
+        "doc_start": np.array([d[1] for d in docs], dtype="<f8"),
+        "doc_end": np.array([d[2] for d in docs], dtype="<f8"),
+        "doc_len": np.array([len(n) for n in norms], dtype="<u4"),
+        "text_off": np.concatenate([[0], np.cumsum([len(b) for b in blobs], dtype=np.int64)]).astype("<u8"),
+        "blob": np.frombuffer(b"".join(blobs), dtype=np.uint8),
+    })
+    return arrays
+
+
+def write_segment(path: str, jobs: list, arrays: dict):
+    layout, pos = {}, 0
+    for name, a in arrays.items():
+        layout[name] = [pos, a.dtype.str, len(a)]
+        pos = _align(pos + a.nbytes)
+    header = json.dumps({"jobs": jobs, "docs": len(arrays["doc_job"]), "chars": int(arrays["doc_len"].sum()),
+                         "arrays": layout}, separators=(",", ":")).encode()
+    base = _align(16 + len(header))
+    with cas.replacing(path) as tmp:
+        with open(tmp, "wb") as f:
+            f.write(MAGIC + len(header).to_bytes(8, "little") + header)
+            for name, a in arrays.items():
+                f.seek(base + layout[name][0])
+                f.write(a.tobytes())
+            f.truncate(base + pos)
+
+
+class Segment:
+    """A segment file, memory-mapped; arrays as in build()."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:8] != MAGIC:
+            raise ValueError(f"{path}: not a text index segment")
+        n = int.from_bytes(self._mm[8:16], "little")
+        header = json.loads(self._mm[16:16 + n])
+        base = _align(16 + n)
+        self.jobs = header["jobs"]
+        self.docs = header["docs"]
+        self.chars = header["chars"]
+        self._blob_at = base + header["arrays"]["blob"][0]
+        for name, (off, dtype, count) in header["arrays"].items():
+            setattr(self, name, np.frombuffer(self._mm, dtype=dtype, count=count, offset=base + off))
+
+    def _slice(self, lo: int, hi: int) -> tuple:
+        i0 = int(np.searchsorted(self.keys, np.uint64(lo), "left"))
+        i1 = int(np.searchsorted(self.keys, np.uint64(hi), "right"))
+        if i1 <= i0:
+            return 0, 0, 0
+        return int(self.post_off[i0]), int(self.post_off[i1]), i1 - i0
+
+    def span(self, lo: int, hi: int) -> int:
+        """Postings in [lo, hi]: an upper bound of the docs holding them."""
+        o0, o1, _ = self._slice(lo, hi)
+        return o1 - o0
+
+    def postings(self, lo: int, hi: int) -> tuple:
+        """(sorted doc ids, occurrences) of the grams in [lo, hi]."""
+        o0, o1, n = self._slice(lo, hi)
+        docs, tf = self.post[o0:o1], self.post_tf[o0:o1]
+        if n <= 1:
+            return docs, tf.astype(np.int64)
+        docs, inv = np.unique(docs, return_inverse=True)
+        return docs, np.bincount(inv, weights=tf).astype(np.int64)
+
+    def match(self, terms: list, live_jobs: np.ndarray) -> tuple:
+        """(docs, occurrences per term [terms x docs]) of the docs of live
+        jobs holding every gram range of every term. A term's count is its
+        rarest gram's (exact for 1-3 characters, else an upper bound)."""
+        docs, tfs = None, []
+        ranges = sorted(((self.span(*r), t, r) for t, rs in enumerate(terms) for r in rs))
+        for _, t, r in ranges:  # rarest first: the candidates shrink fast
+            d, tf = self.postings(*r)
+            if docs is None:
+                docs, tfs = d, [None] * len(terms)
+            else:
+                ia, ib = _intersect(docs, d, self.docs)
+                docs, tfs, d, tf = docs[ia], [x if x is None else x[ia] for x in tfs], d[ib], tf[ib]
+            tfs[t] = tf if tfs[t] is None else np.minimum(tfs[t], tf)
+            if not len(docs):
+                return docs, np.zeros((len(terms), 0), np.int64)
+        keep = live_jobs[self.doc_job[docs]]
+        return docs[keep], np.array([x[keep] for x in tfs])
+
+    def text(self, doc: int) -> str:
+        at = self._blob_at
+        return self._mm[at + int(self.text_off[doc]):at + int(self.text_off[doc + 1])].decode("utf-8")
+
+
+def merge(segments: list, live: list) -> tuple:
+    """(jobs, arrays) of one segment holding the docs of segments whose
+    live[i][job index] is set; postings are concatenated, not rebuilt."""
+    jobs, parts, post, doc_base = [], [], [], 0
+    for seg, alive in zip(segments, live):
+        keep_doc = alive[seg.doc_job]
+        job_map = np.cumsum(alive) - 1 + len(jobs)
+        jobs += [job for job, a in zip(seg.jobs, alive) if a]
+        new_id = np.cumsum(keep_doc) - 1 + doc_base
+        lens = np.diff(seg.text_off.astype(np.int64))
+        parts.append((job_map[seg.doc_job[keep_doc]], seg.doc_start[keep_doc], seg.doc_end[keep_doc],
+                      seg.doc_len[keep_doc], lens[keep_doc], seg.blob[np.repeat(keep_doc, lens)]))
+        per_key = np.diff(seg.post_off.astype(np.int64))
+        kept = keep_doc[seg.post]
+        post.append((np.repeat(seg.keys, per_key)[kept], new_id[seg.post[kept]], seg.post_tf[kept]))
+        doc_base += int(keep_doc.sum())
+    cat = [np.concatenate(x) for x in zip(*post)]
+    arrays = _postings(cat[0], cat[1], cat[2])
+    doc_job, start, end, doc_len, text_len, blob = (np.concatenate(x) for x in zip(*parts))
+    arrays.update({
+        "doc_job": doc_job.astype("<u4"),
+        "doc_start": start.astype("<f8"),
+        "doc_end": end.astype("<f8"),
+        "doc_len": doc_len.astype("<u4"),
+        "text_off": np.concatenate([[0], np.cumsum(text_len)]).astype("<u8"),
+        "blob": blob.astype(np.uint8),
+    })
+    return jobs, arrays
+
+
+# ─── Writer (asr-worker) ───
+
+def read_manifest(root: str) -> dict:
+    """{"seq", "segments": [names], "jobs": {job_id: segment name, "" if
+    the job has no text}}."""
+    try:
+        with open(os.path.join(root, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"seq": 0, "segments": [], "jobs": {}}
+
+
+@contextmanager
+def _locked(root: str):
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _level(name: str) -> int:
+    return int(name.split("-")[1])
+
+
+def add_job(root: str, job_id: str, segments: list) -> int:
+    """(Re)index a job's transcript segments [{"start", "end", "text"}].
+    Returns the docs indexed."""
+    docs = [(0, float(s["start"]), float(s["end"]), s["text"]) for s in segments
+            if normalize(s.get("text") or "")]
+    with _locked(root):
+        m = read_manifest(root)
+        m["seq"] += 1
+        name = f"seg-0-{m['seq']:08d}.idx" if docs else ""
+        if docs:
+            write_segment(os.path.join(root, name), [job_id], build(docs))
+            m["segments"].append(name)
+        m["jobs"][job_id] = name
+        _compact(root, m)
+        used = set(m["jobs"].values())
+        m["segments"] = [s for s in m["segments"] if s in used]
+        with cas.replacing(os.path.join(root, MANIFEST_FILE)) as tmp:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(m, f, separators=(",", ":"))
+        keep = set(m["segments"])
+        for f in os.listdir(root):  # merged away, replaced, or left by a crashed writer
+            if f.endswith(".idx") and f not in keep:
+                os.remove(os.path.join(root, f))
+    return len(docs)
+
+
+def _compact(root: str, m: dict):
+    """Merge FANOUT segments of a level into one of the next, until no level
+    has FANOUT. Docs of jobs indexed again since are dropped."""
+    while True:
+        levels = {}
+        for name in m["segments"]:
+            levels.setdefault(_level(name), []).append(name)
+        full = [names[:FANOUT] for _, names in sorted(levels.items()) if len(names) >= FANOUT]
+        if not full:
+            return
+        names = full[0]
+        segs = [Segment(os.path.join(root, name)) for name in names]
+        live = [np.array([m["jobs"].get(job) == name for job in seg.jobs], dtype=bool)
+                for name, seg in zip(names, segs)]
+        jobs, arrays = merge(segs, live)
+        m["seq"] += 1
+        out = f"seg-{_level(names[0]) + 1}-{m['seq']:08d}.idx" if jobs else ""
+        if jobs:
+            write_segment(os.path.join(root, out), jobs, arrays)
+        for job in jobs:
+            m["jobs"][job] = out
+        m["segments"] = [s for s in m["segments"] if s not in names] + ([out] if jobs else [])
+
+
+# ─── Reader (media-api) ───
+
+class TextIndex:
+    """The segments listed in root/manifest.json, memory-mapped; reopened
+    (only the new ones) when the manifest changes."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._stamp = None
+        self._segments = {}  # name -> Segment
+        self._live = {}  # name -> bool per segment job: still indexed there
+
+    def refresh(self, force: bool = False):
+        for attempt in range(3):
+            try:
+                st = os.stat(os.path.join(self.root, MANIFEST_FILE))
+            except FileNotFoundError:
+                self._stamp, self._segments, self._live = None, {}, {}
+                return
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if stamp == self._stamp and not force:
+                return
+            m = read_manifest(self.root)
+            try:
+                segments = {name: self._segments.get(name) or Segment(os.path.join(self.root, name))
+                            for name in m["segments"]}
+            except FileNotFoundError:  # merged away after we read the manifest
+                if attempt == 2:
+                    raise
+                continue
+            self._live = {name: np.array([m["jobs"].get(job) == name for job in seg.jobs], dtype=bool)
+                          for name, seg in segments.items()}
+            self._segments, self._stamp = segments, stamp
+            return
+
+    def stats(self) -> dict:
+        self.refresh()
+        return {"segments": len(self._segments), "docs": sum(s.docs for s in self._segments.values()),
+                "bytes": sum(len(s._mm) for s in self._segments.values())}
+
+    def search(self, query: str, limit: int = 20) -> dict:
+        """Transcript segments holding every term of query (split on
+        spaces), best BM25 first."""
+        t0 = time.perf_counter()
+        self.refresh()
+        terms = list(dict.fromkeys(t for t in (normalize(w) for w in query.split()) if t))
+        out = {"query": query, "total": 0, "exact": True, "results": []}
+        segments = list(self._segments.values())
+        live = list(self._live.values())
+        if terms and segments:
+            ranges = [key_ranges(t) for t in terms]
+            n_docs = sum(s.docs for s in segments)
+            avg_len = sum(s.chars for s in segments) / max(n_docs, 1)
+            idf = []
+            for rs in ranges:  # df ~ postings of the term's rarest gram range
+                df = min(n_docs, sum(min(s.span(*r) for r in rs) for s in segments))
+                idf.append(math.log(1 + (n_docs - df + 0.5) / (df + 0.5)))
+            idf = np.array(idf)[:, None]
+
+            def bm25(tf, length):
+                return (idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))).sum(axis=0)
+
+            which, docs, scores = [], [], []
+            for i, seg in enumerate(segments):
+                d, tf = seg.match(ranges, live[i])
+                which.append(np.full(len(d), i))
+                docs.append(d)
+                scores.append(bm25(tf, seg.doc_len[d]))
+            which, docs, scores = np.concatenate(which), np.concatenate(docs), np.concatenate(scores)
+
+            # best first; a long term's candidates are checked in that order
+            verify = any(len(t) > 3 for t in terms)
+            check_all = verify and len(docs) <= VERIFY_ALL
+            hits = []
+            for k in _best_first(scores, VERIFY_MAX if verify else limit):
+                if len(hits) >= limit and not check_all:
+                    break
+                seg, d = segments[which[k]], int(docs[k])
+                text, score = seg.text(d), float(scores[k])
+                if verify:
+                    norm = normalize(text)
+                    tf = np.array([[occurrences(norm, t)] for t in terms])
+                    if not tf.all():
+                        continue
+                    score = float(bm25(tf, len(norm))[0])
+                hits.append((score, seg.jobs[seg.doc_job[d]], float(seg.doc_start[d]), float(seg.doc_end[d]), text))
+            out["exact"] = check_all or not verify
+            out["total"] = len(hits) if check_all else len(docs)
+            hits.sort(key=lambda h: (-h[0], h[1], h[2]))
+            out["results"] = [{"job_id": job, "start": round(start, 2), "end": round(end, 2), "text": text,
+                               "score": round(score, 4)} for score, job, start, end, text in hits[:limit]]
+        out["took_ms"] = round((time.perf_counter() - t0) * 1e3, 2)
+        return out
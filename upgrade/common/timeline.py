@@ -0,0 +1,187 @@
+"""
+Transcript <-> frames timeline (FULL jobs): artifacts/timeline.json
+- Segments (transcript.json) and frames (frames_index.json) are loaded into
+  NumPy columns; a frame is on screen from its timestamp until the next one
+  (the last one for one more interval)
+- Each segment is joined to the frames on screen while it is spoken (first
+  / last, an inclusive range) and to the frame nearest its midpoint, with
+  searchsorted over the sorted columns: O((segments + frames) log frames),
+  no loop over pairs
+- timeline.json is one row per line (column names up front), so it is valid
+  JSON and can still be read or written a row at a time
+- Timeline.between(t0, t1) answers "segments and frames between t0 and t1"
+  in-process for the analysis step: two binary searches per column
+- build_if_ready() is called by both workers after writing their artifact;
+  whichever finishes second finds both inputs and writes the timeline
+"""
+
+import json
+import os
+
+import numpy as np
+
+from common import cas
+
+TIMELINE_FILE = "timeline.json"
+TRANSCRIPT_FILE = "transcript.json"
+FRAMES_INDEX_FILE = "frames_index.json"
+VERSION = 1
+FRAME_COLUMNS = ["t", "frame", "alias"]
+SEGMENT_COLUMNS = ["start", "end", "text", "frame_first", "frame_last", "frame_nearest"]
+MIN_SPAN = 1e-6  # a zero-length segment still sees the frame on screen at its start
+
+
+class Timeline:
+    """Segments joined to frames. Columns are NumPy arrays in time order;
+    frame_first / frame_last / frame_nearest are frame positions, -1 for
+    none (no frame on screen during the segment, or no frames at all)."""
+
+    def __init__(self, seg_start, seg_end, texts: list, frame_t, frame_names: list, frame_alias=None,
+                 interval: float = 0.0):
+        self.start = np.asarray(seg_start, dtype=np.float64)
+        self.end = np.asarray(seg_end, dtype=np.float64)
+        self.texts = list(texts)
+        self.frame_t = np.asarray(frame_t, dtype=np.float64)
+        self.frame_names = list(frame_names)
+        self.frame_alias = (np.zeros(len(self.frame_t), dtype=bool) if frame_alias is None
+                            else np.asarray(frame_alias, dtype=bool))
+        if len(self.start) and np.any(np.diff(self.start) < 0):
+            order = np.argsort(self.start, kind="stable")
+            self.start, self.end = self.start[order], self.end[order]
+            self.texts = [self.texts[i] for i in order]
+        if len(self.frame_t) and np.any(np.diff(self.frame_t) < 0):
+            order = np.argsort(self.frame_t, kind="stable")
+            self.frame_t, self.frame_alias = self.frame_t[order], self.frame_alias[order]
+            self.frame_names = [self.frame_names[i] for i in order]
+        self.interval = interval or self._guess_interval()
+        # a frame is on screen over [frame_t, frame_until); without an interval the last one stays
+        self.frame_until = np.append(self.frame_t[1:], self.frame_t[-1:] + (self.interval or np.inf))
+        # ends need not be sorted (overlapping segments): search a running max
+        self._end_max = np.maximum.accumulate(self.end) if len(self.end) else self.end
+        self.frame_first, self.frame_last = self._frames_during(self.start, self.end)
+        self.frame_nearest = self.nearest_frame((self.start + self.end) / 2)
+
+    def _guess_interval(self) -> float:
+        if len(self.frame_t) < 2:
+            return 0.0
+        return float(np.median(np.diff(self.frame_t)))
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    # ─── Join ───
+
+    def _frames_during(self, t0, t1) -> tuple:
+        """(first, last) frame positions on screen during each [t0, t1), -1 if none."""
+        t0 = np.asarray(t0, dtype=np.float64)
+        t1 = np.maximum(np.asarray(t1, dtype=np.float64), t0 + MIN_SPAN)
+        first = np.searchsorted(self.frame_until, t0, side="right")  # first frame still on screen at t0
+        last = np.searchsorted(self.frame_t, t1, side="left") - 1    # last frame shown before t1
+        none = last < first
+        return np.where(none, -1, first), np.where(none, -1, last)
+
+    def nearest_frame(self, t) -> np.ndarray:
+        """Position of the frame whose timestamp is closest to each t (ties
+        go to the earlier frame); -1 without frames."""
+        t = np.asarray(t, dtype=np.float64)
+        n = len(self.frame_t)
+        if not n:
+            return np.full(t.shape, -1, dtype=np.int64)
+        if n == 1:
+            return np.zeros(t.shape, dtype=np.int64)
+        k = np.clip(np.searchsorted(self.frame_t, t, side="left"), 1, n - 1)
+        before = t - self.frame_t[k - 1] <= self.frame_t[k] - t
+        return np.where(before, k - 1, k)
+
+    # ─── Queries ───
+
+    def segment_range(self, t0: float, t1: float) -> np.ndarray:
+        """Positions of the segments overlapping [t0, t1)."""
+        lo = int(np.searchsorted(self._end_max, t0, side="right"))
+        hi = int(np.searchsorted(self.start, max(t1, t0 + MIN_SPAN), side="left"))
+        pos = np.arange(lo, max(lo, hi))
+        return pos[self.end[lo:hi] > t0] if hi > lo else pos
+
+    def frame_range(self, t0: float, t1: float) -> range:
+        """Positions of the frames on screen at some time in [t0, t1)."""
+        first, last = self._frames_during(t0, t1)
+        return range(int(first), int(last) + 1) if first >= 0 else range(0)
+
+    def segment(self, i: int) -> dict:
+        return {
+            "start": float(self.start[i]), "end": float(self.end[i]), "text": self.texts[i],
+            "frame_first": int(self.frame_first[i]), "frame_last": int(self.frame_last[i]),
+            "frame_nearest": int(self.frame_nearest[i]),
+        }
+
+    def frame(self, i: int) -> dict:
+        entry = {"index": i, "t": float(self.frame_t[i]), "frame": self.frame_names[i]}
+        if self.frame_alias[i]:
+            entry["alias"] = True
+        return entry
+
+    def between(self, t0: float, t1: float) -> dict:
+        """Segments and frames between t0 and t1 (seconds) as dicts."""
+        return {
+            "segments": [self.segment(int(i)) for i in self.segment_range(t0, t1)],
+            "frames": [self.frame(i) for i in self.frame_range(t0, t1)],
+        }
+
+    # ─── Files ───
+
+    @classmethod
+    def from_artifacts(cls, art_dir: str) -> "Timeline":
+        """Join transcript.json and frames_index.json of art_dir."""
+        with open(os.path.join(art_dir, TRANSCRIPT_FILE), encoding="utf-8") as f:
+            segments = json.load(f)["segments"]
+        with open(os.path.join(art_dir, FRAMES_INDEX_FILE), encoding="utf-8") as f:
+            index = json.load(f)
+        return cls(
+            [s["start"] for s in segments], [s["end"] for s in segments], [s["text"] for s in segments],
+            [e["timestamp_sec"] for e in index], [e["frame"] for e in index],
+            [bool(e.get("alias")) for e in index],
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "Timeline":
+        """Read a timeline.json back (the join is redone: it is cheap)."""
+        with open(path, encoding="utf-8") as f:
+            doc = json.load(f)
+        frames = doc["frames"]
+        segments = doc["segments"]
+        return cls(
+            [s[0] for s in segments], [s[1] for s in segments], [s[2] for s in segments],
+            [fr[0] for fr in frames], [fr[1] for fr in frames], [fr[2] for fr in frames],
+            interval=doc.get("interval", 0.0),
+        )
+
+    def write(self, path: str):
+        """timeline.json: a header line, then one row per line. Written
+        aside and renamed into place."""
+        with cas.replacing(path) as tmp:
+            with open(tmp, "w", encoding="utf-8") as f:
+                header = {"version": VERSION, "interval": self.interval,
+                          "frame_columns": FRAME_COLUMNS, "segment_columns": SEGMENT_COLUMNS}
+                f.write(json.dumps(header, separators=(",", ":"))[:-1] + ',\n"frames":[')
+                for i, (t, name, alias) in enumerate(zip(self.frame_t.tolist(), self.frame_names,
+                                                         self.frame_alias.tolist())):
+                    t = int(t) if t.is_integer() else t
+                    f.write(("\n" if i == 0 else ",\n") + json.dumps([t, name, int(alias)], ensure_ascii=False, separators=(",", ":")))
+                f.write('\n],\n"segments":[')
+                rows = zip(self.start.tolist(), self.end.tolist(), self.texts, self.frame_first.tolist(),
+                           self.frame_last.tolist(), self.frame_nearest.tolist())
+                for i, row in enumerate(rows):
+                    f.write(("\n" if i == 0 else ",\n") + json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+                f.write("\n]}\n")
+
+
+def build_if_ready(art_dir: str) -> Timeline | None:
+    """Write artifacts/timeline.json once transcript.json and
+    frames_index.json both exist; None (and nothing written) otherwise.
+    Each worker calls this after its own artifact is in place, so the
+    second one to finish always sees both."""
+    if not all(os.path.exists(os.path.join(art_dir, name)) for name in (TRANSCRIPT_FILE, FRAMES_INDEX_FILE)):
+        return None
+    tl = Timeline.from_artifacts(art_dir)
+    tl.write(os.path.join(art_dir, TIMELINE_FILE))
+    return tl
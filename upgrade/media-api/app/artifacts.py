@@ -0,0 +1,179 @@
+"""
+Artifact / frame / video downloads
+- file_response(): a Starlette FileResponse (http.response.pathsend, i.e.
+  sendfile, on servers that offer it; otherwise the file is streamed in
+  chunks off the event loop, never read whole) with Range / If-Range
+- Strong ETag (inode, mtime, size of the source file + the encoding) and
+  Last-Modified; If-None-Match / If-Modified-Since answer 304 without
+  touching the file
+- Text artifacts come precompressed: the .br / .gz sibling the worker wrote
+  (common/precompress.py) is sent with Content-Encoding when the client
+  accepts it and it is fresh. Range requests get the identity bytes
+- Packed frame stores (common/framepack.py) are served from the mmap'd pack
+  with the same validators and single-range Range / If-Range as loose files
+"""
+
+import email.utils
+import mimetypes
+import os
+import re
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from common import framepack, precompress
+
+ARTIFACT_MAX_AGE_SEC = int(os.getenv("ARTIFACT_MAX_AGE_SEC", "60"))
+PRECOMPRESSED = (".json", ".txt", ".srt")  # workers write .br / .gz siblings of these
+SAFE_NAME = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$")
+BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+MEDIA_TYPES = {
+    ".json": "application/json",
+    ".txt": "text/plain; charset=utf-8",
+    ".srt": "application/x-subrip; charset=utf-8",
+    ".jpg": "image/jpeg",
+    ".mp4": "video/mp4",
+}
+
+
+def safe_name(name: str) -> str:
+    """name as one path component (no dirs, no dotfiles, no temp files), else 404."""
+    if not SAFE_NAME.match(name) or ".tmp-" in name:
+        raise HTTPException(status_code=404, detail="Not found")
+    return name
+
+
+def media_type(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    return MEDIA_TYPES.get(ext) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+# ─── Validators ───
+
+def etag(st: os.stat_result, suffix: str = "") -> str:
+    return f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}{suffix}"'
+
+
+def last_modified(st: os.stat_result) -> str:
+    return email.utils.formatdate(st.st_mtime, usegmt=True)
+
+
+def not_modified(request: Request, tag: str, st: os.stat_result) -> bool:
+    """RFC 9110 13.2.2: If-None-Match (weak comparison) wins over If-Modified-Since."""
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        tags = [t.strip().removeprefix("W/") for t in inm.split(",")]
+        return "*" in tags or tag in tags
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            since = email.utils.parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(st.st_mtime) <= since
+    return False
+
+
+def accepted(request: Request) -> dict:
+    """Accept-Encoding as {coding: q}."""
+    out = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for p in params.split(";"):
+            key, _, value = p.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        out[coding.lower()] = q
+    return out
+
+
+def byte_range(request: Request, tag: str, st: os.stat_result, size: int) -> tuple | None:
+    """(start, end) inclusive of a single-range Range header that applies
+    (If-Range matches tag or Last-Modified), else None: the whole body.
+    Multiple ranges are answered whole too. (size, size) = unsatisfiable."""
+    m = BYTE_RANGE.match(request.headers.get("range", "").strip())
+    if not m or not any(m.groups()):
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() not in (tag, last_modified(st)):
+        return None
+    first, last = m.groups()
+    if not first:  # suffix: the last N bytes
+        n = int(last)
+        return (max(0, size - n), size - 1) if n else (size, size)
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return size, size
+    return None if end < start else (start, end)
+
+
+# ─── Responses ───
+
+def file_response(request: Request, path: str, precompressed: bool = False) -> Response:
+    """path with validators, Range, and (precompressed=True) a fresh .br /
+    .gz sibling if the client takes it."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+    send, send_st, encoding = path, st, None
+    if precompressed and "range" not in request.headers:
+        accept = accepted(request)
+        for coding in precompress.ENCODINGS:
+            if accept.get(coding, accept.get("*", 0.0)) > 0:
+                sib = precompress.fresh(path, coding, st.st_mtime_ns)
+                if sib is not None:
+                    send, send_st, encoding = precompress.sibling(path, coding), sib, coding
+                    break
+
+    tag = etag(st, f"-{encoding}" if encoding else "")
+    headers = {
+        "ETag": tag,
+        "Last-Modified": last_modified(st),
+        "Cache-Control": f"private, max-age={ARTIFACT_MAX_AGE_SEC}",
+    }
+    if precompressed:
+        headers["Vary"] = "Accept-Encoding"
+    if not_modified(request, tag, st):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(send, stat_result=send_st, media_type=media_type(path), headers=headers)
+
+
+def packed_frame_response(request: Request, frames_dir: str, name: str) -> Response:
+    """Frame `name` (%06d.jpg, 1-based) out of frames.pack."""
+    n = int(name.split(".")[0]) - 1 if name.split(".")[0].isdigit() else -1
+    if n < 0:
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        st = os.stat(os.path.join(frames_dir, framepack.PACK_FILE))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+    tag = etag(st, f"-{n}")
+    headers = {"ETag": tag, "Last-Modified": last_modified(st), "Accept-Ranges": "bytes",
+               "Cache-Control": f"private, max-age={ARTIFACT_MAX_AGE_SEC}"}
+    if not_modified(request, tag, st):
+        return Response(status_code=304, headers=headers)
+    with framepack.FramePack(frames_dir) as pack:
+        if n >= len(pack):
+            raise HTTPException(status_code=404, detail="Not found")
+        frame = pack.frame(n)
+        size = len(frame)
+        rng = byte_range(request, tag, st, size)
+        if rng == (size, size):
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if rng is None:
+            return Response(bytes(frame), media_type="image/jpeg", headers=headers)
+        start, end = rng
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        # a frame is tens of KB: one copy out of the mmap before it closes
+        return Response(bytes(frame[start:end + 1]), status_code=206, media_type="image/jpeg", headers=headers)
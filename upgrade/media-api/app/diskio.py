@@ -0,0 +1,137 @@
+"""
+Non-blocking upload I/O
+- stream_multipart_file(): parses multipart/form-data straight off request.stream()
+  and yields the bytes of one file field (no SpooledTemporaryFile in between)
+- DiskWriter: coalesces received pieces into WRITE_BLOCK blocks and pwrites them on
+  a dedicated disk thread pool; one block is written while the next is received
+  (double buffering), so a slow disk never stalls the event loop; an optional
+  hashlib object is fed each block on the same thread, in file order
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+DISK_IO_THREADS = int(os.getenv("DISK_IO_THREADS", "8"))
+WRITE_BLOCK = 1024 * 1024
+
+# separate from the anyio pool that runs sync routes such as /quota
+disk_pool = ThreadPoolExecutor(max_workers=DISK_IO_THREADS, thread_name_prefix="disk-io")
+
+
+def pwrite_all(fd: int, data, offset: int):
+    """os.pwrite until every byte of data is at offset (handles short writes)."""
+    view = memoryview(data)
+    while view:
+        n = os.pwrite(fd, view, offset)
+        view = view[n:]
+        offset += n
+
+
+class DiskWriter:
+    """Positional writer for one file descriptor, offloaded to disk_pool.
+
+    `committed` is the offset up to which bytes are known to be written.
+    If hasher is given it has seen exactly the bytes up to `committed`.
+    """
+
+    def __init__(self, fd: int, offset: int = 0, block: int = WRITE_BLOCK, hasher=None):
+        self.fd = fd
+        self.block = block
+        self.hasher = hasher
+        self.committed = offset
+        self._next = offset
+        self._buf = bytearray()
+        self._pending = None
+
+    async def write(self, data: bytes):
+        self._buf += data
+        if len(self._buf) >= self.block:
+            await self._submit()
+
+    async def _wait(self):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            self.committed = await pending
+
+    async def _submit(self):
+        await self._wait()
+        buf, self._buf = self._buf, bytearray()
+        offset, self._next = self._next, self._next + len(buf)
+        end = self._next
+
+        def job():
+            pwrite_all(self.fd, buf, offset)
+            if self.hasher is not None:
+                self.hasher.update(buf)  # releases the GIL for large buffers
+            return end
+
+        self._pending = asyncio.get_running_loop().run_in_executor(disk_pool, job)
+
+    async def flush(self) -> int:
+        """Write everything received so far; returns the committed offset."""
+        if self._buf:
+            await self._submit()
+        await self._wait()
+        return self.committed
+
+    async def abort(self):
+        """Drop buffered bytes and wait for the in-flight write (errors ignored)."""
+        self._buf = bytearray()
+        try:
+            await self._wait()
+        except OSError:
+            pass
+
+
+async def stream_multipart_file(request, field: str = "file"):
+    """Yield the raw bytes of form field `field` as the request body arrives."""
+    ctype, params = parse_options_header(request.headers.get("content-type", ""))
+    if ctype != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+    out = []
+    part = {"headers": {}, "field": b"", "value": b"", "active": False, "seen": False}
+
+    def on_part_begin():
+        part["headers"] = {}
+        part["active"] = False
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"] = part["value"] = b""
+
+    def on_headers_finished():
+        _, opts = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["active"] = opts.get(b"name") == field.encode() and not part["seen"]
+        part["seen"] = part["seen"] or part["active"]
+
+    def on_part_data(data, start, end):
+        if part["active"]:
+            out.append(data[start:end])
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+    async for chunk in request.stream():
+        parser.write(chunk)
+        for piece in out:
+            yield piece
+        out.clear()
+    parser.finalize()
+    if not part["seen"]:
+        raise HTTPException(status_code=422, detail=f"Missing form field '{field}'")
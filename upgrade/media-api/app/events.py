@@ -0,0 +1,106 @@
+"""
+SSE fan-out for job progress (see common/progress.py)
+- One pattern subscription (job:*:events) per media-api process
+- Every open /jobs/{job_id}/events stream gets a small in-process queue
+- A slow client may skip intermediate events but always gets the latest state
+- A stream not yet terminal re-reads the job through refresh() at the start
+  and on every heartbeat: transitions made in MariaDB only (NestJS) publish
+  nothing
+"""
+
+import asyncio
+import json
+
+from common import progress
+
+HEARTBEAT_SEC = 15
+QUEUE_DEPTH = 8
+
+
+class ProgressBroker:
+    def __init__(self, ar):
+        self.ar = ar  # redis.asyncio client
+        self.subscribers = {}  # job_id -> set of asyncio.Queue
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            pubsub = self.ar.pubsub()
+            try:
+                await pubsub.psubscribe(progress.EVENTS_PATTERN)
+                async for msg in pubsub.listen():
+                    if msg["type"] != "pmessage":
+                        continue
+                    job_id = progress.job_id_from_channel(msg["channel"].decode())
+                    queues = self.subscribers.get(job_id)
+                    if not queues:
+                        continue
+                    state = json.loads(msg["data"])
+                    for q in queues:
+                        if q.full():
+                            q.get_nowait()
+                        q.put_nowait(state)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[EVENTS] subscription lost: {e} — reconnecting")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        self.start()
+        q = asyncio.Queue(maxsize=QUEUE_DEPTH)
+        self.subscribers.setdefault(job_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, job_id: str, q: asyncio.Queue):
+        queues = self.subscribers.get(job_id)
+        if queues:
+            queues.discard(q)
+            if not queues:
+                del self.subscribers[job_id]
+
+
+def sse(state: dict) -> bytes:
+    data = json.dumps(state, ensure_ascii=False)
+    return f"id: {state.get('seq', 0)}\nevent: progress\ndata: {data}\n\n".encode("utf-8")
+
+
+async def stream_job(broker: ProgressBroker, job_id: str, refresh=None):
+    """SSE body: current state first, then every newer state until terminal.
+
+    refresh(job_id) -> state or None is a blocking lookup of the job's
+    current state (run in a thread)."""
+    q = broker.subscribe(job_id)  # subscribe before reading so nothing is missed
+    try:
+        last = 0
+        state = progress.decode_state(await broker.ar.hgetall(progress.state_key(job_id)))
+        if refresh and (state or {}).get("status") not in progress.TERMINAL_STATUSES:
+            state = await asyncio.to_thread(refresh, job_id) or state
+        while True:
+            if state and state.get("seq", 0) > last:
+                last = state["seq"]
+                yield sse(state)
+                if state.get("status") in progress.TERMINAL_STATUSES:
+                    return
+            try:
+                state = await asyncio.wait_for(q.get(), HEARTBEAT_SEC)
+            except asyncio.TimeoutError:
+                state = await asyncio.to_thread(refresh, job_id) if refresh else None
+                yield b": ping\n\n"
+    finally:
+        broker.unsubscribe(job_id, q)
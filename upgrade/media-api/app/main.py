@@ -1,21 +1,108 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-import os, uuid, shutil
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+import os, uuid, shutil, hashlib, time
 
-app = FastAPI(title="media-api")
+import redis
+import redis.asyncio
+
+from common import cas, fairqueue, framepack, media, metrics, progress, textindex
+from common.db import Database
+from common.fairqueue import FairQueue
+from common.quota import QuotaLedger
+from app import artifacts, diskio, events, resumable
 
 DATA_ROOT = os.getenv("DATA_ROOT", "/data/jobs")
 QUOTA = int(os.getenv("QUOTA_BYTES_PER_USER", "1073741824"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+QUOTA_RECONCILE_SEC = float(os.getenv("QUOTA_RECONCILE_SEC", "30"))
+UPLOAD_RESERVE_STEP = 64 * 1024 * 1024  # reserve quota 64 MiB at a time while streaming
+TEXT_INDEX_ROOT = os.getenv("TEXT_INDEX_ROOT", "/data/index")  # written by asr-worker
+SEARCH_MAX_LIMIT = 100
+
+DB_HOST = os.getenv("DB_HOST", "")  # unset = Redis-only (no MariaDB)
+DB_RECHECK_SEC = float(os.getenv("DB_RECHECK_SEC", "5"))  # analysis_job read at most once per job per interval
+
+db = Database.from_env(default_host="")
+r = redis.from_url(REDIS_URL)
+ledger = QuotaLedger(r, QUOTA, connect=db.connect if DB_HOST else None)
+broker = events.ProgressBroker(redis.asyncio.from_url(REDIS_URL))
+cache = cas.ArtifactCache.from_env(r)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ledger.start_reconciler(QUOTA_RECONCILE_SEC)
+    yield
+    await broker.stop()
+
+app = FastAPI(title="media-api", lifespan=lifespan)
+
+# TODO: replace with real auth; NestJS forwards the owner as X-User-Id
+def current_user(x_user_id: str | None) -> str:
+    return x_user_id or "me"
+
+# ─── Metrics (common/metrics.py; the workers export theirs on METRICS_PORT) ───
+
+METRICS_QUEUES = ("queue:jobs", "queue:frames")
+_queues = {}
+
+def job_queue(name: str) -> FairQueue:
+    q = _queues.get(name)
+    if q is None or q.r is not r:
+        q = _queues[name] = FairQueue(r, name, "media-api")
+    return q
+
+def collect_queues():
+    """Pipeline-wide queue depth + oldest message age, read at scrape time."""
+    for name in METRICS_QUEUES:
+        metrics.report_queue(job_queue(name))
+
+metrics.add_collector(collect_queues)
+
+# ─── Scheduling (common/fairqueue.py) ───
 
-# TODO: replace with DB user/job
-def get_user_usage_bytes(user_id: str) -> int:
-    # placeholder: compute by scanning DATA_ROOT or from DB
-    return 0
+def schedule_upload(job_id: str, user_id: str, raw_dir: str, video_path: str) -> float:
+    """ffprobe the upload once (raw/media.json, reused by the workers) and
+    record whose job it is and how long, for the fair scheduler."""
+    duration = media.load(raw_dir, video_path)["duration"]
+    fairqueue.set_job(r, job_id, user_id=user_id, duration_sec=round(duration, 1) or None)
+    return duration
+
+@app.post("/api/v1/jobs/{job_id}/priority")
+def set_priority(job_id: str, payload: dict):
+    lane = payload.get("lane")
+    if lane not in fairqueue.QUEUE_LANES:
+        raise HTTPException(status_code=422, detail=f"lane must be one of {fairqueue.QUEUE_LANES}")
+    if not os.path.isdir(os.path.join(DATA_ROOT, artifacts.safe_name(job_id))):
+        raise HTTPException(status_code=404, detail="Job not found")
+    fairqueue.set_job(r, job_id, lane=lane)
+    waiting = [name for name in METRICS_QUEUES if job_queue(name).promote(job_id, lane)]
+    return {"job_id": job_id, "lane": lane, "waiting_in": waiting}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/api/v1/quota")
-def quota():
-    user_id = "me"  # placeholder
-    usage = get_user_usage_bytes(user_id)
-    return {"limit_bytes": QUOTA, "usage_bytes": usage, "remaining_bytes": max(0, QUOTA-usage)}
+def quota(x_user_id: str | None = Header(default=None)):
+    return ledger.snapshot(current_user(x_user_id))
+
+@app.get("/api/v1/cache/stats")
+def cache_stats():
+    return cache.stats()
+
+# ─── Transcript search (common/textindex.py) ───
+
+search_index = textindex.TextIndex(TEXT_INDEX_ROOT)
+
+@app.get("/api/v1/search")
+def search(q: str, limit: int = 20):
+    if not textindex.normalize(q):
+        raise HTTPException(status_code=422, detail="Empty query")
+    with metrics.timer(stage="search"):
+        return search_index.search(q, max(1, min(limit, SEARCH_MAX_LIMIT)))
 
 @app.post("/api/v1/jobs")
 def create_job(payload: dict):
@@ -23,36 +110,244 @@ def create_job(payload: dict):
     job_dir = os.path.join(DATA_ROOT, job_id)
     os.makedirs(os.path.join(job_dir, "raw"), exist_ok=True)
     os.makedirs(os.path.join(job_dir, "artifacts"), exist_ok=True)
+    progress.publish(r, job_id, status="UPLOADING")
     return {"job_id": job_id, "status": "UPLOADING"}
 
-@app.post("/api/v1/jobs/{job_id}/upload")
-async def upload(job_id: str, file: UploadFile = File(...)):
-    user_id = "me"
-    usage = get_user_usage_bytes(user_id)
-
-    # pre-check if client provides size (not always)
-    incoming = file.size if hasattr(file, "size") and file.size else None
-    if incoming and usage + incoming > QUOTA:
-        raise HTTPException(status_code=409, detail="Quota exceeded")
-
-    job_dir = os.path.join(DATA_ROOT, job_id, "raw")
-    os.makedirs(job_dir, exist_ok=True)
-    out_path = os.path.join(job_dir, "video.mp4")
-
-    # stream write with hard-guard
-    written = 0
-    with open(out_path, "wb") as f:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk:
-                break
-            written += len(chunk)
-            if usage + written > QUOTA:
-                f.close()
-                try:
-                    os.remove(out_path)
-                except: pass
-                raise HTTPException(status_code=409, detail="Quota exceeded during upload")
-            f.write(chunk)
+JOB_STATE_COLUMNS = (
+    "status", "analysis_mode", "raw_bytes", "audio_bytes", "frames_bytes", "total_bytes",
+    "has_transcript", "has_frames", "has_cover", "error_message", "error_code",
+)
+
+def load_job_state(job_id: str, state: dict = None) -> dict | None:
+    """Seed the Redis snapshot from analysis_job (jobs that predate it / expired),
+    or bring state up to date when the row's status moved on without it."""
+    if not DB_HOST:
+        return None
+    row = db.fetchone(f"SELECT {', '.join(JOB_STATE_COLUMNS)} FROM analysis_job WHERE id = %s", (job_id,))
+    if not row:
+        return None
+    fields = dict(zip(JOB_STATE_COLUMNS, row))
+    if state and state.get("status") == fields["status"]:
+        return state
+    # published: an open /events stream has to see it too
+    progress.publish(r, job_id, notify=state is not None, **fields)
+    return progress.read_state(r, job_id)
+
+def job_state(job_id: str) -> dict | None:
+    """The Redis snapshot workers keep up to date, checked against
+    analysis_job until it is terminal: NestJS moves jobs (QUEUED, ANALYZING,
+    DONE) in MariaDB only. One check per job every DB_RECHECK_SEC, shared by
+    every GET and open /events stream; the others get the snapshot."""
+    state = progress.read_state(r, job_id)
+    if state and state.get("status") in progress.TERMINAL_STATUSES:
+        return state
+    if not DB_HOST or not r.set(f"job:{job_id}:dbcheck", 1, nx=True, px=int(DB_RECHECK_SEC * 1000)):
+        return state
+    return load_job_state(job_id, state) or state
+
+@app.get("/api/v1/jobs/{job_id}")
+def get_job(job_id: str):
+    state = job_state(job_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, **state}
+
+@app.get("/api/v1/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    return StreamingResponse(
+        events.stream_job(broker, job_id, refresh=job_state),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
+# ─── Downloads (see app/artifacts.py) ───
+
+@app.api_route("/api/v1/jobs/{job_id}/artifacts/{name}", methods=["GET", "HEAD"])
+def get_artifact(job_id: str, name: str, request: Request):
+    path = os.path.join(DATA_ROOT, artifacts.safe_name(job_id), "artifacts", artifacts.safe_name(name))
+    return artifacts.file_response(request, path, precompressed=name.endswith(artifacts.PRECOMPRESSED))
+
+@app.api_route("/api/v1/jobs/{job_id}/frames/{name}", methods=["GET", "HEAD"])
+def get_frame(job_id: str, name: str, request: Request):
+    frames_dir = os.path.join(DATA_ROOT, artifacts.safe_name(job_id), "frames")
+    if framepack.is_packed(frames_dir):
+        return artifacts.packed_frame_response(request, frames_dir, artifacts.safe_name(name))
+    return artifacts.file_response(request, os.path.join(frames_dir, artifacts.safe_name(name)))
+
+@app.api_route("/api/v1/jobs/{job_id}/video", methods=["GET", "HEAD"])
+def get_video(job_id: str, request: Request):
+    return artifacts.file_response(request, os.path.join(DATA_ROOT, artifacts.safe_name(job_id), "raw", "video.mp4"))
+
+MULTIPART_SLACK = 4096  # Content-Length also counts boundaries + part headers
+
+UPLOAD_FORM_SCHEMA = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"],
+    "properties": {"file": {"type": "string", "format": "binary"}},
+}}}}}
+
+@app.post("/api/v1/jobs/{job_id}/upload", openapi_extra=UPLOAD_FORM_SCHEMA)
+async def upload(job_id: str, request: Request, x_user_id: str | None = Header(default=None)):
+    user_id = current_user(x_user_id)
+    t0 = time.perf_counter()
+
+    with ledger.reservation(user_id, f"upload:{job_id}") as res:
+        # pre-check from Content-Length (multipart body = file + small framing)
+        incoming = int(request.headers.get("content-length") or 0) - MULTIPART_SLACK
+        if incoming > 0 and not res.ensure(incoming):
+            raise HTTPException(status_code=409, detail="Quota exceeded")
+
+        job_dir = os.path.join(DATA_ROOT, job_id, "raw")
+        os.makedirs(job_dir, exist_ok=True)
+        out_path = os.path.join(job_dir, "video.mp4")
+
+        # stream write with hard-guard: every byte is covered by the reservation;
+        # the multipart body is parsed as it arrives and written off the event loop
+        written = 0
+        fd = os.open(out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        hasher = hashlib.sha256()  # content address for the artifact cache (common/cas.py)
+        writer = diskio.DiskWriter(fd, hasher=hasher)
+        try:
+            async for chunk in diskio.stream_multipart_file(request, "file"):
+                written += len(chunk)
+                if not res.ensure(written, UPLOAD_RESERVE_STEP):
+                    raise HTTPException(status_code=409, detail="Quota exceeded during upload")
+                await writer.write(chunk)
+            await writer.flush()
+        except BaseException:
+            await writer.abort()
+            os.close(fd)
+            try:
+                os.remove(out_path)
+            except: pass
+            raise
+        os.close(fd)
+        digest = hasher.hexdigest()
+        cas.write_content_hash(job_dir, digest)
+
+        res.commit(written)
+
+    metrics.BYTES.inc(written, kind="upload")
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="upload")
+    await run_in_threadpool(schedule_upload, job_id, user_id, job_dir, out_path)
+    progress.publish(r, job_id, status="UPLOADED", raw_bytes=written, content_sha256=digest)
     return {"status": "UPLOADED", "raw_path": out_path, "raw_bytes": written}
+
+# ─── Resumable upload (see app/resumable.py) ───
+
+def _offset_headers(sess: dict) -> dict:
+    return {
+        "Upload-Offset": str(sess["offset"]),
+        "Upload-Length": str(sess["size"]),
+        "Cache-Control": "no-store",
+    }
+
+@app.post("/api/v1/jobs/{job_id}/upload/resumable")
+def create_resumable_upload(job_id: str, payload: dict, x_user_id: str | None = Header(default=None)):
+    user_id = current_user(x_user_id)
+    size = int(payload.get("size") or 0)
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="size is required")
+
+    sess = resumable.get_session(r, job_id)
+    if not sess:
+        held = ledger.held(user_id, f"upload:{job_id}")
+        if size > ledger.snapshot(user_id)["remaining_bytes"] + held:
+            raise HTTPException(status_code=409, detail="Quota exceeded")
+        raw_dir = os.path.join(DATA_ROOT, job_id, "raw")
+        os.makedirs(raw_dir, exist_ok=True)
+        open(resumable.part_path(raw_dir), "wb").close()
+        sess = resumable.create_session(r, job_id, user_id, size, payload.get("sha256"))
+    return {"job_id": job_id, "upload_offset": sess["offset"], "upload_length": sess["size"]}
+
+@app.head("/api/v1/jobs/{job_id}/upload")
+def upload_status(job_id: str):
+    sess = resumable.get_session(r, job_id)
+    if not sess:
+        raise HTTPException(status_code=404, detail="No resumable upload for this job")
+    return Response(status_code=200, headers=_offset_headers(sess))
+
+@app.patch("/api/v1/jobs/{job_id}/upload")
+async def upload_chunk(job_id: str, request: Request, upload_offset: int = Header(...)):
+    sess = resumable.get_session(r, job_id)
+    if not sess:
+        raise HTTPException(status_code=404, detail="No resumable upload for this job")
+    if upload_offset != sess["offset"]:
+        raise HTTPException(status_code=409, detail="Upload-Offset mismatch", headers=_offset_headers(sess))
+    if not resumable.acquire(r, job_id):
+        raise HTTPException(status_code=423, detail="Another request is writing this upload")
+    # re-read under the lock: a PATCH at the same offset may have just finished
+    sess = resumable.get_session(r, job_id)
+    if not sess or upload_offset != sess["offset"]:
+        resumable.release(r, job_id)
+        if not sess:
+            raise HTTPException(status_code=404, detail="No resumable upload for this job")
+        raise HTTPException(status_code=409, detail="Upload-Offset mismatch", headers=_offset_headers(sess))
+
+    user_id, size = sess["user_id"], sess["size"]
+    res = ledger.reservation(user_id, f"upload:{job_id}", resume=True)
+    raw_dir = os.path.join(DATA_ROOT, job_id, "raw")
+    part = resumable.part_path(raw_dir)
+    received = saved = upload_offset
+    t0 = time.perf_counter()
+    fd = os.open(part, os.O_WRONLY | os.O_CREAT, 0o644)
+    hasher = resumable.take_hasher(job_id, upload_offset)
+    writer = diskio.DiskWriter(fd, upload_offset, hasher=hasher)
+    try:
+        async for piece in request.stream():
+            if not piece:
+                continue
+            if received + len(piece) > size:
+                raise HTTPException(status_code=400, detail="Chunk runs past Upload-Length")
+            # quota is enforced per chunk: the reservation must cover every committed byte
+            if not res.ensure(received + len(piece), UPLOAD_RESERVE_STEP):
+                raise HTTPException(status_code=409, detail="Quota exceeded during upload")
+            await writer.write(piece)
+            received += len(piece)
+            if writer.committed - saved >= resumable.OFFSET_SAVE_EVERY:
+                saved = writer.committed
+                resumable.save_offset(r, job_id, saved)
+        await writer.flush()
+    except ClientDisconnect:
+        await writer.flush()  # keep what arrived; the client resumes from the saved offset
+    finally:
+        await writer.abort()
+        os.close(fd)
+        resumable.save_offset(r, job_id, writer.committed)
+        resumable.keep_hasher(job_id, writer.committed, hasher)
+        resumable.release(r, job_id)
+        metrics.BYTES.inc(writer.committed - upload_offset, kind="upload")
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - t0, stage="upload_chunk")
+    offset = writer.committed
+
+    if offset < size:
+        sess["offset"] = offset
+        return Response(status_code=204, headers=_offset_headers(sess))
+
+    # complete: verify, then move into place
+    digest = hasher.hexdigest() if hasher else await run_in_threadpool(resumable.sha256_file, part)
+    if sess["sha256"] and digest != sess["sha256"].lower():
+        os.remove(part)
+        resumable.drop_session(r, job_id)
+        res.release()
+        raise HTTPException(status_code=422, detail="Checksum mismatch, upload again")
+    out_path = os.path.join(raw_dir, "video.mp4")
+    os.replace(part, out_path)
+    cas.write_content_hash(raw_dir, digest)
+    res.commit(size)
+    resumable.drop_session(r, job_id)
+    await run_in_threadpool(schedule_upload, job_id, user_id, raw_dir, out_path)
+    progress.publish(r, job_id, status="UPLOADED", raw_bytes=size, content_sha256=digest)
+    return {"status": "UPLOADED", "raw_path": out_path, "raw_bytes": size}
+
+@app.delete("/api/v1/jobs/{job_id}/upload")
+def abort_upload(job_id: str):
+    sess = resumable.get_session(r, job_id)
+    if not sess:
+        raise HTTPException(status_code=404, detail="No resumable upload for this job")
+    try:
+        os.remove(resumable.part_path(os.path.join(DATA_ROOT, job_id, "raw")))
+    except FileNotFoundError:
+        pass
+    ledger.release(sess["user_id"], f"upload:{job_id}")
+    resumable.drop_session(r, job_id)
+    return {"aborted": True}
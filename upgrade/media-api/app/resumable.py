@@ -0,0 +1,99 @@
+"""
+Resumable upload sessions (tus-style offsets)
+- POST   /jobs/{job_id}/upload/resumable  -> open session {size, sha256?}
+- PATCH  /jobs/{job_id}/upload            -> bytes written in place at Upload-Offset
+- HEAD   /jobs/{job_id}/upload            -> committed Upload-Offset / Upload-Length
+- Bytes land in raw/video.mp4.part via positional writes (app/diskio.py);
+  renamed once complete + verified
+- Session state (size, committed offset, owner) lives in Redis
+- The sha256 of the committed bytes is kept in-process between PATCHes, so a
+  finished upload is not read back; a resume served by another process falls
+  back to hashing the file once at the end
+"""
+
+import hashlib
+import os
+
+SESSION_TTL_SEC = 24 * 3600
+LOCK_TTL_SEC = 60
+OFFSET_SAVE_EVERY = 4 * 1024 * 1024  # persist committed offset every 4 MiB
+
+_hashers = {}  # job_id -> (committed offset, hashlib object)
+
+
+def session_key(job_id: str) -> str:
+    return f"upload:{job_id}"
+
+
+def lock_key(job_id: str) -> str:
+    return f"upload:{job_id}:lock"
+
+
+def part_path(raw_dir: str) -> str:
+    return os.path.join(raw_dir, "video.mp4.part")
+
+
+def create_session(r, job_id: str, user_id: str, size: int, sha256: str | None) -> dict:
+    """Open a session (idempotent: an existing one is returned unchanged)."""
+    key = session_key(job_id)
+    fields = {"user_id": user_id, "size": size, "offset": 0, "sha256": sha256 or ""}
+    if r.hsetnx(key, "size", size):
+        r.hset(key, mapping=fields)
+    r.expire(key, SESSION_TTL_SEC)
+    return get_session(r, job_id)
+
+
+def get_session(r, job_id: str) -> dict | None:
+    raw = r.hgetall(session_key(job_id))
+    if not raw:
+        return None
+    s = {k.decode(): v.decode() for k, v in raw.items()}
+    return {
+        "user_id": s["user_id"],
+        "size": int(s["size"]),
+        "offset": int(s["offset"]),
+        "sha256": s.get("sha256") or None,
+    }
+
+
+def save_offset(r, job_id: str, offset: int):
+    """Persist the committed offset and keep the writer lock alive."""
+    key = session_key(job_id)
+    r.hset(key, "offset", offset)
+    r.expire(key, SESSION_TTL_SEC)
+    r.expire(lock_key(job_id), LOCK_TTL_SEC)
+
+
+def drop_session(r, job_id: str):
+    r.delete(session_key(job_id), lock_key(job_id))
+    _hashers.pop(job_id, None)
+
+
+def take_hasher(job_id: str, offset: int):
+    """sha256 state covering bytes [0, offset), or None if this process lacks it."""
+    held = _hashers.pop(job_id, None)
+    if held and held[0] == offset:
+        return held[1]
+    return hashlib.sha256() if offset == 0 else None
+
+
+def keep_hasher(job_id: str, offset: int, hasher):
+    if hasher is not None:
+        _hashers[job_id] = (offset, hasher)
+
+
+def acquire(r, job_id: str) -> bool:
+    """One writer per session; a stale lock from a dropped request expires."""
+    return bool(r.set(lock_key(job_id), 1, nx=True, ex=LOCK_TTL_SEC))
+
+
+def release(r, job_id: str):
+    r.delete(lock_key(job_id))
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(4 * 1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
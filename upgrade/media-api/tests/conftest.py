@@ -0,0 +1,29 @@
+import os
+import sys
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..")))        # app
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..", "..")))  # common
+
+from app import events, main
+from common import textindex
+from common.quota import QuotaLedger
+
+QUOTA = 8 * 1024 * 1024
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """media-api wired to an in-process Redis and a temp DATA_ROOT."""
+    server = fakeredis.FakeServer()
+    r = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(main, "DATA_ROOT", str(tmp_path))
+    monkeypatch.setattr(main, "r", r)
+    monkeypatch.setattr(main, "ledger", QuotaLedger(r, QUOTA))
+    monkeypatch.setattr(main, "search_index", textindex.TextIndex(str(tmp_path / "index")))
+    monkeypatch.setattr(main, "broker", events.ProgressBroker(fakeredis.aioredis.FakeRedis(server=server)))
+    return main
@@ -0,0 +1,125 @@
+import json
+import os
+import time
+
+from fastapi.testclient import TestClient
+
+from common import framepack, precompress
+
+
+def write(path, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def transcript_bytes(n=400) -> bytes:
+    segs = [{"start": i * 2.0, "end": i * 2.0 + 1.5, "text": f"ข้อความที่ {i}"} for i in range(n)]
+    return json.dumps({"segments": segs}, ensure_ascii=False, indent=2).encode()
+
+
+def test_precompressed_sibling_by_accept_encoding(api):
+    path = os.path.join(api.DATA_ROOT, "j1", "artifacts", "transcript.json")
+    data = transcript_bytes()
+    write(path, data)
+    written = precompress.write_siblings(path)  # .br only with the Brotli package
+    assert written[-1] == "gzip"
+    client = TestClient(api.app)
+    url = "/api/v1/jobs/j1/artifacts/transcript.json"
+
+    best = client.get(url, headers={"Accept-Encoding": "gzip, br"})
+    assert best.status_code == 200 and best.headers["content-encoding"] == written[0]
+    assert int(best.headers["content-length"]) == os.path.getsize(precompress.sibling(path, written[0])) < len(data)
+    assert best.content == data  # decoded by the client
+    assert best.headers["vary"] == "Accept-Encoding"
+
+    gz = client.get(url, headers={"Accept-Encoding": "gzip, br;q=0"})
+    assert gz.headers["content-encoding"] == "gzip" and gz.content == data
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.content == data
+    assert len({best.headers["etag"], gz.headers["etag"], plain.headers["etag"]}) == len(written) + 1
+    assert "content-encoding" not in client.get(url, headers={"Accept-Encoding": "gzip", "Range": "bytes=0-9"}).headers
+
+    # rewritten artifact: the old siblings are stale and not served
+    time.sleep(0.01)
+    write(path, data + b"\n")
+    again = client.get(url, headers={"Accept-Encoding": "gzip, br"})
+    assert "content-encoding" not in again.headers and again.content == data + b"\n"
+
+
+def test_etag_and_last_modified_give_304(api):
+    path = os.path.join(api.DATA_ROOT, "j2", "artifacts", "cover.jpg")
+    write(path, b"\xff\xd8" + os.urandom(5000) + b"\xff\xd9")
+    client = TestClient(api.app)
+    url = "/api/v1/jobs/j2/artifacts/cover.jpg"
+
+    first = client.get(url)
+    assert first.status_code == 200 and first.headers["content-type"] == "image/jpeg"
+    tag, modified = first.headers["etag"], first.headers["last-modified"]
+    assert tag.startswith('"') and not tag.startswith("W/")
+
+    hit = client.get(url, headers={"If-None-Match": f'"other", {tag}'})
+    assert hit.status_code == 304 and hit.content == b"" and hit.headers["etag"] == tag
+    assert client.get(url, headers={"If-Modified-Since": modified}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": '"other"', "If-Modified-Since": modified}).status_code == 200
+    assert client.head(url).headers["content-length"] == "5004"
+
+
+def test_range_requests_on_the_video(api):
+    data = os.urandom(100_000)
+    write(os.path.join(api.DATA_ROOT, "j3", "raw", "video.mp4"), data)
+    client = TestClient(api.app)
+    url = "/api/v1/jobs/j3/video"
+
+    part = client.get(url, headers={"Range": "bytes=1000-1999"})
+    assert part.status_code == 206 and part.content == data[1000:2000]
+    assert part.headers["content-range"] == "bytes 1000-1999/100000"
+    assert client.get(url, headers={"Range": "bytes=-10"}).content == data[-10:]
+    tag = part.headers["etag"]
+    assert client.get(url, headers={"Range": "bytes=0-9", "If-Range": tag}).status_code == 206
+    assert client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"old"'}).content == data
+    assert client.get(url, headers={"Range": "bytes=200000-"}).status_code == 416
+
+
+def test_frames_from_files_and_from_a_pack(api):
+    client = TestClient(api.app)
+    write(os.path.join(api.DATA_ROOT, "j4", "frames", "000001.jpg"), b"one")
+    assert client.get("/api/v1/jobs/j4/frames/000001.jpg").content == b"one"
+
+    frames_dir = os.path.join(api.DATA_ROOT, "j5", "frames")
+    with framepack.PackWriter(frames_dir) as w:
+        w.put(b"first", 0)
+        w.alias(0, 5)
+        w.put(b"third", 10)
+    assert client.get("/api/v1/jobs/j5/frames/000002.jpg").content == b"first"
+    resp = client.get("/api/v1/jobs/j5/frames/000003.jpg")
+    assert resp.content == b"third" and resp.headers["content-type"] == "image/jpeg"
+    assert client.get("/api/v1/jobs/j5/frames/000003.jpg",
+                      headers={"If-None-Match": resp.headers["etag"]}).status_code == 304
+    assert client.get("/api/v1/jobs/j5/frames/000004.jpg").status_code == 404
+
+    # Range / If-Range as for loose frames
+    for j in ("j4", "j5"):
+        name = "000001.jpg"
+        whole = client.get(f"/api/v1/jobs/{j}/frames/{name}")
+        part = client.get(f"/api/v1/jobs/{j}/frames/{name}", headers={"Range": "bytes=1-"})
+        assert part.status_code == 206 and part.content == whole.content[1:]
+        assert part.headers["content-range"] == f"bytes 1-{len(whole.content) - 1}/{len(whole.content)}"
+        assert client.get(f"/api/v1/jobs/{j}/frames/{name}", headers={"Range": "bytes=-2"}).content == \
+            whole.content[-2:]
+        stale = client.get(f"/api/v1/jobs/{j}/frames/{name}", headers={"Range": "bytes=1-", "If-Range": '"other"'})
+        assert stale.status_code == 200 and stale.content == whole.content
+        fresh = client.get(f"/api/v1/jobs/{j}/frames/{name}",
+                           headers={"Range": "bytes=0-1", "If-Range": whole.headers["etag"]})
+        assert fresh.status_code == 206 and fresh.content == whole.content[:2]
+        assert client.get(f"/api/v1/jobs/{j}/frames/{name}", headers={"Range": "bytes=99-"}).status_code == 416
+
+
+def test_unsafe_names_are_not_found(api):
+    write(os.path.join(api.DATA_ROOT, "j6", "raw", "video.mp4"), b"secret")
+    write(os.path.join(api.DATA_ROOT, "j6", "artifacts", "a.json.tmp-1234"), b"{}")
+    client = TestClient(api.app)
+    for url in ("/api/v1/jobs/j6/artifacts/..%2Fraw%2Fvideo.mp4", "/api/v1/jobs/j6/artifacts/.hidden",
+                "/api/v1/jobs/j6/artifacts/a.json.tmp-1234", "/api/v1/jobs/../artifacts/x.json",
+                "/api/v1/jobs/j6/artifacts/missing.json"):
+        assert client.get(url).status_code == 404, url
@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from app import events
+from common import progress
+
+
+def test_get_job_served_from_snapshot(api):
+    client = TestClient(api.app)
+    job_id = client.post("/api/v1/jobs", json={}).json()["job_id"]
+    assert client.get(f"/api/v1/jobs/{job_id}").json()["status"] == "UPLOADING"
+
+    progress.publish(api.r, job_id, status="PROCESSING_ASR", stage="transcribe", progress=0.25)
+    job = client.get(f"/api/v1/jobs/{job_id}").json()
+    assert (job["status"], job["stage"], job["progress"], job["seq"]) == ("PROCESSING_ASR", "transcribe", 0.25, 2)
+    assert client.get("/api/v1/jobs/unknown").status_code == 404
+
+
+def test_events_stream_until_terminal(api):
+    client = TestClient(api.app)
+    progress.publish(api.r, "j1", status="PROCESSING_ASR", progress=0.1)
+
+    def worker():
+        while not api.r.pubsub_numpat():  # wait for the broker's subscription
+            time.sleep(0.01)
+        progress.publish(api.r, "j1", progress=0.6)
+        progress.publish(api.r, "j1", status="FAILED", error_code="ASR_GPU_ERROR")
+
+    seen = []
+    threading.Thread(target=worker, daemon=True).start()
+    with client.stream("GET", "/api/v1/jobs/j1/events") as resp:
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        for line in resp.iter_lines():
+            if line.startswith("data: "):
+                seen.append(json.loads(line[len("data: "):]))
+
+    seqs = [s["seq"] for s in seen]
+    assert seqs == sorted(set(seqs)) and seqs[-1] == 3  # no repeats, nothing after terminal
+    assert seen[-1]["status"] == "FAILED" and seen[-1]["error_code"] == "ASR_GPU_ERROR"
+
+
+def test_db_transitions_reach_snapshot_and_stream(api, monkeypatch):
+    """NestJS moves jobs on in MariaDB only: GET and /events pick it up."""
+    row = {"status": "ASR_DONE"}
+    columns = api.JOB_STATE_COLUMNS
+    monkeypatch.setattr(api, "DB_HOST", "db")
+    monkeypatch.setattr(api, "db", SimpleNamespace(fetchone=lambda sql, params: tuple(
+        row["status"] if c == "status" else None for c in columns)))
+    monkeypatch.setattr(api, "DB_RECHECK_SEC", 0.01)
+    monkeypatch.setattr(events, "HEARTBEAT_SEC", 0.05)
+    client = TestClient(api.app)
+    progress.publish(api.r, "j2", status="ASR_DONE", has_transcript=1)
+
+    row["status"] = "ANALYZING"
+    assert client.get("/api/v1/jobs/j2").json()["status"] == "ANALYZING"
+
+    def nest():
+        while not api.r.pubsub_numpat():
+            time.sleep(0.01)
+        time.sleep(0.1)
+        row["status"] = "DONE"
+
+    seen = []
+    threading.Thread(target=nest, daemon=True).start()
+    with client.stream("GET", "/api/v1/jobs/j2/events") as resp:
+        for line in resp.iter_lines():
+            if line.startswith("data: "):
+                seen.append(json.loads(line[len("data: "):])["status"])
+    assert seen == ["ANALYZING", "DONE"]  # the stream ends
+
+    # terminal: served from the snapshot, no DB read
+    monkeypatch.setattr(api, "db", None)
+    assert client.get("/api/v1/jobs/j2").json()["status"] == "DONE"
+
+
+def test_db_recheck_is_shared_and_throttled(api, monkeypatch):
+    """Many GETs + an open stream cost one analysis_job read per interval."""
+    reads = []
+    columns = api.JOB_STATE_COLUMNS
+
+    def fetchone(sql, params):
+        reads.append(params)
+        return tuple("ANALYZING" if c == "status" else None for c in columns)
+
+    monkeypatch.setattr(api, "DB_HOST", "db")
+    monkeypatch.setattr(api, "db", SimpleNamespace(fetchone=fetchone))
+    monkeypatch.setattr(api, "DB_RECHECK_SEC", 60)
+    monkeypatch.setattr(events, "HEARTBEAT_SEC", 0.02)
+    client = TestClient(api.app)
+    progress.publish(api.r, "j3", status="QUEUED")
+
+    for _ in range(20):
+        assert client.get("/api/v1/jobs/j3").json()["status"] == "ANALYZING"
+    assert reads == [("j3",)]
+
+    def worker():  # the stream ends on a worker's DONE, after ~10 pings
+        while not api.r.pubsub_numpat():
+            time.sleep(0.01)
+        time.sleep(0.2)
+        progress.publish(api.r, "j3", status="DONE")
+
+    api.r.delete("job:j3:dbcheck")  # next interval: one more read
+    pings = 0
+    threading.Thread(target=worker, daemon=True).start()
+    with client.stream("GET", "/api/v1/jobs/j3/events") as resp:
+        for line in resp.iter_lines():
+            pings += line.startswith(":")
+            client.get("/api/v1/jobs/j3")
+    assert pings >= 3
+    assert reads == [("j3",), ("j3",)]
@@ -0,0 +1,113 @@
+import hashlib
+import os
+
+from fastapi.testclient import TestClient
+
+from app import resumable
+from common import cas
+
+MB = 1024 * 1024
+
+
+def _open(client, job_id, data, sha=True):
+    body = {"size": len(data)}
+    if sha:
+        body["sha256"] = hashlib.sha256(data).hexdigest()
+    return client.post(f"/api/v1/jobs/{job_id}/upload/resumable", json=body)
+
+
+def _patch(client, job_id, offset, data):
+    return client.patch(
+        f"/api/v1/jobs/{job_id}/upload",
+        content=data,
+        headers={"Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"},
+    )
+
+
+def test_resume_after_interruption(api):
+    client = TestClient(api.app)
+    data = os.urandom(5 * MB)
+    assert _open(client, "j1", data).json()["upload_offset"] == 0
+
+    # first attempt dies after 2 MB reached the server
+    assert _patch(client, "j1", 0, data[:2 * MB]).status_code == 204
+    head = client.head("/api/v1/jobs/j1/upload")
+    assert head.headers["Upload-Offset"] == str(2 * MB)
+    assert _open(client, "j1", data).json()["upload_offset"] == 2 * MB
+
+    stale = _patch(client, "j1", 0, data)
+    assert stale.status_code == 409
+    assert stale.headers["Upload-Offset"] == str(2 * MB)
+
+    done = _patch(client, "j1", 2 * MB, data[2 * MB:])
+    assert done.json() == {"status": "UPLOADED", "raw_path": done.json()["raw_path"], "raw_bytes": len(data)}
+    with open(done.json()["raw_path"], "rb") as f:
+        assert f.read() == data
+    assert client.head("/api/v1/jobs/j1/upload").status_code == 404
+    quota = client.get("/api/v1/quota").json()
+    assert quota["usage_bytes"] == len(data) and quota["reserved_bytes"] == 0
+
+
+def test_checksum_mismatch_releases_quota(api):
+    client = TestClient(api.app)
+    data = os.urandom(MB)
+    client.post("/api/v1/jobs/j2/upload/resumable", json={"size": len(data), "sha256": "0" * 64})
+    assert _patch(client, "j2", 0, data).status_code == 422
+    assert client.get("/api/v1/quota").json()["usage_bytes"] == 0
+    assert client.get("/api/v1/quota").json()["reserved_bytes"] == 0
+
+
+def test_quota_enforced_per_chunk(api):
+    client = TestClient(api.app)
+    data = os.urandom(6 * MB)
+    assert _open(client, "j3", data, sha=False).status_code == 200
+    assert _patch(client, "j3", 0, data[:MB]).status_code == 204
+
+    # another upload eats the rest of the 8 MB quota meanwhile
+    api.ledger.adjust("me", 6 * MB)
+    assert _patch(client, "j3", MB, data[MB:]).status_code == 409
+    assert client.get("/api/v1/quota").json()["usage_bytes"] == 6 * MB
+
+    assert client.delete("/api/v1/jobs/j3/upload").json() == {"aborted": True}
+    assert client.get("/api/v1/quota").json()["reserved_bytes"] == 0
+
+
+def test_content_hash_kept_across_patches_and_after_process_change(api):
+    client = TestClient(api.app)
+    data = os.urandom(3 * MB)
+    raw_dir = os.path.join(api.DATA_ROOT, "{}", "raw")
+    for job_id, lose_state in (("j4", False), ("j5", True)):
+        _open(client, job_id, data, sha=False)
+        assert _patch(client, job_id, 0, data[:MB]).status_code == 204
+        if lose_state:  # resumed on another media-api process
+            resumable._hashers.clear()
+        done = _patch(client, job_id, MB, data[MB:])
+        assert done.status_code == 200
+        assert cas.read_content_hash(raw_dir.format(job_id)) == hashlib.sha256(data).hexdigest()
+    assert resumable._hashers == {}
+
+
+def test_same_offset_patches_run_once(api, monkeypatch):
+    client = TestClient(api.app)
+    data = os.urandom(2 * MB)
+    _open(client, "j6", data)
+    assert _patch(client, "j6", 0, data[:MB]).status_code == 204
+
+    # a retry at 0 passed the offset check before that PATCH took the lock
+    get_session, calls = resumable.get_session, []
+
+    def stale(r, job_id):
+        sess = get_session(r, job_id)
+        calls.append(job_id)
+        return {**sess, "offset": 0} if len(calls) == 1 else sess
+
+    monkeypatch.setattr(resumable, "get_session", stale)
+    retry = _patch(client, "j6", 0, os.urandom(MB))
+    assert retry.status_code == 409 and retry.headers["Upload-Offset"] == str(MB)
+
+    # nothing was overwritten, the offset did not move back, the lock is free
+    assert client.head("/api/v1/jobs/j6/upload").headers["Upload-Offset"] == str(MB)
+    done = _patch(client, "j6", MB, data[MB:])
+    assert done.status_code == 200
+    with open(done.json()["raw_path"], "rb") as f:
+        assert f.read() == data
@@ -0,0 +1,20 @@
+from fastapi.testclient import TestClient
+
+from common import textindex
+
+
+def test_search_endpoint_returns_ranked_segments(api):
+    client = TestClient(api.app)
+    root = api.search_index.root
+    textindex.add_job(root, "j1", [{"start": 12.5, "end": 15.0, "text": "วันนี้เราจะเรียนเรื่องเศษส่วน"},
+                                   {"start": 15.0, "end": 18.0, "text": "เศษส่วน เศษส่วน ง่ายมาก"}])
+    textindex.add_job(root, "j2", [{"start": 3.0, "end": 6.0, "text": "การบวกเลข"}])
+
+    resp = client.get("/api/v1/search", params={"q": "เศษส่วน"})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["total"] == 2 and body["exact"]
+    assert [(h["job_id"], h["start"], h["end"]) for h in body["results"]] == [("j1", 15.0, 18.0), ("j1", 12.5, 15.0)]
+    assert len(client.get("/api/v1/search", params={"q": "เศษส่วน", "limit": 1}).json()["results"]) == 1
+    assert client.get("/api/v1/search", params={"q": "การบวก"}).json()["results"][0]["job_id"] == "j2"
+    assert client.get("/api/v1/search", params={"q": " ?! "}).status_code == 422
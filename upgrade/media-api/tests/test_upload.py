@@ -0,0 +1,70 @@
+import hashlib
+import os
+
+from fastapi.testclient import TestClient
+
+from common import cas
+
+MB = 1024 * 1024
+
+
+def test_multipart_upload_streams_to_disk(api):
+    client = TestClient(api.app)
+    data = os.urandom(3 * MB + 123)
+    resp = client.post("/api/v1/jobs/j1/upload", files={"file": ("lesson.mp4", data, "video/mp4")},
+                       data={"note": "ignored"})
+    assert resp.status_code == 200
+    assert resp.json()["raw_bytes"] == len(data)
+    with open(resp.json()["raw_path"], "rb") as f:
+        assert f.read() == data
+    assert client.get("/api/v1/quota").json()["usage_bytes"] == len(data)
+    digest = hashlib.sha256(data).hexdigest()
+    assert cas.read_content_hash(os.path.dirname(resp.json()["raw_path"])) == digest
+    assert client.get("/api/v1/jobs/j1").json()["content_sha256"] == digest
+
+
+def test_over_quota_upload_is_removed(api):
+    client = TestClient(api.app)
+    resp = client.post("/api/v1/jobs/j2/upload", files={"file": ("big.mp4", os.urandom(9 * MB))})
+    assert resp.status_code == 409
+    assert not os.path.exists(os.path.join(api.DATA_ROOT, "j2", "raw", "video.mp4"))
+    assert client.get("/api/v1/quota").json()["reserved_bytes"] == 0
+
+
+def test_missing_file_field(api):
+    client = TestClient(api.app)
+    resp = client.post("/api/v1/jobs/j3/upload", files={"other": ("x.mp4", b"abc")})
+    assert resp.status_code == 422
+
+
+def test_metrics_endpoint_reports_uploads_and_queues(api):
+    client = TestClient(api.app)
+    before = api.metrics.BYTES.value(kind="upload") or 0
+    client.post("/api/v1/jobs/j4/upload", files={"file": ("a.mp4", os.urandom(1000))})
+    api.r.rpush("queue:jobs", '{"job_id": "j4"}')
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/plain")
+    assert api.metrics.BYTES.value(kind="upload") == before + 1000
+    assert 'teachermon_queue_messages{queue="queue:jobs",state="ready"} 1' in resp.text
+    assert 'teachermon_stage_seconds_count{stage="upload"}' in resp.text
+
+
+def test_upload_is_recorded_for_the_scheduler_and_can_be_made_urgent(api):
+    from common.fairqueue import FairQueue
+
+    client = TestClient(api.app)
+    for job_id, user in (("j5", "bulk"), ("j6", "assessor")):
+        client.post(f"/api/v1/jobs/{job_id}/upload", files={"file": ("a.mp4", os.urandom(100))},
+                    headers={"X-User-Id": user})
+        api.r.rpush("queue:jobs", '{"job_id": "%s"}' % job_id)
+    assert api.fairqueue.set_job(api.r, "j5")["user_id"] == "bulk"
+
+    assert client.post("/api/v1/jobs/j6/priority", json={"lane": "vip"}).status_code == 422
+    assert client.post("/api/v1/jobs/nope/priority", json={"lane": "urgent"}).status_code == 404
+    assert client.post("/api/v1/jobs/..%2F..%2Fetc/priority", json={"lane": "urgent"}).status_code == 404
+    assert client.post("/api/v1/jobs/.hidden/priority", json={"lane": "urgent"}).status_code == 404
+    resp = client.post("/api/v1/jobs/j6/priority", json={"lane": "urgent"})
+    assert resp.json() == {"job_id": "j6", "lane": "urgent", "waiting_in": []}  # not admitted yet
+    worker = FairQueue(api.r, "queue:jobs", "w")
+    assert worker.claim(0).data["job_id"] == "j6"
@@ -0,0 +1 @@
+# retention-worker package
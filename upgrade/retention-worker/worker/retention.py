@@ -0,0 +1,196 @@
+"""
+Frames retention: delete the frames of jobs past frames_expires_at
+- Expired jobs are paged on the frames_expires_at index (keyset: expires_at,
+  id), RETENTION_BATCH rows per query, up to a cutoff fixed when the sweep
+  starts, so a sweep always ends
+- Each batch's frames/ dirs are deleted on a thread pool: an os.scandir walk
+  that unlinks entries as it lists them (one getdents + one unlink per file,
+  no stat); a packed store (frames.pack + frames.idx) is just two unlinks
+- Unlinks go through a shared token bucket (RETENTION_MAX_OPS_PER_SEC) so a
+  sweep can't saturate the disk under live jobs
+- Then one transaction per batch: lock the rows still not deleted, set
+  frames_deleted_at, frames_bytes = 0, total_bytes minus the frames, and
+  take the freed bytes off each owner's user_media_quota usage
+- Resumable: files go first, the DB second. A sweep that dies in between
+  finds the same rows next time, deleting nothing twice and charging back
+  only rows it is the first to mark. A job whose delete fails is skipped
+  (left unmarked) and comes back on the next sweep
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+FIRST = (datetime(1970, 1, 1), "")  # keyset cursor before any row
+
+
+# ─── Rate limit ───
+
+class RateLimiter:
+    """Token bucket shared by threads: acquire() blocks until an op may run.
+    rate <= 0 disables it."""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate / 10)
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: float = 1.0):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)  # debt is paid by the time the next caller tops up
+
+
+# ─── Files ───
+
+def remove_tree(path: str, limiter: RateLimiter = None) -> int:
+    """Delete path and everything under it without following symlinks.
+    Returns the number of files unlinked; a missing path is 0."""
+    files = 0
+    try:
+        it = os.scandir(path)
+    except FileNotFoundError:
+        return 0
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                files += remove_tree(entry.path, limiter)
+                continue
+            if limiter:
+                limiter.acquire()
+            try:
+                os.unlink(entry.path)
+                files += 1
+            except FileNotFoundError:
+                pass
+    try:
+        os.rmdir(path)
+    except FileNotFoundError:
+        pass
+    return files
+
+
+# ─── DB ───
+
+class JobStore:
+    """analysis_job / user_media_quota side of the sweep (common.db.Database)."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def expired(self, cutoff: datetime, after: tuple, limit: int) -> list:
+        """[(job_id, frames_expires_at)] of undeleted jobs expired by cutoff,
+        in index order after the (expires_at, id) cursor."""
+        t, job_id = after
+        return self.db.fetchall(
+            "SELECT id, frames_expires_at FROM analysis_job "
+            "WHERE frames_expires_at <= %s AND frames_deleted_at IS NULL "
+            "AND (frames_expires_at > %s OR (frames_expires_at = %s AND id > %s)) "
+            "ORDER BY frames_expires_at, id LIMIT %s",
+            (cutoff, t, t, job_id, limit),
+        )
+
+    def mark_deleted(self, job_ids: list) -> dict:
+        """Record the frames of job_ids as deleted and give their bytes back
+        to the owners' quota, in one transaction. Rows another sweep already
+        marked are left alone. Returns {user_id: bytes freed}."""
+        if not job_ids:
+            return {}
+
+        def fn(cur):
+            marks = ", ".join(["%s"] * len(job_ids))
+            cur.execute(
+                f"SELECT id, user_id, frames_bytes FROM analysis_job "
+                f"WHERE id IN ({marks}) AND frames_deleted_at IS NULL FOR UPDATE",
+                list(job_ids),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                return {}
+            freed = {}
+            for _, user_id, nbytes in rows:
+                freed[user_id] = freed.get(user_id, 0) + int(nbytes or 0)
+            marks = ", ".join(["%s"] * len(rows))
+            # total_bytes first: MariaDB assigns left to right
+            cur.execute(
+                f"UPDATE analysis_job SET total_bytes = GREATEST(0, total_bytes - frames_bytes), "
+                f"frames_bytes = 0, frames_deleted_at = NOW(3), updated_at = NOW() WHERE id IN ({marks})",
+                [row[0] for row in rows],
+            )
+            cur.executemany(
+                "UPDATE user_media_quota SET usage_bytes = GREATEST(0, CAST(usage_bytes AS SIGNED) - %s), "
+                "updated_at = NOW() WHERE user_id = %s",
+                [(n, uid) for uid, n in freed.items() if n],
+            )
+            return freed
+
+        return self.db.transaction(fn)
+
+
+# ─── Sweep ───
+
+class Sweeper:
+    """One pass over the expired jobs. on_batch(freed) runs after each
+    committed batch ({user_id: bytes}, e.g. to refresh the quota cache)."""
+
+    def __init__(self, store: JobStore, data_root: str, threads: int = 4, batch: int = 500,
+                 limiter: RateLimiter = None, on_batch=None):
+        self.store = store
+        self.data_root = data_root
+        self.threads = max(1, threads)
+        self.batch = batch
+        self.limiter = limiter
+        self.on_batch = on_batch
+
+    def delete_frames(self, job_id: str) -> int | None:
+        """Files removed from the job's frames/, or None if it failed."""
+        if not job_id or os.path.basename(job_id) != job_id or job_id in (".", ".."):
+            print(f"[RETENTION] {job_id!r}: not a job id, skipped")
+            return None
+        try:
+            return remove_tree(os.path.join(self.data_root, job_id, "frames"), self.limiter)
+        except OSError as e:
+            print(f"[RETENTION] {job_id}: delete failed, left for the next sweep ({e})")
+            return None
+
+    def run(self, cutoff: datetime = None) -> dict:
+        """Sweep everything expired by cutoff (default now). Returns stats."""
+        cutoff = cutoff or datetime.now()
+        stats = {"jobs": 0, "files": 0, "failed": 0, "bytes": 0, "batches": 0}
+        t0 = time.monotonic()
+        after = FIRST
+        with ThreadPoolExecutor(self.threads) as pool:
+            while True:
+                rows = self.store.expired(cutoff, after, self.batch)
+                if not rows:
+                    break
+                after = (rows[-1][1], rows[-1][0])
+                ids = [row[0] for row in rows]
+                done = []
+                for job_id, files in zip(ids, pool.map(self.delete_frames, ids)):
+                    if files is None:
+                        stats["failed"] += 1
+                    else:
+                        done.append(job_id)
+                        stats["files"] += files
+                freed = self.store.mark_deleted(done)
+                stats["jobs"] += len(done)
+                stats["bytes"] += sum(freed.values())
+                stats["batches"] += 1
+                if self.on_batch and freed:
+                    self.on_batch(freed)
+                if len(rows) < self.batch:
+                    break
+        stats["seconds"] = round(time.monotonic() - t0, 3)
+        return stats
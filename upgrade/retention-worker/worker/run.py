@@ -0,0 +1,126 @@
+"""
+retention-worker: deletes frames past frames_expires_at (daily)
+- Sweeps once every RETENTION_INTERVAL_SEC; the time of the last complete
+  sweep is kept in Redis (retention:last_sweep), so a restart neither sweeps
+  again early nor skips a sweep that died half-way
+- A Redis lock keeps it to one sweep at a time across replicas
+- The sweep itself (batched query, parallel scandir deletes, rate-limited
+  unlinks, batched DB + quota updates) is worker/retention.py
+- Freed bytes are reloaded into the quota ledger's Redis cache per batch
+- Runs at RETENTION_NICE CPU priority; artifacts, cover and thumb are kept
+- Each sweep also drops artifact cache entries past their expiry (cached
+  frames expire with the job that stored them, common/cas.py)
+- Sweep time, jobs and bytes freed and DB latency are exported on
+  METRICS_PORT (common/metrics.py)
+
+    python -m worker.run           # daemon
+    python -m worker.run --once    # one sweep now (cron)
+"""
+
+import argparse
+import os
+import time
+import uuid
+
+import redis
+
+from common import cas, metrics
+from common.db import Database
+from common.quota import QuotaLedger
+from worker import retention
+
+# ─── Config ───
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+DATA_ROOT = os.getenv("DATA_ROOT", "/data/jobs")
+QUOTA_BYTES = int(os.getenv("QUOTA_BYTES_PER_USER", "1073741824"))
+RETENTION_INTERVAL_SEC = float(os.getenv("RETENTION_INTERVAL_SEC", "86400"))
+RETENTION_POLL_SEC = float(os.getenv("RETENTION_POLL_SEC", "600"))  # how often to check if a sweep is due
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "500"))  # jobs per query / transaction
+RETENTION_THREADS = int(os.getenv("RETENTION_THREADS", "4"))  # parallel directory deletes
+RETENTION_MAX_OPS_PER_SEC = float(os.getenv("RETENTION_MAX_OPS_PER_SEC", "2000"))  # unlinks/s, 0 = unlimited
+RETENTION_NICE = int(os.getenv("RETENTION_NICE", "10"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9103"))  # 0 = no exporter
+
+LAST_SWEEP_KEY = "retention:last_sweep"
+LOCK_KEY = "retention:lock"
+LOCK_TTL_SEC = 3600  # renewed after each batch
+
+_UNLOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+r = redis.from_url(REDIS_URL)
+db = Database.from_env()
+ledger = QuotaLedger(r, QUOTA_BYTES, connect=db.connect)
+unlock = r.register_script(_UNLOCK)
+cache = cas.ArtifactCache.from_env(r)
+
+
+def sweep() -> dict | None:
+    """One sweep under the lock; None if another replica holds it."""
+    token = uuid.uuid4().hex
+    if not r.set(LOCK_KEY, token, nx=True, ex=LOCK_TTL_SEC):
+        print("[RETENTION] another sweep is running")
+        return None
+
+    def on_batch(freed: dict):
+        users = sorted(freed)
+        ledger.load(users)  # DB usage went down; refresh the cached value
+        r.expire(LOCK_KEY, LOCK_TTL_SEC)
+        metrics.BYTES.inc(sum(freed.values()), kind="frames_freed")
+        print(f"  [BATCH] {sum(freed.values()) / 1024 / 1024:.1f} MB freed for {len(users)} user(s)")
+
+    try:
+        sweeper = retention.Sweeper(
+            retention.JobStore(db), DATA_ROOT,
+            threads=RETENTION_THREADS,
+            batch=RETENTION_BATCH,
+            limiter=retention.RateLimiter(RETENTION_MAX_OPS_PER_SEC),
+            on_batch=on_batch,
+        )
+        with metrics.timer(stage="retention_sweep"):
+            stats = sweeper.run()
+            stats["cache_bytes"] = cache.expire()
+        r.set(LAST_SWEEP_KEY, time.time())
+    finally:
+        unlock(keys=[LOCK_KEY], args=[token])
+    metrics.JOBS.inc(stats["jobs"], service="retention", outcome="done")
+    metrics.JOBS.inc(stats["failed"], service="retention", outcome="failed")
+    rate = stats["jobs"] / stats["seconds"] if stats["seconds"] else 0.0
+    print(f"[RETENTION] {stats['jobs']} jobs ({stats['files']} files, "
+          f"{stats['bytes'] / 1024 / 1024:.1f} MB) in {stats['seconds']:.1f}s, {rate:.0f} jobs/s; "
+          f"{stats['failed']} failed; {stats['cache_bytes'] / 1024 / 1024:.1f} MB of expired cache entries")
+    return stats
+
+
+def due() -> bool:
+    last = float(r.get(LAST_SWEEP_KEY) or 0)
+    return time.time() - last >= RETENTION_INTERVAL_SEC
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--once", action="store_true", help="sweep now and exit")
+    args = ap.parse_args()
+
+    if RETENTION_NICE:
+        os.nice(RETENTION_NICE)
+    if args.once:
+        sweep()
+        return
+
+    metrics.serve(METRICS_PORT)
+    print(f"[START] retention-worker ready — every {RETENTION_INTERVAL_SEC / 3600:g}h — "
+          f"batch={RETENTION_BATCH} threads={RETENTION_THREADS} max_ops={RETENTION_MAX_OPS_PER_SEC:g}/s")
+    while True:
+        try:
+            if due():
+                sweep()
+        except Exception as e:
+            print(f"[RETENTION] sweep failed, retrying in {RETENTION_POLL_SEC:g}s: {e}")
+        time.sleep(RETENTION_POLL_SEC)
+
+
+if __name__ == "__main__":
+    main()
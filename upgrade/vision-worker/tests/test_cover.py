@@ -0,0 +1,61 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from worker import cover
+
+
+def jpeg(arr: np.ndarray, quality: int = 90) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def board(seed: int, teacher_x: int = 900, blur: bool = False, gain: float = 1.0) -> np.ndarray:
+    """720p grey frame with handwriting on a board and a 'teacher' block."""
+    rng = np.random.default_rng(seed)
+    img = np.full((720, 1280, 3), 120.0)
+    img[100:400, 200:900] = 230
+    strokes = rng.random((300, 700)) > 0.93
+    img[100:400, 200:900][strokes] = 30
+    img[300:650, teacher_x:teacher_x + 150] = (150, 60, 50)
+    if blur:  # out of focus: 16x box downsample and back up
+        img = img.reshape(45, 16, 80, 16, 3).mean(axis=(1, 3)).repeat(16, axis=0).repeat(16, axis=1)
+    return img * gain
+
+
+def test_small_gray_is_draft_decoded():
+    g = cover.small_gray(jpeg(board(0)))
+    assert g.shape == (90, 160) and g.dtype == np.uint8
+
+
+def test_pick_prefers_sharp_well_exposed_frame_with_activity():
+    frames = [
+        board(0),                    # empty room
+        board(0, blur=True),         # out of focus
+        board(0),
+        board(0, teacher_x=500),     # teacher walks to the board
+        board(0, teacher_x=650),
+        board(0),
+        board(0, gain=0.15),         # lights off
+        board(0),
+    ]
+    assert cover.pick((i, jpeg(f)) for i, f in enumerate(frames)) in (3, 4)
+    m = cover.metrics(np.stack([cover.small_gray(jpeg(f)) for f in frames]))
+    assert m["sharpness"][1] < m["sharpness"][0] and m["exposure"][6] < m["exposure"][0]
+    assert cover.pick([]) is None
+    assert cover.pick([("only", jpeg(board(0)))]) == "only"
+
+
+def test_cover_is_copied_not_reencoded(tmp_path):
+    src = jpeg(board(0))
+    assert cover.write_cover_and_thumb(src, str(tmp_path)) is False
+    assert (tmp_path / "cover.jpg").read_bytes() == src
+    with Image.open(tmp_path / "thumb.jpg") as t:
+        assert t.size == (320, 180)
+
+    wide = jpeg(np.tile(board(0), (2, 2, 1)))  # 2560x1440
+    assert cover.write_cover_and_thumb(wide, str(tmp_path)) is True
+    with Image.open(tmp_path / "cover.jpg") as c:
+        assert c.size == (cover.COVER_MAX_WIDTH, 1080)
@@ -0,0 +1,67 @@
+import io
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from worker import dedup, frames
+
+
+def jpeg(arr: np.ndarray, quality: int = 85) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(arr.astype(np.uint8)).save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def classroom(seed: int, board: int = 200) -> np.ndarray:
+    """720p frame: gradient wall, a whiteboard and a 'teacher' block."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:720, 0:1280]
+    img = np.stack([60 + x / 10, 70 + y / 12, 90 + (x + y) / 30], axis=-1)
+    img[100:400, 200:900] = board
+    img[300:650, 950:1100] = (120, 40, 40)
+    return np.clip(img + rng.normal(0, 3, img.shape), 0, 255)
+
+
+@pytest.mark.parametrize("method", ["dhash", "phash"])
+def test_hash_ignores_noise_and_recompression_but_not_scene_change(method):
+    h = dedup.HASHES[method]
+    base = h(jpeg(classroom(0)))
+    assert dedup.hamming(base, h(jpeg(classroom(1), quality=60))) <= 4
+    moved = classroom(2)
+    moved[:, :640] = moved[:, :640][:, ::-1]  # camera / slide change
+    assert dedup.hamming(base, h(jpeg(moved))) > 10
+
+
+def test_deduper_compares_with_last_kept_frame():
+    d = dedup.Deduper("dhash", max_distance=4)
+    a, b = jpeg(classroom(0)), jpeg(classroom(1))
+    other = classroom(3)
+    other[:, :640] = other[:, :640][:, ::-1]
+    c = jpeg(other)
+    assert [d.alias_of(j, n) for j, n in ((a, "1"), (b, "2"), (c, "3"), (a, "4"))] == [None, "1", None, None]
+    assert (d.aliased, d.saved_bytes) == (1, len(b))
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")
+def test_static_video_keeps_one_frame_per_scene(tmp_path):
+    video = str(tmp_path / "static.mp4")
+    subprocess.check_call([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", "smptebars=size=320x240:rate=10:duration=30",
+        "-f", "lavfi", "-i", "rgbtestsrc=size=320x240:rate=10:duration=30",
+        "-filter_complex", "[0:v][1:v]concat=n=2:v=1[v]", "-map", "[v]",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", video,
+    ])
+    out = tmp_path / "frames"
+    out.mkdir()
+    d = dedup.Deduper("dhash", 4)
+    index, total = frames.extract(video, frames.FileStore(str(out)), 5, 3, dedup=d)
+
+    assert [e["timestamp_sec"] for e in index] == list(range(0, 60, 5))
+    kept = [e["frame"] for e in index if not e.get("alias")]
+    assert kept == sorted(os.listdir(out)) == ["000001.jpg", "000007.jpg"]
+    assert all(e["frame"] == ("000001.jpg" if e["timestamp_sec"] < 30 else "000007.jpg") for e in index)
+    assert d.aliased == 10 and d.saved_bytes > total
@@ -0,0 +1,114 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from worker import cover, frames
+
+needs_ffmpeg = pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "lesson.mp4")
+    subprocess.check_call([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=10:duration=42",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", path,
+    ])
+    return path
+
+
+def test_split_jpegs_any_block_boundaries():
+    # fake JPEGs: APP0 with FF D9 inside its payload, stuffed FF 00 in the scan data
+    def jpeg(n):
+        app0 = b"\xff\xe0\x00\x06\xff\xd9\x00" + bytes([n])
+        sos = b"\xff\xda\x00\x03\x01"
+        return frames.SOI + app0 + sos + b"\x12\xff\x00\x34" * n + b"\xff\xd0\x56" + frames.EOI
+
+    stream = b"".join(jpeg(n) for n in range(1, 6))
+    for size in (1, 2, 3, 7, 64, len(stream)):
+        blocks = [stream[i:i + size] for i in range(0, len(stream), size)]
+        assert list(frames.split_jpegs(blocks)) == [jpeg(n) for n in range(1, 6)]
+
+    with pytest.raises(ValueError):
+        list(frames.split_jpegs([stream[:-1]]))
+
+
+@needs_ffmpeg
+def test_streamed_frames_match_ffmpeg_image2_output(tmp_path, video):
+    ref = tmp_path / "ref"
+    ref.mkdir()
+    subprocess.check_call(["ffmpeg", "-v", "error", "-i", video, "-vf", "fps=1/5", "-q:v", "3",
+                           str(ref / "%06d.jpg")])
+    out = tmp_path / "frames"
+    out.mkdir()
+    seen = []
+    index, total = frames.extract(video, frames.FileStore(str(out)), 5, 3,
+                                  on_frame=lambda n, t: seen.append((n, t)))
+
+    names = sorted(os.listdir(ref))
+    assert [e["frame"] for e in index] == names == sorted(os.listdir(out))
+    for name in names:
+        assert (out / name).read_bytes() == (ref / name).read_bytes()
+    assert total == sum(os.path.getsize(ref / n) for n in names)
+    assert [e["timestamp_sec"] for e in index] == [5 * i for i in range(len(names))]
+    assert index[-1]["timestamp_str"] == f"00:{5 * (len(names) - 1):02d}"
+    assert seen[-1] == (len(names), 5 * (len(names) - 1))
+    assert cover.pick((e["frame"], (out / e["frame"]).read_bytes()) for e in index) in names
+
+
+@needs_ffmpeg
+def test_quota_stops_ffmpeg_mid_video(tmp_path, video):
+    asked = []
+
+    def admit(total):
+        asked.append(total)
+        return len(asked) <= 3
+
+    with pytest.raises(OverflowError):
+        frames.extract(video, frames.FileStore(str(tmp_path)), 5, 3, admit=admit)
+    assert sorted(os.listdir(tmp_path)) == [frames.frame_name(i) for i in range(3)]
+    assert len(asked) == 4  # stopped at the first frame that didn't fit
+    assert asked[-1] > sum(os.path.getsize(tmp_path / n) for n in os.listdir(tmp_path))
+
+
+def test_plan_segments_covers_grid_once():
+    assert frames.plan_segments(42, 5, 4) == [(0, 2), (2, 2), (4, 3), (7, None)]
+    assert frames.plan_segments(42, 5, 1) == [(0, None)]
+    assert frames.plan_segments(7, 5, 8) == [(0, 1), (1, None)]  # never more ranges than frames
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize("jobs", [2, 3, 4])
+def test_parallel_extraction_matches_single_pass(tmp_path, video, jobs):
+    seq, par = tmp_path / "seq", tmp_path / "par"
+    index, total = frames.extract(video, frames.FileStore(str(seq)), 5, 3)
+    index2, total2 = frames.extract(video, frames.FileStore(str(par)), 5, 3, jobs=jobs, duration=42.0)
+
+    assert (index2, total2) == (index, total)
+    assert sorted(os.listdir(par)) == sorted(os.listdir(seq))  # spool dir removed
+    for name in os.listdir(seq):
+        assert (par / name).read_bytes() == (seq / name).read_bytes()
+
+
+@needs_ffmpeg
+def test_parallel_extraction_falls_back_when_duration_is_wrong(tmp_path, video):
+    index, _ = frames.extract(video, frames.FileStore(str(tmp_path / "seq")), 5, 3)
+    index2, _ = frames.extract(video, frames.FileStore(str(tmp_path / "par")), 5, 3, jobs=3, duration=90.0)
+    assert index2 == index
+
+
+@needs_ffmpeg
+def test_spooled_jpegs_replace_the_decode(tmp_path, video):
+    spool = tmp_path / "frames.mjpeg"
+    spool.write_bytes(subprocess.check_output([
+        "ffmpeg", "-v", "error", "-i", video, "-an", "-vf", "fps=1/5", "-q:v", "3",
+        "-f", "image2pipe", "-c:v", "mjpeg", "pipe:1",
+    ]))
+    index, total = frames.extract(video, frames.FileStore(str(tmp_path / "seq")), 5, 3)
+    spooled = frames.extract("/nonexistent.mp4", frames.FileStore(str(tmp_path / "spool")), 5, 3,
+                             jobs=3, duration=42.0, jpegs=frames.iter_spooled([str(spool)]))
+    assert spooled == (index, total)
+    assert frames.extract("/nonexistent.mp4", frames.FileStore(str(tmp_path / "list")), 5, 3,
+                          jpegs=[]) == ([], 0)
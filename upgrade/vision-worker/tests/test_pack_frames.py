@@ -0,0 +1,57 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from common import framepack
+from worker import dedup, frames, pack_frames
+
+pytestmark = pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    """20 s of moving test pattern, then 20 s of a still image."""
+    path = str(tmp_path_factory.mktemp("video") / "lesson.mp4")
+    subprocess.check_call([
+        "ffmpeg", "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=320x240:rate=10:duration=20",
+        "-f", "lavfi", "-i", "smptebars=size=320x240:rate=10:duration=20",
+        "-filter_complex", "[0:v][1:v]concat=n=2:v=1[v]", "-map", "[v]",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", path,
+    ])
+    return path
+
+
+def test_packed_extraction_matches_loose_files(tmp_path, video):
+    loose, packed = str(tmp_path / "loose"), str(tmp_path / "packed")
+    index, _ = frames.extract(video, frames.FileStore(loose), 5, 3, dedup=dedup.Deduper())
+    with framepack.PackWriter(packed) as w:
+        index2, total = frames.extract(video, w, 5, 3, dedup=dedup.Deduper())
+
+    assert index2 == index and any(e.get("alias") for e in index)
+    assert sorted(os.listdir(packed)) == [framepack.INDEX_FILE, framepack.PACK_FILE]
+    assert total == w.bytes
+    with framepack.FramePack(packed) as pack:
+        assert len(pack) == len(index)
+        for n, e in enumerate(index):
+            with open(os.path.join(loose, e["frame"]), "rb") as f:
+                assert bytes(pack.frame(n)) == f.read()
+        assert pack.nearest(e["timestamp_sec"] + 1) == len(index) - 1
+
+
+def test_converter_packs_existing_job_in_place(tmp_path, video):
+    job = tmp_path / "job1"
+    (job / "artifacts").mkdir(parents=True)
+    index, total = frames.extract(video, frames.FileStore(str(job / "frames")), 5, 3, dedup=dedup.Deduper())
+    (job / "artifacts" / "frames_index.json").write_text(json.dumps(index, indent=2))
+
+    before, after = pack_frames.pack_job(str(job))
+    assert before == total and after == before + framepack.HEADER_BYTES + 16 * len(index)
+    assert sorted(os.listdir(job / "frames")) == [framepack.INDEX_FILE, framepack.PACK_FILE]
+    with framepack.FramePack(str(job / "frames")) as pack:
+        assert list(pack.timestamps) == [e["timestamp_sec"] for e in index]
+        kept = {e["frame"] for e in index if not e.get("alias")}
+        assert len({int(r["offset"]) for r in pack.records}) == len(kept)
+    assert pack_frames.pack_job(str(job)) is None  # already packed
@@ -0,0 +1,136 @@
+"""
+Cover selection: the most "active" frame of the lesson instead of the middle one
+- Each candidate (kept, non-alias frame) is decoded with Image.draft() at
+  1/8 scale in grayscale: libjpeg skips the full IDCT and colour conversion,
+  ~1 ms per 720p frame. Decodes run on a thread pool (Pillow drops the GIL)
+- Metrics are computed on the whole stack at once with NumPy:
+  sharpness = variance of the 4-neighbour Laplacian, exposure = distance of
+  the mean from mid-grey minus the clipped fraction, motion = mean absolute
+  difference with the previous and next candidates, the smaller of the two
+  (a scene cut or a lights-off frame moves one neighbour only; the first
+  and last frames count as still)
+- Sharpness and motion are scaled by their 90th percentile so one outlier
+  doesn't flatten the rest; their weighted sum times exposure is the score
+  (a dark or blown-out frame never wins) and the top score is the cover
+- cover.jpg is the frame's own JPEG when it is no wider than COVER_MAX_WIDTH
+  (no re-encode); thumb.jpg comes from a draft decode at thumbnail size
+"""
+
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from common import cas
+
+DRAFT_SCALE = 8
+COVER_MAX_WIDTH = int(os.getenv("COVER_MAX_WIDTH", "1920"))
+THUMB_WIDTH = 320
+WEIGHTS = {"sharpness": 0.6, "motion": 0.4}
+CLIP_LOW, CLIP_HIGH = 16, 239
+
+
+def small_gray(jpeg: bytes) -> np.ndarray:
+    """uint8 grayscale of the JPEG at 1/DRAFT_SCALE size, decoded in the DCT."""
+    img = Image.open(io.BytesIO(jpeg))
+    w, h = img.size
+    img.draft("L", (max(1, w // DRAFT_SCALE), max(1, h // DRAFT_SCALE)))
+    return np.asarray(img.convert("L"))
+
+
+def _scaled(x: np.ndarray) -> np.ndarray:
+    """x / its 90th percentile, clipped to 0..1."""
+    top = float(np.percentile(x, 90)) if len(x) else 0.0
+    return np.clip(x / top, 0, 1) if top > 0 else np.zeros(len(x))
+
+
+def metrics(stack: np.ndarray) -> dict:
+    """Per-frame sharpness, exposure and motion of an (n, h, w) uint8 stack.
+
+    Integer arithmetic throughout (int16 fits a Laplacian of uint8): about
+    twice as fast as float32 on a 700-frame stack.
+    """
+    n = len(stack)
+    px = stack[0].size
+    g = stack.astype(np.int16)
+    lap = g[:, 1:-1, 1:-1] * 4
+    lap -= g[:, :-2, 1:-1]
+    lap -= g[:, 2:, 1:-1]
+    lap -= g[:, 1:-1, :-2]
+    lap -= g[:, 1:-1, 2:]
+    lap = lap.reshape(n, -1)
+    m = lap.shape[1]
+    sharpness = (np.einsum("ij,ij->i", lap, lap, dtype=np.int64) / m
+                 - (lap.sum(axis=1, dtype=np.int64) / m) ** 2)
+
+    flat = stack.reshape(n, -1)
+    mean = flat.sum(axis=1, dtype=np.int64) / px
+    clipped = np.count_nonzero((flat < CLIP_LOW) | (flat > CLIP_HIGH), axis=1) / px
+    exposure = np.clip(1 - np.abs(mean - 128) / 128 - clipped, 0, 1)
+
+    motion = np.zeros(n)
+    if n > 2:
+        step = np.abs(g[1:] - g[:-1]).reshape(n - 1, -1).sum(axis=1, dtype=np.int64) / px
+        motion[1:-1] = np.minimum(step[:-1], step[1:])
+    return {"sharpness": sharpness, "exposure": exposure, "motion": motion}
+
+
+def scores(stack: np.ndarray) -> np.ndarray:
+    m = metrics(stack)
+    return m["exposure"] * (WEIGHTS["sharpness"] * _scaled(m["sharpness"])
+                            + WEIGHTS["motion"] * _scaled(m["motion"]))
+
+
+def pick(candidates, threads: int = 0):
+    """Key of the best frame among candidates, an iterable of (key, jpeg)
+    in time order; None if empty. Frames whose thumbnail size differs from
+    the first are skipped (a mid-stream resolution change)."""
+    keys, jpegs = [], []
+    for key, jpeg in candidates:
+        keys.append(key)
+        jpegs.append(jpeg)
+    if not keys:
+        return None
+    threads = threads or os.cpu_count() or 1
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as pool:
+            grays = list(pool.map(small_gray, jpegs))
+    else:
+        grays = list(map(small_gray, jpegs))
+    shape = grays[0].shape
+    if min(shape) < 3:  # nothing to measure on
+        return keys[len(keys) // 2]
+    keep = [i for i, g in enumerate(grays) if g.shape == shape]
+    best = int(np.argmax(scores(np.stack([grays[i] for i in keep]))))
+    return keys[keep[best]]
+
+
+def write_cover_and_thumb(jpeg: bytes, art_dir: str) -> bool:
+    """cover.jpg + thumb.jpg from the frame's JPEG bytes. Returns True if
+    the cover had to be re-encoded (wider than COVER_MAX_WIDTH)."""
+    os.makedirs(art_dir, exist_ok=True)
+    img = Image.open(io.BytesIO(jpeg))
+    w, h = img.size
+
+    # written aside: the old cover may be a cache hardlink
+    resized = w > COVER_MAX_WIDTH
+    with cas.replacing(os.path.join(art_dir, "cover.jpg")) as tmp:
+        if resized:
+            size = (COVER_MAX_WIDTH, round(h * COVER_MAX_WIDTH / w))
+            img.draft("RGB", size)
+            img.convert("RGB").resize(size, Image.LANCZOS).save(tmp, format="JPEG", quality=85)
+        else:
+            with open(tmp, "wb") as f:
+                f.write(jpeg)
+
+    size = (THUMB_WIDTH, max(1, int(h * THUMB_WIDTH / w)))
+    thumb = Image.open(io.BytesIO(jpeg))
+    thumb.draft("RGB", size)  # libjpeg scales down to >= size; LANCZOS does the rest
+    thumb = thumb.convert("RGB")
+    if thumb.size != size:
+        thumb = thumb.resize(size, Image.LANCZOS)
+    with cas.replacing(os.path.join(art_dir, "thumb.jpg")) as tmp:
+        thumb.save(tmp, format="JPEG", quality=75)
+    return resized
@@ -0,0 +1,83 @@
+"""
+Perceptual-hash near-duplicate frames (fixed classroom camera)
+- JPEGs are decoded straight to a small grayscale image: Image.draft() lets
+  libjpeg scale by 1/2..1/8 in the DCT, so a 1080p frame never decodes at
+  full size
+- dhash: sign of horizontal gradients on a 9x8 thumbnail; phash: sign
+  against the median of the 8x8 lowest DCT coefficients of a 32x32
+  thumbnail. Both are 64-bit ints, computed with NumPy
+- Deduper compares each frame with the last kept one; within max_distance
+  bits it is an alias of that frame and is not written
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+_BIT_WEIGHTS = 1 << np.arange(HASH_BITS - 1, -1, -1, dtype=np.uint64)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def gray(jpeg: bytes, size: tuple) -> np.ndarray:
+    """float32 grayscale of the JPEG resized to size (w, h); the decode
+    itself is scaled down as far as libjpeg allows above size."""
+    img = Image.open(io.BytesIO(jpeg))
+    img.draft("L", (size[0] * 2, size[1] * 2))
+    return np.asarray(img.convert("L").resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def _pack(bits: np.ndarray) -> int:
+    return int(bits.reshape(-1).astype(np.uint64) @ _BIT_WEIGHTS)
+
+
+def dhash(jpeg: bytes) -> int:
+    g = gray(jpeg, (9, 8))
+    return _pack(g[:, 1:] > g[:, :-1])
+
+
+def phash(jpeg: bytes) -> int:
+    g = gray(jpeg, (32, 32))
+    low = (_DCT32 @ g @ _DCT32.T)[:8, :8]
+    return _pack(low > np.median(low))
+
+
+HASHES = {"dhash": dhash, "phash": phash}
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class Deduper:
+    """Aliases a frame to the last kept one when their hashes are within
+    max_distance bits. Tracks what the dropped frames would have cost."""
+
+    def __init__(self, method: str = "dhash", max_distance: int = 4):
+        self.hash = HASHES[method]
+        self.max_distance = max_distance
+        self.kept = None       # (hash, key) of the last kept frame
+        self.aliased = 0
+        self.saved_bytes = 0
+
+    def alias_of(self, jpeg: bytes, key):
+        """Key (frame number or name) of the frame this one duplicates, or
+        None if it should be kept; it then becomes the reference for the
+        next frames under key."""
+        h = self.hash(jpeg)
+        if self.kept and hamming(h, self.kept[0]) <= self.max_distance:
+            self.aliased += 1
+            self.saved_bytes += len(jpeg)
+            return self.kept[1]
+        self.kept = (h, key)
+        return None
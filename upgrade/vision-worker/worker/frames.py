@@ -0,0 +1,273 @@
+"""
+Streaming frame extraction for the vision-worker
+- ffmpeg samples one frame every INTERVAL seconds and encodes it as MJPEG
+  onto a pipe (image2pipe); split_jpegs() cuts the byte stream into whole
+  JPEG files on their markers
+- extract() hands each frame to a store as it arrives (FileStore: one
+  %06d.jpg each; common/framepack.PackWriter: one pack file), keeping a
+  running byte count;
+  admit(total_bytes) is asked before every write, so a quota check can stop
+  ffmpeg mid-video instead of after the fact
+- The frames index comes out of the same pass: nothing globs or sorts the
+  frames directory afterwards (the cover is picked from it, worker/cover.py)
+- jobs > 1 splits the sampling grid into that many time ranges, each decoded
+  by its own seek-based ffmpeg (-ss start, -frames:v count) at the same time;
+  their outputs are spooled and merged in order into one sequence. Ranges
+  start on grid points, so every timestamp is produced exactly once
+- With a Deduper (worker/dedup.py) near-identical frames are not written;
+  their index entries point at the kept frame ("alias": true), so the
+  timestamps stay continuous
+"""
+
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+
+PIPE_BLOCK = 1 << 20  # bytes per read from ffmpeg
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+SOS = 0xDA
+# markers without a length field (TEM, RST0-7)
+STANDALONE = {0x01, *range(0xD0, 0xD8)}
+
+
+def _frames_cmd(video_path: str, interval: int, qscale: int) -> list:
+    return [
+        "ffmpeg", "-nostdin", "-v", "error", "-i", video_path,
+        "-vf", f"fps=1/{interval}", "-q:v", str(qscale),
+        "-f", "image2pipe", "-c:v", "mjpeg", "pipe:1",
+    ]
+
+
+def _segment_cmd(video_path: str, interval: int, qscale: int, start_sec: float, count: int | None) -> list:
+    cmd = ["ffmpeg", "-nostdin", "-v", "error", "-threads", "1", "-ss", str(start_sec), "-i", video_path,
+           "-vf", f"fps=1/{interval}", "-q:v", str(qscale)]
+    if count is not None:
+        cmd += ["-frames:v", str(count)]
+    return cmd + ["-f", "image2pipe", "-c:v", "mjpeg", "pipe:1"]
+
+
+def _scan_start(buf: bytearray) -> int:
+    """Offset of the entropy-coded data after the first SOS header, or -1
+    while the headers are still incomplete."""
+    if len(buf) < 2:
+        return -1
+    if buf[:2] != SOI:
+        raise ValueError("image2pipe stream out of sync: no JPEG SOI marker")
+    i = 2
+    while i + 4 <= len(buf):
+        if buf[i] != 0xFF:
+            raise ValueError(f"bad JPEG marker at byte {i}")
+        marker = buf[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in STANDALONE:
+            i += 2
+            continue
+        end = i + 2 + int.from_bytes(buf[i + 2:i + 4], "big")
+        if marker == SOS:
+            return end if end <= len(buf) else -1
+        i = end
+    return -1
+
+
+def split_jpegs(blocks):
+    """Yield whole JPEG files from an iterable of byte blocks.
+
+    0xFF in entropy-coded data is always followed by 0x00 or an RST marker,
+    so the first FFD9 after the SOS header is the end of the image.
+    """
+    buf = bytearray()
+    scan = search = -1
+    for block in blocks:
+        buf += block
+        while buf:
+            if scan < 0:
+                scan = _scan_start(buf)
+                if scan < 0:
+                    break
+                search = scan
+            end = buf.find(EOI, search)
+            if end < 0:
+                search = max(scan, len(buf) - 1)  # FF may end this block, D9 start the next
+                break
+            end += 2
+            yield bytes(buf[:end])
+            del buf[:end]
+            scan = search = -1
+    if buf:
+        raise ValueError(f"image2pipe stream ended inside a JPEG ({len(buf)} bytes)")
+
+
+def iter_jpegs(video_path: str, interval: int, qscale: int, block_bytes: int = PIPE_BLOCK):
+    """Yield JPEG bytes of one frame every interval seconds, as ffmpeg
+    produces them. Raises CalledProcessError if ffmpeg fails. Closing the
+    generator early kills ffmpeg."""
+    proc = subprocess.Popen(_frames_cmd(video_path, interval, qscale),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        yield from split_jpegs(iter(lambda: proc.stdout.read1(block_bytes), b""))
+        err = proc.stderr.read()
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, "ffmpeg", stderr=err)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+
+def plan_segments(duration: float, interval: int, jobs: int) -> list:
+    """[(first_frame, count)] covering the sampling grid 0, interval, ...
+    below duration in `jobs` ranges. The last range has count None: it runs
+    to the end of the stream like a single ffmpeg would."""
+    grid = max(1, math.ceil(duration / interval))
+    jobs = max(1, min(jobs, grid))
+    bounds = [round(k * grid / jobs) for k in range(jobs + 1)]
+    return [(bounds[k], bounds[k + 1] - bounds[k] if k < jobs - 1 else None) for k in range(jobs)]
+
+
+def _iter_file(path: str):
+    with open(path, "rb") as f:
+        yield from split_jpegs(iter(lambda: f.read(PIPE_BLOCK), b""))
+
+
+def run_segments(video_path: str, interval: int, qscale: int, duration: float, jobs: int,
+                 spool_dir: str) -> list:
+    """Decode the plan_segments() ranges with one ffmpeg each, all at once,
+    each writing its MJPEG stream to a spool file. Returns the spool files
+    in order.
+
+    Raises CalledProcessError if an ffmpeg fails and ValueError if a range
+    came up short (duration longer than the stream): merging it would leave
+    a gap, so the caller should fall back to one sequential ffmpeg.
+    """
+    plan = plan_segments(duration, interval, jobs)
+    procs = []
+    try:
+        for k, (first, count) in enumerate(plan):
+            path = os.path.join(spool_dir, f"{k:04d}.mjpeg")
+            with open(path, "wb") as out:
+                proc = subprocess.Popen(_segment_cmd(video_path, interval, qscale, first * interval, count),
+                                        stdout=out, stderr=subprocess.PIPE)
+            procs.append((proc, path, count))
+        for proc, path, count in procs:
+            _, err = proc.communicate()
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, "ffmpeg", stderr=err)
+            if count is not None and sum(1 for _ in _iter_file(path)) != count:
+                raise ValueError(f"segment {os.path.basename(path)} has fewer than {count} frames")
+    finally:
+        for proc, _, _ in procs:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+    return [path for _, path, _ in procs]
+
+
+def _closable(iterable):
+    yield from iterable  # close() reaches a generator iterable too
+
+
+def iter_spooled(paths: list):
+    for path in paths:
+        yield from _iter_file(path)
+
+
+def frame_name(i: int) -> str:
+    """File name of the i-th frame (0-based), same as ffmpeg's %06d.jpg."""
+    return f"{i + 1:06d}.jpg"
+
+
+def index_entry(i: int, interval: int, alias_of: str = None) -> dict:
+    ts = i * interval
+    entry = {
+        "frame": alias_of or frame_name(i),
+        "timestamp_sec": ts,
+        "timestamp_str": f"{int(ts // 60):02d}:{int(ts % 60):02d}",
+    }
+    if alias_of:
+        entry["alias"] = True
+    return entry
+
+
+class FileStore:
+    """Frame store of loose files: frames_dir/%06d.jpg, one per kept frame.
+
+    Stores number frames in timestamp order: put() writes frame n, alias(k)
+    adds frame n as a copy of frame k (nothing to write here).
+    """
+
+    def __init__(self, frames_dir: str):
+        os.makedirs(frames_dir, exist_ok=True)
+        self.frames_dir = frames_dir
+        self.count = 0
+        self.bytes = 0
+
+    def put(self, jpeg, timestamp_sec: float) -> int:
+        with open(os.path.join(self.frames_dir, frame_name(self.count)), "wb") as f:
+            f.write(jpeg)
+        self.bytes += len(jpeg)
+        self.count += 1
+        return self.count - 1
+
+    def alias(self, n: int, timestamp_sec: float) -> int:
+        self.count += 1
+        return self.count - 1
+
+    def close(self):
+        pass
+
+
+def extract(video_path: str, store, interval: int, qscale: int, admit=None, on_frame=None, dedup=None,
+            jobs: int = 1, duration: float = 0.0, jpegs=None):
+    """Stream frames into store (FileStore or PackWriter). Returns
+    (index, total_bytes).
+
+    With jobs > 1 and a known duration the video is decoded in parallel
+    ranges (run_segments) and merged here; frames, names and index are the
+    same as from one ffmpeg. jpegs: frames already decoded at this interval
+    (e.g. iter_spooled() of the demux spool); the video is not read then.
+
+    admit(total_bytes) runs before each frame is stored; if it returns
+    False ffmpeg is stopped and OverflowError raised (frames stored so far
+    stay on disk for the caller to remove). on_frame(frames, seconds_done)
+    runs after each frame. Frames dedup aliases are indexed, not stored.
+    """
+    index = []
+    spool = None
+    frames = _closable(jpegs) if jpegs is not None else None
+    if frames is None and jobs > 1 and duration > interval:
+        spool = tempfile.mkdtemp(prefix=".segments-", dir=store.frames_dir)
+        try:
+            frames = iter_spooled(run_segments(video_path, interval, qscale, duration, jobs, spool))
+        except (ValueError, subprocess.CalledProcessError) as e:
+            print(f"[FRAMES] parallel extraction failed ({e}); decoding in one pass")
+    if frames is None:
+        frames = iter_jpegs(video_path, interval, qscale)
+    try:
+        for i, jpeg in enumerate(frames):
+            ts = i * interval
+            kept = dedup.alias_of(jpeg, i) if dedup else None
+            if kept is not None:
+                store.alias(kept, ts)
+                index.append(index_entry(i, interval, frame_name(kept)))
+            else:
+                if admit and not admit(store.bytes + len(jpeg)):
+                    raise OverflowError(
+                        f"Quota exceeded during frame extraction ({i} frames, {store.bytes / 1024 / 1024:.1f} MB)"
+                    )
+                store.put(jpeg, ts)
+                index.append(index_entry(i, interval))
+            if on_frame:
+                on_frame(i + 1, ts)
+    finally:
+        frames.close()
+        if spool:
+            shutil.rmtree(spool, ignore_errors=True)
+    return index, store.bytes
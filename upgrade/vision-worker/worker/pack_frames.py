@@ -0,0 +1,120 @@
+"""
+Convert existing jobs' loose frames/%06d.jpg into the packed frame store
+- Frame order and timestamps come from artifacts/frames_index.json (a
+  listing of frames/ only if the index is missing); aliased entries become
+  alias records, so frame N of the pack is index entry N
+- The pack is built in frames/.pack-tmp and renamed into place before any
+  JPEG is removed: an interrupted run leaves the job readable either way
+- frames_bytes and the owner's quota usage are adjusted by the size change
+  (--no-db to skip, e.g. on a copy of the data)
+
+    python -m worker.pack_frames                # every job under DATA_ROOT
+    python -m worker.pack_frames JOB_ID ...
+"""
+
+import argparse
+import json
+import os
+import shutil
+
+from common import framepack
+
+DATA_ROOT = os.getenv("DATA_ROOT", "/data/jobs")
+INTERVAL = int(os.getenv("FRAME_INTERVAL_SEC", "5"))
+
+
+def load_index(job_dir: str) -> list:
+    try:
+        with open(os.path.join(job_dir, "artifacts", "frames_index.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        names = sorted(n for n in os.listdir(os.path.join(job_dir, "frames")) if n.endswith(".jpg"))
+        return [{"frame": n, "timestamp_sec": i * INTERVAL} for i, n in enumerate(names)]
+
+
+def pack_job(job_dir: str) -> tuple | None:
+    """Pack one job's frames. Returns (bytes_before, bytes_after), or None
+    if there is nothing to convert."""
+    frames_dir = os.path.join(job_dir, "frames")
+    if not os.path.isdir(frames_dir):
+        return None
+    index = load_index(job_dir)
+    if framepack.is_packed(frames_dir):
+        for name in {e["frame"] for e in index}:  # a previous run died before removing them
+            if os.path.exists(os.path.join(frames_dir, name)):
+                os.remove(os.path.join(frames_dir, name))
+        return None
+    if not index:
+        return None
+
+    tmp = os.path.join(frames_dir, ".pack-tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    first = {}  # file name -> record number
+    before = 0
+    with framepack.PackWriter(tmp) as pack:
+        for entry in index:
+            name = entry["frame"]
+            if name in first:
+                pack.alias(first[name], entry["timestamp_sec"])
+                continue
+            with open(os.path.join(frames_dir, name), "rb") as f:
+                jpeg = f.read()
+            first[name] = pack.put(jpeg, entry["timestamp_sec"])
+            before += len(jpeg)
+    after = pack.bytes
+
+    # data first: once frames.idx is in place the job reads from the pack
+    os.replace(os.path.join(tmp, framepack.PACK_FILE), os.path.join(frames_dir, framepack.PACK_FILE))
+    os.replace(os.path.join(tmp, framepack.INDEX_FILE), os.path.join(frames_dir, framepack.INDEX_FILE))
+    os.rmdir(tmp)
+    for name in first:
+        os.remove(os.path.join(frames_dir, name))
+    return before, after
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("job_ids", nargs="*")
+    ap.add_argument("--no-db", action="store_true", help="don't touch frames_bytes / quota usage")
+    args = ap.parse_args()
+
+    db = ledger = None
+    if not args.no_db:
+        import redis
+
+        from common.db import Database
+        from common.quota import QuotaLedger
+
+        db = Database.from_env()
+        ledger = QuotaLedger(redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0")),
+                             int(os.getenv("QUOTA_BYTES_PER_USER", "1073741824")), connect=db.connect)
+
+    job_ids = args.job_ids or sorted(os.listdir(DATA_ROOT))
+    converted = saved = 0
+    users = set()
+    for job_id in job_ids:
+        try:
+            sizes = pack_job(os.path.join(DATA_ROOT, job_id))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[PACK] {job_id}: skipped ({e})")
+            continue
+        if not sizes:
+            continue
+        before, after = sizes
+        converted += 1
+        saved += before - after
+        print(f"[PACK] {job_id}: {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB")
+        if db:
+            db.update_job(job_id, {"frames_bytes": after})
+            meta = db.job_meta(job_id)
+            if meta and after != before:
+                ledger.adjust(meta["user_id"], after - before)
+                users.add(meta["user_id"])
+            db.forget_job(job_id)
+    if ledger and users:
+        ledger.flush(sorted(users))  # usage is written behind; nothing else will flush it here
+    print(f"[PACK] {converted} jobs converted, {saved / 1024 / 1024:+.1f} MB freed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,133 +1,123 @@
 """
 vision-worker: Frame extraction for FULL analysis mode
-- Reads from Redis queue:frames
-- Extracts frames every N seconds via ffmpeg
-- Builds frames_index.json with timestamps
-- Creates cover.jpg + thumb.jpg (middle frame)
-- Enforces quota before and during extraction
+- Reads from Redis queue:frames through the reliable queue (common/jobqueue.py):
+  VISION_CONCURRENCY jobs at a time, leased and acked, re-claimed from a
+  worker that died, retried up to QUEUE_MAX_ATTEMPTS times, then dead-lettered
+- QUEUE_SCHEDULER=fair claims fairly across users, shortest lesson first
+  and urgent lane first (common/fairqueue.py); fifo = arrival order
+- Streams frames every N seconds from ffmpeg (image2pipe) and writes them one
+  by one; quota is checked before each frame and ffmpeg is stopped as soon as
+  the reservation can't grow (worker/frames.py)
+- FRAME_EXTRACT_JOBS > 1 decodes that many time ranges of the video with
+  parallel seek-based ffmpegs and merges them into the same frame sequence
+- Takes the frames from the asr-worker's demux spool (common/media.py) when
+  there is one: the video is then decoded once for audio and frames. An
+  "early" message arrives as soon as that ffmpeg exits, so frames run while
+  ASR is still transcribing and leave the job status to the asr-worker
+- Builds frames_index.json with timestamps in the same pass, then
+  timeline.json if the transcript is already done (common/timeline.py);
+  both get .gz / .br siblings for media-api (common/precompress.py)
+- Picks the cover by activity (sharpness, exposure, motion on 1/8-scale
+  draft decodes, worker/cover.py; COVER_SELECT=middle for the old pick) and
+  writes cover.jpg (the frame's own JPEG) + thumb.jpg
+- FRAME_STORE=pack writes all frames of a job to frames/frames.pack + an
+  offset table (common/framepack.py) instead of one JPEG per frame
+- Near-duplicate frames (perceptual hash within FRAME_DEDUP_MAX_DIST bits of
+  the last kept frame) are aliased in the index instead of written
+- Re-uploads of the same video (same content hash + interval) get frames,
+  index and cover hardlinked from the artifact cache (common/cas.py)
+- Enforces quota via the shared Redis quota ledger (reserve -> commit)
 - Updates MariaDB job status + byte accounting
+- Publishes stage transitions + frames-written progress to Redis (job:{id}:events)
+- Stage timers, frames/s, bytes, queue depth and DB latency are exported on
+  METRICS_PORT (common/metrics.py)
 """
 
 import os
+import socket
 import sys
 import json
 import time
-import subprocess
 import traceback
-import glob as globmod
+import shutil
 from datetime import datetime, timedelta
 
 import redis
-import mysql.connector
-from PIL import Image
+
+from common import cas, framepack, media, metrics, precompress, progress, timeline
+from common.db import Database
+from common.fairqueue import FairQueue
+from common.jobqueue import JobQueue
+from common.quota import QuotaLedger
+from worker import cover, dedup, frames
 
 # ─── Config ───
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 DATA_ROOT = os.getenv("DATA_ROOT", "/data/jobs")
 INTERVAL = int(os.getenv("FRAME_INTERVAL_SEC", "5"))
 QUOTA_BYTES = int(os.getenv("QUOTA_BYTES_PER_USER", "1073741824"))
-
-DB_HOST = os.getenv("DB_HOST", "host.docker.internal")
-DB_PORT = int(os.getenv("DB_PORT", "3306"))
-DB_USER = os.getenv("DB_USER", "root")
-DB_PASS = os.getenv("DB_PASS", "")
-DB_NAME = os.getenv("DB_NAME", "teachermon")
+QUOTA_RECONCILE_SEC = float(os.getenv("QUOTA_RECONCILE_SEC", "30"))
+FRAME_STORE = os.getenv("FRAME_STORE", "files")  # files | pack
+FRAME_DEDUP = os.getenv("FRAME_DEDUP", "dhash")  # dhash | phash | off
+FRAME_DEDUP_MAX_DIST = int(os.getenv("FRAME_DEDUP_MAX_DIST", "4"))  # Hamming distance, of 64 bits
+FRAME_EXTRACT_JOBS = int(os.getenv("FRAME_EXTRACT_JOBS", "1")) or os.cpu_count() or 1  # 0 = one per CPU
+COVER_SELECT = os.getenv("COVER_SELECT", "activity")  # activity | middle
+VISION_WORKER_ID = os.getenv("VISION_WORKER_ID") or socket.gethostname()
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", "1"))  # jobs at once in this process
+QUEUE_VISIBILITY_SEC = float(os.getenv("QUEUE_VISIBILITY_SEC", "300"))  # lease lost after this without heartbeat
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+QUEUE_SCHEDULER = os.getenv("QUEUE_SCHEDULER", "fair")  # fair (common/fairqueue.py) | fifo; same on every consumer
+FRAMES_RESERVE_STEP = int(os.getenv("FRAMES_RESERVE_STEP", str(8 * 1024 * 1024)))  # reservation top-up
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9102"))  # 0 = no exporter
+FRAMES_RETENTION_DAYS = 365  # frames_expires_at; cached frames expire with the job that stored them
 
 # ─── Redis ───
 r = redis.from_url(REDIS_URL)
+queue = (FairQueue if QUEUE_SCHEDULER == "fair" else JobQueue)(
+    r, "queue:frames", VISION_WORKER_ID, QUEUE_VISIBILITY_SEC, QUEUE_MAX_ATTEMPTS)
+PERMANENT_ERRORS = (OverflowError, FileNotFoundError, LookupError)  # failed without a retry
 
 
-# ─── DB helpers ───
-
-def get_db():
-    return mysql.connector.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        user=DB_USER,
-        password=DB_PASS,
-        database=DB_NAME,
-        charset="utf8mb4",
-        collation="utf8mb4_unicode_ci",
-    )
+# ─── DB helpers (pooled, see common/db.py) ───
+db = Database.from_env()
 
 
 def update_job(job_id: str, updates: dict):
     """Generic update for analysis_job row."""
-    conn = get_db()
-    try:
-        cur = conn.cursor()
-        sets = ["updated_at = NOW()"]
-        vals = []
-        for k, v in updates.items():
-            sets.append(f"{k} = %s")
-            vals.append(v)
-        vals.append(job_id)
-        sql = f"UPDATE analysis_job SET {', '.join(sets)} WHERE id = %s"
-        cur.execute(sql, vals)
-        conn.commit()
-    finally:
-        conn.close()
+    db.update_job(job_id, updates)
+    progress.publish(r, job_id, **updates)
 
 
-def get_user_quota_remaining(job_id: str) -> int:
-    """Check remaining quota for the user who owns this job."""
-    conn = get_db()
-    try:
-        cur = conn.cursor()
-        # get user_id from job
-        cur.execute("SELECT user_id FROM analysis_job WHERE id = %s", (job_id,))
-        row = cur.fetchone()
-        if not row:
-            return 0
-        user_id = row[0]
-
-        # get quota
-        cur.execute(
-            "SELECT limit_bytes, usage_bytes FROM user_media_quota WHERE user_id = %s",
-            (user_id,),
-        )
-        qrow = cur.fetchone()
-        if not qrow:
-            return QUOTA_BYTES  # no record = full quota available
-        return max(0, int(qrow[0]) - int(qrow[1]))
-    finally:
-        conn.close()
+def get_job_user_id(job_id: str) -> str | None:
+    """Return the user_id that owns this job (cached for the life of the job)."""
+    meta = db.job_meta(job_id)
+    return meta["user_id"] if meta else None
 
 
-def add_quota_usage(job_id: str, delta_bytes: int):
-    """Increment the user's usage_bytes."""
-    conn = get_db()
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT user_id FROM analysis_job WHERE id = %s", (job_id,))
-        row = cur.fetchone()
-        if not row:
-            return
-        user_id = row[0]
-        cur.execute(
-            "UPDATE user_media_quota SET usage_bytes = usage_bytes + %s, updated_at = NOW() WHERE user_id = %s",
-            (delta_bytes, user_id),
-        )
-        conn.commit()
-    finally:
-        conn.close()
+# ─── Quota ledger ───
+ledger = QuotaLedger(r, QUOTA_BYTES, connect=db.connect)
+
+# ─── Artifact cache ───
+cache = cas.ArtifactCache.from_env(r)
+JPEG_QSCALE = 3
+COVER_FILES = ["artifacts/frames_index.json", "artifacts/cover.jpg", "artifacts/thumb.jpg"]
+
+
+def frames_cache_key(raw_dir: str) -> str | None:
+    content = cas.read_content_hash(raw_dir)
+    if not content:
+        return None
+    return cas.cache_key(content, interval=INTERVAL, qscale=JPEG_QSCALE,
+                         cover=COVER_SELECT, cover_max_width=cover.COVER_MAX_WIDTH,
+                         dedup=FRAME_DEDUP, dedup_max_dist=FRAME_DEDUP_MAX_DIST, store=FRAME_STORE)
 
 
 # ─── Video duration ───
 
 def get_video_duration(video_path: str) -> float:
-    """Get video duration in seconds via ffprobe."""
-    try:
-        cmd = [
-            "ffprobe", "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            video_path,
-        ]
-        result = subprocess.check_output(cmd, stderr=subprocess.DEVNULL)
-        return float(result.decode().strip())
-    except Exception:
-        return 0.0
+    """Video duration in seconds (raw/media.json, probed once per upload)."""
+    with metrics.timer(stage="probe"):
+        return media.load(os.path.dirname(video_path), video_path)["duration"]
 
 
 # ─── Core functions ───
@@ -145,162 +135,275 @@ def find_video_file(raw_dir: str) -> str | None:
     return None
 
 
-def extract_frames(video_path: str, frames_dir: str) -> int:
-    """Extract frames every INTERVAL seconds. Returns total bytes written."""
-    os.makedirs(frames_dir, exist_ok=True)
-    cmd = [
-        "ffmpeg", "-y", "-i", video_path,
-        "-vf", f"fps=1/{INTERVAL}",
-        "-q:v", "3",
-        os.path.join(frames_dir, "%06d.jpg"),
-    ]
-    subprocess.check_call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-    # calculate total bytes
-    total = 0
-    for f in globmod.glob(os.path.join(frames_dir, "*.jpg")):
-        total += os.path.getsize(f)
-    return total
-
-
-def build_frames_index(frames_dir: str, duration: float) -> list:
-    """Build frames_index.json mapping frame files to timestamps."""
-    files = sorted(globmod.glob(os.path.join(frames_dir, "*.jpg")))
-    index = []
-    for i, fpath in enumerate(files):
-        ts = i * INTERVAL
-        index.append({
-            "frame": os.path.basename(fpath),
-            "timestamp_sec": ts,
-            "timestamp_str": f"{int(ts // 60):02d}:{int(ts % 60):02d}",
-        })
-    return index
+def extract_frames(video_path: str, frames_dir: str, res, on_progress=None, deduper=None,
+                   duration: float = 0.0, jpegs=None) -> tuple:
+    """Extract frames every INTERVAL seconds. Returns (index, total_bytes).
+
+    Each frame is charged against res before it is written; OverflowError
+    as soon as the reservation can't grow. on_progress(frames_written,
+    seconds_done) follows each frame. Starts from an empty dir: leftover
+    frames may be hardlinks into the cache. With FRAME_EXTRACT_JOBS > 1
+    and a known duration the ranges are decoded in parallel first, so
+    progress only moves once they are merged. jpegs (the demux spool)
+    replaces decoding the video.
+    """
+    shutil.rmtree(frames_dir, ignore_errors=True)
+    store = framepack.PackWriter(frames_dir) if FRAME_STORE == "pack" else frames.FileStore(frames_dir)
+    try:
+        return frames.extract(
+            video_path, store, INTERVAL, JPEG_QSCALE,
+            admit=lambda total: res.ensure(total, FRAMES_RESERVE_STEP),
+            on_frame=on_progress,
+            dedup=deduper,
+            jobs=FRAME_EXTRACT_JOBS,
+            duration=duration,
+            jpegs=jpegs,
+        )
+    finally:
+        store.close()
 
 
-def create_cover_and_thumb(frames_dir: str, art_dir: str):
-    """Pick middle frame as cover.jpg; create thumb.jpg (320px wide)."""
-    files = sorted(globmod.glob(os.path.join(frames_dir, "*.jpg")))
-    if not files:
-        return
+def stored_frame_files(frames_dir: str, index: list) -> list:
+    """Files of the frame store, relative to the job dir (cache entries)."""
+    if framepack.is_packed(frames_dir):
+        return [f"frames/{framepack.PACK_FILE}", f"frames/{framepack.INDEX_FILE}"]
+    return [f"frames/{e['frame']}" for e in index if not e.get("alias")]
+
 
+def write_frames_index(index: list, art_dir: str):
+    """artifacts/frames_index.json, compact, + its .gz / .br; written aside
+    (the old one may be a cache hardlink)."""
     os.makedirs(art_dir, exist_ok=True)
-    mid = files[len(files) // 2]
+    with cas.replacing(os.path.join(art_dir, "frames_index.json")) as tmp:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    precompress.write_all(art_dir, ["frames_index.json"])
 
-    # cover = full size copy
-    img = Image.open(mid)
-    img.save(os.path.join(art_dir, "cover.jpg"), quality=85)
 
-    # thumb = 320px wide
-    w, h = img.size
-    new_w = 320
-    new_h = int(h * (new_w / w))
-    thumb = img.resize((new_w, new_h), Image.LANCZOS)
-    thumb.save(os.path.join(art_dir, "thumb.jpg"), quality=75)
+def build_timeline(art_dir: str):
+    """timeline.json once transcript.json is there too (the asr-worker does
+    the same on its side). Not fatal: analysis can rebuild it."""
+    try:
+        with metrics.timer(stage="timeline"):
+            tl = timeline.build_if_ready(art_dir)
+        if tl is not None:
+            precompress.write_all(art_dir, [timeline.TIMELINE_FILE])
+            print(f"  [TIMELINE] {len(tl)} segments joined to {len(tl.frame_t)} frames")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"  [TIMELINE] not written: {e}")
+
+
+def create_cover_and_thumb(frames_dir: str, index: list, art_dir: str):
+    """Best frame (COVER_SELECT) as cover.jpg; create thumb.jpg (320px wide)."""
+    if not index:
+        return
+    packed = framepack.is_packed(frames_dir)
+    pack = framepack.FramePack(frames_dir) if packed else None
+
+    def read(n: int) -> bytes:
+        if pack:  # records of aliases point at the kept bytes
+            return bytes(pack.frame(n))
+        with open(os.path.join(frames_dir, index[n]["frame"]), "rb") as f:
+            return f.read()
+
+    try:
+        if COVER_SELECT == "activity":
+            t0 = time.perf_counter()
+            n = cover.pick((n, read(n)) for n, e in enumerate(index) if not e.get("alias"))
+            print(f"  [COVER] {index[n]['frame']} at {index[n]['timestamp_str']} "
+                  f"({time.perf_counter() - t0:.2f}s)")
+        else:
+            n = len(index) // 2
+        cover.write_cover_and_thumb(read(n), art_dir)
+    finally:
+        if pack:
+            pack.close()
+
+
+def finish_job(job_id: str, res, total_bytes: int, frame_count: int, early: bool = False):
+    # Update DB — set frames_expires_at = now + FRAMES_RETENTION_DAYS
+    now_dt = datetime.now()
+    expires_at = now_dt + timedelta(days=FRAMES_RETENTION_DAYS)
+
+    # an early run overlaps ASR: the asr-worker owns the status then
+    status = {} if early else {"status": "ASR_DONE"}  # back to ASR_DONE so NestJS cron picks up for analysis
+    update_job(job_id, {
+        **status,
+        "frames_bytes": total_bytes,
+        "total_bytes": total_bytes,  # will be recalculated
+        "has_frames": 1,
+        "has_cover": 1,
+        "frames_done_at": now_dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "frames_expires_at": expires_at.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+
+    # Update quota: reservation -> usage (written behind to user_media_quota)
+    res.commit(total_bytes)
+    metrics.JOBS.inc(service="vision", outcome="done")
+
+    print(f"[DONE] Frames for job {job_id}: {frame_count} frames, {total_bytes / 1024 / 1024:.1f} MB")
 
 
 # ─── Main loop ───
 
-def main():
-    print(f"[START] vision-worker ready — interval={INTERVAL}s — waiting on queue:frames")
-    while True:
-        item = r.blpop("queue:frames", timeout=5)
-        if not item:
-            continue
-
-        _, raw = item
-        msg = json.loads(raw.decode("utf-8"))
-        job_id = msg["job_id"]
-
-        print(f"[JOB] Processing frames for {job_id}")
-
-        job_dir = os.path.join(DATA_ROOT, job_id)
-        raw_dir = os.path.join(job_dir, "raw")
-        video_path = find_video_file(raw_dir)
-        if not video_path:
-            update_job(job_id, {
-                "status": "FAILED",
-                "error_message": "No video file found in raw directory",
-                "error_code": "VIDEO_NOT_FOUND",
-            })
-            print(f"[FAILED] job_id={job_id} No video file found in {raw_dir}")
-            continue
-        frames_dir = os.path.join(job_dir, "frames")
-        art_dir = os.path.join(job_dir, "artifacts")
-
-        # mark PROCESSING_FRAMES
+def process_message(msg):
+    """Extract frames for one queue:frames message. Settles msg itself only
+    on a retry; queue.serve() acks it when this returns."""
+    job_id = msg.data["job_id"]
+    early = bool(msg.data.get("early"))
+
+    print(f"[JOB] Processing frames for {job_id}{' (early, alongside ASR)' if early else ''}")
+
+    job_dir = os.path.join(DATA_ROOT, job_id)
+    raw_dir = os.path.join(job_dir, "raw")
+    video_path = find_video_file(raw_dir)
+    if not video_path:
         update_job(job_id, {
-            "status": "PROCESSING_FRAMES",
-            "frames_started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "status": "FAILED",
+            "error_message": "No video file found in raw directory",
+            "error_code": "VIDEO_NOT_FOUND",
         })
+        print(f"[FAILED] job_id={job_id} No video file found in {raw_dir}")
+        return
+    frames_dir = os.path.join(job_dir, "frames")
+    art_dir = os.path.join(job_dir, "artifacts")
 
-        try:
-            if not os.path.exists(video_path):
-                raise FileNotFoundError(f"Video not found: {video_path}")
-
-            # 1) Pre-check quota (estimate: ~50KB per frame)
-            duration = get_video_duration(video_path)
-            est_frames = max(1, int(duration / INTERVAL))
-            est_bytes = est_frames * 50_000  # ~50KB per frame
-            remaining = get_user_quota_remaining(job_id)
-            if est_bytes > remaining:
-                raise OverflowError(
-                    f"Estimated frames ({est_bytes / 1024 / 1024:.1f} MB) "
-                    f"exceeds remaining quota ({remaining / 1024 / 1024:.1f} MB)"
-                )
-
-            print(f"  [1/4] Extracting frames (est. {est_frames} frames)...")
-            total_bytes = extract_frames(video_path, frames_dir)
-
-            # 2) Post-check quota
-            remaining_after = get_user_quota_remaining(job_id)
-            if total_bytes > remaining_after + total_bytes:
-                # quota exceeded during extraction — clean up
-                import shutil
+    # mark PROCESSING_FRAMES (an early run leaves the status to ASR)
+    started = {"frames_started_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+    update_job(job_id, started if early else {"status": "PROCESSING_FRAMES", **started})
+
+    user_id = get_job_user_id(job_id)
+    res = ledger.reservation(user_id, f"frames:{job_id}")
+    reporter = progress.ProgressReporter(r, job_id)
+
+    try:
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"Video not found: {video_path}")
+        if user_id is None:
+            raise LookupError(f"Job not found: {job_id}")
+
+        key = frames_cache_key(raw_dir)
+        manifest = cache.fetch("frames", key, job_dir) if key else None
+        if manifest:
+            # same video seen before: frames linked from the cache, charged like a fresh run
+            total_bytes = manifest["frames_bytes"]
+            frame_count = manifest["frames"]
+            print(f"  [CACHE] {frame_count} frames reused ({total_bytes / 1024 / 1024:.1f} MB)")
+            if not res.ensure(total_bytes):
                 shutil.rmtree(frames_dir, ignore_errors=True)
-                raise OverflowError("Quota exceeded during frame extraction")
-
-            print(f"  [2/4] Frames extracted: {total_bytes / 1024 / 1024:.1f} MB")
-
-            # 3) Build index
-            print(f"  [3/4] Building frames index...")
-            index = build_frames_index(frames_dir, duration)
-            with open(os.path.join(art_dir, "frames_index.json"), "w", encoding="utf-8") as f:
-                json.dump(index, f, ensure_ascii=False, indent=2)
-
-            # 4) Create cover + thumb
-            print(f"  [4/4] Creating cover and thumbnail...")
-            create_cover_and_thumb(frames_dir, art_dir)
-
-            # Update DB — set frames_expires_at = now + 365 days
-            now_dt = datetime.now()
-            expires_at = now_dt + timedelta(days=365)
-
-            update_job(job_id, {
-                "status": "ASR_DONE",  # back to ASR_DONE so NestJS cron picks up for analysis
-                "frames_bytes": total_bytes,
-                "total_bytes": total_bytes,  # will be recalculated
-                "has_frames": 1,
-                "has_cover": 1,
-                "frames_done_at": now_dt.strftime("%Y-%m-%d %H:%M:%S"),
-                "frames_expires_at": expires_at.strftime("%Y-%m-%d %H:%M:%S"),
-            })
-
-            # Update quota
-            add_quota_usage(job_id, total_bytes)
-
-            print(f"[DONE] Frames for job {job_id}: {len(index)} frames, {total_bytes / 1024 / 1024:.1f} MB")
-
-        except Exception as e:
-            err = str(e)
-            tb = traceback.format_exc()
-            print(f"[FAILED] job_id={job_id} err={err}\n{tb}")
-
-            update_job(job_id, {
-                "status": "FAILED",
-                "error_message": f"Frame extraction failed: {err[:500]}",
-                "error_code": "FRAMES_ERROR",
-            })
+                for rel in COVER_FILES:
+                    if os.path.exists(os.path.join(job_dir, rel)):
+                        os.remove(os.path.join(job_dir, rel))
+                raise OverflowError("Quota exceeded for cached frames")
+            reporter.stage("cover", progress=1.0, frames_written=frame_count, cached=True)
+            precompress.write_all(art_dir, ["frames_index.json"])  # the link is a new file
+            build_timeline(art_dir)
+            finish_job(job_id, res, total_bytes, frame_count, early)
+            media.remove_spool(job_dir)
+            return
 
+        # 1) Reserve quota up front (estimate: ~50KB per frame)
+        duration = get_video_duration(video_path)
+        est_frames = max(1, int(duration / INTERVAL))
+        est_bytes = est_frames * 50_000  # ~50KB per frame
+        if not res.ensure(est_bytes):
+            remaining = ledger.snapshot(user_id)["remaining_bytes"]
+            raise OverflowError(
+                f"Estimated frames ({est_bytes / 1024 / 1024:.1f} MB) "
+                f"exceeds remaining quota ({remaining / 1024 / 1024:.1f} MB)"
+            )
+
+        print(f"  [1/4] Extracting frames (est. {est_frames} frames)...")
+        reporter.stage("extract_frames", progress=0.0, frames_total=est_frames)
+
+        def on_frames(written: int, done: float):
+            reporter.update(
+                frames_written=written,
+                progress=round(min(1.0, done / duration), 3) if duration else None,
+            )
+
+        deduper = dedup.Deduper(FRAME_DEDUP, FRAME_DEDUP_MAX_DIST) if FRAME_DEDUP != "off" else None
+        spool = media.ready_spool(job_dir, INTERVAL, JPEG_QSCALE)
+        if spool:
+            print(f"  [DEMUX] frames from the ASR decode ({os.path.getsize(spool) / 1024 / 1024:.1f} MB spool)")
+        t0 = time.perf_counter()
+        try:
+            with metrics.timer(stage="extract_frames"):
+                index, total_bytes = extract_frames(video_path, frames_dir, res, on_frames, deduper, duration,
+                                                    jpegs=frames.iter_spooled([spool]) if spool else None)
+        except OverflowError:
+            shutil.rmtree(frames_dir, ignore_errors=True)  # stopped mid-video
+            raise
+        elapsed = time.perf_counter() - t0
+        if index and elapsed > 0:
+            metrics.FRAMES_PER_SEC.observe(len(index) / elapsed)
+        metrics.BYTES.inc(total_bytes, kind="frames")
+
+        print(f"  [2/4] Frames extracted: {len(index)} frames, {total_bytes / 1024 / 1024:.1f} MB")
+        if deduper:
+            print(f"  [DEDUP] {deduper.aliased}/{len(index)} frames aliased, "
+                  f"{deduper.saved_bytes / 1024 / 1024:.1f} MB saved")
+            reporter.update(force=True, frames_aliased=deduper.aliased,
+                            dedup_saved_bytes=deduper.saved_bytes)
+
+        # 3) Write index (built while extracting)
+        print(f"  [3/4] Writing frames index...")
+        reporter.stage("index_frames", progress=1.0)
+        with metrics.timer(stage="write_index"):
+            write_frames_index(index, art_dir)
+
+        # 4) Create cover + thumb
+        print(f"  [4/4] Creating cover and thumbnail...")
+        reporter.stage("cover")
+        with metrics.timer(stage="cover"):
+            create_cover_and_thumb(frames_dir, index, art_dir)
+        build_timeline(art_dir)
+
+        if key:
+            files = stored_frame_files(frames_dir, index)
+            files += [rel for rel in COVER_FILES if os.path.exists(os.path.join(job_dir, rel))]
+            try:
+                cache.store("frames", key, job_dir, files, frames=len(index), frames_bytes=total_bytes,
+                            expires_at=time.time() + FRAMES_RETENTION_DAYS * 86400)
+            except OSError as e:
+                print(f"  [CACHE] store failed: {e}")
+
+        finish_job(job_id, res, total_bytes, len(index), early)
+        media.remove_spool(job_dir)
+
+    except Exception as e:
+        err = str(e)
+        tb = traceback.format_exc()
+        print(f"[FAILED] job_id={job_id} err={err}\n{tb}")
+
+        res.release()
+        # quota / missing input won't change on a retry; anything else might
+        attempt = f"attempt {msg.attempts}/{QUEUE_MAX_ATTEMPTS}"
+        if not isinstance(e, PERMANENT_ERRORS) and msg.retry(err):
+            print(f"  [QUEUE] {job_id} requeued after {attempt}")
+            update_job(job_id, {"error_message": f"Frames {attempt} failed, retrying: {err[:400]}"})
+            metrics.JOBS.inc(service="vision", outcome="retry")
+            return
+        update_job(job_id, {
+            "status": "FAILED",
+            "error_message": f"Frame extraction failed: {err[:500]}",
+            "error_code": "FRAMES_ERROR",
+        })
+        media.remove_spool(job_dir)
+        metrics.JOBS.inc(service="vision", outcome="failed")
+
+    finally:
+        db.forget_job(job_id)
+
+
+
+def main():
+    print(f"[START] vision-worker ready — interval={INTERVAL}s — concurrency={VISION_CONCURRENCY} "
+          f"— waiting on queue:frames")
+    ledger.start_reconciler(QUOTA_RECONCILE_SEC)
+    metrics.watch_queues(queue)
+    metrics.serve(METRICS_PORT)
+    queue.serve(process_message, VISION_CONCURRENCY)
 
 if __name__ == "__main__":
     main()